@@ -101,6 +101,12 @@ config.JobStateMachine.jobSummaryDBName = jobSummaryDBName
 config.JobStateMachine.summaryStatsDBName = summaryStatsDBName
 # Amount of documents allowed in the ChangeState module for bulk commits
 config.JobStateMachine.maxBulkCommitDocs = 250
+# Record the job state transitions with bulk document updates instead of one update handler call per job
+config.JobStateMachine.bulkStateTransitions = False
+config.JobStateMachine.maxConflictRetries = 10
+# Number of workflows and seconds the campaign and PrepIDs of the specs are cached for
+config.JobStateMachine.specCacheSize = 500
+config.JobStateMachine.specCacheExpiration = 6 * 3600
 # total allowed serialized size for the FJR document that is uploaded to wmagent_jobdump/fwjrs
 # NOTE: this needs to be in sync with CouchDB couchdb.max_document_size parameter
 # see: https://docs.couchdb.org/en/latest/config/couchdb.html#couchdb/max_document_size
@@ -121,6 +127,9 @@ config.BossAir.nCondorProcesses = 1
 config.BossAir.submitWMSMode = True
 config.BossAir.acctGroup = glideInAcctGroup
 config.BossAir.acctGroupUser = glideInAcctGroupUser
+# "full" classAd queries every cycle, or "eventlog" to read the job state changes from the schedd EVENT_LOG
+config.BossAir.condorTrackingMode = "full"
+config.BossAir.condorFullTrackingInterval = 3600
 
 config.section_("CoreDatabase")
 config.CoreDatabase.connectUrl = databaseUrl
@@ -201,6 +210,10 @@ config.JobCreator.pollInterval = 120
 config.JobCreator.jobCacheDir = config.General.workDir + "/JobCache"
 config.JobCreator.defaultJobType = "Processing"
 config.JobCreator.workerThreads = 1
+# job object store: "pickle" for one job.pkl per job, "collection" for one indexed file per JobCollection
+config.JobCreator.jobObjectStore = "pickle"
+# threads creating the job work areas and objects while the previous groups are recorded in the database
+config.JobCreator.creatorThreads = 1
 # glidein restrictions used for resource estimation (per core)
 config.JobCreator.GlideInRestriction = {"MinWallTimeSecs": 1 * 3600,  # 1h
                                         "MaxWallTimeSecs": 45 * 3600,  # pilot lifetime is usually 48h
@@ -212,6 +225,8 @@ config.JobSubmitter.componentDir = config.General.workDir + "/JobSubmitter"
 config.JobSubmitter.logLevel = globalLogLevel
 config.JobSubmitter.maxThreads = 1
 config.JobSubmitter.pollInterval = 120
+config.JobSubmitter.wakeupStates = []  # wake up as soon as jobs move to these states, e.g. ["created"]
+config.JobSubmitter.maxPollInterval = 120  # with wakeupStates, poll less often (up to this) while the cycles find no work
 config.JobSubmitter.workerThreads = 1
 config.JobSubmitter.jobsPerWorker = 100
 config.JobSubmitter.maxJobsPerPoll = 1000
@@ -221,6 +236,11 @@ config.JobSubmitter.skipRefreshCount = 20  # (If above the threshold meet, cache
 config.JobSubmitter.submitScript = os.path.join(os.environ["WMCORE_ROOT"], submitScript)
 config.JobSubmitter.extraMemoryPerCore = 500  # in MB
 config.JobSubmitter.drainGraceTime = 2 * 24 * 60 * 60  # in seconds
+config.JobSubmitter.streamArraySize = 0  # stream created jobs from the database in chunks of this size, 0 to disable
+# only query the jobs created or retried since the previous cache refresh, with a full refresh every fullRefreshCycles
+config.JobSubmitter.incrementalRefresh = False
+config.JobSubmitter.fullRefreshCycles = 10
+config.JobSubmitter.refreshTimeMargin = 600  # in seconds, look back this far for jobs that re-entered the created state
 
 config.component_("JobTracker")
 config.JobTracker.namespace = "WMComponent.JobTracker.JobTracker"
@@ -246,6 +266,8 @@ config.ErrorHandler.namespace = "WMComponent.ErrorHandler.ErrorHandler"
 config.ErrorHandler.componentDir = config.General.workDir + "/ErrorHandler"
 config.ErrorHandler.logLevel = globalLogLevel
 config.ErrorHandler.pollInterval = 240
+config.ErrorHandler.wakeupStates = []  # wake up as soon as jobs move to these states, e.g. ["createfailed", "submitfailed", "jobfailed"]
+config.ErrorHandler.maxPollInterval = 240  # with wakeupStates, poll less often (up to this) while the cycles find no work
 config.ErrorHandler.readFWJR = True
 config.ErrorHandler.maxFailTime = 120000
 config.ErrorHandler.maxProcessSize = 500
@@ -264,9 +286,12 @@ config.component_("JobArchiver")
 config.JobArchiver.namespace = "WMComponent.JobArchiver.JobArchiver"
 config.JobArchiver.componentDir = config.General.workDir + "/JobArchiver"
 config.JobArchiver.pollInterval = 120
+config.JobArchiver.wakeupStates = []  # wake up as soon as jobs move to these states, e.g. ["success", "exhausted", "killed"]
+config.JobArchiver.maxPollInterval = 120  # with wakeupStates, poll less often (up to this) while the cycles find no work
 config.JobArchiver.logLevel = globalLogLevel
 config.JobArchiver.numberOfJobsToCluster = 1000
 config.JobArchiver.numberOfJobsToArchive = 10000
+config.JobArchiver.streamArraySize = 0  # stream finished jobs from the database in chunks of this size, 0 to disable
 # This is now OPTIONAL, it defaults to the componentDir
 # HOWEVER: Is is HIGHLY recommended that you do NOT run this on the same
 # disk as the JobCreator
@@ -8,9 +8,15 @@ an explicit data type check when adding a new item to the cache.
 It raises a TypeError exception if the cache data type chagens;
 or if the user tries to extend the cache with an incompatible
 data type.
+
+LRUCache is a bounded and thread safe cache of key/value pairs,
+with an expiration time per item and an optional bound on the size of
+the values.
 """
 
+from collections import OrderedDict
 from copy import copy
+from threading import Lock
 
 from builtins import object
 from time import time
@@ -117,3 +123,114 @@ class MemoryCache():
         else:
             msg = "Input item type: %s cannot be added to a cache type: %s" % (type(self._cache), type(inputItem))
             raise TypeError("Cache and input item data type mismatch. %s" % msg)
+
+
+class LRUCache(object):
+    """
+    Thread safe in-memory cache of key/value pairs, bounded to maxSize items
+    and, if maxBytes is set, to maxBytes for the total size of the values.
+    The least recently used items are evicted first, and items older than
+    expiration seconds (if set) are dropped when looked up.
+    """
+
+    def __init__(self, maxSize=100, expiration=None, maxBytes=None):
+        """
+        Initializes cache object
+
+        :param maxSize: maximum number of items in the cache
+        :param expiration: expiration time of every item in seconds, None for no expiration
+        :param maxBytes: maximum total size of the values, None for no bound
+        """
+        self.maxSize = maxSize
+        self.expiration = expiration
+        self.maxBytes = maxBytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._cache = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def __contains__(self, key):
+        return key in self._cache
+
+    def get(self, key, default=None, validate=None):
+        """
+        Return the value of key, making it the most recently used item, or
+        default if it is not cached, expired or not valid anymore.
+        :param key: the key of the item
+        :param default: value returned on a cache miss
+        :param validate: optional function called with the cached value,
+            returning False if the item must be dropped
+        """
+        with self._lock:
+            item = self._cache.get(key)
+            if item is not None:
+                value, added, _ = item
+                if self.expiration is not None and added + self.expiration < time():
+                    item = None
+                elif validate is not None and not validate(value):
+                    item = None
+                if item is None:
+                    self._remove(key)
+            if item is None:
+                self.misses += 1
+                return default
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, size=None):
+        """
+        Add or replace an item, evicting the least recently used ones beyond
+        maxSize items or maxBytes. An item larger than maxBytes is not kept.
+        :param size: size of the value, len(value) by default
+        """
+        if size is None:
+            size = len(value) if self.maxBytes is not None else 0
+        with self._lock:
+            self._remove(key)
+            if self.maxBytes is not None and size > self.maxBytes:
+                return
+            self._cache[key] = (value, time(), size)
+            self.bytes += size
+            while len(self._cache) > self.maxSize or \
+                    (self.maxBytes is not None and self.bytes > self.maxBytes):
+                self._remove(next(iter(self._cache)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        """
+        Remove an item, if cached. Must be called with the lock held.
+        """
+        item = self._cache.pop(key, None)
+        if item is not None:
+            self.bytes -= item[2]
+        return item
+
+    def pop(self, key, default=None):
+        """
+        Remove an item from the cache and return its value
+        """
+        with self._lock:
+            item = self._remove(key)
+        return default if item is None else item[0]
+
+    def clear(self):
+        """
+        Remove all the items, keeping the counters
+        """
+        with self._lock:
+            self._cache.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """
+        Return the cache counters
+        """
+        return {"size": len(self._cache), "maxSize": self.maxSize, "bytes": self.bytes,
+                "maxBytes": self.maxBytes, "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions}
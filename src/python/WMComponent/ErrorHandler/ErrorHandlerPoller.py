@@ -323,12 +323,16 @@ class ErrorHandlerPoller(BaseWorkerThread):
         """
         Queries DB for all watched filesets, if matching filesets become
         available, create the subscriptions
+
+        Returns the number of jobs handled.
         """
+        numJobs = 0
         # Run over created, submitted and executed job failures
         failure_states = ['create', 'submit', 'job']
         for state in failure_states:
             idList = self.getJobs.execute(state="%sfailed" % state)
             logging.info("Found %d failed jobs in state %sfailed", len(idList), state)
+            numJobs += len(idList)
             for jobSlice in grouper(idList, self.maxProcessSize):
                 jobList = self.loadJobsFromList(jobSlice)
                 self.handleFailedJobs(jobList, state)
@@ -336,11 +340,12 @@ class ErrorHandlerPoller(BaseWorkerThread):
         # Run over jobs done with retries
         idList = self.getJobs.execute(state='retrydone')
         logging.info("Found %d jobs done with all retries", len(idList))
+        numJobs += len(idList)
         for jobSlice in grouper(idList, self.maxProcessSize):
             jobList = self.loadJobsFromList(jobSlice)
             self.handleRetryDoneJobs(jobList)
 
-        return
+        return numJobs
 
     def loadJobsFromList(self, idList):
         """
@@ -408,7 +413,7 @@ class ErrorHandlerPoller(BaseWorkerThread):
 
         try:
             myThread = threading.currentThread()
-            self.handleErrors()
+            self.cycleWork = self.handleErrors()
         except (CouchConnectionError, HTTPException) as ex:
             if getattr(myThread, 'transaction', None) is not None:
                 myThread.transaction.rollback()
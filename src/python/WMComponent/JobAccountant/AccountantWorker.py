@@ -26,6 +26,7 @@ from WMCore.JobStateMachine.ChangeState import ChangeState
 from WMCore.Services.WMStats.WMStatsWriter import WMStatsWriter
 from WMCore.WMBS.File import File
 from WMCore.WMBS.Job import Job
+from WMCore.WMBS.Parentage import ParentageResolver
 from WMCore.WMConnectionBase import WMConnectionBase
 from WMCore.WMException import WMException
 
@@ -61,6 +62,7 @@ class AccountantWorker(WMConnectionBase):
         self.bulkParentageAction = self.daofactory(classname="Files.AddBulkParentage")
         self.getJobTypeAction = self.daofactory(classname="Jobs.GetType")
         self.getParentInfoAction = self.daofactory(classname="Files.GetParentAndGrandParentInfo")
+        self.parentageResolver = ParentageResolver(self.getParentInfoAction, excludeUnmergedLFNs=True)
         self.setParentageByJob = self.daofactory(classname="Files.SetParentageByJob")
         self.setParentageByMergeJob = self.daofactory(classname="Files.SetParentageByMergeJob")
         self.setFileRunLumi = self.daofactory(classname="Files.AddRunLumi")
@@ -144,6 +146,7 @@ class AccountantWorker(WMConnectionBase):
         self.parentageBinds = []
         self.parentageBindsForMerge = []
         self.jobsWithSkippedFiles = {}
+        self.parentageResolver.clear()
         gc.collect()
         return
 
@@ -373,38 +376,22 @@ class AccountantWorker(WMConnectionBase):
         _findDBSParents_
 
         Find the parent of the file in DBS
-        This is meant to be called recursively
-        """
-        parentsInfo = self.getParentInfoAction.execute([lfn],
-                                                       conn=self.getDBConn(),
-                                                       transaction=self.existingTransaction())
-        newParents = set()
-        logging.debug("Found %d potential parents for lfn: %s", len(parentsInfo), lfn)
-        for parentInfo in parentsInfo:
-            # This will catch straight to merge files that do not have redneck
-            # parents.  We will mark the straight to merge file from the job
-            # as a child of the merged parent.
-            if int(parentInfo["merged"]) == 1 and not parentInfo["lfn"].startswith("/store/unmerged/"):
-                newParents.add(parentInfo["lfn"])
-
-            elif parentInfo['gpmerged'] is None:
-                continue
-
-            # Handle the files that result from merge jobs that aren't redneck
-            # children.  We have to setup parentage and then check on whether or
-            # not this file has any redneck children and update their parentage
-            # information.
-            elif int(parentInfo["gpmerged"]) == 1 and not parentInfo["gplfn"].startswith("/store/unmerged/"):
-                newParents.add(parentInfo["gplfn"])
+        """
+        return self.findDBSParentsBulk([lfn])[lfn]
 
-            # If that didn't work, we've reached the great-grandparents
-            # And we have to work via recursion
-            else:
-                parentSet = self.findDBSParents(lfn=parentInfo['gplfn'])
-                for parent in parentSet:
-                    newParents.add(parent)
+    def findDBSParentsBulk(self, lfns):
+        """
+        _findDBSParentsBulk_
 
-        return newParents
+        Find the DBS parents of many files at once, walking up their WMBS
+        parentage one generation at a time. Return a dictionary of the sets
+        of parent lfns keyed by lfn.
+        """
+        parents = self.parentageResolver.findParents(lfns,
+                                                     conn=self.getDBConn(),
+                                                     transaction=self.existingTransaction())
+        logging.debug("Found the parents of %d lfns", len(parents))
+        return parents
 
     def addFileToWMBS(self, jobType, fwjrFile, jobMask, task, jobID=None):
         """
@@ -903,9 +890,9 @@ class AccountantWorker(WMConnectionBase):
         """
         outputLFNs = [f['lfn'] for f in self.mergedOutputFiles]
         bindList = []
+        parentsByLFN = self.findDBSParentsBulk(outputLFNs)
         for lfn in outputLFNs:
-            newParents = self.findDBSParents(lfn=lfn)
-            for parentLFN in newParents:
+            for parentLFN in parentsByLFN[lfn]:
                 bindList.append({'child': lfn, 'parent': parentLFN})
 
         # Now all the parents should exist
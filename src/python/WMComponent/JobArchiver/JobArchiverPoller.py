@@ -56,6 +56,8 @@ class JobArchiverPoller(BaseWorkerThread):
                                              "numberOfJobsToCluster", 1000)
         self.numberOfJobsToArchive = getattr(self.config.JobArchiver,
                                              "numberOfJobsToArchive", 10000)
+        # stream the finished jobs from the database in chunks of this size (0 loads them all at once)
+        self.streamArraySize = int(getattr(self.config.JobArchiver, "streamArraySize", 0))
 
         try:
             self.logDir = getattr(config.JobArchiver, 'logDir',
@@ -104,7 +106,7 @@ class JobArchiverPoller(BaseWorkerThread):
         And deal with it as desired.
         """
         try:
-            self.archiveJobs()
+            self.cycleWork = self.archiveJobs()
             self.pollForClosable()
             self.markInjected()
         except WMException:
@@ -131,12 +133,20 @@ class JobArchiverPoller(BaseWorkerThread):
 
         archiveJobs will handle the master task of looking for finished jobs,
         and running the code that cleans them out.
+
+        Returns the number of jobs archived.
         """
-        doneList = self.findFinishedJobs()
-        logging.info("Found %i finished jobs to archive", len(doneList))
+        if self.streamArraySize:
+            jobSlices = self.streamFinishedJobs()
+            numDoneJobs = "unknown"
+        else:
+            doneList = self.findFinishedJobs()
+            jobSlices = grouper(doneList, 10000)
+            numDoneJobs = len(doneList)
+            logging.info("Found %i finished jobs to archive", numDoneJobs)
 
         jobCounter = 0
-        for slicedList in grouper(doneList, 10000):
+        for slicedList in jobSlices:
             self.cleanWorkArea(slicedList)
 
             successList = []
@@ -158,7 +168,9 @@ class JobArchiverPoller(BaseWorkerThread):
             myThread.transaction.commit()
 
             jobCounter += len(slicedList)
-            logging.info("Successfully archived %d jobs out of %d.", jobCounter, len(doneList))
+            logging.info("Successfully archived %d jobs out of %s.", jobCounter, numDoneJobs)
+
+        return jobCounter
 
     def findFinishedJobs(self):
         """
@@ -181,9 +193,31 @@ class JobArchiverPoller(BaseWorkerThread):
             # Then nothing is ready
             return []
 
+        return self.loadJobs(jobList)
+
+    def streamFinishedJobs(self):
+        """
+        _streamFinishedJobs_
+
+        Same as findFinishedJobs, but the job IDs are streamed from the
+        database and the jobs are loaded and yielded in chunks of
+        streamArraySize, such that only one chunk is held in memory.
+        """
+        jobListAction = self.daoFactory(classname="Jobs.GetAllJobs")
+        for state in ("success", "exhausted", "killed"):
+            for jobIDs in jobListAction.execute(state=state, limitRows=self.numberOfJobsToArchive,
+                                                stream=True, arraysize=self.streamArraySize):
+                yield self.loadJobs(jobIDs)
+
+    def loadJobs(self, jobIDs):
+        """
+        _loadJobs_
+
+        Load the given job IDs, with their workflow, as WMBS Job objects.
+        """
         # Put together a list of job IDs
         binds = []
-        for jobID in jobList:
+        for jobID in jobIDs:
             binds.append({"jobid": jobID})
 
         results = self.loadAction.execute(jobID=binds)
@@ -53,27 +53,19 @@ def makedirs(directory):
 
     Implementation of os.makedirs
     You can run subscriptions from the same workflow in separate instances
-    of the JobCreatorWorker.  This exists to make sure that if they collide,
-    a rare but observed possibility, they don't kill everything.
+    of the JobCreatorWorker, or job groups of the same task in the threads of
+    the JobCreatorPoller.  This exists to make sure that if they collide,
+    they don't kill everything: a directory created meanwhile is fine.
     """
 
     try:
-        os.makedirs(directory)
-    except:
-        if not os.path.isdir(directory):
-            # Then it really screwed up
-            msg = "Failed to create directory %s\n" % (directory)
-            msg += str(traceback.format_exc())
-            logging.error(msg)
-            raise CreateWorkAreaException(msg)
-        # Else: the directory exists.  Don't complain, but do mention it
-        else:
-            msg = "Hit error in creating directory %s; ignoring. \n" % (msg)
-            msg += str(traceback.format_exc())
-            msg = "This looks like an error but everything seems to be in place"
-            logging.error(msg)
-
-    return
+        os.makedirs(directory, exist_ok=True)
+    except OSError as ex:
+        # Then it really screwed up
+        msg = "Failed to create directory %s: %s\n" % (directory, str(ex))
+        msg += str(traceback.format_exc())
+        logging.error(msg)
+        raise CreateWorkAreaException(msg)
 
 
 def getMasterName(startDir, wmWorkload=None, workflow=None):
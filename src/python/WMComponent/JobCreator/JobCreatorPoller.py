@@ -11,12 +11,13 @@ import logging
 import os
 import os.path
 import threading
-import pickle
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
 
 from Utils.Timers import timeFunction
-from Utils.PythonVersion import HIGHEST_PICKLE_PROTOCOL
 from Utils.MathUtils import quantize
 from WMComponent.JobCreator.CreateWorkArea import CreateWorkArea
+from WMComponent.JobCreator.JobObjectStore import getJobObjectStore
 from WMCore.WorkerThreads.BaseWorkerThread import BaseWorkerThread
 from WMCore.DAOFactory import DAOFactory
 from WMCore.WMException import WMException
@@ -117,11 +118,12 @@ def capResourceEstimates(jobGroups, constraints):
     return
 
 
-def saveJob(job, thisJobNumber, **kwargs):
+def saveJob(job, thisJobNumber, jobStore=None, **kwargs):
     """
     _saveJob_
 
-    Actually do the mechanics of saving the job to a pickle file
+    Actually do the mechanics of saving the job to the job object store,
+    by default a job.pkl file in the job cache directory
     """
     job['counter'] = thisJobNumber
     job['spec'] = kwargs.get('workflow').spec
@@ -148,19 +150,22 @@ def saveJob(job, thisJobNumber, **kwargs):
     job['physicsTaskType'] = kwargs['physicsTaskType']
     job['campaignName'] = kwargs['campaignName']
 
-    with open(os.path.join(cacheDir, 'job.pkl'), 'wb') as output:
-        pickle.dump(job, output, HIGHEST_PICKLE_PROTOCOL)
+    if jobStore is None:
+        jobStore = getJobObjectStore()
+    jobStore.save(job)
 
     return
 
 
-def creatorProcess(work, jobCacheDir):
+def creatorProcess(work, jobCacheDir, jobStoreType="pickle"):
     """
     _creatorProcess_
 
-    Creator work areas and pickle job objects
+    Creator work areas and store the job objects. The job object store
+    is closed before returning, so the jobs are readable once committed.
     """
     createWorkArea = CreateWorkArea()
+    jobStore = getJobObjectStore(jobStoreType)
 
     try:
         wmbsJobGroup = work.get('jobGroup')
@@ -187,7 +192,8 @@ def creatorProcess(work, jobCacheDir):
         thisJobNumber = work.get('jobNumber', 0)
         for job in wmbsJobGroup.jobs:
             thisJobNumber += 1
-            saveJob(job, thisJobNumber, **work)
+            saveJob(job, thisJobNumber, jobStore=jobStore, **work)
+        jobStore.close()
     except Exception as ex:
         msg = "Exception in processing wmbsJobGroup %i\n. Error: %s" % (wmbsJobGroup.id, str(ex))
         logging.exception(msg)
@@ -335,6 +341,9 @@ class JobCreatorPoller(BaseWorkerThread):
         self.agentNumber = int(getattr(config.Agent, 'agentNumber', 0))
         self.agentName = getattr(config.Agent, 'hostName', '')
         self.glideinLimits = getattr(config.JobCreator, 'GlideInRestriction', None)
+        self.jobStoreType = getattr(config.JobCreator, 'jobObjectStore', 'pickle')
+        # number of threads creating the work areas and job objects, 1 creates them in the poller thread
+        self.creatorThreads = int(getattr(config.JobCreator, 'creatorThreads', 1))
 
         try:
             self.jobCacheDir = getattr(config.JobCreator, 'jobCacheDir',
@@ -411,11 +420,54 @@ class JobCreatorPoller(BaseWorkerThread):
 
         """
         logging.info("Beginning JobCreator.pollSubscriptions() cycle.")
-        myThread = threading.currentThread()
 
         # First, get list of Subscriptions
         subscriptions = self.subscriptionList.execute()
 
+        if self.creatorThreads > 1:
+            # leaving the executor waits for the running groups, so a failure
+            # is only raised (and the transaction rolled back) once they are done
+            with ThreadPoolExecutor(max_workers=self.creatorThreads) as executor:
+                self.processSubscriptions(subscriptions, executor)
+        else:
+            self.processSubscriptions(subscriptions)
+
+        return
+
+    def createJobGroups(self, workList, executor=None):
+        """
+        _createJobGroups_
+
+        Run creatorProcess for each work dictionary and yield the job groups
+        in the same order. With an executor, all the groups are submitted at
+        once, such that the work areas and job objects of the next groups are
+        created while the poller thread records the previous ones in the database.
+        The groups not started yet are cancelled when the generator is closed.
+        """
+        if executor is None:
+            for work in workList:
+                yield creatorProcess(work=work, jobCacheDir=self.jobCacheDir,
+                                     jobStoreType=self.jobStoreType)
+            return
+
+        futures = [executor.submit(creatorProcess, work=work, jobCacheDir=self.jobCacheDir,
+                                   jobStoreType=self.jobStoreType) for work in workList]
+        try:
+            for future in futures:
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def processSubscriptions(self, subscriptions, executor=None):
+        """
+        _processSubscriptions_
+
+        Split the subscriptions one by one and create their jobs, optionally
+        creating the job groups with the given executor.
+        """
+        myThread = threading.currentThread()
+
         # Okay, now we have a list of subscriptions
         for subscriptionID in subscriptions:
             wmbsSubscription = Subscription(id=subscriptionID)
@@ -551,46 +603,45 @@ class JobCreatorPoller(BaseWorkerThread):
                 if self.glideinLimits:
                     capResourceEstimates(wmbsJobGroups, self.glideinLimits)
 
-                nameDictList = []
+                workList = []
                 for wmbsJobGroup in wmbsJobGroups:
                     # For each jobGroup, put a dictionary
                     # together and run it with creatorProcess
-                    jobsInGroup = len(wmbsJobGroup.jobs)
                     wmbsJobGroup.subscription = tempSubscription
                     tempDict = {}
                     tempDict.update(processDict)
                     tempDict['jobGroup'] = wmbsJobGroup
                     tempDict['jobNumber'] = jobNumber
                     tempDict['inputDatasetLocations'] = wmbsJobGroup.getLocationsForJobs()
-
-                    jobGroup = creatorProcess(work=tempDict,
-                                              jobCacheDir=self.jobCacheDir)
-                    jobNumber += jobsInGroup
-
-                    # Set jobCache for group
-                    for job in jobGroup.jobs:
-                        nameDictList.append({'jobid': job['id'],
-                                             'cacheDir': job['cache_dir']})
-                        job["user"] = wmWorkload.getOwner()["name"]
-                        job["group"] = wmWorkload.getOwner()["group"]
-                # Set the caches in the database
-                try:
-                    if len(nameDictList) > 0:
-                        self.setBulkCache.execute(jobDictList=nameDictList,
-                                                  conn=myThread.transaction.conn,
-                                                  transaction=True)
-                except WMException:
-                    raise
-                except Exception as ex:
-                    msg = "Unknown exception while setting the bulk cache:\n"
-                    msg += str(ex)
-                    logging.error(msg)
-                    logging.debug("Error while setting bulkCache with following values: %s\n", nameDictList)
-                    raise JobCreatorException(msg)
-
-                # Advance the jobGroup in changeState
-                for wmbsJobGroup in wmbsJobGroups:
-                    self.advanceJobGroup(wmbsJobGroup=wmbsJobGroup)
+                    workList.append(tempDict)
+                    jobNumber += len(wmbsJobGroup.jobs)
+
+                with closing(self.createJobGroups(workList, executor)) as jobGroups:
+                    for jobGroup in jobGroups:
+                        # Set jobCache for group
+                        nameDictList = []
+                        for job in jobGroup.jobs:
+                            nameDictList.append({'jobid': job['id'],
+                                                 'cacheDir': job['cache_dir']})
+                            job["user"] = wmWorkload.getOwner()["name"]
+                            job["group"] = wmWorkload.getOwner()["group"]
+                        # Set the caches in the database
+                        try:
+                            if len(nameDictList) > 0:
+                                self.setBulkCache.execute(jobDictList=nameDictList,
+                                                          conn=myThread.transaction.conn,
+                                                          transaction=True)
+                        except WMException:
+                            raise
+                        except Exception as ex:
+                            msg = "Unknown exception while setting the bulk cache:\n"
+                            msg += str(ex)
+                            logging.error(msg)
+                            logging.debug("Error while setting bulkCache with following values: %s\n", nameDictList)
+                            raise JobCreatorException(msg)
+
+                        # Advance the jobGroup in changeState
+                        self.advanceJobGroup(wmbsJobGroup=jobGroup)
 
                 # Now end the transaction so that everything is wrapped
                 # in a single rollback
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+"""
+_JobObjectStore_
+
+Storage for the job objects created by the JobCreator and loaded by the
+JobSubmitter. Two stores are available:
+  * pickle: one job.pkl file in the cache directory of every job (default)
+  * collection: the jobs of a JobCollection directory are appended to a
+    single data file, with an index of the offset and size of every job
+
+The JobObjectReader loads jobs from either of them, falling back to the
+job.pkl file when a job is not indexed in its collection.
+"""
+
+import logging
+import os
+import pickle
+
+from Utils.PythonVersion import HIGHEST_PICKLE_PROTOCOL
+from WMCore.WMException import WMException
+
+JOB_PICKLE = "job.pkl"
+COLLECTION_DATA = "JobObjects.pkl"
+COLLECTION_INDEX = "JobObjects.idx"
+
+
+class JobObjectStoreException(WMException):
+    """
+    _JobObjectStoreException_
+
+    Raised when a job object can't be read back from its store.
+    """
+
+
+class JobPickleStore(object):
+    """
+    _JobPickleStore_
+
+    Pickle every job into its own job.pkl file.
+    """
+
+    def save(self, job):
+        """
+        Pickle the job in its cache directory
+        """
+        with open(os.path.join(job['cache_dir'], JOB_PICKLE), 'wb') as output:
+            pickle.dump(job, output, HIGHEST_PICKLE_PROTOCOL)
+
+    def close(self):
+        """
+        Nothing to flush
+        """
+        return
+
+
+class JobCollectionStore(object):
+    """
+    _JobCollectionStore_
+
+    Append the pickled jobs to a single data file per JobCollection
+    directory. Every job adds a "jobID offset size" line to the index file
+    of the collection. The data files are closed before the index files,
+    and close() must be called before the jobs are committed to WMBS.
+    """
+
+    def __init__(self):
+        self.handles = {}
+
+    def save(self, job):
+        """
+        Append the job to the data file of its collection
+        """
+        collectionDir = os.path.dirname(job['cache_dir'])
+        if collectionDir not in self.handles:
+            self.handles[collectionDir] = (open(os.path.join(collectionDir, COLLECTION_DATA), 'ab'),
+                                           open(os.path.join(collectionDir, COLLECTION_INDEX), 'a'))
+        dataFile, indexFile = self.handles[collectionDir]
+
+        data = pickle.dumps(job, HIGHEST_PICKLE_PROTOCOL)
+        offset = dataFile.tell()
+        dataFile.write(data)
+        indexFile.write("%d %d %d\n" % (job['id'], offset, len(data)))
+
+    def close(self):
+        """
+        Flush and close the data and index files of every collection
+        """
+        for dataFile, indexFile in self.handles.values():
+            dataFile.close()
+            indexFile.close()
+        self.handles = {}
+
+
+def getJobObjectStore(storeType="pickle"):
+    """
+    _getJobObjectStore_
+
+    Return a new job object store of the given type
+    """
+    if storeType == "pickle":
+        return JobPickleStore()
+    elif storeType == "collection":
+        return JobCollectionStore()
+    raise JobObjectStoreException("Unknown job object store type: %s" % storeType)
+
+
+class JobObjectReader(object):
+    """
+    _JobObjectReader_
+
+    Load job objects from their collection store, or from their job.pkl file.
+    Collection indexes and data files are kept open until clear() is called,
+    so loading many jobs of the same collection costs a seek and a read each.
+    """
+
+    def __init__(self, maxOpenFiles=100):
+        self.maxOpenFiles = maxOpenFiles
+        self.indexes = {}
+        self.dataFiles = {}
+
+    def clear(self):
+        """
+        Close the data files and forget the indexes, such that jobs
+        appended to the collections afterwards can be found
+        """
+        for dataFile in self.dataFiles.values():
+            dataFile.close()
+        self.dataFiles = {}
+        self.indexes = {}
+
+    def _loadIndex(self, collectionDir):
+        """
+        Read the index of a collection, if it has any
+        """
+        index = {}
+        indexPath = os.path.join(collectionDir, COLLECTION_INDEX)
+        if os.path.isfile(indexPath):
+            with open(indexPath, 'r') as indexFile:
+                for line in indexFile:
+                    fields = line.split()
+                    if len(fields) == 3:
+                        index[int(fields[0])] = (int(fields[1]), int(fields[2]))
+        self.indexes[collectionDir] = index
+        return index
+
+    def _readCollection(self, collectionDir, offset, size):
+        """
+        Read the pickled job at the given offset of a collection data file
+        """
+        if collectionDir not in self.dataFiles:
+            if len(self.dataFiles) >= self.maxOpenFiles:
+                for dataFile in self.dataFiles.values():
+                    dataFile.close()
+                self.dataFiles = {}
+            self.dataFiles[collectionDir] = open(os.path.join(collectionDir, COLLECTION_DATA), 'rb')
+        dataFile = self.dataFiles[collectionDir]
+        dataFile.seek(offset)
+        data = dataFile.read(size)
+        if len(data) != size:
+            raise JobObjectStoreException("Truncated job object in %s at offset %d" % (collectionDir, offset))
+        return pickle.loads(data)
+
+    def load(self, cacheDir, jobID):
+        """
+        _load_
+
+        Return the job object of the given job cache directory and ID, or
+        None if it can't be found. Raise JobObjectStoreException if it is
+        found but can't be loaded.
+        """
+        collectionDir = os.path.dirname(cacheDir)
+        index = self.indexes.get(collectionDir)
+        if index is None or (index and jobID not in index):
+            index = self._loadIndex(collectionDir)
+
+        try:
+            if jobID in index:
+                return self._readCollection(collectionDir, *index[jobID])
+
+            pickledJobPath = os.path.join(cacheDir, JOB_PICKLE)
+            if not os.path.isfile(pickledJobPath):
+                return None
+            with open(pickledJobPath, 'rb') as jobHandle:
+                return pickle.load(jobHandle)
+        except JobObjectStoreException:
+            raise
+        except Exception as ex:
+            logging.warning("Failed to load job object %s from %s: %s", jobID, cacheDir, str(ex))
+            raise JobObjectStoreException("Failed to load job object %s from %s" % (jobID, cacheDir))
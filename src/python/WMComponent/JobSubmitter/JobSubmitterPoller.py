@@ -17,7 +17,7 @@ import threading
 import json
 import time
 from collections import defaultdict, Counter
-import pickle
+from itertools import chain
 
 from Utils.Timers import timeFunction
 from WMCore.DAOFactory import DAOFactory
@@ -33,9 +33,38 @@ from WMCore.BossAir.BossAirAPI import BossAirAPI
 from WMCore.Services.ReqMgr.ReqMgr import ReqMgr
 from WMCore.Services.ReqMgrAux.ReqMgrAux import ReqMgrAux
 
+from WMComponent.JobCreator.JobObjectStore import JobObjectReader, JobObjectStoreException
 from WMComponent.JobSubmitter.JobSubmitAPI import availableScheddSlots
 
 
+def timedIterator(iterable, timings, key):
+    """
+    Iterate over iterable, adding the time spent waiting for each
+    item to timings[key]
+    """
+    iterator = iter(iterable)
+    while True:
+        startTime = time.time()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            timings[key] += time.time() - startTime
+            return
+        timings[key] += time.time() - startTime
+        yield item
+
+
+def countedIterator(iterable, counter):
+    """
+    Iterate over the jobs in iterable, keeping their number and the
+    last job ID in counter
+    """
+    for item in iterable:
+        counter['rows'] += 1
+        counter['lastId'] = item['id']
+        yield item
+
+
 def jobSubmitCondition(jobStats):
     for jobInfo in jobStats:
         if jobInfo["Current"] >= jobInfo["Threshold"]:
@@ -82,6 +111,13 @@ class JobSubmitterPoller(BaseWorkerThread):
         self.maxJobsThisCycle = self.maxJobsPerPoll  # changes as per schedd limit
         self.cacheRefreshSize = int(getattr(self.config.JobSubmitter, 'cacheRefreshSize', 30000))
         self.skipRefreshCount = int(getattr(self.config.JobSubmitter, 'skipRefreshCount', 20))
+        # stream the created jobs from the database in chunks of this size (0 loads them all at once)
+        self.streamArraySize = int(getattr(self.config.JobSubmitter, 'streamArraySize', 0))
+        # only fetch the jobs created (or retried) since the previous refresh, with a full refresh every
+        # fullRefreshCycles refreshes to purge the jobs that left the created state behind our back
+        self.incrementalRefresh = getattr(self.config.JobSubmitter, 'incrementalRefresh', False)
+        self.fullRefreshCycles = int(getattr(self.config.JobSubmitter, 'fullRefreshCycles', 10))
+        self.refreshTimeMargin = int(getattr(self.config.JobSubmitter, 'refreshTimeMargin', 600))
         self.packageSize = getattr(self.config.JobSubmitter, 'packageSize', 500)
         self.collSize = getattr(self.config.JobSubmitter, 'collectionSize', self.packageSize * 1000)
         self.maxTaskPriority = getattr(self.config.BossAir, 'maxTaskPriority', 1e7)
@@ -102,6 +138,15 @@ class JobSubmitterPoller(BaseWorkerThread):
         self.drainSitesSet = set()
         self.abortSites = set()
         self.refreshPollingCount = 0
+        self.refreshCount = 0
+        self.jobIdHighWaterMark = None
+        # job ID range left to page through after a full refresh truncated by maxJobsToCache
+        self.backfillJobId = None
+        self.backfillMaxJobId = None
+        self.lastRefreshTime = None
+        self.refreshSummary = None
+        # loads the job objects written by the JobCreator, either job.pkl or collection files
+        self.jobObjectReader = JobObjectReader()
 
         try:
             if not getattr(self.config.JobSubmitter, 'submitDir', None):
@@ -120,6 +165,7 @@ class JobSubmitterPoller(BaseWorkerThread):
 
         # Now the DAOs
         self.listJobsAction = self.daoFactory(classname="Jobs.ListForSubmitter")
+        self.maxJobIdAction = self.daoFactory(classname="Jobs.GetMaxIdByState")
         self.setLocationAction = self.daoFactory(classname="Jobs.SetLocation")
         self.locationAction = self.daoFactory(classname="Locations.GetSiteInfo")
         self.setFWJRPathAction = self.daoFactory(classname="Jobs.SetFWJRPath")
@@ -267,58 +313,97 @@ class JobSubmitterPoller(BaseWorkerThread):
           - Batch ID
           - Path to sanbox
           - Path to cache directory
+
+        In incremental mode, only the jobs with an ID above the highest one
+        seen so far, or that entered the created state since the previous
+        refresh (retries), are queried; jobs that left the created state are
+        only purged from the cache by the periodic full refreshes. When a full
+        refresh is truncated by maxJobsToCache, the jobs it cut off are paged
+        through by ascending ID as the cache makes room for them.
         """
         # make a counter for jobs pending to sites in drain mode within the grace period
         countDrainingJobs = 0
         timeNow = int(time.time())
         badJobs = dict([(x, []) for x in range(71101, 71106)])
         newJobIds = set()
+        maxJobId = None
+        timings = {'query': 0.0, 'load': 0.0, 'locations': 0.0}
+
+        fullRefresh = not self.incrementalRefresh or self.jobIdHighWaterMark is None or \
+            self.refreshCount % self.fullRefreshCycles == 0
+        self.refreshCount += 1
+        queryArgs = {}
+        if not fullRefresh:
+            queryArgs = {'minJobId': self.jobIdHighWaterMark,
+                         'minStateTime': self.lastRefreshTime - self.refreshTimeMargin}
 
-        logging.info("Refreshing priority cache with currently %i jobs", len(self.jobDataCache))
+        logging.info("Refreshing priority cache (%s) with currently %i jobs",
+                     "full" if fullRefresh else "incremental", len(self.jobDataCache))
 
-        newJobs = self.listJobsAction.execute(limitRows=self.maxJobsToCache)
         if self.useReqMgrForCompletionCheck:
             # if reqmgr is used (not Tier0 Agent) get the aborted/forceCompleted record
             abortedAndForceCompleteRequests = self.abortedAndForceCompleteWorkflowCache.getData()
         else:
             abortedAndForceCompleteRequests = []
 
-        logging.info("Found %s new jobs to be submitted.", len(newJobs))
+        newJobs, numNewJobs = self._listCreatedJobs(self.maxJobsToCache, timings, **queryArgs)
+        if self.streamArraySize:
+            logging.info("Streaming new jobs to be submitted in chunks of %d.", self.streamArraySize)
+        else:
+            logging.info("Found %s new jobs to be submitted.", numNewJobs)
+
+        backfill = None
+        if not fullRefresh and self.backfillJobId is not None:
+            backfill = {'room': self.maxJobsToCache - len(self.jobDataCache), 'rows': 0,
+                        'lastId': self.backfillJobId}
+            if backfill['room'] > 0:
+                backfillJobs, numBackfillJobs = self._listCreatedJobs(backfill['room'], timings,
+                                                                      minJobId=self.backfillJobId,
+                                                                      maxJobId=self.backfillMaxJobId)
+                logging.info("Paging through the jobs cut off by maxJobsToCache, from job ID %d to %d.",
+                             self.backfillJobId, self.backfillMaxJobId)
+                newJobs = chain(newJobs, countedIterator(backfillJobs, backfill))
+                if not self.streamArraySize:
+                    numNewJobs += numBackfillJobs
 
         if self.enableAllSites:
             logging.info("Agent is in speed drain mode. Submitting jobs to all possible locations.")
 
         logging.info("Determining possible sites for new jobs...")
         jobCount = 0
+        queryTime = timings['query']
+        loopStartTime = time.time()
         for newJob in newJobs:
             jobCount += 1
             if jobCount % 5000 == 0:
-                logging.info("Processed %d/%d new jobs.", jobCount, len(newJobs))
+                logging.info("Processed %d/%s new jobs.", jobCount, numNewJobs)
+
+            jobID = newJob['id']
+            if maxJobId is None or jobID > maxJobId:
+                maxJobId = jobID
 
             # whether newJob belongs to aborted or force-complete workflow, and skip it if it is.
             if newJob['request_name'] in abortedAndForceCompleteRequests and \
                             newJob['task_type'] not in ['LogCollect', "Cleanup"]:
                 continue
 
-            jobID = newJob['id']
             newJobIds.add(jobID)
             if jobID in self.jobDataCache:
                 continue
 
-            pickledJobPath = os.path.join(newJob["cache_dir"], "job.pkl")
-
-            if not os.path.isfile(pickledJobPath):
-                # Then we have a problem - there's no file
-                logging.warning("Could not find pickled jobObject %s", pickledJobPath)
-                badJobs[71104].append(newJob)
-                continue
             try:
-                with open(pickledJobPath, 'rb') as jobHandle:
-                    loadedJob = pickle.load(jobHandle)
-            except Exception as ex:
-                logging.warning("Failed to load job pickle object %s", pickledJobPath)
+                startTime = time.time()
+                loadedJob = self.jobObjectReader.load(newJob["cache_dir"], jobID)
+                timings['load'] += time.time() - startTime
+            except JobObjectStoreException:
+                logging.warning("Failed to load job object for job %s in %s", jobID, newJob["cache_dir"])
                 badJobs[71105].append(newJob)
                 continue
+            if loadedJob is None:
+                # Then we have a problem - there's no file
+                logging.warning("Could not find job object for job %s in %s", jobID, newJob["cache_dir"])
+                badJobs[71104].append(newJob)
+                continue
 
             # figure out possible locations for job
             possibleLocations = loadedJob["possiblePSN"]
@@ -416,6 +501,12 @@ class JobSubmitterPoller(BaseWorkerThread):
 
             self.jobDataCache[jobID] = jobInfo
 
+        # anything else spent in the loop, but the streamed fetches, is the location computation
+        timings['locations'] = time.time() - loopStartTime - timings['load'] - (timings['query'] - queryTime)
+
+        # close the job collection files, they are re-indexed in the next cycle
+        self.jobObjectReader.clear()
+
         # Register failures in submission
         for errorCode in badJobs:
             if badJobs[errorCode] and errorCode in [71101, 71102, 71103]:
@@ -430,15 +521,59 @@ class JobSubmitterPoller(BaseWorkerThread):
         # Persist remaining job packages to disk
         self.flushJobPackages()
 
-        # We need to remove any jobs from the cache that were not returned in
-        # the last call to the database.
-        jobIDsToPurge = set(self.jobDataCache.keys()) - newJobIds
-        self._purgeJobsFromCache(jobIDsToPurge)
-
+        if fullRefresh:
+            # We need to remove any jobs from the cache that were not returned in
+            # the last call to the database.
+            jobIDsToPurge = set(self.jobDataCache.keys()) - newJobIds
+            self._purgeJobsFromCache(jobIDsToPurge)
+            self.backfillJobId = None
+            if self.maxJobsToCache and jobCount >= self.maxJobsToCache:
+                # the jobs cut off by maxJobsToCache are sorted by priority, not by ID,
+                # so they can have lower IDs than the ones cached: carry on from the
+                # highest created job ID, and page through the IDs below it
+                self.jobIdHighWaterMark = self.maxJobIdAction.execute("created") or maxJobId
+                self.backfillJobId = 0
+                self.backfillMaxJobId = self.jobIdHighWaterMark
+            elif maxJobId is not None:
+                self.jobIdHighWaterMark = maxJobId
+        else:
+            if maxJobId is not None:
+                self.jobIdHighWaterMark = max(self.jobIdHighWaterMark, maxJobId)
+            if backfill and backfill['room'] > 0:
+                # a page shorter than the room left is the last one
+                self.backfillJobId = backfill['lastId'] if backfill['rows'] >= backfill['room'] else None
+        self.lastRefreshTime = timeNow
+
+        self.refreshSummary = "%s refresh of %d jobs: query %.3f, load %.3f, locations %.3f secs" % \
+                              ("full" if fullRefresh else "incremental", jobCount,
+                               timings['query'], timings['load'], timings['locations'])
+        logging.info("Done with the %s", self.refreshSummary)
         logging.info("Found %d jobs pending to sites in drain within the grace period", countDrainingJobs)
         logging.info("Done pruning killed jobs, moving on to submit.")
         return
 
+    def _listCreatedJobs(self, limitRows, timings, **queryArgs):
+        """
+        _listCreatedJobs_
+
+        List at most limitRows jobs in the created state, streamed in chunks
+        of streamArraySize if set. Return the jobs and their number, unknown
+        when they are streamed.
+        """
+        startTime = time.time()
+        if self.streamArraySize:
+            jobs = chain.from_iterable(timedIterator(self.listJobsAction.execute(limitRows=limitRows,
+                                                                                 stream=True,
+                                                                                 arraysize=self.streamArraySize,
+                                                                                 **queryArgs),
+                                                     timings, 'query'))
+            numJobs = "unknown"
+        else:
+            jobs = self.listJobsAction.execute(limitRows=limitRows, **queryArgs)
+            numJobs = len(jobs)
+        timings['query'] += time.time() - startTime
+        return jobs, numJobs
+
     def failJobDrain(self, timeNow, possibleLocations):
         """
         Check whether sites are in drain for too long such that the job
@@ -796,6 +931,8 @@ class JobSubmitterPoller(BaseWorkerThread):
         1) Refresh the cache
         2) Find jobs for all the necessary sites
         3) Submit the jobs to the plugin
+
+        Returns the cache refresh timings, recorded in the worker heartbeat.
         """
         myThread = threading.currentThread()
 
@@ -823,11 +960,13 @@ class JobSubmitterPoller(BaseWorkerThread):
         try:
             myThread.logdbClient.delete("JobSubmitter_submitWork", "warning", this_thread=True)
             self.getThresholds()
+            self.refreshSummary = "cache refresh skipped"
             if self.hasToRefreshCache():
                 self.refreshCache()
 
             jobsToSubmit = self.assignJobLocations()
             self.submitJobs(jobsToSubmit=jobsToSubmit)
+            self.cycleWork = sum(len(jobs) for jobs in jobsToSubmit.values())
         except WMException:
             if getattr(myThread, 'transaction', None) is not None:
                 myThread.transaction.rollback()
@@ -842,7 +981,8 @@ class JobSubmitterPoller(BaseWorkerThread):
                 myThread.transaction.rollback()
             raise JobSubmitterPollerException(msg)
 
-        return
+        # reported as the outcome of this cycle in the worker heartbeat
+        return self.refreshSummary
 
     def passSubmitConditions(self):
         """
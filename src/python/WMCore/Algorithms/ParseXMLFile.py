@@ -4,7 +4,8 @@
 _ParseXMLFile_
 
 This holds the methods used to take an xmlFilename and return a tree structure.
-Used for the expat xml parsers
+Used for the expat xml parsers, and for the ElementTree iterparse based
+streaming of large files
 
 """
 
@@ -12,6 +13,7 @@ from builtins import next, str, object
 from future.utils import viewitems
 
 import xml.parsers.expat
+from xml.etree.ElementTree import iterparse
 
 class Node(object):
     """
@@ -113,3 +115,61 @@ def build(topNode):
             nodeStack[-1].text = str(''.join(charCache)).strip()
             nodeStack.pop()
             charCache = []
+
+
+def checkXMLFile(reportFile):
+    """
+    _checkXMLFile_
+
+    Run expat over the XML file without building anything, such that
+    a malformed file is rejected before any of it is processed
+
+    """
+    parser = xml.parsers.expat.ParserCreate()
+    with open(reportFile, 'rb') as f:
+        parser.ParseFile(f)
+
+
+def elementToNode(element):
+    """
+    _elementToNode_
+
+    Convert an ElementTree element and its children into a Node structure
+    identical to the one built from the expat events
+
+    """
+    node = Node(element.tag, element.attrib)
+    # as in build, the text of a node is the character data after its last child
+    if len(element):
+        text = element[-1].tail
+    else:
+        text = element.text
+    node.text = str(text or '').strip()
+    node.children = [elementToNode(child) for child in element]
+    return node
+
+
+def xmlFileToNodeStream(reportFile):
+    """
+    _xmlFileToNodeStream_
+
+    Use iterparse to stream the XML file, yielding a (root, child) pair of
+    nodes for every child of the root element as soon as it has been parsed.
+    The root node has no children and the parsed elements are cleared, so
+    only one child of the root element is held in memory at a time.
+
+    """
+    depth = 0
+    root = rootNode = None
+    for event, element in iterparse(reportFile, events=("start", "end")):
+        if event == "start":
+            depth += 1
+            if depth == 1:
+                root = element
+                rootNode = Node(element.tag, element.attrib)
+            continue
+
+        depth -= 1
+        if depth == 1:
+            yield rootNode, elementToNode(element)
+            root.clear()
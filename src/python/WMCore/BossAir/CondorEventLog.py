@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+"""
+_CondorEventLog_
+
+Incremental reader of the HTCondor schedd event log (EVENT_LOG knob).
+
+The schedd writes every job event to its event log, in the classic user log
+format unless EVENT_LOG_USE_XML is set. The reader remembers where it stopped
+reading, so every call only returns the events written since the previous one,
+following the log through its rotations (EventLog -> EventLog.old).
+
+Classic events look like:
+  001 (1234.000.000) 2024-03-01 10:05:00 Job executing on host: <...>
+  ...
+and the job ad information events (028) carry the JobAdInformationAttrs of
+the job as "Name = value" lines, in particular JobStatus and the site where
+the job runs (MachineAttrGLIDEIN_CMSSite0).
+"""
+
+import logging
+import os
+import re
+
+# separator ending every event
+EVENT_END = b"...\n"
+
+EVENT_HEADER_REGEXP = re.compile(r"^(\d{3}) \((\d+)\.(\d+)\.(\d+)\) (\S+ \S+) (.*)$")
+EVENT_ATTR_REGEXP = re.compile(r"^(\w+) = (.*)$")
+
+JOB_AD_INFORMATION_EVENT = 28
+
+# status of the jobs after each event, named as in SimpleCondorPlugin.exitCodeMap
+EVENT_STATUS = {0: 'Idle',  # submit
+                1: 'Running',  # execute
+                4: 'Idle',  # evicted
+                5: 'Completed',  # terminated
+                9: 'Removed',  # aborted
+                10: 'Suspended',  # suspended
+                11: 'Running',  # unsuspended
+                12: 'Held',  # held
+                13: 'Idle',  # released
+                24: 'Idle'}  # reconnect failed
+
+JOB_STATUS = {0: 'Unknown',
+              1: 'Idle',
+              2: 'Running',
+              3: 'Removed',
+              4: 'Completed',
+              5: 'Held',
+              6: 'TransferOutput',
+              7: 'Suspended'}
+
+
+def parseValue(value):
+    """
+    Convert a classad literal of the event log to the python value
+    """
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return value[1:-1]
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def parseEvent(text):
+    """
+    _parseEvent_
+
+    Parse the text of a single classic event. Return a dictionary with the
+    EventTypeNumber, the GridId (cluster.proc), the EventTime, the
+    description and the attributes of the job ad information events, or
+    None for text that is not an event.
+    """
+    lines = text.splitlines()
+    match = EVENT_HEADER_REGEXP.match(lines[0]) if lines else None
+    if not match:
+        return None
+    event = {'EventTypeNumber': int(match.group(1)),
+             'GridId': "%d.%d" % (int(match.group(2)), int(match.group(3))),
+             'EventTime': match.group(5),
+             'Description': match.group(6)}
+    if event['EventTypeNumber'] == JOB_AD_INFORMATION_EVENT:
+        for line in lines[1:]:
+            attrMatch = EVENT_ATTR_REGEXP.match(line)
+            if attrMatch and attrMatch.group(1) not in event:
+                event[attrMatch.group(1)] = parseValue(attrMatch.group(2))
+    return event
+
+
+def parseEvents(data):
+    """
+    _parseEvents_
+
+    Parse all the events of a chunk of the event log
+    """
+    events = []
+    for text in data.decode("utf-8", "replace").split(EVENT_END.decode()):
+        event = parseEvent(text.strip("\n"))
+        if event is not None:
+            events.append(event)
+    return events
+
+
+def getJobStates(events, jobStates=None):
+    """
+    _getJobStates_
+
+    Apply the events, in order, to the dictionary of job states keyed by
+    grid id, with (status, location) values named as the SimpleCondorPlugin
+    job info. Return the updated dictionary.
+    """
+    jobStates = {} if jobStates is None else jobStates
+    for event in events:
+        gridId = event['GridId']
+        status, location = jobStates.get(gridId, (None, None))
+        if event['EventTypeNumber'] == JOB_AD_INFORMATION_EVENT:
+            status = JOB_STATUS.get(event.get('JobStatus'), status)
+            location = event.get('MachineAttrGLIDEIN_CMSSite0', location)
+        elif event['EventTypeNumber'] in EVENT_STATUS:
+            status = EVENT_STATUS[event['EventTypeNumber']]
+        else:
+            continue
+        if status is not None:
+            jobStates[gridId] = (status, location)
+    return jobStates
+
+
+class CondorEventLogReader(object):
+    """
+    _CondorEventLogReader_
+
+    Read the events added to the event log since the previous read
+    """
+
+    def __init__(self, path, rotatedSuffix=".old"):
+        self.path = path
+        self.rotatedPath = path + rotatedSuffix
+        self.inode = None
+        self.offset = 0
+        # whether events may have been missed since the last call to reset
+        self.lostEvents = False
+
+    @staticmethod
+    def _readChunk(path, offset):
+        """
+        Read the complete events of a file from the offset.
+        Return the data read and the offset after the last event.
+        """
+        with open(path, 'rb') as fd:
+            fd.seek(offset)
+            data = fd.read()
+        # the last event may still be being written
+        end = data.rfind(EVENT_END)
+        if end < 0:
+            return b"", offset
+        end += len(EVENT_END)
+        return data[:end], offset + end
+
+    def readEvents(self):
+        """
+        _readEvents_
+
+        Return the list of events written since the previous call
+        """
+        try:
+            stat = os.stat(self.path)
+        except OSError as ex:
+            logging.warning("Cannot access the condor event log %s: %s", self.path, str(ex))
+            self.lostEvents = True
+            return []
+
+        events = []
+        if self.inode is not None and stat.st_ino != self.inode:
+            # the log was rotated, finish reading the previous one
+            try:
+                if os.stat(self.rotatedPath).st_ino == self.inode:
+                    events.extend(parseEvents(self._readChunk(self.rotatedPath, self.offset)[0]))
+                else:
+                    self.lostEvents = True
+            except OSError:
+                self.lostEvents = True
+            self.offset = 0
+        elif stat.st_size < self.offset:
+            # truncated
+            self.lostEvents = True
+            self.offset = 0
+        self.inode = stat.st_ino
+
+        data, self.offset = self._readChunk(self.path, self.offset)
+        events.extend(parseEvents(data))
+        return events
+
+    def reset(self):
+        """
+        _reset_
+
+        Skip all the events written so far, e.g. before querying the
+        state of all the jobs from the schedd.
+        """
+        try:
+            stat = os.stat(self.path)
+        except OSError as ex:
+            logging.warning("Cannot access the condor event log %s: %s", self.path, str(ex))
+            self.inode = None
+            self.offset = 0
+            self.lostEvents = True
+            return
+        self.inode = stat.st_ino
+        # start after the last complete event
+        self.offset = stat.st_size
+        with open(self.path, 'rb') as fd:
+            while self.offset > 0:
+                start = max(self.offset - 65536, 0)
+                fd.seek(start)
+                end = fd.read(self.offset - start + len(EVENT_END)).rfind(EVENT_END)
+                if end >= 0:
+                    self.offset = start + end + len(EVENT_END)
+                    break
+                self.offset = start
+        self.lostEvents = False
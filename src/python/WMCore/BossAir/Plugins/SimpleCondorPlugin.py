@@ -14,6 +14,7 @@ import htcondor
 
 from Utils import FileTools
 from Utils.IteratorTools import grouper
+from WMCore.BossAir.CondorEventLog import CondorEventLogReader, getJobStates
 from WMCore.BossAir.Plugins.BasePlugin import BasePlugin
 from WMCore.Credential.Proxy import Proxy
 from WMCore.DAOFactory import DAOFactory
@@ -135,6 +136,20 @@ class SimpleCondorPlugin(BasePlugin):
         proxy = Proxy({'logger': myThread.logger})
         self.x509userproxy = proxy.getProxyFilename()
 
+        # Job tracking: either query the classAds of all the jobs every cycle ("full")
+        # or only read their state changes from the schedd event log ("eventlog"),
+        # querying all the classAds again every condorFullTrackingInterval seconds
+        self.eventLogReader = None
+        self.jobInfo = {}
+        self.lastFullTracking = 0
+        self.fullTrackingInterval = getattr(config.BossAir, 'condorFullTrackingInterval', 3600)
+        if getattr(config.BossAir, 'condorTrackingMode', 'full') == 'eventlog':
+            eventLog = getattr(config.BossAir, 'condorEventLog', None) or htcondor.param.get('EVENT_LOG')
+            if eventLog:
+                self.eventLogReader = CondorEventLogReader(eventLog)
+            else:
+                logging.warning("The schedd has no EVENT_LOG, tracking jobs with full classAd queries")
+
         # These are added now by the condor client
         #self.x509userproxysubject = proxy.getSubject()
         #self.x509userproxyfqan = proxy.getAttributeFromProxy(self.x509userproxy)
@@ -197,7 +212,6 @@ class SimpleCondorPlugin(BasePlugin):
         Second, the jobs that need to be changed
         Third, the jobs that need to be completed
         """
-        jobInfo = {}
         changeList = []
         completeList = []
         runningList = []
@@ -205,34 +219,33 @@ class SimpleCondorPlugin(BasePlugin):
         # get info about all active and recent jobs
         logging.debug("SimpleCondorPlugin is going to track %s jobs", len(jobs))
 
-        schedd = htcondor.Schedd()
-
-        logging.debug("Start: Retrieving classAds using Condor Python XQuery")
-        try:
-            itobj = schedd.xquery("WMAgent_AgentName == %s" % classad.quote(self.agent),
-                                  ['ClusterId', 'ProcId', 'JobStatus', 'MachineAttrGLIDEIN_CMSSite0'])
-            for jobAd in itobj:
-                gridId = "%s.%s" % (jobAd['ClusterId'], jobAd['ProcId'])
-                jobStatus = SimpleCondorPlugin.exitCodeMap().get(jobAd.get('JobStatus'), 'Unknown')
-                location = jobAd.get('MachineAttrGLIDEIN_CMSSite0', None)
-                jobInfo[gridId] = (jobStatus, location)
-        except Exception as ex:
-            logging.error("Query to condor schedd failed in SimpleCondorPlugin.")
-            logging.error("Returning empty lists for all job types...")
-            logging.exception(ex)
-            return runningList, changeList, completeList
-
-        logging.debug("Finished retrieving %d classAds from Condor", len(jobInfo))
+        fullTracking = True
+        if self.eventLogReader and not self.eventLogReader.lostEvents and \
+                time.time() - self.lastFullTracking < self.fullTrackingInterval:
+            events = self.eventLogReader.readEvents()
+            if not self.eventLogReader.lostEvents:
+                jobInfo = getJobStates(events, self.jobInfo)
+                fullTracking = False
+                logging.debug("Read %d events from the condor event log", len(events))
+
+        if fullTracking:
+            jobInfo = self.getJobInfo()
+            if jobInfo is None:
+                logging.error("Returning empty lists for all job types...")
+                return runningList, changeList, completeList
 
         # now go over the jobs and see what we have
         for job in jobs:
 
             # if the schedd doesn't know a job, consider it complete
             # doing any further checks is not cost effective
-            if job['gridid'] not in jobInfo:
+            # (when tracking from the event log, jobs without events did not change)
+            if job['gridid'] in jobInfo:
+                (newStatus, location) = jobInfo[job['gridid']]
+            elif fullTracking:
                 (newStatus, location) = ('Completed', None)
             else:
-                (newStatus, location) = jobInfo[job['gridid']]
+                (newStatus, location) = (job['status'], None)
 
             # check for status changes
             if newStatus != job['status']:
@@ -258,11 +271,57 @@ class SimpleCondorPlugin(BasePlugin):
             else:
                 runningList.append(job)
 
+        # finished jobs are not tracked anymore
+        if self.eventLogReader:
+            for job in completeList:
+                self.jobInfo.pop(job['gridid'], None)
+
         logging.debug("SimpleCondorPlugin tracking : %i/%i/%i (Executing/Changing/Complete)",
                       len(runningList), len(changeList), len(completeList))
 
         return runningList, changeList, completeList
 
+    def getJobInfo(self):
+        """
+        _getJobInfo_
+
+        Query the status and location of all the jobs of the agent from the schedd.
+        Return a dictionary of (status, location) keyed by grid id, or None if the
+        query failed.
+        """
+        jobInfo = {}
+
+        # the events up to now are superseded by the query results
+        if self.eventLogReader:
+            self.eventLogReader.reset()
+
+        schedd = htcondor.Schedd()
+
+        logging.debug("Start: Retrieving classAds using Condor Python XQuery")
+        try:
+            itobj = schedd.xquery("WMAgent_AgentName == %s" % classad.quote(self.agent),
+                                  ['ClusterId', 'ProcId', 'JobStatus', 'MachineAttrGLIDEIN_CMSSite0'])
+            for jobAd in itobj:
+                gridId = "%s.%s" % (jobAd['ClusterId'], jobAd['ProcId'])
+                jobStatus = SimpleCondorPlugin.exitCodeMap().get(jobAd.get('JobStatus'), 'Unknown')
+                location = jobAd.get('MachineAttrGLIDEIN_CMSSite0', None)
+                jobInfo[gridId] = (jobStatus, location)
+        except Exception as ex:
+            logging.error("Query to condor schedd failed in SimpleCondorPlugin.")
+            logging.exception(ex)
+            if self.eventLogReader:
+                # query again on the next cycle
+                self.eventLogReader.lostEvents = True
+            return None
+
+        logging.debug("Finished retrieving %d classAds from Condor", len(jobInfo))
+
+        if self.eventLogReader:
+            self.jobInfo = jobInfo
+            self.lastFullTracking = time.time()
+
+        return jobInfo
+
     def complete(self, jobs):
         """
         Do any completion work required
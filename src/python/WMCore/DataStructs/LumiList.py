@@ -20,13 +20,99 @@ from future.utils import viewitems
 from future import standard_library
 standard_library.install_aliases()
 
-import copy
-import itertools
+import bisect
 import json
 import re
 import urllib.request
+from array import array
 from contextlib import closing
 
+
+def _appendInterval(starts, ends, first, last):
+    """
+    Append the [first, last] range to the interval arrays, merging it into
+    the last interval when they overlap or are adjacent. Ranges must come
+    in ascending order of first.
+    """
+    if starts and first <= ends[-1] + 1:
+        if last > ends[-1]:
+            ends[-1] = last
+    else:
+        starts.append(first)
+        ends.append(last)
+
+
+def _compactIntervals(lumiPairs):
+    """
+    Sort a list of [first, last] lumi pairs and compact it into a
+    (starts, ends) tuple of sorted, disjoint interval arrays
+    """
+    starts, ends = array('q'), array('q')
+    for first, last in sorted(lumiPairs):
+        _appendInterval(starts, ends, int(first), int(last))
+    return starts, ends
+
+
+def _unionIntervals(aIntervals, bIntervals):
+    """
+    Merge two compacted interval arrays into their union
+    """
+    (aStarts, aEnds), (bStarts, bEnds) = aIntervals, bIntervals
+    starts, ends = array('q'), array('q')
+    i, j = 0, 0
+    while i < len(aStarts) or j < len(bStarts):
+        if j >= len(bStarts) or (i < len(aStarts) and aStarts[i] <= bStarts[j]):
+            _appendInterval(starts, ends, aStarts[i], aEnds[i])
+            i += 1
+        else:
+            _appendInterval(starts, ends, bStarts[j], bEnds[j])
+            j += 1
+    return starts, ends
+
+
+def _intersectIntervals(aIntervals, bIntervals):
+    """
+    Sweep two compacted interval arrays and return their intersection
+    """
+    (aStarts, aEnds), (bStarts, bEnds) = aIntervals, bIntervals
+    starts, ends = array('q'), array('q')
+    i, j = 0, 0
+    while i < len(aStarts) and j < len(bStarts):
+        first = max(aStarts[i], bStarts[j])
+        last = min(aEnds[i], bEnds[j])
+        if first <= last:
+            _appendInterval(starts, ends, first, last)
+        # drop whichever interval finishes first, the other may overlap more
+        if aEnds[i] < bEnds[j]:
+            i += 1
+        else:
+            j += 1
+    return starts, ends
+
+
+def _subtractIntervals(aIntervals, bIntervals):
+    """
+    Sweep two compacted interval arrays and return the ranges of the
+    first one which are not covered by the second one
+    """
+    (aStarts, aEnds), (bStarts, bEnds) = aIntervals, bIntervals
+    starts, ends = array('q'), array('q')
+    j = 0
+    for first, last in zip(aStarts, aEnds):
+        # intervals of b ending before this one can't overlap the next ones either
+        while j < len(bStarts) and bEnds[j] < first:
+            j += 1
+        k = j
+        while k < len(bStarts) and bStarts[k] <= last and first <= last:
+            if bStarts[k] > first:
+                _appendInterval(starts, ends, first, bStarts[k] - 1)
+            first = max(first, bEnds[k] + 1)
+            k += 1
+        if first <= last:
+            _appendInterval(starts, ends, first, last)
+    return starts, ends
+
+
 class LumiList(object):
     """
     Deal with lists of lumis in several different forms:
@@ -52,6 +138,10 @@ class LumiList(object):
         '1:1-1:33,1:35,1:37-1:47,2:1-2:45,2:50-2:80'
         The string used by CMSSW in lumisToProcess or lumisToSkip
         is a subset of the compactList example above
+
+    Internally each run (integer key) is stored as a pair of sorted, disjoint
+    arrays of range starts and ends, so set operations are linear merges and
+    lookups are bisections. The compact list is only built when requested.
     """
 
     def __init__(self, filename=None, lumis=None, runsAndLumis=None, runs=None, compactList=None, url=None,
@@ -60,16 +150,18 @@ class LumiList(object):
         Constructor takes filename (JSON), a list of run/lumi pairs,
         or a dict with run #'s as the keys and a list of lumis as the values, or just a list of runs
         """
-        self.compactList = {}
+        lumiDict = {}
         self.duplicates = {}
+        self._compactList = None
+        self._openEndedRuns = None
         if filename:
             self.filename = filename
             with open(self.filename,'r') as jsonFile:
-                self.compactList = json.load(jsonFile)
+                lumiDict = json.load(jsonFile)
         elif url:
             self.url = url
             with closing(urllib.request.urlopen(url)) as jsonFile:
-                self.compactList = json.load(jsonFile)
+                lumiDict = json.load(jsonFile)
         elif lumis:
             runsAndLumis = {}
             for (run, lumi) in lumis:
@@ -91,27 +183,26 @@ class LumiList(object):
                 lastLumi = -1000
                 lumiList = runsAndLumis[run]
                 if lumiList:
-                    self.compactList[runString] = []
+                    lumiDict[runString] = []
                     self.duplicates[runString] = []
                     for lumi in sorted(int(l) for l in lumiList):
                         if lumi == lastLumi:
                             self.duplicates[runString].append(lumi)
                         elif lumi != lastLumi + 1: # Break in lumi sequence
-                            self.compactList[runString].append([lumi, lumi])
+                            lumiDict[runString].append([lumi, lumi])
                         else:
-                            nRange =  len(self.compactList[runString])
-                            self.compactList[runString][nRange-1][1] = lumi
+                            lumiDict[runString][-1][1] = lumi
                         lastLumi = lumi
         if runs:
             for run in runs:
                 runString = str(run)
-                self.compactList[runString] = [[1, 0xFFFFFFF]]
+                lumiDict[runString] = [[1, 0xFFFFFFF]]
 
         if compactList:
             for run in compactList:
                 runString = str(run)
                 if compactList[run]:
-                    self.compactList[runString] = compactList[run]
+                    lumiDict[runString] = compactList[run]
 
         if wmagentFormat:
             """
@@ -130,8 +221,8 @@ class LumiList(object):
 
             for run, lumiString in zip(runs, lumis):
                 runLumis = lumiString.split(',')
-                if str(run) not in self.compactList:
-                    self.compactList[str(run)] = []
+                if str(run) not in lumiDict:
+                    lumiDict[str(run)] = []
                 if len(runLumis) % 2:
                     raise RuntimeError('Improper format for wmagentFormat. Lumis must be in pairs')
 
@@ -139,94 +230,82 @@ class LumiList(object):
                 it = iter(runLumis)
                 for beginLumi in it:
                     endLumi = next(it)
-                    self.compactList[str(run)].append([int(beginLumi), int(endLumi)])
+                    lumiDict[str(run)].append([int(beginLumi), int(endLumi)])
 
         # Compact each run and make it unique
+        self._intervals = {}
+        for run in lumiDict:
+            self._intervals[int(run)] = _compactIntervals(lumiDict[run])
 
-        for run in self.compactList:
-            newLumis = []
-            for lumi in sorted(self.compactList[run]):
-                # If the next lumi starts inside or just after the last just change the endpoint of the first
-                if newLumis and newLumis[-1][0] <= lumi[0] <= newLumis[-1][1] + 1:
-                    newLumis[-1][1] = max(newLumis[-1][1], lumi[1])
-                else:
-                    newLumis.append(lumi)
-            self.compactList[run] = newLumis
+    @classmethod
+    def _fromIntervals(cls, intervals):
+        """
+        Build a LumiList straight from a dict of already compacted
+        (starts, ends) interval arrays, dropping the runs left empty
+        """
+        lumiList = cls()
+        for run, runIntervals in viewitems(intervals):
+            if runIntervals[0]:
+                lumiList._intervals[run] = runIntervals
+        return lumiList
+
+    @staticmethod
+    def _runKey(run):
+        """
+        Return the integer run number used to key the interval arrays,
+        or None if the run cannot be one of them
+        """
+        try:
+            return int(run)
+        except (TypeError, ValueError):
+            return None
+
+    @property
+    def compactList(self):
+        """
+        The compact list (string run keys, [first, last] lumi pairs) built on
+        demand from the interval arrays
+        """
+        if self._compactList is None:
+            self._compactList = {}
+            for run, (starts, ends) in viewitems(self._intervals):
+                self._compactList[str(run)] = [[first, last] for first, last in zip(starts, ends)]
+        return self._compactList
+
+    @compactList.setter
+    def compactList(self, lumiDict):
+        self._compactList = None
+        self._openEndedRuns = None
+        self._intervals = {}
+        for run in lumiDict:
+            self._intervals[int(run)] = _compactIntervals(lumiDict[run])
 
     def __sub__(self, other): # Things from self not in other
         result = {}
-        for run in sorted(self.compactList.keys()):
-            alumis = sorted(self.compactList[run])
-            blumis = sorted(other.compactList.get(run, []))
-            alist = []                    # verified part
-            for alumi in alumis:
-                tmplist = [alumi[0], alumi[1]] # may be part
-                for blumi in blumis:
-                    if blumi[0] <= tmplist[0] and blumi[1] >= tmplist[1]: # blumi has all of alumi
-                        tmplist = []
-                        break # blumi is has all of alumi
-                    if blumi[0] > tmplist[0] and blumi[1] < tmplist[1]: # blumi is part of alumi
-                        alist.append([tmplist[0], blumi[0]-1])
-                        tmplist = [blumi[1]+1, tmplist[1]]
-                    elif blumi[0] <= tmplist[0] and blumi[1] < tmplist[1] and blumi[1]>=tmplist[0]: # overlaps start
-                        tmplist = [blumi[1]+1, tmplist[1]]
-                    elif blumi[0] > tmplist[0] and blumi[1] >= tmplist[1] and blumi[0]<=tmplist[1]: # overlaps end
-                        alist.append([tmplist[0], blumi[0]-1])
-                        tmplist = []
-                        break
-                if tmplist:
-                    alist.append(tmplist)
-            result[run] = alist
-
-        return LumiList(compactList = result)
+        for run, runIntervals in viewitems(self._intervals):
+            if run in other._intervals:
+                result[run] = _subtractIntervals(runIntervals, other._intervals[run])
+            else:
+                result[run] = runIntervals
+        return self._fromIntervals(result)
 
 
     def __and__(self, other): # Things in both
         result = {}
-        aruns = set(self.compactList.keys())
-        bruns = set(other.compactList.keys())
-        for run in aruns & bruns:
-            lumiList = []                    # List for this run
-            unique = []                    # List for this run
-            for alumi in self.compactList[run]:
-                for blumi in other.compactList[run]:
-                    if blumi[0] <= alumi[0] and blumi[1] >= alumi[1]: # blumi has all of alumi
-                        lumiList.append(alumi)
-                    if blumi[0] > alumi[0] and blumi[1] < alumi[1]: # blumi is part of alumi
-                        lumiList.append(blumi)
-                    elif blumi[0] <= alumi[0] and blumi[1] < alumi[1] and blumi[1] >= alumi[0]: # overlaps start
-                        lumiList.append([alumi[0], blumi[1]])
-                    elif blumi[0] > alumi[0] and blumi[1] >= alumi[1] and blumi[0] <= alumi[1]: # overlaps end
-                        lumiList.append([blumi[0], alumi[1]])
-
-
-            if lumiList:
-                unique = [lumiList[0]]
-            for pair in lumiList[1:]:
-                if pair[0] == unique[-1][1]+1:
-                    unique[-1][1] = copy.deepcopy(pair[1])
-                else:
-                    unique.append(copy.deepcopy(pair))
-
-            result[run] = unique
-        return LumiList(compactList = result)
+        for run, runIntervals in viewitems(self._intervals):
+            if run in other._intervals:
+                result[run] = _intersectIntervals(runIntervals, other._intervals[run])
+        return self._fromIntervals(result)
 
 
     def __or__(self, other):
-        result = {}
-        aruns = list(self.compactList)
-        bruns = list(other.compactList)
-        runs = set(aruns + bruns)
-        for run in runs:
-            overlap = sorted(self.compactList.get(run, []) + other.compactList.get(run, []))
-            unique = [overlap[0]]
-            for pair in overlap[1:]:
-                if pair[0] >= unique[-1][0] and pair[0] <= unique[-1][1]+1 and pair[1] > unique[-1][1]:
-                    unique[-1][1] = copy.deepcopy(pair[1])
-                elif pair[0] > unique[-1][1]:
-                    unique.append(copy.deepcopy(pair))
-            result[run] = unique
-        return LumiList(compactList = result)
+        result = dict(self._intervals)
+        for run, runIntervals in viewitems(other._intervals):
+            if run in result:
+                result[run] = _unionIntervals(result[run], runIntervals)
+            else:
+                result[run] = runIntervals
+        return self._fromIntervals(result)
 
 
     def __add__(self, other):
@@ -235,7 +314,7 @@ class LumiList(object):
 
     def __len__(self):
         '''Returns number of runs in list'''
-        return len(self.compactList)
+        return len(self._intervals)
 
     def filterLumis(self, lumiList):
         """
@@ -244,12 +323,17 @@ class LumiList(object):
         [(run1,lumi1),(run1,lumi2),(run2,lumi1)]
         """
         filteredList = []
+        runCache = {}
         for (run, lumi) in lumiList:
-            runsInLumi = self.compactList.get(str(run), [[0, -1]])
-            for (first, last) in runsInLumi:
-                if lumi >= first and lumi <= last:
-                    filteredList.append((run, lumi))
-                    break
+            if run not in runCache:
+                runCache[run] = self._intervals.get(self._runKey(run))
+            runIntervals = runCache[run]
+            if runIntervals is None:
+                continue
+            starts, ends = runIntervals
+            index = bisect.bisect_right(starts, lumi) - 1
+            if index >= 0 and lumi <= ends[index]:
+                filteredList.append((run, lumi))
         return filteredList
 
 
@@ -278,13 +362,10 @@ class LumiList(object):
         Return the list of pairs representation
         """
         theList = []
-        runs = list(self.compactList)
-        runs.sort(key=int)
-        for run in runs:
-            lumis = self.compactList[run]
-            for lumiPair in sorted(lumis):
-                for lumi in range(lumiPair[0], lumiPair[1]+1):
-                    theList.append((int(run), lumi))
+        for run in sorted(self._intervals):
+            starts, ends = self._intervals[run]
+            for first, last in zip(starts, ends):
+                theList.extend((run, lumi) for lumi in range(first, last + 1))
 
         return theList
 
@@ -293,7 +374,7 @@ class LumiList(object):
         '''
         return the sorted list of runs contained
         '''
-        return sorted (self.compactList.keys())
+        return sorted(str(run) for run in self._intervals)
 
 
     def _getLumiParts(self):
@@ -303,16 +384,14 @@ class LumiList(object):
         """
 
         parts = []
-        runs = list(self.compactList)
-        runs.sort(key=int)
-        for run in runs:
-            lumis = self.compactList[run]
-            for lumiPair in sorted(lumis):
-                if lumiPair[0] == lumiPair[1]:
-                    parts.append("%s:%s" % (run, lumiPair[0]))
+        for run in sorted(self._intervals):
+            starts, ends = self._intervals[run]
+            for first, last in zip(starts, ends):
+                if first == last:
+                    parts.append("%s:%s" % (run, first))
                 else:
                     parts.append("%s:%s-%s:%s" %
-                                 (run, lumiPair[0], run, lumiPair[1]))
+                                 (run, first, run, last))
         return parts
 
 
@@ -353,9 +432,8 @@ class LumiList(object):
         removes runs from runList from collection
         '''
         for run in runList:
-            run = str(run)
-            if run in self.compactList:
-                del self.compactList[run]
+            self._intervals.pop(self._runKey(run), None)
+        self._compactList = None
 
         return
 
@@ -365,12 +443,13 @@ class LumiList(object):
         Selects only runs from runList in collection
         '''
         runsToDelete = []
-        for run in list(self.compactList):
-            if int(run) not in runList and run not in runList:
+        for run in self._intervals:
+            if run not in runList and str(run) not in runList:
                 runsToDelete.append(run)
 
         for run in runsToDelete:
-            del self.compactList[run]
+            del self._intervals[run]
+        self._compactList = None
 
         return
 
@@ -385,27 +464,30 @@ class LumiList(object):
         if lumiSection is None:
             # if this is an integer or a string, see if the run exists
             if isinstance (run, int) or isinstance (run, str):
-                return str(run) in self.compactList
+                return self._runKey(run) in self._intervals
             # if we're here, then run better be a tuple or list
             try:
                 lumiSection = run[1]
                 run         = run[0]
             except:
                 raise RuntimeError("Improper format for run '%s'" % run)
-        lumiRangeList = self.compactList.get( str(run) )
-        if not lumiRangeList:
+        runIntervals = self._intervals.get(self._runKey(run))
+        if not runIntervals or not runIntervals[0]:
             # the run isn't there, so no need to look any further
             return False
-        for lumiRange in lumiRangeList:
-            # we want to make this as found if either the lumiSection
-            # is inside the range OR if the lumi section is greater
-            # than or equal to the lower bound of the lumi range and
-            # the upper bound is 0 (which means extends to the end of
-            # the run)
-            if lumiRange[0] <= lumiSection and \
-               (0 == lumiRange[1] or lumiSection <= lumiRange[1]):
-                # got it
-                return True
+        starts, ends = runIntervals
+        # ranges are sorted and disjoint, so only the last one starting
+        # at or before lumiSection can contain it
+        index = bisect.bisect_right(starts, lumiSection) - 1
+        if index < 0:
+            return False
+        if lumiSection <= ends[index]:
+            return True
+        # an upper bound of 0 means the range extends to the end of the run
+        if self._openEndedRuns is None:
+            self._openEndedRuns = set(key for key, (_, runEnds) in viewitems(self._intervals) if 0 in runEnds)
+        if self._runKey(run) in self._openEndedRuns:
+            return any(ends[i] == 0 for i in range(index + 1))
         return False
 
 
@@ -413,7 +495,6 @@ class LumiList(object):
         return self.contains (runTuple)
 
 
-
 '''
 # Unit test code
 import unittest
@@ -423,6 +423,46 @@ class Database(CouchDBRequests):
                                                        maxConflictLimit=maxConflictLimit - 1)
         return []
 
+    def updateBulkDocumentsWithFunction(self, doc_ids, updateFunc, updateLimits=1000, maxConflictLimit=10):
+        """
+        Update documents client side instead of with an update handler: fetch
+        updateLimits documents at a time with _all_docs, pass every one of them
+        to updateFunc(doc_id, doc) and write back the documents it returns with
+        _bulk_docs. doc is None for documents not in the database, and updateFunc
+        returns None to leave a document untouched. The documents in conflict are
+        fetched and updated again, up to maxConflictLimit times.
+
+        param: doc_ids: list of couch doc ids to update, without duplicates
+        param: updateFunc: function returning the updated document
+        param: updateLimits: number of documents in one commit
+        param: maxConflictLimit: number of conflicts fix tries before we give up
+        return: list of the doc ids that could not be updated
+        """
+        uri = '/%s/_bulk_docs/' % self.name
+        failedDocIDs = []
+        conflictDocIDs = list(doc_ids)
+        for _ in range(maxConflictLimit + 1):
+            pendingDocIDs = conflictDocIDs
+            conflictDocIDs = []
+            for ids in grouper(pendingDocIDs, updateLimits):
+                docs = []
+                for row in self.allDocs(options={"include_docs": True}, keys=ids)['rows']:
+                    doc = updateFunc(row['key'], row.get('doc'))
+                    if doc is not None:
+                        docs.append(doc)
+                if not docs:
+                    continue
+                for result in self.post(uri, {'docs': docs}):
+                    if result.get('error', None) == 'conflict':
+                        conflictDocIDs.append(result['id'])
+                    elif result.get('error', None):
+                        logging.error("Failed to update document %s: %s", result['id'], result.get('reason'))
+                        failedDocIDs.append(result['id'])
+            if not conflictDocIDs:
+                break
+        failedDocIDs.extend(conflictDocIDs)
+        return failedDocIDs
+
     def putDocument(self, doc_id, fields):
         """
         Call the update function update_func defined in the design document
@@ -530,6 +570,26 @@ class Database(CouchDBRequests):
         self.last_seq = data['last_seq']
         return data
 
+    def changesBySelector(self, selector, since=None, limit=None, includeDocs=False):
+        """
+        Get the changes of the documents matching a Mango selector since the
+        sequence, using the built-in _selector filter (CouchDB 2.x and later).
+        Store the last sequence value to self.last_seq. If since is None use
+        self.last_seq. The sequences are opaque strings in CouchDB 2.x, pass
+        them as they were returned (e.g. the update_seq of info()).
+        """
+        if since is None:
+            since = self.last_seq
+        options = {'filter': '_selector', 'since': since}
+        if limit is not None:
+            options['limit'] = limit
+        if includeDocs:
+            options['include_docs'] = 'true'
+        data = self.post('/%s/_changes?%s' % (self.name, urllib.parse.urlencode(options)),
+                         {'selector': selector})
+        self.last_seq = data['last_seq']
+        return data
+
     def purge(self, data):
         return self.post('/%s/_purge' % self.name, data)
 
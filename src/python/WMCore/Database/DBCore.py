@@ -6,6 +6,7 @@ Core Database APIs
 
 
 """
+import re
 from copy import copy
 
 from Utils.IteratorTools import grouper
@@ -31,11 +32,17 @@ class DBInterface(WMObject):
     logger = None
     engine = None
 
+    # SQL constructs for which running a select once per bind is not
+    # equivalent to running it once with all the binds in an IN list
+    bulkSelectExclude = re.compile(r"\b(order\s+by|group\s+by|having|distinct|union|limit|rownum|or)\b"
+                                   r"|\b(count|sum|min|max|avg)\s*\(", re.IGNORECASE)
+
     def __init__(self, logger, engine):
         self.logger = logger
         self.logger.info ("Instantiating base WM DBInterface")
         self.engine = engine
         self.maxBindsPerQuery = 500
+        self.streamArraySize = 1000
 
     def buildbinds(self, sequence, thename, therest=[{}]):
         """
@@ -71,6 +78,104 @@ class DBInterface(WMObject):
         resultProxy.close()
         return result
 
+    def bulkselect(self, s, b):
+        """
+        _bulkselect_
+
+        Check whether a SELECT run for a list of single key binds, e.g.:
+
+        SELECT id, name FROM wmbs_job WHERE id = :jobid
+        b = [{'jobid': 1}, {'jobid': 2}, {'jobid': 3}]
+
+        can be run once with all the bind values in an IN list instead of
+        once per bind. The condition on the bind must be a plain equality
+        at the top level of the statement and the bind values must be unique.
+
+        returns a (sqlHead, sqlTail, bindName) tuple, the IN list going
+        between the head and the tail, or None when the select can't be
+        rewritten
+        """
+        if not b or not isinstance(b[0], dict) or len(b[0]) != 1:
+            return None
+        bindName = list(b[0])[0]
+        if any(not isinstance(bind, dict) or len(bind) != 1 or bindName not in bind for bind in b):
+            return None
+        try:
+            if len(set(bind[bindName] for bind in b)) != len(b):
+                return None
+        except TypeError:
+            return None
+        if self.bulkSelectExclude.search(s):
+            return None
+
+        bindRegex = r":%s\b" % re.escape(bindName)
+        if len(re.findall(bindRegex, s, re.IGNORECASE)) != 1:
+            return None
+        match = re.search(r"([\w.]+)\s*=\s*%s" % bindRegex, s, re.IGNORECASE)
+        if not match:
+            return None
+        # must not be within a subquery or a parenthesized condition
+        if s.count("(", 0, match.start()) != s.count(")", 0, match.start()):
+            return None
+        # must be a WHERE condition, not a (possibly outer) JOIN one
+        whereClauses = re.split(r"\bwhere\b", s[:match.start()], flags=re.IGNORECASE)
+        if len(whereClauses) < 2 or re.search(r"\bjoin\b", whereClauses[-1], re.IGNORECASE):
+            return None
+
+        sqlHead = "%s%s IN (" % (s[:match.start()], match.group(1))
+        sqlTail = ")%s" % s[match.end():]
+        return sqlHead, sqlTail, bindName
+
+    def executebulkselect(self, sqlHead, sqlTail, bindName, values, connection=None):
+        """
+        _executebulkselect_
+
+        Run a select rewritten by bulkselect for all the bind values, with
+        at most maxBindsPerQuery values in each IN list.
+
+        returns a single ResultSet holding the rows of all the queries
+        """
+        result = ResultSet()
+        for chunk in grouper(values, self.maxBindsPerQuery):
+            bindNames = ["%s_%d" % (bindName, i) for i in range(len(chunk))]
+            sql = sqlHead + ", ".join(":%s" % name for name in bindNames) + sqlTail
+            chunkResult = self.executebinds(sql, dict(zip(bindNames, chunk)), connection=connection)
+            if not result.keys:
+                result.keys.extend(chunkResult.keys)
+            result.data.extend(chunkResult.data)
+        return result
+
+    def executestream(self, s=None, b=None, connection=None, arraysize=None):
+        """
+        _executestream_
+
+        Execute a SQL statement with a server side cursor and yield its rows
+        as a sequence of ResultSet objects holding at most arraysize rows
+        each, so the whole result is never held in memory.
+        """
+        arraysize = arraysize or self.streamArraySize
+        connection = connection.execution_options(stream_results=True,
+                                                  max_row_buffer=arraysize)
+        if b is None:
+            resultProxy = connection.execute(s)
+        else:
+            resultProxy = connection.execute(s, b)
+
+        try:
+            if not resultProxy.returns_rows:
+                return
+            keys = list(resultProxy.keys())
+            while True:
+                rows = resultProxy.fetchmany(arraysize)
+                if not rows:
+                    break
+                result = ResultSet()
+                result.keys = keys
+                result.data = rows
+                yield result
+        finally:
+            resultProxy.close()
+
     def executemanybinds(self, s=None, b=None, connection=None,
                          returnCursor=False):
         """
@@ -84,7 +189,8 @@ class DBInterface(WMObject):
 
         Can't executemany() selects - so do each combination of binds here instead.
         This will return a list of sqlalchemy.engine.base.ResultProxy object's
-        one for each set of binds.
+        one for each set of binds. Selects on a single bind are run with
+        all the bind values in an IN list when possible, see bulkselect.
 
         returns a list of sqlalchemy.engine.base.ResultProxy objects
         """
@@ -94,7 +200,13 @@ class DBInterface(WMObject):
             """
             Trying to select many
             """
-            if returnCursor:
+            bulkSelect = None if returnCursor else self.bulkselect(s, b)
+            if bulkSelect:
+                sqlHead, sqlTail, bindName = bulkSelect
+                values = [bind[bindName] for bind in b]
+                return self.makelist(self.executebulkselect(sqlHead, sqlTail, bindName, values,
+                                                            connection=connection))
+            elif returnCursor:
                 result = []
                 for bind in b:
                     result.append(connection.execute(s, bind))
@@ -120,6 +232,25 @@ class DBInterface(WMObject):
         return self.engine.connect()
 
 
+    def processDataStream(self, sqlstmt, binds=None, conn=None, arraysize=None):
+        """
+        _processDataStream_
+
+        Generator version of processData for a single SELECT statement and
+        a single set of binds. It yields ResultSet objects of at most
+        arraysize rows (streamArraySize by default), read from a server side
+        cursor. When no connection is given, a new one is kept open until
+        the generator is exhausted or closed.
+        """
+        connection = conn or self.connection()
+        try:
+            for result in self.executestream(sqlstmt, binds or None, connection=connection,
+                                             arraysize=arraysize):
+                yield result
+        finally:
+            if not conn:
+                connection.close()  # Return connection to the pool
+
     def processData(self, sqlstmt, binds={}, conn=None,
                     transaction=False, returnCursor=False):
         """
@@ -11,6 +11,7 @@ from builtins import str, bytes, zip, range
 import datetime
 import time
 import types
+from collections import namedtuple
 
 from Utils.Utilities import decodeBytesToUnicodeConditional
 from WMCore.DataStructs.WMObject import WMObject
@@ -66,27 +67,49 @@ class DBFormatter(WMObject):
                 out.append(i)
         return out
 
+    def _formatKeys(self, descriptions):
+        """
+        Decode and lower case the column names of a result proxy.
+        WARNING: Oracle returns table names in CAP!
+        """
+        keys = []
+        for keyName in descriptions:
+            if isinstance(keyName, (str, bytes)):
+                keyName = decodeBytesToUnicodeConditional(keyName, condition=PY3)
+            keys.append(keyName.lower())
+        return keys
+
+    def _bytesColumns(self, rows, numColumns):
+        """
+        Return the indexes of the columns holding byte strings, each column
+        being judged by its first non NULL value
+        """
+        pending = set(range(numColumns))
+        bytesColumns = []
+        for row in rows:
+            for index in list(pending):
+                if row[index] is not None:
+                    pending.discard(index)
+                    if isinstance(row[index], bytes):
+                        bytesColumns.append(index)
+            if not pending:
+                break
+        return sorted(bytesColumns)
+
     def formatDict(self, result):
         """
         Returns an array of dictionaries representing the results
         """
         dictOut = []
         for r in result:
-            descriptions = r.keys
+            keys = self._formatKeys(r.keys)
             for i in r.fetchall():
                 # WARNING: this can generate errors for some stupid reason
                 # in both oracle and mysql.
-                entry = {}
-                for index in range(0, len(descriptions)):
-                    # WARNING: Oracle returns table names in CAP!
-                    if isinstance(descriptions[index], (str, bytes)):
-                        keyName = decodeBytesToUnicodeConditional(descriptions[index], condition=PY3)
-                    else:
-                        keyName = descriptions[index]
-                    if isinstance(i[index], (str, bytes)):
-                        entry[keyName.lower()] = decodeBytesToUnicodeConditional(i[index], condition=PY3)
-                    else:
-                        entry[keyName.lower()] = i[index]
+                entry = dict(zip(keys, i))
+                for keyName, value in entry.items():
+                    if isinstance(value, bytes):
+                        entry[keyName] = decodeBytesToUnicodeConditional(value, condition=PY3)
 
                 dictOut.append(entry)
 
@@ -101,16 +124,65 @@ class DBFormatter(WMObject):
         """
         listOut = []
         for r in result:
-            descriptions = r.keys
+            numColumns = len(r.keys)
             for i in r.fetchall():
-                for index in range(0, len(descriptions)):
-                    if isinstance(i[index], (str, bytes)):
-                        listOut.append(decodeBytesToUnicodeConditional(i[index], condition=PY3))
+                for index in range(numColumns):
+                    value = i[index]
+                    if isinstance(value, bytes):
+                        listOut.append(decodeBytesToUnicodeConditional(value, condition=PY3))
                     else:
-                        listOut.append(i[index])
+                        listOut.append(value)
             r.close()
         return listOut
 
+    def formatRows(self, result, rowType="dict"):
+        """
+        Fast formatting for large results: column names are lowered once
+        per result proxy and only the columns holding byte strings are
+        decoded. rowType can be:
+          * "dict": a list of dictionaries, like formatDict
+          * "columns": a dictionary of column name to the list of its values
+          * "namedtuple": a list of namedtuples with the column names as fields
+        """
+        if rowType == "columns":
+            out = {}
+        elif rowType in ("dict", "namedtuple"):
+            out = []
+        else:
+            raise ValueError("Unknown rowType: %s" % rowType)
+
+        for r in result:
+            keys = self._formatKeys(r.keys)
+            rows = r.fetchall()
+            bytesColumns = self._bytesColumns(rows, len(keys))
+            if bytesColumns:
+                rows = [list(row) for row in rows]
+                for row in rows:
+                    for index in bytesColumns:
+                        row[index] = decodeBytesToUnicodeConditional(row[index], condition=PY3)
+
+            if rowType == "columns":
+                for index, keyName in enumerate(keys):
+                    out.setdefault(keyName, []).extend(row[index] for row in rows)
+            elif rowType == "namedtuple":
+                rowClass = namedtuple("Row", keys, rename=True)
+                out.extend(rowClass._make(row) for row in rows)
+            else:
+                out.extend(dict(zip(keys, row)) for row in rows)
+
+            r.close()
+
+        return out
+
+    def formatStream(self, resultStream, rowType="dict"):
+        """
+        Generator formatting, with formatRows, each ResultSet chunk yielded
+        by DBInterface.processDataStream. It yields one formatted chunk at a
+        time, so only arraysize rows are held in memory.
+        """
+        for result in resultStream:
+            yield self.formatRows([result], rowType=rowType)
+
     def formatOneDict(self, result):
         """
         Return a dictionary representing the first record
@@ -118,6 +118,18 @@ class MySQLInterface(DBInterface):
         s, b = self.substitute(s, b)
         return DBInterface.executebinds(self, s, b, connection, returnCursor)
 
+    def executestream(self, s = None, b = None, connection = None,
+                      arraysize = None):
+        """
+        _executestream_
+
+        Stream the results of a SQL statement with a single set of bind
+        variables. Transform the bind variables into the format that MySQL
+        expects.
+        """
+        s, b = self.substitute(s, b)
+        return DBInterface.executestream(self, s, b, connection, arraysize)
+
     def executemanybinds(self, s = None, b = None, connection = None,
                          returnCursor = False):
         """
@@ -125,7 +137,18 @@ class MySQLInterface(DBInterface):
 
         Execute a SQL statement that has multiple sets of bind variables.
         Transform the bind variables into the format that MySQL expects.
+        Selects which can be run with an IN list are rewritten first, see
+        DBInterface.bulkselect.
         """
+        s = s.strip()
+        if s.lower().endswith('select', 0, 6) and not returnCursor:
+            bulkSelect = self.bulkselect(s, b)
+            if bulkSelect:
+                sqlHead, sqlTail, bindName = bulkSelect
+                values = [bind[bindName] for bind in b]
+                return self.makelist(self.executebulkselect(sqlHead, sqlTail, bindName, values,
+                                                            connection=connection))
+
         newsql, binds = self.substitute(s, b)
 
         return DBInterface.executemanybinds(self, newsql, binds, connection,
@@ -26,6 +26,7 @@ class Transaction(WMObject):
         self.dbi = dbinterface
         self.conn = None
         self.transaction = None
+        self.commitCallbacks = []
 
     def begin(self):
         if self.conn == None:
@@ -47,6 +48,16 @@ class Transaction(WMObject):
                                       transaction = True)
         return result
 
+    def addCommitCallback(self, callback, *args):
+        """
+        Call callback(*args) once the transaction is committed, unless the
+        same call is already registered. The callbacks are dropped if the
+        transaction is rolled back.
+        """
+        if (callback, args) not in self.commitCallbacks:
+            self.commitCallbacks.append((callback, args))
+        return
+
     def commit(self):
         """
         Commit the transaction and return the connection to the pool
@@ -59,6 +70,14 @@ class Transaction(WMObject):
         self.conn = None
         self.transaction = None
 
+        callbacks = self.commitCallbacks
+        self.commitCallbacks = []
+        for callback, args in callbacks:
+            try:
+                callback(*args)
+            except Exception as ex:
+                logging.error("Error in transaction commit callback: %s", str(ex))
+
     def rollback(self):
         """
         To be called if there is an exception and you want to roll back the
@@ -72,6 +91,7 @@ class Transaction(WMObject):
 
         self.conn = None
         self.transaction = None
+        self.commitCallbacks = []
         return
 
     def rollbackForError(self):
@@ -22,6 +22,7 @@ from WMCore.Configuration import ConfigSection
 from WMCore.DataStructs.File import File
 from WMCore.DataStructs.Run import Run
 from WMCore.FwkJobReport.FileInfo import FileInfo
+from WMCore.FwkJobReport.ReportFormat import dumpReport, isCompactReport, loadReport
 from WMCore.WMException import WMException
 from WMCore.WMExceptions import WM_JOB_ERROR_CODES
 
@@ -386,15 +387,19 @@ class Report(object):
 
         return returnCode, returnMessage
 
-    def persist(self, filename):
+    def persist(self, filename, compact=True):
         """
         _persist_
 
-        Pickle this object and save it to disk.
+        Save this object to disk, in the compact format (see ReportFormat)
+        or as a single pickle if compact is False.
         """
         if PY3:
             with open(filename, 'wb') as handle:
-                pickle.dump(encodeUnicodeToBytes(self.data), handle)
+                if compact:
+                    dumpReport(self.data, handle)
+                else:
+                    pickle.dump(encodeUnicodeToBytes(self.data), handle)
         else:
             with open(filename, 'w') as handle:
                 pickle.dump(self.data, handle)
@@ -404,11 +409,16 @@ class Report(object):
         """
         _unpersist_
 
-        Load a pickled FWJR from disk.
+        Load a FWJR from disk, either in the compact format or pickled.
+        The step sections of a compact FWJR are only loaded when accessed.
         """
         if PY3:
             with open(filename, 'rb') as handle:
-                self.data = decodeBytesToUnicode(pickle.load(handle))
+                data = handle.read()
+            if isCompactReport(data):
+                self.data = loadReport(data)
+            else:
+                self.data = decodeBytesToUnicode(pickle.loads(data))
         else:
             with open(filename, 'r') as handle:
                 self.data = pickle.load(handle)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+"""
+_ReportFormat_
+
+Compact on-disk format for framework job reports.
+
+The report ConfigSection tree is written as a small pickled header, holding
+the report and step level settings, followed by one pickle per step section
+(output, input, performance, errors...). The header records the offset and
+size of every one of them, so they are only unpickled when first accessed.
+
+Layout (format version 1):
+  MAGIC | version (1 byte) | header size (8 bytes, big endian) | header | sections
+"""
+
+import pickle
+import struct
+
+from Utils.PythonVersion import HIGHEST_PICKLE_PROTOCOL
+from WMCore.Configuration import ConfigSection
+
+MAGIC = b"WMFWJR"
+FORMAT_VERSION = 1
+# sections nested deeper than this (report -> step -> section) are loaded lazily
+LAZY_DEPTH = 2
+
+_headerStruct = struct.Struct(">BQ")
+
+
+class LazyConfigSection(ConfigSection):
+    """
+    _LazyConfigSection_
+
+    ConfigSection whose child sections are unpickled from the report
+    data the first time they are accessed.
+    """
+
+    def __init__(self, name=None):
+        ConfigSection.__init__(self, name)
+        self._internal_lazy = {}
+        self._internal_buffer = None
+
+    def __getattr__(self, name):
+        # only called when the attribute was not found, i.e. for pending sections
+        lazy = self.__dict__.get("_internal_lazy")
+        if not lazy or name not in lazy:
+            raise AttributeError("'%s' section has no attribute '%s'" % (self.__dict__.get("_internal_name"), name))
+
+        offset, size = lazy.pop(name)
+        section = pickle.loads(self._internal_buffer[offset:offset + size])
+        section._internal_parent_ref = self
+        object.__setattr__(self, name, section)
+        if not lazy:
+            self._internal_buffer = None
+        return section
+
+    def __setattr__(self, name, value):
+        lazy = self.__dict__.get("_internal_lazy")
+        if lazy and name in lazy:
+            del lazy[name]
+        ConfigSection.__setattr__(self, name, value)
+
+    def __delattr__(self, name):
+        lazy = self.__dict__.get("_internal_lazy")
+        if lazy and name in lazy:
+            del lazy[name]
+            self._internal_children.discard(name)
+            self._internal_settings.discard(name)
+            return
+        ConfigSection.__delattr__(self, name)
+
+    def __getstate__(self):
+        self.loadAll_()
+        state = self.__dict__.copy()
+        state["_internal_buffer"] = None
+        return state
+
+    def section_(self, sectionName):
+        if sectionName in self._internal_lazy:
+            return getattr(self, sectionName)
+        return ConfigSection.section_(self, sectionName)
+
+    def loadAll_(self):
+        """
+        _loadAll_
+
+        Load all the pending sections of this section and of its children
+        """
+        for name in list(self._internal_lazy):
+            getattr(self, name)
+        for name in self._internal_children:
+            child = getattr(self, name)
+            if isinstance(child, LazyConfigSection):
+                child.loadAll_()
+
+
+def _packSection(section, depth, blobs, offset):
+    """
+    Describe a section in the header, pickling its children beyond
+    LAZY_DEPTH into blobs. Return the header node and the next offset.
+    """
+    node = {"name": section._internal_name,
+            "documentation": section._internal_documentation,
+            "docstrings": section._internal_docstrings,
+            "settings": {},
+            "sections": {},
+            "lazy": {}}
+    for name in section._internal_settings:
+        value = getattr(section, name)
+        if not isinstance(value, ConfigSection):
+            node["settings"][name] = value
+        elif depth + 1 < LAZY_DEPTH:
+            node["sections"][name], offset = _packSection(value, depth + 1, blobs, offset)
+        else:
+            # do not drag the parent sections into the pickle
+            parent = value._internal_parent_ref
+            value._internal_parent_ref = None
+            try:
+                blob = pickle.dumps(value, HIGHEST_PICKLE_PROTOCOL)
+            finally:
+                value._internal_parent_ref = parent
+            node["lazy"][name] = (offset, len(blob))
+            blobs.append(blob)
+            offset += len(blob)
+    return node, offset
+
+
+def _unpackSection(node, buff):
+    """
+    Rebuild a section from its header node, leaving the pickled
+    children pending in buff.
+    """
+    section = LazyConfigSection(node["name"])
+    section._internal_documentation = node["documentation"]
+    section._internal_docstrings = node["docstrings"]
+    for name, value in node["settings"].items():
+        object.__setattr__(section, name, value)
+        section._internal_settings.add(name)
+    for name, childNode in node["sections"].items():
+        ConfigSection.__setattr__(section, name, _unpackSection(childNode, buff))
+    if node["lazy"]:
+        section._internal_lazy = dict(node["lazy"])
+        section._internal_buffer = buff
+        section._internal_settings.update(node["lazy"])
+        section._internal_children.update(node["lazy"])
+    return section
+
+
+def isCompactReport(data):
+    """
+    Whether the raw report data is in the compact format
+    """
+    return data[:len(MAGIC)] == MAGIC
+
+
+def dumpReport(section, handle):
+    """
+    _dumpReport_
+
+    Write the report ConfigSection to an open binary file handle
+    """
+    blobs = []
+    node, bodySize = _packSection(section, 0, blobs, 0)
+    node["size"] = bodySize
+    header = pickle.dumps(node, HIGHEST_PICKLE_PROTOCOL)
+    handle.write(MAGIC)
+    handle.write(_headerStruct.pack(FORMAT_VERSION, len(header)))
+    handle.write(header)
+    for blob in blobs:
+        handle.write(blob)
+
+
+def loadReport(data):
+    """
+    _loadReport_
+
+    Rebuild the report ConfigSection from the raw compact report data.
+    Only the header is unpickled, the step sections are loaded on access.
+    """
+    start = len(MAGIC)
+    version, headerSize = _headerStruct.unpack_from(data, start)
+    if version != FORMAT_VERSION:
+        raise ValueError("Unsupported framework job report format version: %s" % version)
+    start += _headerStruct.size
+    node = pickle.loads(data[start:start + headerSize])
+    buff = memoryview(data)[start + headerSize:]
+    if len(buff) < node["size"]:
+        raise ValueError("Truncated framework job report")
+    return _unpackSection(node, buff)
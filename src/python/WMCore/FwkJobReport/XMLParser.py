@@ -9,7 +9,7 @@ from __future__ import division, print_function
 import logging
 import re
 
-from WMCore.Algorithms.ParseXMLFile import coroutine, xmlFileToNode
+from WMCore.Algorithms.ParseXMLFile import checkXMLFile, coroutine, xmlFileToNode, xmlFileToNodeStream
 from WMCore.DataStructs.Run import Run
 from WMCore.FwkJobReport import Report
 
@@ -29,6 +29,19 @@ def reportBuilder(nodeStruct, report, target):
         target.send((report, node))
 
 
+def streamReportBuilder(xmlFile, report, target):
+    """
+    _streamReportBuilder_
+
+    Driver for coroutine pipe for building reports while streaming the
+    XML file. Every child of the FrameworkJobReport element is sent on its
+    own, as the only child of the root node, as soon as it has been parsed.
+    """
+    for rootNode, node in xmlFileToNodeStream(xmlFile):
+        rootNode.children = [node]
+        target.send((report, rootNode))
+
+
 @coroutine
 def reportDispatcher(targets):
     """
@@ -554,16 +567,24 @@ def perfStoreHandler():
             logging.error("Not adding any storage performance info to report.")
 
 
-def xmlToJobReport(reportInstance, xmlFile):
+def xmlToJobReport(reportInstance, xmlFile, streaming=True):
     """
     _xmlToJobReport_
 
     parse the XML file and insert the information into the
     Report instance provided
 
+    If streaming is True, the XML file is processed as it is parsed instead
+    of building the whole node structure first, which keeps the memory
+    footprint low for reports with many files and lumi sections. It is first
+    checked to be well formed, so a corrupt file leaves the Report untouched.
+
     """
-    # read XML, build node structure
-    node = xmlFileToNode(xmlFile)
+    if streaming:
+        checkXMLFile(xmlFile)
+    else:
+        # read XML, build node structure
+        node = xmlFileToNode(xmlFile)
 
     #  //
     # // Set up coroutine pipeline
@@ -595,10 +616,13 @@ def xmlToJobReport(reportInstance, xmlFile):
     #  //
     # // Feed pipeline with node structure and report result instance
     # //
-    reportBuilder(
-        node, reportInstance,
-        reportDispatcher(dispatchers)
-    )
+    if streaming:
+        streamReportBuilder(xmlFile, reportInstance, reportDispatcher(dispatchers))
+    else:
+        reportBuilder(
+            node, reportInstance,
+            reportDispatcher(dispatchers)
+        )
 
     return
 
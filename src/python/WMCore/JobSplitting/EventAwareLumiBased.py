@@ -154,6 +154,9 @@ class EventAwareLumiBased(JobFactory):
         currentJobAvgEventCount = 0
         stopTask = False
         self.lumiChecker = LumiChecker(applyLumiCorrection)
+        if getParents:
+            # look up the parents of all the files at once
+            self.findParents([f['lfn'] for location in locationDict for f in locationDict[location]])
         for location in locationDict:
 
             # For each location, we need a new jobGroup
@@ -17,7 +17,7 @@ from __future__ import (division, print_function)
 
 import operator
 
-from future.utils import viewitems
+from future.utils import viewitems, viewvalues
 
 import logging
 from collections import defaultdict
@@ -122,6 +122,10 @@ class EventAwareLumiByWork(JobFactory):
         stopTask = False
         lastFile = None
 
+        if getParents:
+            # look up the parents of all the files at once
+            self.findParents([f['lfn'] for filesAtLocation in viewvalues(filesByLocation) for f in filesAtLocation])
+
         for location, filesAtLocation in viewitems(filesByLocation):
             self.newGroup()  # For each location, we need a new jobGroup
             self.eventsInJob = 0
@@ -73,6 +73,9 @@ class EventBased(JobFactory):
         totalJobs = 0
 
         locationDict = self.sortByLocation()
+        if getParents:
+            # look up the parents of all the files at once
+            self.findParents([f['lfn'] for location in locationDict for f in locationDict[location]])
         for location in locationDict:
             self.newGroup()
             fileList = locationDict[location]
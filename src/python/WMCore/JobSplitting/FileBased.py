@@ -100,6 +100,10 @@ class FileBased(JobFactory):
                     if f in locationDict[locSet]:
                         locationDict[locSet].remove(f)
 
+        if getParents:
+            # look up the parents of all the files at once
+            self.findParents([f['lfn'] for locSet in locationDict for f in locationDict[locSet]])
+
         for locSet in locationDict:
             #Now we have all the files in a certain location set
             fileList = locationDict[locSet]
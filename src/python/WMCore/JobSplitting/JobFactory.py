@@ -14,6 +14,7 @@ from WMCore.DAOFactory import DAOFactory
 from WMCore.DataStructs.WMObject import WMObject
 from WMCore.Services.UUIDLib import makeUUID
 from WMCore.WMBS.File import File as WMBSFile
+from WMCore.WMBS.Parentage import ParentageResolver
 from WMCore.WMExceptions import WM_JOB_ERROR_CODES
 
 
@@ -48,6 +49,7 @@ class JobFactory(WMObject):
         self.siteBlacklist = []
         self.trustSitelists = False
         self.trustPUSitelists = False
+        self.parentageResolver = None
 
         if package == "WMCore.WMBS":
             myThread = threading.currentThread()
@@ -56,6 +58,7 @@ class JobFactory(WMObject):
                                          logger=myThread.logger,
                                          dbinterface=myThread.dbi)
             self.getParentInfoAction = self.daoFactory(classname="Files.GetParentAndGrandParentInfo")
+            self.parentageResolver = ParentageResolver(self.getParentInfoAction)
 
             self.pnn_to_psn = self.daoFactory(classname="Locations.GetPNNtoPSNMapping").execute()
 
@@ -72,6 +75,8 @@ class JobFactory(WMObject):
         self.jobGroups = []
         self.currentGroup = None
         self.currentJob = None
+        if self.parentageResolver:
+            self.parentageResolver.clear()
 
         self.siteWhitelist = kwargs.get("siteWhitelist", [])
         self.siteBlacklist = kwargs.get("siteBlacklist", [])
@@ -418,35 +423,18 @@ class JobFactory(WMObject):
 
         Find the parents for a file based on its lfn
         """
+        return self.findParents([lfn])[lfn]
 
-        parentsInfo = self.getParentInfoAction.execute([lfn])
-        newParents = set()
-        for parentInfo in parentsInfo:
-
-            # This will catch straight to merge files that do not have redneck
-            # parents.  We will mark the straight to merge file from the job
-            # as a child of the merged parent.
-            if int(parentInfo["merged"]) == 1:
-                newParents.add(parentInfo["lfn"])
-
-            elif parentInfo['gpmerged'] is None:
-                continue
-
-            # Handle the files that result from merge jobs that aren't redneck
-            # children.  We have to setup parentage and then check on whether or
-            # not this file has any redneck children and update their parentage
-            # information.
-            elif int(parentInfo["gpmerged"]) == 1:
-                newParents.add(parentInfo["gplfn"])
-
-            # If that didn't work, we've reached the great-grandparents
-            # And we have to work via recursion
-            else:
-                parentSet = self.findParent(lfn=parentInfo['gplfn'])
-                for parent in parentSet:
-                    newParents.add(parent)
+    def findParents(self, lfns):
+        """
+        _findParents_
 
-        return newParents
+        Find the parents of many files at once, based on their lfns.
+        Return a dictionary of the sets of parent lfns keyed by lfn.
+        The parents are remembered for the rest of the splitting, so
+        algorithms can look up all their files before calling findParent.
+        """
+        return self.parentageResolver.findParents(lfns)
 
     def checkForAmountOfWork(self):
         """
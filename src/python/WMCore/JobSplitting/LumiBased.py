@@ -244,6 +244,9 @@ class LumiBased(JobFactory):
         lumisInJob = 0
         lumisInTask = 0
         self.lumiChecker = LumiChecker(applyLumiCorrection)
+        if getParents:
+            # look up the parents of all the files at once
+            self.findParents([f['lfn'] for location in locationDict for f in locationDict[location]])
         for location in locationDict:
 
             # For each location, we need a new jobGroup
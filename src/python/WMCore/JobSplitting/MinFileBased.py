@@ -39,6 +39,10 @@ class MinFileBased(JobFactory):
         #Get a dictionary of sites, files
         locationDict = self.sortByLocation()
 
+        if getParents:
+            # look up the parents of all the files at once
+            self.findParents([f['lfn'] for location in locationDict for f in locationDict[location]])
+
         for location in locationDict:
             #Now we have all the files in a certain location
             fileList    = locationDict[location]
@@ -49,10 +49,6 @@ class TwoFileBased(JobFactory):
                                      logger = myThread.logger,
                                      dbinterface = myThread.dbi)
 
-        self.getParentInfoAction     = self.daoFactory(classname = "Files.GetParentAndGrandParentInfo")
-
-
-
         return
 
 
@@ -74,6 +70,9 @@ class TwoFileBased(JobFactory):
         #Get a dictionary of sites, files
         locationDict = self.sortByLocation()
 
+        # look up the parents of all the files at once
+        self.findParents([file['lfn'] for location in locationDict for file in locationDict[location]])
+
         for location in locationDict:
             #Now we have all the files in a certain location
             fileList    = locationDict[location]
@@ -111,43 +110,3 @@ class TwoFileBased(JobFactory):
 
 
         return
-
-
-
-
-    def findParent(self, lfn):
-        """
-        _findParent_
-
-        Find the parents for a file based on its lfn
-        """
-
-
-        parentsInfo = self.getParentInfoAction.execute([lfn])
-        newParents = set()
-        for parentInfo in parentsInfo:
-
-            # This will catch straight to merge files that do not have redneck
-            # parents.  We will mark the straight to merge file from the job
-            # as a child of the merged parent.
-            if int(parentInfo["merged"]) == 1:
-                newParents.add(parentInfo["lfn"])
-
-            elif parentInfo['gpmerged'] == None:
-                continue
-
-            # Handle the files that result from merge jobs that aren't redneck
-            # children.  We have to setup parentage and then check on whether or
-            # not this file has any redneck children and update their parentage
-            # information.
-            elif int(parentInfo["gpmerged"]) == 1:
-                newParents.add(parentInfo["gplfn"])
-
-            # If that didn't work, we've reached the great-grandparents
-            # And we have to work via recursion
-            else:
-                parentSet = self.findParent(lfn = parentInfo['gplfn'])
-                for parent in parentSet:
-                    newParents.add(parent)
-
-        return newParents
@@ -5,12 +5,16 @@ _ChangeState_
 Propagate a job from one state to another.
 """
 import json
+import os
 import sys
+from functools import partial
 from builtins import str
 import logging
 import re
+import threading
 import time
 
+from Utils.MemoryCache import LRUCache
 from WMCore.DataStructs.WMObject import WMObject
 from WMCore.Database.CMSCouch import CouchNotFoundError, CouchError, CouchRequestTooLargeError
 from WMCore.Database.CMSCouch import CouchServer
@@ -19,6 +23,7 @@ from WMCore.JobStateMachine.Transitions import Transitions
 from WMCore.Lexicon import sanitizeURL
 from WMCore.WMConnectionBase import WMConnectionBase
 from WMCore.WMSpec.WMWorkload import WMWorkloadHelper
+from WMCore.WorkerThreads.WorkNotifier import WorkNotifier, getNotifyDir
 
 CMSSTEP = re.compile(r'^cmsRun[0-9]+$')
 
@@ -60,6 +65,40 @@ def discardConflictingDocument(couchDbInstance, data, result):
         return result
 
 
+def addJobStateTransitions(transitions, docId, doc):
+    """
+    _addJobStateTransitions_
+
+    Client side version of the JobDump stateTransition update handler,
+    add the state transitions of a job to its document.
+    """
+    if doc is None:
+        doc = {"_id": docId, "states": {}}
+    states = doc.setdefault("states", {})
+    for transition in transitions[docId]:
+        maxKey = max([int(key) for key in states] or [0])
+        states[str(maxKey + 1)] = dict(transition)
+    return doc
+
+
+def addJobSummaryTransitions(transitions, docId, doc):
+    """
+    _addJobSummaryTransitions_
+
+    Client side version of the WMStatsAgent jobSummaryState and
+    jobStateTransition update handlers, set the state of a job summary
+    and add the state transitions to its history. Like the handlers,
+    only the history is recorded if the summary does not exist yet.
+    """
+    if doc is None:
+        doc = {"_id": docId}
+    else:
+        doc["state"] = transitions[docId][-1]["newstate"]
+        doc["timestamp"] = transitions[docId][-1]["timestamp"]
+    doc.setdefault("state_history", []).extend(dict(transition) for transition in transitions[docId])
+    return doc
+
+
 def shrinkLargeFJR(couchDbInstance, sizeLimit):
     """
     Look at the CouchDB database queue and empty documents
@@ -138,10 +177,22 @@ def getDataFromSpecFile(specFile):
     return result
 
 
+def getSpecMtime(specFile):
+    """
+    Return the modification time of a workflow spec file, None if it can't be read
+    """
+    try:
+        return os.path.getmtime(specFile)
+    except (OSError, TypeError):
+        return None
+
+
 class ChangeState(WMObject, WMConnectionBase):
     """
     Propagate the state of a job through the JSM.
     """
+    # campaign and task PrepIDs of the workflow specs, shared by all the instances
+    specCache = None
 
     def __init__(self, config, couchDbName=None):
         WMObject.__init__(self, config)
@@ -159,6 +210,9 @@ class ChangeState(WMObject, WMConnectionBase):
 
         # max total number of documents to be committed in the same Couch operation
         self.maxBulkCommit = getattr(self.config.JobStateMachine, 'maxBulkCommitDocs', 250)
+        # record the state transitions with _all_docs/_bulk_docs instead of an update per job
+        self.bulkStateTransitions = getattr(self.config.JobStateMachine, 'bulkStateTransitions', False)
+        self.maxConflictRetries = getattr(self.config.JobStateMachine, 'maxConflictRetries', 10)
         self.couchdb = CouchServer(self.config.JobStateMachine.couchurl)
         self._connectDatabases()
 
@@ -172,7 +226,10 @@ class ChangeState(WMObject, WMConnectionBase):
 
         self.maxUploadedInputFiles = getattr(self.config.JobStateMachine, 'maxFWJRInputFiles', 1000)
         self.fwjrLimitSize = getattr(self.config.JobStateMachine, 'fwjrLimitSize', 8 * 1000**2)
-        self.workloadCache = {}
+        if ChangeState.specCache is None:
+            ChangeState.specCache = LRUCache(getattr(self.config.JobStateMachine, 'specCacheSize', 500),
+                                             getattr(self.config.JobStateMachine, 'specCacheExpiration', 6 * 3600))
+        self.workNotifier = WorkNotifier(getNotifyDir(self.config))
         return
 
     def _connectDatabases(self):
@@ -239,8 +296,9 @@ class ChangeState(WMObject, WMConnectionBase):
         # 2. Load workflow/task information into the jobs
         self.loadExtraJobInformation(jobs)
 
-        # 3. Make the state transition
+        # 3. Make the state transition, waking up the components waiting for it
         self.persist(jobs, newstate, oldstate)
+        self.notifyWork(newstate)
 
         # 4. Complete the job information for jobs in created state
         try:
@@ -260,6 +318,21 @@ class ChangeState(WMObject, WMConnectionBase):
 
         return
 
+    def notifyWork(self, newstate):
+        """
+        _notifyWork_
+
+        Notify the other components that jobs were moved to a new state,
+        once the transaction making the change is committed.
+        """
+        newstate = newstate.lower()
+        if self.existingTransaction():
+            myThread = threading.currentThread()
+            myThread.transaction.addCommitCallback(self.workNotifier.notify, newstate)
+        else:
+            self.workNotifier.notify(newstate)
+        return
+
     def check(self, newstate, oldstate):
         """
         check that the transition is allowed. return a tuple of the transition
@@ -288,19 +361,16 @@ class ChangeState(WMObject, WMConnectionBase):
         timestamp = int(time.time())
         couchRecordsToUpdate = []
 
+        if self.bulkStateTransitions:
+            self.recordTransitionsInBulk(jobs, newstate, oldstate, timestamp, updatesummary)
+
         for job in jobs:
             couchDocID = job.get("couch_record", None)
 
             if newstate == "new":
                 oldstate = "none"
 
-            if job.get("site_cms_name", None):
-                if newstate == "executing":
-                    jobLocation = job["site_cms_name"]
-                else:
-                    jobLocation = "Agent"
-            else:
-                jobLocation = "Agent"
+            jobLocation = self.getJobLocation(job, newstate)
 
             if couchDocID is None:
                 jobDocument = {}
@@ -352,7 +422,7 @@ class ChangeState(WMObject, WMConnectionBase):
                 if self.jobsdatabase.getQueueSize() >= self.maxBulkCommit:
                     self.jobsdatabase.commit(callback=discardConflictingDocument)
                 self.jobsdatabase.queue(jobDocument, callback=discardConflictingDocument)
-            else:
+            elif not self.bulkStateTransitions:
                 # We send a PUT request to the stateTransition update handler.
                 # Couch expects the parameters to be passed as arguments to in
                 # the URI while the Requests class will only encode arguments
@@ -368,7 +438,7 @@ class ChangeState(WMObject, WMConnectionBase):
 
             # updating the status of the summary doc only when it is explicitely requested
             # doc is already in couch
-            if updatesummary:
+            if updatesummary and not self.bulkStateTransitions:
                 jobSummaryId = job["name"]
                 updateUri = "/" + self.jsumdatabase.name + "/_design/WMStatsAgent/_update/jobSummaryState/" + jobSummaryId
                 # map retrydone state to jobfailed state for monitoring
@@ -390,10 +460,7 @@ class ChangeState(WMObject, WMConnectionBase):
 
             if job.get("fwjr", None):
 
-                cachedByWorkflow = self.workloadCache.setdefault(job['workflow'],
-                                                                 getDataFromSpecFile(
-                                                                     self.getWorkflowSpecDAO.execute(job['task'])[
-                                                                         job['task']]['spec']))
+                cachedByWorkflow = self.getWorkflowSpecData(job['workflow'], job['task'])
                 job['fwjr'].setCampaign(job.get('campaignName', ''))
                 job['fwjr'].setPrepID(cachedByWorkflow.get(job['task'], ''))
                 # If there are too many input files, strip them out
@@ -583,6 +650,77 @@ class ChangeState(WMObject, WMConnectionBase):
             self.jsumdatabase.commit()
         return
 
+    def getWorkflowSpecData(self, workflow, task):
+        """
+        _getWorkflowSpecData_
+
+        Return the campaign and the task PrepIDs of a workflow spec. They are
+        cached per workflow, as long as the spec file is not modified.
+        """
+        specData = self.specCache.get(workflow, validate=lambda item: getSpecMtime(item[0]) == item[1])
+        if specData is not None:
+            return specData[2]
+
+        specFile = self.getWorkflowSpecDAO.execute(task)[task]['spec']
+        specMtime = getSpecMtime(specFile)
+        data = getDataFromSpecFile(specFile)
+        self.specCache.set(workflow, (specFile, specMtime, data))
+        logging.info("Loaded spec of workflow %s, spec cache: %s", workflow, self.specCache.stats())
+        return data
+
+    @staticmethod
+    def getJobLocation(job, newstate):
+        """
+        _getJobLocation_
+
+        Location recorded with the state transition, the site for executing
+        jobs and the agent otherwise
+        """
+        if job.get("site_cms_name", None) and newstate == "executing":
+            return job["site_cms_name"]
+        return "Agent"
+
+    def recordTransitionsInBulk(self, jobs, newstate, oldstate, timestamp, updatesummary=False):
+        """
+        _recordTransitionsInBulk_
+
+        Record the state transition of the jobs already in couch, and of their
+        job summaries if requested. The documents are fetched and written back
+        maxBulkCommit at a time, instead of calling the update handlers once
+        per job.
+        """
+        if newstate == "new":
+            oldstate = "none"
+        # map retrydone state to jobfailed state for monitoring
+        monitorState = "jobfailed" if newstate == "retrydone" else newstate
+
+        jobTransitions = {}
+        summaryTransitions = {}
+        for job in jobs:
+            couchDocID = job.get("couch_record", None)
+            if couchDocID is not None:
+                jobTransitions.setdefault(couchDocID, []).append({"oldstate": oldstate,
+                                                                  "newstate": newstate,
+                                                                  "location": self.getJobLocation(job, newstate),
+                                                                  "timestamp": timestamp})
+            if updatesummary:
+                summaryTransitions.setdefault(job["name"], []).append({"oldstate": oldstate,
+                                                                       "newstate": monitorState,
+                                                                       "location": job["location"],
+                                                                       "timestamp": timestamp})
+
+        for database, transitions, updateFunc in ((self.jobsdatabase, jobTransitions, addJobStateTransitions),
+                                                  (self.jsumdatabase, summaryTransitions, addJobSummaryTransitions)):
+            if not transitions:
+                continue
+            failedDocIDs = database.updateBulkDocumentsWithFunction(list(transitions), partial(updateFunc, transitions),
+                                                                    updateLimits=self.maxBulkCommit,
+                                                                    maxConflictLimit=self.maxConflictRetries)
+            if failedDocIDs:
+                logging.error("Failed to record the %s transition of %d documents in %s: %s",
+                              newstate, len(failedDocIDs), database.name, failedDocIDs[:10])
+        return
+
     def persist(self, jobs, newstate, oldstate):
         """
         _persist_
@@ -12,8 +12,11 @@ RSE basis.
 # futures
 from __future__ import division, print_function
 
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor, wait, ALL_COMPLETED, FIRST_COMPLETED
 from pprint import pformat
-from time import time
+from queue import Queue
+from time import time, sleep
 from datetime import datetime
 
 import random
@@ -23,11 +26,21 @@ import errno
 import stat
 try:
     import gfal2
+    GfalError = gfal2.GError
 except ImportError:
     # in case we do not have gfal2 installed
     print("FAILED to import gfal2. Use it only in emulateGfal2=True mode!!!")
     gfal2 = None
 
+    class GfalError(Exception):
+        """
+        Stand-in for gfal2.GError, to be raised by gfal2 context emulations
+        """
+        def __init__(self, message="", code=0):
+            super(GfalError, self).__init__(message)
+            self.message = message
+            self.code = code
+
 from pymongo import IndexModel
 from pymongo.errors  import NotPrimaryError
 
@@ -79,6 +92,48 @@ def createGfal2Context(logLevel="normal", emulate=False):
     return ctx
 
 
+def dirFilesGen(sortedFiles, dirLfn):
+    """
+    Generator over the files of a directory, looked up with bisect in a
+    sorted list of files: the directory entry itself, if it is listed,
+    followed by all the files below it.
+    :param sortedFiles: a sorted list of file LFNs
+    :param dirLfn:      the directory LFN
+    :return:            a generator of file LFNs
+    """
+    idx = bisect_left(sortedFiles, dirLfn)
+    if idx < len(sortedFiles) and sortedFiles[idx] == dirLfn:
+        yield dirLfn
+    # all the paths below dirLfn sort between dirLfn + '/' and dirLfn + '0',
+    # since '0' is the character right after '/'
+    start = bisect_left(sortedFiles, dirLfn + '/', idx)
+    end = bisect_left(sortedFiles, dirLfn + '0', start)
+    for i in range(start, end):
+        yield sortedFiles[i]
+
+
+def dirIndexFilesGen(dirIndex, sortedDirs, dirLfn):
+    """
+    Generator over the files of a directory, looked up in the compact per
+    directory index built while streaming the unmerged files: the files of
+    the directory itself, followed by those of all the directories below it.
+    :param dirIndex:   a dictionary of directory LFNs and the bytearray of the
+                       new line terminated suffixes of the files in them
+    :param sortedDirs: the sorted list of the dirIndex keys
+    :param dirLfn:     the directory LFN
+    :return:           a generator of file LFNs
+    """
+    idx = bisect_left(sortedDirs, dirLfn)
+    start = bisect_left(sortedDirs, dirLfn + '/', idx)
+    end = bisect_left(sortedDirs, dirLfn + '0', start)
+    subDirs = list(sortedDirs[start:end])
+    if idx < len(sortedDirs) and sortedDirs[idx] == dirLfn:
+        subDirs.insert(0, dirLfn)
+    for subDir in subDirs:
+        for suffix in dirIndex[subDir].decode('utf-8').split('\n')[:-1]:
+            yield subDir + suffix
+
+
 class MSUnmerged(MSCore):
     """
     MSUnmerged.py class provides the logic for cleaning the unmerged area of
@@ -106,6 +161,11 @@ class MSUnmerged(MSCore):
         self.msConfig.setdefault("dirFilterExcl", [])
         self.msConfig.setdefault("emulateGfal2", False)
         self.msConfig.setdefault("filesToDeleteSliceSize", 100)
+        self.msConfig.setdefault("rucioConMonStream", False)
+        self.msConfig.setdefault("deletionThreads", 1)
+        self.msConfig.setdefault("deletionThreadsPerRSE", {})
+        self.msConfig.setdefault("deletionRetries", 0)
+        self.msConfig.setdefault("deletionBackoff", 10)
 
         self.msConfig.setdefault("mongoDBRetryCount", 3)
         self.msConfig.setdefault("mongoDBReplicaSet", None)
@@ -306,134 +366,257 @@ class MSUnmerged(MSCore):
     def cleanRSE(self, rse):
         """
         The method to implement the actual deletion of files for an RSE.
+        The directories are cleaned by up to 'deletionThreads' (or the RSE value in
+        'deletionThreadsPerRSE') concurrent workers, each one with its own gfal2 context.
+        At most two directories per worker are submitted at any time, such that only
+        their Pfn lists are held in memory.
         :param rse: MSUnmergedRSE object to be cleaned
         :return:    The MSUnmergedRSE object
         """
+        numThreads = self.msConfig['deletionThreadsPerRSE'].get(rse['name'], self.msConfig['deletionThreads'])
+        numThreads = max(numThreads, 1)
 
-        # Create the gfal2 context object:
+        # Create the gfal2 context objects, one per deletion worker:
+        contexts = Queue()
         try:
-            ctx = createGfal2Context(self.msConfig['gfalLogLevel'], self.msConfig['emulateGfal2'])
+            for _ in range(numThreads):
+                contexts.put(createGfal2Context(self.msConfig['gfalLogLevel'], self.msConfig['emulateGfal2']))
         except Exception as ex:
+            self._freeContexts(contexts)
             msg = "RSE: %s, Failed to create gfal2 Context object. " % rse['name']
             msg += "Skipping it in the current run."
             self.logger.exception(msg)
             raise MSUnmergedPlineExit(msg) from ex
 
+        def cleanDirWorker(dirLfn, dirPfn, pfnList):
+            ctx = contexts.get()
+            try:
+                return self._cleanDir(ctx, rse['name'], dirLfn, dirPfn, pfnList)
+            finally:
+                contexts.put(ctx)
+
         filesToDeleteCurrRSE = 0
+        executor = ThreadPoolExecutor(max_workers=numThreads) if numThreads > 1 else None
+        dirFutures = []
 
-        # Start cleaning one directory at a time:
-        for dirLfn, fileLfnGen in rse['files']['toDelete'].items():
-            if dirLfn in rse['dirs']['deletedSuccess']:
-                self.logger.info("RSE: %s, dir: %s already successfully deleted.", rse['name'], dirLfn)
-                continue
+        try:
+            # Start cleaning one directory at a time:
+            for dirLfn, fileLfnGen in rse['files']['toDelete'].items():
+                if dirLfn in rse['dirs']['deletedSuccess']:
+                    self.logger.info("RSE: %s, dir: %s already successfully deleted.", rse['name'], dirLfn)
+                    continue
 
-            if self.msConfig['limitFilesPerRSE'] < 0 or \
-               filesToDeleteCurrRSE < self.msConfig['limitFilesPerRSE']:
-
-                # Now we consume the rse['files']['toDelete'][dirLfn] generator
-                # upon that no values will be left in it. In case we need it again
-                # we will have to recreate the filter as we did in self.filterUnmergedFiles()
-                pfnList = []
-                if not rse['pfnPrefix']:
-                    # Fall back to calling Rucio on a per directory basis for
-                    # resolving the lfn to pfn mapping
-                    dirPfn = self.rucio.getPFN(rse['name'], dirLfn, operation='delete')[dirLfn]
-                    for fileLfn in fileLfnGen:
-                        fileLfnSuffix = fileLfn.split(dirLfn)[1]
-                        filePfn = dirPfn + fileLfnSuffix
-                        pfnList.append(filePfn)
-                else:
-                    # Proceed with assembling the full filePfn out of the rse['pfnPrefix'] and the fileLfn
-                    dirPfn = rse['pfnPrefix'] + dirLfn
-                    for fileLfn in fileLfnGen:
-                        filePfn = rse['pfnPrefix'] + fileLfn
-                        pfnList.append(filePfn)
-
-                filesToDeleteCurrRSE += len(pfnList)
-                msg = "\nRSE: %s \nDELETING: %s."
-                msg += "\nPFN list with: %s entries: \n%s"
-                self.logger.debug(msg, rse['name'], dirLfn, len(pfnList), twFormat(pfnList, maxLength=4))
-
-                if self.msConfig['enableRealMode']:
-                    # The following two bool flags are to track the success for directory removal
-                    # during all consecutive attempts/steps of cleaning the current branch.
-                    rmdirSuccess = False
-                    purgeSuccess = False
-                    filesDeletedSuccess = 0
-                    filesDeletedFail = 0
-
-                    # Initially try to delete the whole directory even before emptying its content:
-                    self.logger.info("Trying to remove nonempty directory: %s", dirLfn)
-                    rmdirSuccess = self._rmDir(ctx, dirPfn)
-
-                    # If the directory was considered successfully removed, update the file counters with the length of the directory contents
-                    # If the above operation fails try to execute the directory contents deletion in bulk - full list of files per directory
-                    if rmdirSuccess:
-                        filesDeletedSuccess = len(pfnList)
+                if self.msConfig['limitFilesPerRSE'] < 0 or \
+                   filesToDeleteCurrRSE < self.msConfig['limitFilesPerRSE']:
+
+                    # Now we consume the rse['files']['toDelete'][dirLfn] generator
+                    # upon that no values will be left in it. In case we need it again
+                    # we will have to recreate the filter as we did in self.filterUnmergedFiles()
+                    pfnList = []
+                    if not rse['pfnPrefix']:
+                        # Fall back to calling Rucio on a per directory basis for
+                        # resolving the lfn to pfn mapping
+                        dirPfn = self.rucio.getPFN(rse['name'], dirLfn, operation='delete')[dirLfn]
+                        for fileLfn in fileLfnGen:
+                            fileLfnSuffix = fileLfn.split(dirLfn)[1]
+                            filePfn = dirPfn + fileLfnSuffix
+                            pfnList.append(filePfn)
                     else:
-                        msg = "Trying to clean the contents of nonempty directory: %s "
-                        msg += "in slices of: %s files"
-                        self.logger.info(msg, dirLfn, self.msConfig["filesToDeleteSliceSize"])
-                        for pfnSlice in list(grouper(pfnList, self.msConfig["filesToDeleteSliceSize"])):
-                            try:
-                                delResult = ctx.unlink(pfnSlice)
-                                # Count all the successfully deleted files (if a deletion was
-                                # successful a value of None is put in the delResult list):
-                                self.logger.debug("RSE: %s, Dir: %s, delResult: %s",
-                                                  rse['name'], dirLfn, pformat(delResult))
-                                for gfalErr in delResult:
-                                    if gfalErr is None:
-                                        filesDeletedSuccess += 1
-                                    else:
-                                        filesDeletedFail += 1
-                                        errMessage = os.strerror(gfalErr.code)
-                                        rse['counters']['gfalErrors'].setdefault(errMessage, 0)
-                                        rse['counters']['gfalErrors'][errMessage] += 1
-                            except Exception as ex:
-                                msg = "Error while cleaning RSE: %s. "
-                                msg += "Will retry in the next cycle. Err: %s"
-                                self.logger.exception(msg, rse['name'], str(ex))
-
-                        self.logger.info("RSE: %s, Dir: %s, filesDeletedSuccess: %s",
-                                          rse['name'], dirLfn, filesDeletedSuccess)
-
-                        # Now delete the whole branch, which was previously cleaned file by file
-                        # First try to delete the base directory:
-                        rmdirSuccess = self._rmDir(ctx, dirPfn)
-
-                        # Then if unable to delete the base directory due to nonEmpty err or similar, try with _purgeTree() recursively
-                        if not rmdirSuccess:
-                            self.logger.info("Trying to recursively purge directory: %s:\n", dirLfn)
-                            purgeSuccess = self._purgeTree(ctx, dirPfn)
-
-                    # Updating the RSE counters with the newly successfully deleted files
-                    rse['counters']['filesDeletedSuccess'] += filesDeletedSuccess
-                    rse['counters']['filesDeletedFail'] += filesDeletedFail
-
-                    if purgeSuccess or rmdirSuccess:
-                        rse['dirs']['deletedSuccess'].add(dirLfn)
-                        rse['counters']['dirsDeletedSuccess'] = len(rse['dirs']['deletedSuccess'])
-                        # if dirLfn in rse['dirs']['toDelete']:
-                        #     rse['dirs']['toDelete'].remove(dirLfn)
-                        if dirLfn in rse['dirs']['deletedFail']:
-                            rse['dirs']['deletedFail'].remove(dirLfn)
-                        msg = "RSE: %s  Success deleting directory: %s"
-                        self.logger.info(msg, rse['name'], dirLfn)
+                        # Proceed with assembling the full filePfn out of the rse['pfnPrefix'] and the fileLfn
+                        dirPfn = rse['pfnPrefix'] + dirLfn
+                        for fileLfn in fileLfnGen:
+                            filePfn = rse['pfnPrefix'] + fileLfn
+                            pfnList.append(filePfn)
+
+                    filesToDeleteCurrRSE += len(pfnList)
+                    msg = "\nRSE: %s \nDELETING: %s."
+                    msg += "\nPFN list with: %s entries: \n%s"
+                    self.logger.debug(msg, rse['name'], dirLfn, len(pfnList), twFormat(pfnList, maxLength=4))
+
+                    if self.msConfig['enableRealMode']:
+                        if executor:
+                            dirFutures.append((dirLfn, executor.submit(cleanDirWorker, dirLfn, dirPfn, pfnList)))
+                            # Only keep the Pfn lists of a few directories per worker in memory
+                            if len(dirFutures) >= 2 * numThreads:
+                                dirFutures = self._collectDirResults(rse, dirFutures, FIRST_COMPLETED)
+                        else:
+                            self._updateDirCounters(rse, dirLfn, cleanDirWorker(dirLfn, dirPfn, pfnList))
+                else:
+                    msg = "RSE: %s reached limit of files per RSE to be deleted. Skipping directory: %s. It will be retried on the next cycle."
+                    self.logger.warning(msg, rse['name'], dirLfn)
+
+            # Collect the results of the remaining concurrent workers
+            if executor:
+                dirFutures = self._collectDirResults(rse, dirFutures, ALL_COMPLETED)
+            rse['isClean'] = self._checkClean(rse)
+        finally:
+            if executor:
+                for _, future in dirFutures:
+                    future.cancel()
+                executor.shutdown()
+            # Explicitly release all internal resources used by the gfal2 context instances
+            self._freeContexts(contexts)
+
+        return rse
+
+    def _collectDirResults(self, rse, dirFutures, returnWhen):
+        """
+        Auxiliary method to wait for the concurrent workers cleaning the directories
+        and to update the RSE with the results of the finished ones, in the order
+        the directories were submitted.
+        :param rse:        The RSE object
+        :param dirFutures: List of (dirLfn, future) tuples of the submitted directories
+        :param returnWhen: FIRST_COMPLETED or ALL_COMPLETED, as for concurrent.futures.wait
+        :return:           The list of (dirLfn, future) tuples still running
+        """
+        done, _ = wait([future for _, future in dirFutures], return_when=returnWhen)
+        running = []
+        for dirLfn, future in dirFutures:
+            if future not in done:
+                running.append((dirLfn, future))
+                continue
+            try:
+                self._updateDirCounters(rse, dirLfn, future.result())
+            except Exception as ex:
+                msg = "RSE: %s, Dir: %s, unexpected error while cleaning it. "
+                msg += "Will retry in the next cycle. Err: %s"
+                self.logger.exception(msg, rse['name'], dirLfn, str(ex))
+                self._updateDirCounters(rse, dirLfn, {'dirDeleted': False, 'filesDeletedSuccess': 0,
+                                                      'filesDeletedFail': 0, 'gfalErrors': {}})
+        return running
+
+    @staticmethod
+    def _freeContexts(contexts):
+        """
+        Auxiliary method to release the resources of all the gfal2 context objects in a queue
+        :param contexts: Queue of gfal2 context objects
+        :return:         None
+        """
+        while not contexts.empty():
+            ctx = contexts.get()
+            if ctx:
+                ctx.free()
+
+    def _cleanDir(self, ctx, rseName, dirLfn, dirPfn, pfnList):
+        """
+        Auxiliary method deleting the contents of a single directory and the directory itself.
+        It only uses its own gfal2 context object and does not touch the RSE object, such
+        that it can run concurrently for several directories.
+        :param ctx:     The gfal2 context object
+        :param rseName: The RSE name
+        :param dirLfn:  The Lfn of the directory to be removed
+        :param dirPfn:  The Pfn of the directory to be removed
+        :param pfnList: The list of the Pfns of the files in the directory
+        :return:        A dictionary with the directory deletion status, the number of files
+                        deleted successfully or not, and the count of every gfal error
+        """
+        # The following two bool flags are to track the success for directory removal
+        # during all consecutive attempts/steps of cleaning the current branch.
+        rmdirSuccess = False
+        purgeSuccess = False
+        filesDeletedSuccess = 0
+        filesDeletedFail = 0
+        gfalErrors = {}
+
+        # Initially try to delete the whole directory even before emptying its content:
+        self.logger.info("Trying to remove nonempty directory: %s", dirLfn)
+        rmdirSuccess = self._rmDir(ctx, dirPfn)
+
+        # If the directory was considered successfully removed, update the file counters with the length of the directory contents
+        # If the above operation fails try to execute the directory contents deletion in bulk - full list of files per directory
+        if rmdirSuccess:
+            filesDeletedSuccess = len(pfnList)
+        else:
+            msg = "Trying to clean the contents of nonempty directory: %s "
+            msg += "in slices of: %s files"
+            self.logger.info(msg, dirLfn, self.msConfig["filesToDeleteSliceSize"])
+            for pfnSlice in list(grouper(pfnList, self.msConfig["filesToDeleteSliceSize"])):
+                delResult = self._unlinkSlice(ctx, rseName, pfnSlice)
+                # Count all the successfully deleted files (if a deletion was
+                # successful a value of None is put in the delResult list):
+                self.logger.debug("RSE: %s, Dir: %s, delResult: %s",
+                                  rseName, dirLfn, pformat(delResult))
+                for gfalErr in delResult:
+                    if gfalErr is None:
+                        filesDeletedSuccess += 1
                     else:
-                        rse['dirs']['deletedFail'].add(dirLfn)
-                        rse['counters']['dirsDeletedFail'] = len(rse['dirs']['deletedFail'])
-                        msg = "RSE: %s Failed to purge directory: %s"
-                        self.logger.error(msg, rse['name'], dirLfn)
-            else:
-                msg = "RSE: %s reached limit of files per RSE to be deleted. Skipping directory: %s. It will be retried on the next cycle."
-                self.logger.warning(msg, rse['name'], dirLfn)
-        rse['isClean'] = self._checkClean(rse)
+                        filesDeletedFail += 1
+                        errMessage = os.strerror(gfalErr.code)
+                        gfalErrors.setdefault(errMessage, 0)
+                        gfalErrors[errMessage] += 1
 
-        # Explicitly release all internal resources used by the gfal2 context instance
-        if ctx:
-            ctx.free()
+            self.logger.info("RSE: %s, Dir: %s, filesDeletedSuccess: %s",
+                             rseName, dirLfn, filesDeletedSuccess)
 
-        return rse
+            # Now delete the whole branch, which was previously cleaned file by file
+            # First try to delete the base directory:
+            rmdirSuccess = self._rmDir(ctx, dirPfn)
+
+            # Then if unable to delete the base directory due to nonEmpty err or similar, try with _purgeTree() recursively
+            if not rmdirSuccess:
+                self.logger.info("Trying to recursively purge directory: %s:\n", dirLfn)
+                purgeSuccess = self._purgeTree(ctx, dirPfn)
+
+        return {'dirDeleted': purgeSuccess or rmdirSuccess,
+                'filesDeletedSuccess': filesDeletedSuccess,
+                'filesDeletedFail': filesDeletedFail,
+                'gfalErrors': gfalErrors}
+
+    def _unlinkSlice(self, ctx, rseName, pfnSlice):
+        """
+        Auxiliary method to unlink a slice of files with gfal2, retrying up to
+        'deletionRetries' times with an exponential backoff if the whole call fails.
+        :param ctx:      The gfal2 context object
+        :param rseName:  The RSE name
+        :param pfnSlice: The Pfns of the files to be unlinked
+        :return:         The gfal2 unlink result, with a None value for every file
+                         successfully deleted, or an empty list if all attempts failed
+        """
+        for attempt in range(self.msConfig['deletionRetries'] + 1):
+            try:
+                return ctx.unlink(pfnSlice)
+            except Exception as ex:
+                if attempt < self.msConfig['deletionRetries']:
+                    backoff = self.msConfig['deletionBackoff'] * 2 ** attempt
+                    msg = "Error while cleaning RSE: %s. Retrying in %s secs. Err: %s"
+                    self.logger.warning(msg, rseName, backoff, str(ex))
+                    sleep(backoff)
+                else:
+                    msg = "Error while cleaning RSE: %s. "
+                    msg += "Will retry in the next cycle. Err: %s"
+                    self.logger.exception(msg, rseName, str(ex))
+        return []
+
+    def _updateDirCounters(self, rse, dirLfn, dirResult):
+        """
+        Auxiliary method to update the RSE counters and directory sets with
+        the result of cleaning one of its directories.
+        :param rse:       The RSE object
+        :param dirLfn:    The Lfn of the directory
+        :param dirResult: The dictionary returned by _cleanDir
+        :return:          None
+        """
+        # Updating the RSE counters with the newly successfully deleted files
+        rse['counters']['filesDeletedSuccess'] += dirResult['filesDeletedSuccess']
+        rse['counters']['filesDeletedFail'] += dirResult['filesDeletedFail']
+        for errMessage, errCount in dirResult['gfalErrors'].items():
+            rse['counters']['gfalErrors'].setdefault(errMessage, 0)
+            rse['counters']['gfalErrors'][errMessage] += errCount
+
+        if dirResult['dirDeleted']:
+            rse['dirs']['deletedSuccess'].add(dirLfn)
+            rse['counters']['dirsDeletedSuccess'] = len(rse['dirs']['deletedSuccess'])
+            # if dirLfn in rse['dirs']['toDelete']:
+            #     rse['dirs']['toDelete'].remove(dirLfn)
+            if dirLfn in rse['dirs']['deletedFail']:
+                rse['dirs']['deletedFail'].remove(dirLfn)
+            msg = "RSE: %s  Success deleting directory: %s"
+            self.logger.info(msg, rse['name'], dirLfn)
+        else:
+            rse['dirs']['deletedFail'].add(dirLfn)
+            rse['counters']['dirsDeletedFail'] = len(rse['dirs']['deletedFail'])
+            msg = "RSE: %s Failed to purge directory: %s"
+            self.logger.error(msg, rse['name'], dirLfn)
 
     def _rmDir(self, ctx, dirPfn):
         """
@@ -447,7 +630,7 @@ class MSUnmerged(MSCore):
         try:
             # NOTE: For gfal2 rmdir() exit status of 0 is success
             rmdirSuccess = ctx.rmdir(dirPfn) == 0
-        except gfal2.GError as gfalExc:
+        except GfalError as gfalExc:
             if gfalExc.code == errno.ENOENT:
                 self.logger.warning("MISSING directory: %s", dirPfn)
                 rmdirSuccess = True
@@ -476,7 +659,7 @@ class MSUnmerged(MSCore):
                 if not stat.S_ISDIR(entryStat.st_mode):
                     self.logger.error("The base pfn: %s is not a directory entry.", baseDirPfn)
                     return False
-            except gfal2.GError as gfalExc:
+            except GfalError as gfalExc:
                 if gfalExc.code == errno.ENOENT:
                     self.logger.warning("MISSING baseDir: %s", baseDirPfn)
                     return True
@@ -488,7 +671,7 @@ class MSUnmerged(MSCore):
         successList = []
         try:
             dirEntryList = ctx.listdir(baseDirPfn)
-        except gfal2.GError as gfalExc:
+        except GfalError as gfalExc:
             if gfalExc.code == errno.ENOENT:
                 self.logger.warning("MISSING baseDir: %s", baseDirPfn)
                 return True
@@ -499,11 +682,11 @@ class MSUnmerged(MSCore):
         for dirEntry in dirEntryList:
             if dirEntry in ['.', '..']:
                 continue
-            dirEntryPfn = baseDirPfn + dirEntry
+            dirEntryPfn = baseDirPfn.rstrip('/') + '/' + dirEntry
             entryStat = None
             try:
                 entryStat = ctx.stat(dirEntryPfn)
-            except gfal2.GError as gfalExc:
+            except GfalError as gfalExc:
                 if gfalExc.code == errno.ENOENT:
                     self.logger.warning("MISSING dirEntry: %s", dirEntryPfn)
                     successList.append(True)
@@ -612,9 +795,18 @@ class MSUnmerged(MSCore):
         /ver2_HIPM_UL2016_MiniAODv2-v2         - processing string + processing version
         /140000/388E3DEF-...-7DD036D9DD33.root - to be cut off
 
+        If the rucioConMonStream option is set, the zipped list of unmerged files is
+        streamed instead, and rse['files']['allUnmerged'] is a compact index of the
+        files to be considered for deletion: a dictionary of their cut directory path
+        and the suffixes of the files in it. The files in protected directories, or in
+        directories left out by the service filters, are dropped as soon as they are read.
+
         :param rse: The RSE to work on
         :return:    rse
         """
+        if self.msConfig['rucioConMonStream']:
+            return self._streamUnmergedFiles(rse)
+
         rse['files']['allUnmerged'] = self.rucioConMon.getRSEUnmerged(rse['name'])
         for filePath in rse['files']['allUnmerged']:
             # Check if what we start with is under /store/unmerged/*
@@ -630,21 +822,77 @@ class MSUnmerged(MSCore):
         rse['counters']['totalNumDirs'] = len(rse['dirs']['allUnmerged'])
         return rse
 
+    def _streamUnmergedFiles(self, rse):
+        """
+        Streaming version of getUnmergedFiles, building the compact per directory index
+        of the files to be considered for deletion
+        :param rse: The RSE to work on
+        :return:    rse
+        """
+        dirIndex = {}
+        totalNumFiles = 0
+        for filePath in self.rucioConMon.getRSEUnmerged(rse['name'], zipped=True, stream=True):
+            totalNumFiles += 1
+            # Check if what we start with is under /store/unmerged/*
+            if not self.regStoreUnmergedLfn.match(filePath):
+                continue
+            # Cut the path to the deepest level known to WMStats protected LFNs
+            dirPath = self._cutPath(filePath)
+            # Check if what is left is still under /store/unmerged/*
+            if not self.regStoreUnmergedLfn.match(dirPath):
+                continue
+            rse['dirs']['allUnmerged'].add(dirPath)
+            if dirPath in self.protectedLFNs or not filePath.startswith(dirPath):
+                continue
+            if dirPath not in dirIndex:
+                if not self._passDirFilters(dirPath):
+                    continue
+                dirIndex[dirPath] = bytearray()
+            dirIndex[dirPath] += filePath[len(dirPath):].encode('utf-8') + b'\n'
+
+        rse['files']['allUnmerged'] = dirIndex
+        rse['counters']['totalNumFiles'] = totalNumFiles
+        rse['counters']['totalNumDirs'] = len(rse['dirs']['allUnmerged'])
+        return rse
+
+    def _passDirFilters(self, dirName):
+        """
+        Checks a directory against the 'dirFilterIncl' and 'dirFilterExcl' service filters
+        :param dirName: The directory path
+        :return:        Bool: True if the directory is to be cleaned, False otherwise
+        """
+        # NOTE: If the 'dirFilterIncl' is non empty then the cleaning process will
+        #       be enclosed only in this part of the tree and will ignore anything
+        #       from /store/unmerged/ which does not belong to the included filter
+        # NOTE: 'dirFilterExcl' is always applied.
+        for pathExcl in self.msConfig['dirFilterExcl']:
+            if dirName.startswith(pathExcl):
+                # then it matched one of the exclusion paths
+                return False
+        if not self.msConfig['dirFilterIncl']:
+            return True
+        for pathIncl in self.msConfig['dirFilterIncl']:
+            if dirName.startswith(pathIncl):
+                return True
+        return False
+
     def _cutPath(self, filePath):
         """
         Cuts a file path to the deepest level known to WMStats protected LFNs
         :param filePath:   The full (absolute) file path together with the file name
         :return finalPath: The final path cut the to correct level
         """
+        # Split the path on its first 7 slashes, which gives the empty root, followed by
+        # ['store', 'unmerged', 'RunIISummer20UL17SIM', ...], and keep up to the 7th element.
+        # Paths which would not be split the same way as os.path.split does are left to it
+        if filePath.startswith('/') and not filePath.endswith('/') and '//' not in filePath:
+            return '/'.join(filePath.split('/', 7)[:7])
+
         # pylint: disable=E1120
         # This is a known issue when when passing an unpacked list to a method expecting
         # at least one variable. In this case the signature of the method breaking the
         # rule is:
         # os.path.join(*newPath) != os.path.join(a, *p)
-
-        # Split the initial filePath into chunks and fill it into a dictionary
-        # containing only directory names and the root of the path e.g.
-        # ['/', 'store', 'unmerged', 'RunIISummer20UL17SIM', ...]
         newPath = []
         root = filePath
         while True:
@@ -681,54 +929,35 @@ class MSUnmerged(MSCore):
         # Get rid of 'allUnmerged' directories
         rse['dirs']['allUnmerged'].clear()
 
-        # NOTE: Here we may want to filter out all protected files from allUnmerged and leave just those
-        #       eligible for deletion. This will minimize the iteration time of the filters
-        #       from toDelete later on.
-        # while rse['files']['allUnmerged'
+        # Now create the filters for rse['files']['toDelete'] - those should be pure generators.
+        # The files are sorted once, such that the files of every directory are found with
+        # a bisect range lookup, instead of scanning all the files for every directory
+        if isinstance(rse['files']['allUnmerged'], dict):
+            # the compact per directory index built while streaming the files
+            sortedDirs = sorted(rse['files']['allUnmerged'])
 
-        # Now create the filters for rse['files']['toDelete'] - those should be pure generators
-        # A simple generator:
-        def genFunc(pattern, iterable):
-            for i in iterable:
-                if i.startswith(pattern):
-                    yield i
-
-        # NOTE: If the 'dirFilterIncl' is non empty then the cleaning process will
-        #       be enclosed only in this part of the tree and will ignore anything
-        #       from /store/unmerged/ which does not belong to the included filter
-        # NOTE: 'dirFilterExcl' is always applied.
+            def dirFilter(dirName):
+                return dirIndexFilesGen(rse['files']['allUnmerged'], sortedDirs, dirName)
+        else:
+            if not isinstance(rse['files']['allUnmerged'], list):
+                rse['files']['allUnmerged'] = list(rse['files']['allUnmerged'])
+            rse['files']['allUnmerged'].sort()
 
-        # Merge the additional filters into a final set to be applied:
-        dirFilterIncl = set(self.msConfig['dirFilterIncl'])
-        dirFilterExcl = set(self.msConfig['dirFilterExcl'])
+            def dirFilter(dirName):
+                return dirFilesGen(rse['files']['allUnmerged'], dirName)
 
         # Update directory/files with no service filters
-        if not dirFilterIncl and not dirFilterExcl:
+        if not self.msConfig['dirFilterIncl'] and not self.msConfig['dirFilterExcl']:
             for dirName in rse['dirs']['toDelete']:
-                rse['files']['toDelete'][dirName] = genFunc(dirName, rse['files']['allUnmerged'])
+                rse['files']['toDelete'][dirName] = dirFilter(dirName)
             rse['counters']['dirsToDelete'] = len(rse['files']['toDelete'])
             self.logger.info("RSE: %s: %s", rse['name'], twFormat(rse, maxLength=8))
             return rse
 
         # If we are here, then there are service filters...
         for dirName in rse['dirs']['toDelete']:
-            # apply exclusion filter
-            dirFilterExclMatch = []
-            for pathExcl in dirFilterExcl:
-                dirFilterExclMatch.append(dirName.startswith(pathExcl))
-            if any(dirFilterExclMatch):
-                # then it matched one of the exclusion paths
-                continue
-            if not dirFilterIncl:
-                # there is no inclusion filter, simply add this directory/files
-                rse['files']['toDelete'][dirName] = genFunc(dirName, rse['files']['allUnmerged'])
-                continue
-
-            # apply inclusion filter
-            for pathIncl in dirFilterIncl:
-                if dirName.startswith(pathIncl):
-                    rse['files']['toDelete'][dirName] = genFunc(dirName, rse['files']['allUnmerged'])
-                    break
+            if self._passDirFilters(dirName):
+                rse['files']['toDelete'][dirName] = dirFilter(dirName)
 
         # Now apply the filters back to the set in rse['dirs']['toDelete']
         rse['dirs']['toDelete'] = set(rse['files']['toDelete'].keys())
@@ -751,6 +980,9 @@ class MSUnmerged(MSCore):
         #        beginning of the lfn part rather than just the protocol prefix
         if rse['files']['allUnmerged']:
             lfn = next(iter(rse['files']['allUnmerged']))
+            if isinstance(rse['files']['allUnmerged'], dict):
+                # take the first file of the first directory in the compact index
+                lfn += rse['files']['allUnmerged'][lfn].decode('utf-8').split('\n', 1)[0]
             pfnDict = self.rucio.getPFN(rse['name'], lfn, operation='delete')
             pfnFull = pfnDict[lfn]
             if self.regStoreUnmergedPfn.match(pfnFull):
@@ -14,10 +14,19 @@ import sys
 import logging
 import os
 import threading
+import time
 import traceback
 import pickle
 
-from Utils.PythonVersion import PY3
+from collections import deque
+
+try:
+    import msgpack
+except ImportError:
+    # optional, only needed by the msgpack codec
+    msgpack = None
+
+from Utils.PythonVersion import PY3, HIGHEST_PICKLE_PROTOCOL
 
 from logging.handlers import RotatingFileHandler
 
@@ -29,6 +38,7 @@ from WMCore.Services.Requests import JSONRequests
 from WMCore.Agent.HeartbeatAPI import HeartbeatAPI
 
 from WMCore.WMException import WMException
+from WMCore.Wrappers.JsonWrapper.JSONThunker import JSONThunker
 
 
 class ProcessPoolException(WMException):
@@ -39,6 +49,247 @@ class ProcessPoolException(WMException):
     """
 
 
+class JSONCodec(object):
+    """
+    _JSONCodec_
+
+    Encode the messages as JSON strings, using the Services.Requests
+    JSONizer, which handles __to_json__ calls. This is the default codec.
+    """
+    name = "json"
+
+    def __init__(self):
+        self.jsonHandler = JSONRequests()
+
+    def send(self, socket, data):
+        """
+        Encode the data and send it through the socket
+        """
+        encodedData = self.jsonHandler.encode(data)
+        if PY3:
+            socket.send_string(encodedData)
+        else:
+            socket.send(encodedData)
+
+    def recv(self, socket):
+        """
+        Receive a message from the socket and decode it
+        """
+        return self.jsonHandler.decode(socket.recv())
+
+
+class MsgpackCodec(object):
+    """
+    _MsgpackCodec_
+
+    Encode the messages as msgpack binaries. The data goes through the
+    JSONThunker first, so objects are exchanged as with the JSON codec.
+    """
+    name = "msgpack"
+
+    def __init__(self):
+        if msgpack is None:
+            raise ProcessPoolException("The msgpack codec requires the msgpack module")
+        self.thunker = JSONThunker()
+
+    def send(self, socket, data):
+        """
+        Encode the data and send it through the socket
+        """
+        socket.send(msgpack.packb(self.thunker.thunk(data), use_bin_type=True), copy=False)
+
+    def recv(self, socket):
+        """
+        Receive a message from the socket and decode it
+        """
+        frame = socket.recv(copy=False)
+        return self.thunker.unthunk(msgpack.unpackb(frame.buffer, raw=False))
+
+
+class PickleCodec(object):
+    """
+    _PickleCodec_
+
+    Pickle the messages, such that the slaves get and return the python
+    objects themselves (e.g. framework job reports) without any JSON
+    thunking. With pickle protocol 5, the large buffers (bytearrays,
+    PickleBuffers) are sent out-of-band as extra frames of a multipart
+    message, so they are neither copied into the pickle nor out of it.
+    """
+    name = "pickle"
+
+    def __init__(self):
+        self.protocol = max(HIGHEST_PICKLE_PROTOCOL, min(pickle.HIGHEST_PROTOCOL, 5))
+
+    def send(self, socket, data):
+        """
+        Pickle the data and send it, with its out-of-band buffers
+        """
+        if self.protocol < 5:
+            socket.send(pickle.dumps(data, self.protocol), copy=False)
+            return
+        buffers = []
+        frames = [pickle.dumps(data, self.protocol, buffer_callback=buffers.append)]
+        frames.extend(buff.raw() for buff in buffers)
+        socket.send_multipart(frames, copy=False)
+
+    def recv(self, socket):
+        """
+        Receive a multipart message and unpickle it
+        """
+        frames = socket.recv_multipart(copy=False)
+        if len(frames) == 1:
+            return pickle.loads(frames[0].buffer)
+        return pickle.loads(frames[0].buffer, buffers=[frame.buffer for frame in frames[1:]])
+
+
+CODECS = {"json": JSONCodec, "msgpack": MsgpackCodec, "pickle": PickleCodec}
+
+
+def getCodec(name="json"):
+    """
+    _getCodec_
+
+    Return a new instance of the named message codec
+    """
+    if name not in CODECS:
+        raise ProcessPoolException("Unknown ProcessPool codec: %s" % name)
+    return CODECS[name]()
+
+
+def getEndpoints(transport, inPort, outPort, componentDir, slaveClassName):
+    """
+    _getEndpoints_
+
+    Return the ZMQ addresses the pool binds its input and output sockets
+    to, and the ones the slaves connect to. With the tcp transport the
+    sockets listen on the given ports, with the ipc transport they are
+    unix domain sockets in the component directory.
+    """
+    if transport == "tcp":
+        bindAddresses = ("tcp://*:%s" % inPort, "tcp://*:%s" % outPort)
+        connectAddresses = ("tcp://localhost:%s" % inPort, "tcp://localhost:%s" % outPort)
+        return bindAddresses, connectAddresses
+    elif transport == "ipc":
+        addresses = tuple("ipc://%s" % os.path.join(os.path.abspath(componentDir),
+                                                    "%s_%s.ipc" % (slaveClassName, port))
+                          for port in (inPort, outPort))
+        return addresses, addresses
+    raise ProcessPoolException("Unknown ProcessPool transport: %s" % transport)
+
+
+def fileSizeCost(item, key="fwjr_path"):
+    """
+    _fileSizeCost_
+
+    Estimate the cost of a work item by the size of the file it points to,
+    e.g. the framework job report of a job. Missing files cost 1 byte.
+    """
+    try:
+        return max(os.path.getsize(item[key]), 1)
+    except (OSError, KeyError, TypeError):
+        return 1
+
+
+def chunkWork(work, costFunction=None, nChunks=1, maxChunkCost=None):
+    """
+    _chunkWork_
+
+    Split the work in about nChunks chunks of similar estimated cost, and no
+    more than maxChunkCost (unless a single item costs more than that).
+    Items cost 1 by default. The most expensive items come first, such that
+    the cheap chunks dispatched last even out the load of the slaves.
+
+    Return a list of (chunk, cost) tuples.
+    """
+    if costFunction is None:
+        costedWork = [(1, item) for item in work]
+    else:
+        costedWork = sorted(((costFunction(item), item) for item in work),
+                            key=lambda x: x[0], reverse=True)
+    totalCost = sum(cost for cost, _ in costedWork)
+    targetCost = float(totalCost) / max(nChunks, 1)
+    if maxChunkCost:
+        targetCost = min(targetCost, maxChunkCost)
+
+    chunks = []
+    chunk = []
+    chunkCost = 0
+    for cost, item in costedWork:
+        if chunk and chunkCost + cost > targetCost:
+            chunks.append((chunk, chunkCost))
+            chunk = []
+            chunkCost = 0
+        chunk.append(item)
+        chunkCost += cost
+    if chunk:
+        chunks.append((chunk, chunkCost))
+    return chunks
+
+
+class SlaveDispatcher(object):
+    """
+    _SlaveDispatcher_
+
+    Keep track of the chunks of work waiting to be dispatched and of the
+    slaves asking for work, and account the time every slave spends on
+    its chunks.
+    """
+
+    def __init__(self):
+        self.pendingChunks = deque()
+        self.idleSlaves = deque()
+        self.busySlaves = {}
+        self.stats = {}
+
+    def addChunks(self, chunks):
+        """
+        Queue (chunk, cost) tuples to be dispatched
+        """
+        self.pendingChunks.extend(chunks)
+
+    def slaveReady(self, slaveName, now=None):
+        """
+        _slaveReady_
+
+        Mark the slave as idle. If it was working on a chunk, account it in
+        its counters and return them, otherwise return None.
+        """
+        now = time.time() if now is None else now
+        stats = self.stats.setdefault(slaveName, {"chunks": 0, "items": 0, "cost": 0,
+                                                  "busyTime": 0.0, "lastLatency": 0.0,
+                                                  "throughput": 0.0})
+        if slaveName not in self.idleSlaves:
+            self.idleSlaves.append(slaveName)
+        if slaveName not in self.busySlaves:
+            return None
+
+        startTime, items, cost = self.busySlaves.pop(slaveName)
+        latency = max(now - startTime, 0.0)
+        stats["chunks"] += 1
+        stats["items"] += items
+        stats["cost"] += cost
+        stats["busyTime"] += latency
+        stats["lastLatency"] = latency
+        if stats["busyTime"] > 0:
+            stats["throughput"] = stats["items"] / stats["busyTime"]
+        return stats
+
+    def nextAssignment(self, now=None):
+        """
+        _nextAssignment_
+
+        Return the next (slaveName, chunk) to dispatch, or None if there is
+        no pending work or no idle slave.
+        """
+        if not self.pendingChunks or not self.idleSlaves:
+            return None
+        slaveName = self.idleSlaves.popleft()
+        chunk, cost = self.pendingChunks.popleft()
+        self.busySlaves[slaveName] = (time.time() if now is None else now, len(chunk), cost)
+        return slaveName, chunk
+
+
 class ProcessPoolWorker(object):
     """
     _ProcessPoolWorker_
@@ -65,7 +316,8 @@ class ProcessPoolWorker(object):
 class ProcessPool(object):
     def __init__(self, slaveClassName, totalSlaves, componentDir,
                  config, namespace='WMComponent', inPort='5555',
-                 outPort='5558'):
+                 outPort='5558', codec='json', transport='tcp', batching=False,
+                 chunksPerSlave=4, maxChunkCost=None):
         """
         __init__
 
@@ -79,15 +331,27 @@ class ProcessPool(object):
         parameters.  It is not passed to the slave class.  The slaveInit
         parameter will be serialized and passed to the slave class's
         constructor.
+
+        The codec used to serialize the work and the results can be json
+        (default), msgpack or pickle. The transport can be tcp (default),
+        listening on inPort and outPort, or ipc, using unix domain sockets
+        in the component directory.
+
+        In batching mode the work is split in chunks of similar estimated
+        cost, chunksPerSlave per slave, and the slaves pull a new chunk
+        whenever they are done with the previous one. Every chunk is passed
+        to the slave class as a list, and it must return one result per
+        item. The time spent by every slave on its chunks is available with
+        slaveStats(), and reported with the heartbeat API.
         """
         self.enqueueIndex = 0
         self.dequeueIndex = 0
         self.runningWork = 0
 
-        # Use the Services.Requests JSONizer, which handles __to_json__ calls
-        self.jsonHandler = JSONRequests()
+        self.codec = getCodec(codec)
 
         # heartbeat should be registered at this point
+        self.heartbeatAPI = None
         if getattr(config.Agent, "useHeartbeat", True):
             self.heartbeatAPI = HeartbeatAPI(getattr(config.Agent, "componentName", "ProcPoolSlave"))
 
@@ -101,7 +365,13 @@ class ProcessPool(object):
         self.namespace = namespace
         self.inPort = inPort
         self.outPort = outPort
-
+        self.transport = transport
+        self.batching = batching
+        self.chunksPerSlave = chunksPerSlave
+        self.maxChunkCost = maxChunkCost
+        self.dispatcher = SlaveDispatcher()
+        bindAddresses, self.slaveAddresses = getEndpoints(transport, inPort, outPort,
+                                                          componentDir, slaveClassName)
 
         # Pickle the config
         self.configPath = os.path.join(componentDir, '%s_config.pkl' % slaveClassName)
@@ -115,10 +385,10 @@ class ProcessPool(object):
         # Set up ZMQ
         try:
             context = zmq.Context()
-            self.sender = context.socket(zmq.PUSH)
-            self.sender.bind("tcp://*:%s" % inPort)
+            self.sender = context.socket(zmq.ROUTER if batching else zmq.PUSH)
+            self.sender.bind(bindAddresses[0])
             self.sink = context.socket(zmq.PULL)
-            self.sink.bind("tcp://*:%s" % outPort)
+            self.sink.bind(bindAddresses[1])
         except zmq.ZMQError:
             # Try this again in a moment to see
             # if it's just being held by something pre-existing
@@ -127,12 +397,12 @@ class ProcessPool(object):
             logging.error("Blocked socket on startup: Attempting sleep to give it time to clear.")
             try:
                 context = zmq.Context()
-                self.sender = context.socket(zmq.PUSH)
-                self.sender.bind("tcp://*:%s" % inPort)
+                self.sender = context.socket(zmq.ROUTER if batching else zmq.PUSH)
+                self.sender.bind(bindAddresses[0])
                 self.sink = context.socket(zmq.PULL)
-                self.sink.bind("tcp://*:%s" % outPort)
+                self.sink.bind(bindAddresses[1])
             except Exception as ex:
-                msg = "Error attempting to open TCP sockets\n"
+                msg = "Error attempting to open %s sockets\n" % transport
                 msg += str(ex)
                 logging.error(msg)
                 import traceback
@@ -157,18 +427,26 @@ class ProcessPool(object):
         slaveClassName = self.slaveClassName
         config = self.config
         namespace = self.namespace
-        inPort = self.inPort
-        outPort = self.outPort
+        inAddress, outAddress = self.slaveAddresses
 
-        slaveArgs = [self.versionString, __file__, self.slaveClassName, inPort,
-                     outPort, self.configPath, self.componentDir, self.namespace]
+        slaveArgs = [self.versionString, __file__, self.slaveClassName, inAddress,
+                     outAddress, self.configPath, self.componentDir, self.namespace,
+                     self.codec.name]
 
+        self.dispatcher = SlaveDispatcher()
         count = 0
         while totalSlaves > 0:
             # For each worker you want create a slave process
             # That process calls this code (WMCore.ProcessPool) and opens
             # A process pool that loads the designated class
-            slaveProcess = subprocess.Popen(slaveArgs, stdin=subprocess.PIPE,
+            args = slaveArgs
+            if self.batching:
+                # the slave asks for work under its own name
+                slaveName = self._subProcessName(slaveClassName, count)
+                args = slaveArgs + [slaveName]
+                if self.heartbeatAPI:
+                    self.heartbeatAPI.registerWorker(slaveName)
+            slaveProcess = subprocess.Popen(args, stdin=subprocess.PIPE,
                                             stdout=subprocess.PIPE)
             self.workers.append(slaveProcess)
             totalSlaves -= 1
@@ -202,18 +480,17 @@ class ProcessPool(object):
         b) Closing the pipes
         c) Shutting down the workers themselves
         """
-        for i in range(self.nSlaves):
-            try:
-                encodedWork = self.jsonHandler.encode('STOP')
-                if PY3:
-                    self.sender.send_string(encodedWork)
-                else:
-                    self.sender.send(encodedWork)
-            except Exception as ex:
-                # Might be already failed.  Nothing you can
-                # really do about that.
-                logging.error("Failure killing running process: %s" % str(ex))
-                pass
+        if self.batching:
+            self._stopSlaves()
+        else:
+            for i in range(self.nSlaves):
+                try:
+                    self.codec.send(self.sender, 'STOP')
+                except Exception as ex:
+                    # Might be already failed.  Nothing you can
+                    # really do about that.
+                    logging.error("Failure killing running process: %s" % str(ex))
+                    pass
 
         try:
             self.sender.close()
@@ -241,14 +518,18 @@ class ProcessPool(object):
         self.workers = []
         return
 
-    def enqueue(self, work, list=False):
+    def enqueue(self, work, list=False, costFunction=None):
         """
         __enqeue__
 
         Assign work to the workers processes.  The work parameters must be a
-        list where each item in the list can be serialized into JSON.
+        list where each item in the list can be serialized by the codec.
 
         If list is True, the entire list is sent as one piece of work
+
+        In batching mode the work is chunked by the cost estimated with
+        costFunction (e.g. fileSizeCost), 1 per item by default, and the
+        list parameter is ignored.
         """
         if len(self.workers) < 1:
             # Someone's shut down the system
@@ -256,20 +537,17 @@ class ProcessPool(object):
             logging.error(msg)
             raise ProcessPoolException(msg)
 
-        if not list:
+        if self.batching:
+            nChunks = max(len(self.workers), 1) * self.chunksPerSlave
+            self.dispatcher.addChunks(chunkWork(work, costFunction, nChunks, self.maxChunkCost))
+            self.runningWork += len(work)
+            self._dispatch()
+        elif not list:
             for w in work:
-                encodedWork = self.jsonHandler.encode(w)
-                if PY3:
-                    self.sender.send_string(encodedWork)
-                else:
-                    self.sender.send(encodedWork)
+                self.codec.send(self.sender, w)
                 self.runningWork += 1
         else:
-            encodedWork = self.jsonHandler.encode(work)
-            if PY3:
-                self.sender.send_string(encodedWork)
-            else:
-                self.sender.send(encodedWork)
+            self.codec.send(self.sender, work)
             self.runningWork += 1
 
         return
@@ -289,10 +567,23 @@ class ProcessPool(object):
             logging.error(msg)
             raise ProcessPoolException(msg)
 
+        poller = None
+        if self.batching:
+            # hand out the chunks as the slaves ask for them
+            poller = zmq.Poller()
+            poller.register(self.sink, zmq.POLLIN)
+            poller.register(self.sender, zmq.POLLIN)
+
         while totalItems > 0:
             try:
-                output = self.sink.recv()
-                decode = self.jsonHandler.decode(output)
+                if poller is not None:
+                    events = dict(poller.poll())
+                    if self.sender in events:
+                        self._receiveReady()
+                        self._dispatch()
+                    if self.sink not in events:
+                        continue
+                decode = self.codec.recv(self.sink)
                 if isinstance(decode, dict) and decode.get('type', None) == 'ERROR':
                     # Then we had some kind of error
                     msg = decode.get('msg', 'Unknown Error in ProcessPool')
@@ -311,6 +602,75 @@ class ProcessPool(object):
 
         return completedWork
 
+    def _dispatch(self):
+        """
+        _dispatch_
+
+        Send the pending chunks to the idle slaves
+        """
+        assignment = self.dispatcher.nextAssignment()
+        while assignment is not None:
+            slaveName, chunk = assignment
+            self.sender.send(slaveName.encode('utf-8'), zmq.SNDMORE)
+            self.codec.send(self.sender, chunk)
+            assignment = self.dispatcher.nextAssignment()
+        return
+
+    def _receiveReady(self):
+        """
+        _receiveReady_
+
+        Handle all the pending requests for work from the slaves, updating
+        the heartbeat of those that finished a chunk.
+        """
+        while True:
+            try:
+                frames = self.sender.recv_multipart(zmq.NOBLOCK)
+            except zmq.Again:
+                return
+            slaveName = frames[0].decode('utf-8')
+            stats = self.dispatcher.slaveReady(slaveName)
+            if stats and self.heartbeatAPI:
+                results = "chunks: %d, items: %d, items/sec: %.2f" % (stats['chunks'], stats['items'],
+                                                                    stats['throughput'])
+                self.heartbeatAPI.updateWorkerCycle(slaveName, stats['lastLatency'], results)
+
+    def _stopSlaves(self, timeout=5):
+        """
+        _stopSlaves_
+
+        Send STOP to every slave in batching mode, waiting up to timeout
+        seconds for the slaves that did not ask for work yet.
+        """
+        stopped = set()
+        endTime = time.time() + timeout
+        while len(stopped) < len(self.workers):
+            try:
+                self._receiveReady()
+                for slaveName in self.dispatcher.stats:
+                    if slaveName not in stopped:
+                        self.sender.send(slaveName.encode('utf-8'), zmq.SNDMORE)
+                        self.codec.send(self.sender, 'STOP')
+                        stopped.add(slaveName)
+            except Exception as ex:
+                logging.error("Failure killing running process: %s" % str(ex))
+                return
+            if len(stopped) < len(self.workers):
+                if time.time() > endTime:
+                    logging.error("Some slaves never asked for work, they will be terminated")
+                    return
+                self.sender.poll(100)
+        return
+
+    def slaveStats(self):
+        """
+        _slaveStats_
+
+        Return the chunks, items, cost, busy time, latency of the last chunk
+        and throughput (items/sec) of every slave in batching mode
+        """
+        return dict((slaveName, dict(stats)) for slaveName, stats in self.dispatcher.stats.items())
+
     def restart(self):
         """
         _restart_
@@ -372,27 +732,41 @@ if __name__ == "__main__":
     in through stdin as a JSON object.
 
     Input variables:
-    className, input port, output port, path to pickled config, component dir, namespace
+    className, input address, output address, path to pickled config, component dir, namespace,
+    codec name
     """
 
     # Get variables passed in
     slaveClassName = sys.argv[1]
-    inPort = sys.argv[2]
-    outPort = sys.argv[3]
+    inAddress = sys.argv[2]
+    outAddress = sys.argv[3]
     configPath = sys.argv[4]
     componentDir = sys.argv[5]
     namespace = sys.argv[6]
+    codecName = sys.argv[7] if len(sys.argv) > 7 else "json"
+    # in batching mode the slave pulls chunks of work under its own name
+    slaveName = sys.argv[8] if len(sys.argv) > 8 else None
+
+    # plain port numbers are tcp ports on localhost
+    if "://" not in inAddress:
+        inAddress = "tcp://localhost:%s" % inAddress
+    if "://" not in outAddress:
+        outAddress = "tcp://localhost:%s" % outAddress
 
     # Set up logging
     setupLogging(componentDir)
 
     # Build ZMQ link
     context = zmq.Context()
-    receiver = context.socket(zmq.PULL)
-    receiver.connect("tcp://localhost:%s" % inPort)
+    if slaveName:
+        receiver = context.socket(zmq.DEALER)
+        receiver.setsockopt(zmq.IDENTITY, slaveName.encode('utf-8'))
+    else:
+        receiver = context.socket(zmq.PULL)
+    receiver.connect(inAddress)
 
     sender = context.socket(zmq.PUSH)
-    sender.connect("tcp://localhost:%s" % outPort)
+    sender.connect(outAddress)
 
     # Build config
     if not os.path.exists(configPath):
@@ -408,8 +782,8 @@ if __name__ == "__main__":
     wmInit = WMInit()
     setupDB(config, wmInit)
 
-    # Create JSON handler
-    jsonHandler = JSONRequests()
+    # Create the message codec
+    codec = getCodec(codecName)
 
     wmFactory = WMFactory(name="slaveFactory", namespace=namespace)
     slaveClass = wmFactory.loadObject(classname=slaveClassName, args=config)
@@ -417,10 +791,11 @@ if __name__ == "__main__":
     logging.info("Have slave class")
 
     while (True):
-        encodedInput = receiver.recv()
+        if slaveName:
+            receiver.send(b"READY")
 
         try:
-            input = jsonHandler.decode(encodedInput)
+            input = codec.recv(receiver)
         except Exception as ex:
             logging.error("Error decoding: %s" % str(ex))
             break
@@ -442,34 +817,22 @@ if __name__ == "__main__":
             logging.error(crashMessage)
             try:
                 output = {'type': 'ERROR', 'msg': crashMessage}
-                encodedOutput = jsonHandler.encode(output)
-                if PY3:
-                    sender.send_string(encodedOutput)
-                else:
-                    sender.send(encodedOutput)
+                codec.send(sender, output)
                 logging.error("Sent error message and now breaking")
                 break
             except Exception as ex:
                 logging.error("Failed to send error message")
                 logging.error(str(ex))
-                del jsonHandler
+                del codec
                 sys.exit(1)
 
         if output != None:
             if isinstance(output, list):
                 for item in output:
-                    encodedOutput = jsonHandler.encode(item)
-                    if PY3:
-                        sender.send_string(encodedOutput)
-                    else:
-                        sender.send(encodedOutput)
+                    codec.send(sender, item)
             else:
-                encodedOutput = jsonHandler.encode(output)
-                if PY3:
-                    sender.send_string(encodedOutput)
-                else:
-                    sender.send(encodedOutput)
+                codec.send(sender, output)
 
     logging.info("Process with PID %s finished" % (os.getpid()))
-    del jsonHandler
+    del codec
     sys.exit(0)
@@ -51,7 +51,7 @@ from WMCore.Wrappers.JsonWrapper.JSONThunker import JSONThunker
 from Utils.PortForward import portForward
 
 try:
-    from WMCore.Services.pycurl_manager import RequestHandler, ResponseHeader
+    from WMCore.Services.pycurl_manager import RequestHandler, ResponseHeader, AsyncRequestHandler
 except ImportError:
     pass
 
@@ -603,6 +603,63 @@ class JSONRequests(Requests):
         return {}
 
 
+class AsyncRequests(Requests):
+    """
+    asyncio counterpart of Requests. makeRequest, and so get, post, put and
+    delete, are coroutines making their request with pycurl on the event
+    loop, with the authentication, encoding and errors of Requests, so many
+    requests can be in flight at once on a single thread. At most
+    max_concurrent (idict, 50 by default) requests of the instance are in
+    flight at once.
+    """
+
+    def __init__(self, url='http://localhost', idict=None):
+        idict = dict(idict or {})
+        idict['pycurl'] = True
+        Requests.__init__(self, url, idict)
+        self.setdefault("max_concurrent", 50)
+        self.reqmgr = AsyncRequestHandler({'max_concurrent': self['max_concurrent']})
+
+    async def makeRequest(self, uri=None, data=None, verb='GET', incoming_headers=None,
+                          encoder=True, decoder=True, contentType=None):
+        """
+        Wrapper around request helper functions.
+        """
+        data = data or {}
+        incoming_headers = incoming_headers or {}
+        data, headers = self.encodeParams(data, verb, incoming_headers, encoder, contentType)
+
+        uri = self['host'] + uri
+        result, response = await self.makeRequest_pycurl(uri, data, verb, headers)
+
+        result = self.decodeResult(result, decoder)
+        return result, response.status, response.reason, response.fromcache
+
+    async def makeRequest_pycurl(self, uri, data, verb, headers):
+        """
+        Make HTTP(s) request via pycurl library, without blocking the event loop.
+        """
+        ckey, cert = self.getKeyCert()
+        capath = self.getCAPath()
+
+        headers["Accept-Encoding"] = "gzip,deflate,identity"
+
+        response, result = await self.reqmgr.request(uri, data, headers, verb=verb,
+                                                     ckey=ckey, cert=cert, capath=capath)
+        return result, response
+
+
+class AsyncJSONRequests(AsyncRequests, JSONRequests):
+    """
+    asyncio counterpart of JSONRequests
+    """
+
+    def __init__(self, url='http://localhost:8080', idict=None):
+        AsyncRequests.__init__(self, url, idict)
+        self['accept_type'] = "application/json"
+        self['content_type'] = "application/json"
+
+
 class TempDirectory(object):
     """
     Directory that cleans up after itself
@@ -94,6 +94,33 @@ class RucioConMon(Service):
         data = decodeBytesToUnicode(data)
         return [f for f in data.split('\n') if f]
 
+    def _getResultZippedStream(self, uri, callname="", clearCache=True, args=None):
+        """
+        Same as _getResultZipped, but the zipped file is decompressed and split
+        into lines while it is read from the cache file, instead of in memory
+        :param uri: The endpoint uri
+        :param callname: alias for caller function
+        :param clearCache: parameter to control the cache behavior
+        :param args: additional parameters to HTTP request call
+        :return:    a generator of LFNs
+        """
+        cachedApi = "%s.json" % callname
+        apiUrl = uri
+
+        self['logger'].debug('Streaming data from %s, with args %s', apiUrl, args)
+        if args:
+            apiUrl = "%s&%s" % (apiUrl, urlencode(args, doseq=True))
+
+        if clearCache:
+            self.clearCache(cachedApi, args)
+        with self.refreshCache(cachedApi, apiUrl, decoder=False, binary=True) as istream:
+            # split on new lines only, as _getResultZipped does
+            with gzip.open(istream, 'rt', encoding='utf-8', newline='\n') as lines:
+                for line in lines:
+                    line = line.rstrip('\n')
+                    if line:
+                        yield line
+
     def getRSEStats(self):
         """
         Gets the latest statistics from the RucioConMon, together with the last
@@ -104,20 +131,26 @@ class RucioConMon(Service):
         rseStats = self._getResult(uri, callname='stats')
         return rseStats
 
-    def getRSEUnmerged(self, rseName, zipped=False):
+    def getRSEUnmerged(self, rseName, zipped=False, stream=False):
         """
         Gets the list of all unmerged files in an RSE
         :param rseName: The RSE whose list of unmerged files to be retrieved
         :param zipped:  If True the interface providing the zipped lists will be called
-        :return:        A list of unmerged files for the RSE in question
+        :param stream:  If True the zipped list is streamed from the cache file, the
+                        zipped interface is then always used
+        :return:        A list of unmerged files for the RSE in question, or a generator
+                        of them if stream is True
         """
         # NOTE: The default API provided by Rucio Consistency Monitor is in a form of a
         #       zipped file/stream. Currently we are using the newly provided json API
         #       But in in case we figure out the data is too big we may need to
         #       implement the method with the zipped API and use disc cache for
-        #       reading/streaming from file. This will prevent any set arithmetic
-        #       in the future.
-        if not zipped:
+        #       reading/streaming from file, which is what the stream mode does.
+        if stream:
+            uri = "files?rse=%s&format=raw" % rseName
+            callname = '{}.zipped'.format(rseName)
+            return self._getResultZippedStream(uri, callname=callname, clearCache=True)
+        elif not zipped:
             uri = "files?rse=%s&format=json" % rseName
             rseUnmerged = self._getResult(uri, callname=rseName)
             return rseUnmerged
@@ -46,22 +46,38 @@ httplib2 cache  |   yes    |   yes    |    no    |     no     |
 service cache   |    no    |   yes    |   yes    |     no     |
 ----------------+----------+----------+----------+------------+
 result          |  cached  |  cached  |  cached  | not cached |
+
+The service cache can keep the most recently used data in memory too, in front
+of the cache files: memcachesize (number of items, 0 by default, which disables
+it) and memcachebytes (total size, 64MB by default) bound it.
+
+With usestalecache, data expired for less than stalecacheduration hours
+(cacheduration by default) is returned at once, while a background request
+refreshes it. The cache files of the service older than diskcachemaxage hours,
+or beyond diskcachemaxbytes in total, are removed every diskcachepruneinterval
+seconds (600 by default) when new data is written. cacheStats returns the
+counters of the cache.
 """
 
 from builtins import str
 from future import standard_library
 standard_library.install_aliases()
 
+import asyncio
 import datetime
 import json
 import logging
 import os
+import re
+import tempfile
+import threading
 import time
 from io import BytesIO, StringIO
 from http.client import HTTPException
 
+from Utils.MemoryCache import LRUCache
 from Utils.PythonVersion import PY3
-from WMCore.Services.Requests import Requests, JSONRequests
+from WMCore.Services.Requests import Requests, JSONRequests, AsyncRequests, AsyncJSONRequests
 from WMCore.WMException import WMException
 
 try:
@@ -72,6 +88,10 @@ except ImportError:
         pass
 
 
+# names of the cache files made by Service.cacheFileName
+CACHE_FILE_REGEXP = re.compile(r"^-?\d+_(GET|POST|PUT|DELETE)_")
+
+
 def isfile(obj):
     """
     Check whether obj is a file-like object (file, StringIO)"
@@ -132,6 +152,17 @@ class Service(dict):
         # Set a timeout for the socket
         self.setdefault("timeout", 300)
 
+        # in-memory tier of the cache, disabled by default
+        self.setdefault("memcachesize", 0)
+        self.setdefault("memcachebytes", 64 * 1024 * 1024)
+        # with usestalecache, hours expired data is returned while being refreshed,
+        # cacheduration if not set
+        self.setdefault("stalecacheduration", None)
+        # pruning of the cache files, disabled by default
+        self.setdefault("diskcachemaxage", None)
+        self.setdefault("diskcachemaxbytes", None)
+        self.setdefault("diskcachepruneinterval", 600)
+
         # then update with the incoming dict
         self.update(cfg_dict)
 
@@ -145,6 +176,8 @@ class Service(dict):
             requests = JSONRequests
         else:
             requests = Requests
+        # configuration of the asyncio counterpart, instantiated on first use
+        self.requestsConfig = cfg_dict
         # Instantiate a Request
         try:
             self["requests"] = requests(cfg_dict['endpoint'], cfg_dict)
@@ -169,6 +202,18 @@ class Service(dict):
             self['logger'] = logging.getLogger(self.__class__.__name__)
             self['requests']['logger'] = self['logger']
 
+        if self['memcachesize']:
+            self.memoryCache = LRUCache(self['memcachesize'], maxBytes=self['memcachebytes'])
+        else:
+            self.memoryCache = None
+        self.cacheCounters = {'memoryHits': 0, 'diskHits': 0, 'staleHits': 0, 'misses': 0,
+                              'revalidations': 0, 'revalidationErrors': 0, 'pruned': 0}
+        # cache files being refreshed in the background
+        self.revalidating = set()
+        self.revalidatingLock = threading.Lock()
+        self.revalidationTasks = set()
+        self.lastPrune = 0
+
         msg = "Service '%s' initialized with the following settings: %s"
         self['logger'].debug(msg, self.__class__.__name__, self)
 
@@ -214,18 +259,20 @@ class Service(dict):
 
         cachefile = self.cacheFileName(cachefile, verb, inputdata)
 
-        if cache_expired(cachefile, self["cacheduration"]):
+        state, content = self._cacheLookup(cachefile, openfile)
+        if state is None:
             self.getData(cachefile, url, inputdata, incoming_headers, encoder, decoder, verb, contentType, binary=binary)
+        elif state == 'stale':
+            if self._startRevalidation(cachefile):
+                thread = threading.Thread(target=self._revalidate,
+                                          args=(cachefile, url, inputdata, dict(incoming_headers),
+                                                encoder, decoder, verb, contentType, binary))
+                thread.daemon = True
+                thread.start()
         else:
             self['logger'].debug('Data is from the Service cache')
 
-        # cachefile may be filename or file object
-        if openfile and not isfile(cachefile):
-            if binary:
-                return open(cachefile, 'rb')
-            return open(cachefile, 'r', encoding='utf-8')
-        else:
-            return cachefile
+        return self._openCache(cachefile, openfile, binary, content)
 
     def forceRefresh(self, cachefile, url='', inputdata=None, openfile=True,
                      encoder=True, decoder=True, verb='GET',
@@ -257,13 +304,241 @@ class Service(dict):
         incoming_headers.update({'cache-control': 'no-cache'})
         self.getData(cachefile, url, inputdata, incoming_headers,
                      encoder, decoder, verb, contentType, force_refresh=True, binary=binary)
+        return self._openCache(cachefile, openfile, binary)
+
+    async def refreshCacheAsync(self, cachefile, url='', inputdata=None, openfile=True,
+                                encoder=True, decoder=True, verb='GET', contentType=None,
+                                incoming_headers=None, binary=False):
+        """
+        Coroutine variant of refreshCache, see asyncRequests.
+        """
+        inputdata = inputdata or {}
+        incoming_headers = incoming_headers or {}
+        verb = self._verbCheck(verb)
+
+        cachefile = self.cacheFileName(cachefile, verb, inputdata)
+
+        state, content = self._cacheLookup(cachefile, openfile)
+        if state is None:
+            await self.getDataAsync(cachefile, url, inputdata, incoming_headers, encoder, decoder,
+                                    verb, contentType, binary=binary)
+        elif state == 'stale':
+            if self._startRevalidation(cachefile):
+                task = asyncio.ensure_future(
+                    self._revalidateAsync(cachefile, url, inputdata, dict(incoming_headers),
+                                          encoder, decoder, verb, contentType, binary))
+                self.revalidationTasks.add(task)
+                task.add_done_callback(self.revalidationTasks.discard)
+        else:
+            self['logger'].debug('Data is from the Service cache')
+
+        return self._openCache(cachefile, openfile, binary, content)
+
+    async def forceRefreshAsync(self, cachefile, url='', inputdata=None, openfile=True,
+                                encoder=True, decoder=True, verb='GET',
+                                contentType=None, incoming_headers=None, binary=False):
+        """
+        Coroutine variant of forceRefresh, see asyncRequests.
+        """
+        inputdata = inputdata or {}
+        incoming_headers = incoming_headers or {}
+        verb = self._verbCheck(verb)
+
+        cachefile = self.cacheFileName(cachefile, verb, inputdata)
+
+        self['logger'].debug("Forcing cache refresh of %s" % cachefile)
+        incoming_headers.update({'cache-control': 'no-cache'})
+        await self.getDataAsync(cachefile, url, inputdata, incoming_headers,
+                                encoder, decoder, verb, contentType, force_refresh=True, binary=binary)
+        return self._openCache(cachefile, openfile, binary)
+
+    def _openCache(self, cachefile, openfile, binary, content=None):
+        """
+        Return the cache file, opened if openfile, or the file object.
+        The content of the cache file, if given, is returned as a file object.
+        """
+        # cachefile may be filename or file object
         if openfile and not isfile(cachefile):
+            if content is not None:
+                if binary:
+                    return BytesIO(content if isinstance(content, bytes) else content.encode('utf-8'))
+                return StringIO(content.decode('utf-8') if isinstance(content, bytes) else content)
             if binary:
                 return open(cachefile, 'rb')
             return open(cachefile, 'r', encoding='utf-8')
         else:
             return cachefile
 
+    def _cacheLookup(self, cachefile, openfile):
+        """
+        Look the data of cachefile up, in memory then on disk. Return the state
+        of the data: 'fresh', 'stale' (expired, but returned while refreshed)
+        or None (to be requested), and its content if in memory, or read from
+        the cache file into memory.
+        """
+        if isfile(cachefile):
+            return None, None
+        content = fetched = None
+        tier = 'diskHits'
+        if openfile and self.memoryCache is not None:
+            item = self.memoryCache.get(cachefile)
+            if item is not None:
+                content, fetched = item
+                tier = 'memoryHits'
+        if fetched is None:
+            try:
+                fetched = os.path.getmtime(cachefile)
+            except OSError:
+                self._countCache('misses')
+                return None, None
+
+        age = time.time() - fetched
+        staleDuration = self['stalecacheduration']
+        if staleDuration is None:
+            staleDuration = self['cacheduration']
+        if age < self['cacheduration'] * 3600:
+            state = 'fresh'
+            self._countCache(tier)
+        elif self.get('usestalecache', False) and age < (self['cacheduration'] + staleDuration) * 3600:
+            state = 'stale'
+            self._countCache('staleHits')
+            self['logger'].debug('Returning stale data from %s while refreshing it', cachefile)
+        else:
+            self._countCache('misses')
+            return None, None
+
+        if content is None and openfile and self.memoryCache is not None:
+            try:
+                with open(cachefile, 'rb') as f:
+                    content = f.read()
+            except (IOError, OSError):
+                self._countCache('misses')
+                return None, None
+            self.memoryCache.set(cachefile, (content, fetched), len(content))
+        return state, content
+
+    def _countCache(self, counter, value=1):
+        """
+        Add value to a cache counter, also updated by the revalidation threads
+        """
+        with self.revalidatingLock:
+            self.cacheCounters[counter] += value
+
+    def _startRevalidation(self, cachefile):
+        """
+        Return whether stale data of cachefile is to be refreshed, False if
+        it is already being refreshed
+        """
+        with self.revalidatingLock:
+            if cachefile in self.revalidating:
+                return False
+            self.revalidating.add(cachefile)
+            return True
+
+    def _revalidated(self, cachefile, exc=None):
+        """
+        Record the end of the refresh of stale data
+        """
+        with self.revalidatingLock:
+            self.revalidating.discard(cachefile)
+            self.cacheCounters['revalidations' if exc is None else 'revalidationErrors'] += 1
+        if exc is not None:
+            self['logger'].warning("Failed to refresh the stale data of %s: %s", cachefile, str(exc))
+
+    def _revalidate(self, cachefile, *args):
+        """
+        Refresh stale data, in a background thread. The requests instance
+        of the service is not thread safe (e.g. its httplib2 connection
+        without pycurl), so the refresh makes its own.
+        """
+        try:
+            requests = self['requests'].__class__(self.requestsConfig['endpoint'], self.requestsConfig)
+            requests['logger'] = self['logger']
+            self._getData(requests, cachefile, *args[:-1], force_refresh=True, binary=args[-1])
+        except Exception as ex:
+            self._revalidated(cachefile, ex)
+        else:
+            self._revalidated(cachefile)
+
+    async def _revalidateAsync(self, cachefile, *args):
+        """
+        Refresh stale data, in a background task
+        """
+        try:
+            await self.getDataAsync(cachefile, *args[:-1], force_refresh=True, binary=args[-1])
+        except Exception as ex:
+            self._revalidated(cachefile, ex)
+        else:
+            self._revalidated(cachefile)
+
+    def cacheStats(self):
+        """
+        Return the counters of the cache: hits in memory, on disk, of stale
+        data, misses, refreshes of stale data, failed refreshes, pruned cache
+        files and the counters of the memory tier, if enabled
+        """
+        with self.revalidatingLock:
+            stats = dict(self.cacheCounters)
+        stats['memory'] = self.memoryCache.stats() if self.memoryCache is not None else None
+        return stats
+
+    def pruneCache(self, maxAge=None, maxBytes=None):
+        """
+        Remove the cache files of the service older than maxAge hours, then the
+        least recently written ones until they take at most maxBytes.
+        Return the number of files removed.
+        """
+        if not self['cachepath']:
+            return 0
+        cacheFiles = []
+        for entry in os.scandir(self['cachepath']):
+            if not CACHE_FILE_REGEXP.match(entry.name):
+                continue
+            try:
+                if entry.is_file():
+                    info = entry.stat()
+                    cacheFiles.append((info.st_mtime, info.st_size, entry.path))
+            except OSError:
+                continue
+        cacheFiles.sort()
+
+        now = time.time()
+        totalBytes = sum(size for _, size, _ in cacheFiles)
+        removed = 0
+        for mtime, size, path in cacheFiles:
+            if (maxAge is None or now - mtime <= maxAge * 3600) and \
+                    (maxBytes is None or totalBytes <= maxBytes):
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            totalBytes -= size
+            removed += 1
+            if self.memoryCache is not None:
+                self.memoryCache.pop(path)
+        self._countCache('pruned', removed)
+        if removed:
+            self['logger'].info("Removed %d files from the cache %s", removed, self['cachepath'])
+        return removed
+
+    def asyncRequests(self):
+        """
+        Return the asyncio counterpart of the requests instance, an
+        AsyncJSONRequests or AsyncRequests with the same configuration,
+        used by the coroutine variants of refreshCache, forceRefresh and
+        getData. Their requests run concurrently on the event loop, at most
+        max_concurrent (configuration, 50 by default) at once.
+        """
+        if self.get('asyncrequests') is None:
+            if isinstance(self['requests'], JSONRequests):
+                requests = AsyncJSONRequests
+            else:
+                requests = AsyncRequests
+            self['asyncrequests'] = requests(self.requestsConfig['endpoint'], self.requestsConfig)
+            self['asyncrequests']['logger'] = self['logger']
+        return self['asyncrequests']
+
     def clearCache(self, cachefile, inputdata=None, verb='GET'):
         """
         Delete the cache file and the httplib2 cache.
@@ -276,6 +551,8 @@ class Service(dict):
         verb = self._verbCheck(verb)
         os.system("/bin/rm -f %s/*" % self['requests']['req_cache_path'])
         cachefile = self.cacheFileName(cachefile, verb, inputdata)
+        if self.memoryCache is not None and not isfile(cachefile):
+            self.memoryCache.pop(cachefile)
         try:
             if not isfile(cachefile):
                 os.remove(cachefile)
@@ -303,6 +580,15 @@ class Service(dict):
         :param binary: use binary mode to decode HTTP data, boolean
         :return: None
         """
+        self._getData(self["requests"], cachefile, url, inputdata, incoming_headers, encoder, decoder,
+                      verb, contentType, force_refresh, binary)
+
+    def _getData(self, requests, cachefile, url, inputdata=None, incoming_headers=None,
+                 encoder=True, decoder=True,
+                 verb='GET', contentType=None, force_refresh=False, binary=False):
+        """
+        getData, making the request with the given requests instance
+        """
         inputdata = inputdata or {}
         incoming_headers = incoming_headers or {}
         verb = self._verbCheck(verb)
@@ -315,81 +601,141 @@ class Service(dict):
                                  url, verb, incoming_headers, inputdata)
             # self['logger'].debug('getData: \n\turl: %s\n\tdata: %s' % \
             #                     (url, inputdata))
-            data, dummyStatus, dummyReason, from_cache = self["requests"].makeRequest(uri=url,
-                                                                                      verb=verb,
-                                                                                      data=inputdata,
-                                                                                      incoming_headers=incoming_headers,
-                                                                                      encoder=encoder,
-                                                                                      decoder=decoder,
-                                                                                      contentType=contentType)
-            if from_cache:
-                # If it's coming from the cache we don't need to write it to the
-                # second cache, or do we?
-                self['logger'].debug('Data is from the Requests cache')
-            else:
-                # getData have done that for us
-                if isfile(cachefile):
-                    cachefile.write(data)
-                    cachefile.seek(0, 0)  # return to beginning of file
-                elif binary:
-                    with open(cachefile, 'wb') as f:
-                        f.write(data)
-                elif isinstance(data, (dict, list)):
-                    with open(cachefile, 'w', encoding='utf-8') as f:
-                        f.write(json.dumps(data))
-                else:
-                    with open(cachefile, 'w', encoding='utf-8') as f:
-                        f.write(data)
+            data, dummyStatus, dummyReason, from_cache = requests.makeRequest(uri=url,
+                                                                              verb=verb,
+                                                                              data=inputdata,
+                                                                              incoming_headers=incoming_headers,
+                                                                              encoder=encoder,
+                                                                              decoder=decoder,
+                                                                              contentType=contentType)
+            self._writeCache(cachefile, data, from_cache, binary)
+        except (IOError, HttpLib2Error, HTTPException) as he:
+            self._getDataFailed(he, cachefile, url, force_refresh)
 
+    async def getDataAsync(self, cachefile, url, inputdata=None, incoming_headers=None,
+                           encoder=True, decoder=True,
+                           verb='GET', contentType=None, force_refresh=False, binary=False):
+        """
+        Coroutine variant of getData, making the request with the
+        asyncRequests instance.
+        """
+        inputdata = inputdata or {}
+        incoming_headers = incoming_headers or {}
+        verb = self._verbCheck(verb)
 
+        try:
+            if not inputdata:
+                inputdata = self["inputdata"]
+            self['logger'].debug('getDataAsync: \n\turl: %s\n\tverb: %s\n\tincoming_headers: %s\n\tdata: %s',
+                                 url, verb, incoming_headers, inputdata)
+            data, dummyStatus, dummyReason, from_cache = await self.asyncRequests().makeRequest(
+                uri=url, verb=verb, data=inputdata, incoming_headers=incoming_headers,
+                encoder=encoder, decoder=decoder, contentType=contentType)
+            self._writeCache(cachefile, data, from_cache, binary)
         except (IOError, HttpLib2Error, HTTPException) as he:
-            #
-            # Overly complicated exception handling. This is due to a request
-            # from *Ops that it is very clear that data is is being returned
-            # from a cachefile, and that cachefiles can be good/stale/dead.
-            #
-            if force_refresh or isfile(cachefile) or not os.path.exists(cachefile):
-                msg = 'The cachefile %s does not exist and the service at %s'
-                msg = msg % (cachefile, self["requests"]['host'] + url)
+            self._getDataFailed(he, cachefile, url, force_refresh)
+
+    def _writeCache(self, cachefile, data, from_cache, binary):
+        """
+        Write the data of a request to the cache file, or file object
+        """
+        if from_cache:
+            # If it's coming from the cache we don't need to write it to the
+            # second cache, or do we?
+            self['logger'].debug('Data is from the Requests cache')
+        elif isfile(cachefile):
+            # getData have done that for us
+            cachefile.write(data)
+            cachefile.seek(0, 0)  # return to beginning of file
+        else:
+            if isinstance(data, (dict, list)) and not binary:
+                data = json.dumps(data)
+            # write a new file and move it in place, not to be read half written
+            f = tempfile.NamedTemporaryFile(mode='wb' if binary else 'w', dir=os.path.dirname(cachefile),
+                                            prefix='.%s.' % os.path.basename(cachefile),
+                                            encoding=None if binary else 'utf-8', delete=False)
+            try:
+                with f:
+                    f.write(data)
+                os.replace(f.name, cachefile)
+            except Exception:
+                # the temporary files are not removed by the pruning of the cache files
+                try:
+                    os.remove(f.name)
+                except OSError:
+                    pass
+                raise
+            if self.memoryCache is not None:
+                self.memoryCache.set(cachefile, (data, time.time()), len(data))
+            self._pruneCacheFiles()
+
+    def _pruneCacheFiles(self):
+        """
+        Prune the cache files every diskcachepruneinterval seconds, if configured
+        """
+        if self['diskcachemaxage'] is None and self['diskcachemaxbytes'] is None:
+            return
+        now = time.time()
+        if now - self.lastPrune < self['diskcachepruneinterval']:
+            return
+        self.lastPrune = now
+        try:
+            self.pruneCache(self['diskcachemaxage'], self['diskcachemaxbytes'])
+        except OSError as ex:
+            self['logger'].warning("Failed to prune the cache %s: %s", self['cachepath'], str(ex))
+
+    def _getDataFailed(self, he, cachefile, url, force_refresh):
+        """
+        Handle the failure of the request of getData: raise the exception,
+        unless stale data of the cache file can be used.
+        """
+        #
+        # Overly complicated exception handling. This is due to a request
+        # from *Ops that it is very clear that data is is being returned
+        # from a cachefile, and that cachefiles can be good/stale/dead.
+        #
+        if force_refresh or isfile(cachefile) or not os.path.exists(cachefile):
+            msg = 'The cachefile %s does not exist and the service at %s'
+            msg = msg % (cachefile, self["requests"]['host'] + url)
+            if hasattr(he, 'status') and hasattr(he, 'reason'):
+                msg += ' is unavailable - it returned %s because %s' % (he.status,
+                                                                        he.reason)
+                if hasattr(he, 'result'):
+                    msg += ' with result: %s\n' % he.result
+            else:
+                msg += ' raised a %s when accessed' % he.__repr__()
+            self['logger'].warning(msg)
+            raise he
+        else:
+            cache_dead = cache_expired(cachefile, delta=self["cacheduration"])
+            if cache_dead:
+                msg = 'The cachefile %s is dead (older than %s hours of cache duration), '
+                msg += 'and the service at %s '
+                msg = msg % (cachefile, self["cacheduration"], url)
                 if hasattr(he, 'status') and hasattr(he, 'reason'):
-                    msg += ' is unavailable - it returned %s because %s' % (he.status,
-                                                                            he.reason)
-                    if hasattr(he, 'result'):
-                        msg += ' with result: %s\n' % he.result
+                    msg += 'is unavailable - it returned %s because %s' % (he.status, he.reason)
                 else:
-                    msg += ' raised a %s when accessed' % he.__repr__()
+                    msg += 'raised a %s when accessed' % he.__repr__()
                 self['logger'].warning(msg)
                 raise he
+            if self.get('usestalecache', False):
+                # then we can return data from the cache file, without raising an exception
+                # but with a suitable message in the log
+                msg = 'Returning stale cache data from %s, the service at ' % cachefile
+                if hasattr(he, 'status') and hasattr(he, 'reason'):
+                    msg += '%s returned %s because %s' % (he.url, he.status, he.reason)
+                else:
+                    msg += '%s raised a %s when accessed' % (url, he.__repr__())
+                self['logger'].warning(msg)
             else:
-                cache_dead = cache_expired(cachefile, delta=self["cacheduration"])
-                if cache_dead:
-                    msg = 'The cachefile %s is dead (older than %s hours of cache duration), '
-                    msg += 'and the service at %s '
-                    msg = msg % (cachefile, self["cacheduration"], url)
-                    if hasattr(he, 'status') and hasattr(he, 'reason'):
-                        msg += 'is unavailable - it returned %s because %s' % (he.status, he.reason)
-                    else:
-                        msg += 'raised a %s when accessed' % he.__repr__()
-                    self['logger'].warning(msg)
-                    raise he
-                if self.get('usestalecache', False):
-                    # then we can return data from the cache file, without raising an exception
-                    # but with a suitable message in the log
-                    msg = 'Returning stale cache data from %s, the service at ' % cachefile
-                    if hasattr(he, 'status') and hasattr(he, 'reason'):
-                        msg += '%s returned %s because %s' % (he.url, he.status, he.reason)
-                    else:
-                        msg += '%s raised a %s when accessed' % (url, he.__repr__())
-                    self['logger'].warning(msg)
+                # Cache is not dead, but Service is configured to not return stale data.
+                msg = 'The cachefile %s is stale and the service at %s ' % (cachefile, url)
+                if hasattr(he, 'status') and hasattr(he, 'reason'):
+                    msg += 'is unavailable - it returned %s because %s' % (he.status, he.reason)
                 else:
-                    # Cache is not dead, but Service is configured to not return stale data.
-                    msg = 'The cachefile %s is stale and the service at %s ' % (cachefile, url)
-                    if hasattr(he, 'status') and hasattr(he, 'reason'):
-                        msg += 'is unavailable - it returned %s because %s' % (he.status, he.reason)
-                    else:
-                        msg += 'raised a %s when accessed' % he.__repr__()
-                    self['logger'].warning(msg)
-                    raise he
+                    msg += 'raised a %s when accessed' % he.__repr__()
+                self['logger'].warning(msg)
+                raise he
 
     def _verbCheck(self, verb='GET'):
         if verb.upper() in self.supportVerbList:
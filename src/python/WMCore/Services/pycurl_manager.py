@@ -7,7 +7,8 @@ Author: Valentin Kuznetsov <vkuznet@gmail.com>
 Description: a basic wrapper around pycurl library.
 The RequestHandler class provides basic APIs to get data
 from a single resource or submit mutliple requests to
-underlying data-services.
+underlying data-services. The AsyncRequestHandler class provides
+the single request APIs as coroutines, for asyncio applications.
 
 Examples:
 # CERN SSO: http://linux.web.cern.ch/linux/docs/cernssocookie.shtml
@@ -35,6 +36,12 @@ urls = [url1, url2, url3]
 data = getdata(urls, ckey, cert, cookie=cookie)
 for row in data:
     print(row)
+
+# fetch many resources concurrently from an asyncio application
+async def fetch(urls):
+    mgr = AsyncRequestHandler({'max_concurrent': 20})
+    return await asyncio.gather(*[mgr.getdata(url, {}, ckey=ckey, cert=cert) for url in urls])
+data = asyncio.run(fetch(urls))
 """
 from __future__ import print_function
 from future import standard_library
@@ -46,6 +53,8 @@ from future.utils import viewitems
 
 
 # system modules
+import asyncio
+import collections
 import copy
 import json
 import gzip
@@ -53,10 +62,12 @@ import logging
 import os
 import re
 import subprocess
+import threading
+import time
 import pycurl
 from io import BytesIO
 import http.client
-from urllib.parse import urlencode
+from urllib.parse import urlencode, urlparse
 
 from Utils.Utilities import encodeUnicodeToBytes, decodeBytesToUnicode
 from Utils.PortForward import portForward, PortForward
@@ -170,10 +181,140 @@ class ResponseHeader(object):
                 return valHea
 
 
+class CurlHandlePool(object):
+    """
+    Thread safe pool of curl handles, kept per host.
+
+    Reusing a handle keeps its connection to the host open between requests
+    (HTTP keep-alive), so the TCP and TLS handshakes are only made once. The
+    handles also share their DNS cache and TLS sessions, so new connections
+    to a host resume the TLS session instead of a full handshake.
+    At most maxPerHost idle handles are kept per host, and handles idle for
+    more than maxIdleTime seconds are closed.
+    """
+
+    def __init__(self, maxPerHost=8, maxIdleTime=60):
+        self.maxPerHost = maxPerHost
+        self.maxIdleTime = maxIdleTime
+        self.lock = threading.Lock()
+        # idle (handle, release time) tuples per host, most recently released last
+        self.idle = {}
+        self.share = pycurl.CurlShare()
+        self.share.setopt(pycurl.SH_SHARE, pycurl.LOCK_DATA_DNS)
+        self.share.setopt(pycurl.SH_SHARE, pycurl.LOCK_DATA_SSL_SESSION)
+        self.counters = {'created': 0, 'reused': 0, 'released': 0, 'evicted': 0, 'discarded': 0}
+
+    @staticmethod
+    def hostKey(url):
+        """
+        Return the key of the handles for the url: scheme, host and port
+        """
+        parts = urlparse(url)
+        return parts.scheme, parts.hostname, parts.port
+
+    def _evict(self, now):
+        """
+        Close the handles idle for too long. Must be called with the lock held.
+        """
+        for key in list(self.idle):
+            handles = self.idle[key]
+            while handles and now - handles[0][1] > self.maxIdleTime:
+                handles.pop(0)[0].close()
+                self.counters['evicted'] += 1
+            if not handles:
+                del self.idle[key]
+
+    def acquire(self, url):
+        """
+        Return a curl handle for a request to the url
+        """
+        key = self.hostKey(url)
+        with self.lock:
+            self._evict(time.time())
+            handles = self.idle.get(key)
+            if handles:
+                curl = handles.pop()[0]
+                self.counters['reused'] += 1
+                return curl
+            self.counters['created'] += 1
+        curl = pycurl.Curl()
+        curl.setopt(pycurl.SHARE, self.share)
+        curl.setopt(pycurl.TCP_KEEPALIVE, 1)
+        return curl
+
+    def release(self, url, curl, reusable=True):
+        """
+        Give a handle back to the pool once its request is done. Handles of
+        failed transfers, or beyond maxPerHost, are closed.
+        """
+        key = self.hostKey(url)
+        if reusable:
+            # save the cookies to the cookie jar of the request, if any, then
+            # forget its options and cookies, keeping the connection and the share
+            curl.setopt(pycurl.COOKIELIST, "FLUSH")
+            curl.reset()
+            curl.setopt(pycurl.COOKIELIST, "ALL")
+            curl.setopt(pycurl.TCP_KEEPALIVE, 1)
+        with self.lock:
+            now = time.time()
+            self._evict(now)
+            handles = self.idle.setdefault(key, [])
+            if reusable and len(handles) < self.maxPerHost:
+                handles.append((curl, now))
+                self.counters['released'] += 1
+                return
+            if not handles:
+                del self.idle[key]
+            self.counters['discarded'] += 1
+        curl.close()
+
+    def clear(self):
+        """
+        Close all the idle handles
+        """
+        with self.lock:
+            for handles in self.idle.values():
+                for curl, _ in handles:
+                    curl.close()
+            self.idle = {}
+
+    def stats(self):
+        """
+        Return the counters of the pool and the ratio of requests made with
+        a reused handle
+        """
+        with self.lock:
+            stats = dict(self.counters)
+            stats['idle'] = sum(len(handles) for handles in self.idle.values())
+        requests = stats['created'] + stats['reused']
+        stats['reuseRatio'] = float(stats['reused']) / requests if requests else 0.0
+        return stats
+
+
+_handlePool = None
+_handlePoolLock = threading.Lock()
+
+
+def getHandlePool():
+    """
+    Return the curl handle pool shared by all the RequestHandler instances
+    """
+    global _handlePool
+    with _handlePoolLock:
+        if _handlePool is None:
+            _handlePool = CurlHandlePool()
+        return _handlePool
+
+
 class RequestHandler(object):
     """
     RequestHandler provides APIs to fetch single/multiple
     URL requests based on pycurl library
+
+    Single requests reuse the curl handles, and so the connections, of a
+    CurlHandlePool: the one given as the 'pool' configuration, or the pool
+    shared by the whole process. The 'keepalive' configuration set to False
+    makes a new handle for every request instead.
     """
 
     def __init__(self, config=None, logger=None):
@@ -192,6 +333,11 @@ class RequestHandler(object):
             self.tmgr = TokenManager(self.tokenLocation)
         else:
             self.tmgr = None
+        self.multiWindow = config.get('multi_window', 10)
+        if config.get('keepalive', True):
+            self.pool = config.get('pool') or getHandlePool()
+        else:
+            self.pool = None
 
     def encode_params(self, params, verb, doseq, encode):
         """ Encode request parameters for usage with the 4 verbs.
@@ -332,12 +478,25 @@ class RequestHandler(object):
                 verbose=0, ckey=None, cert=None, capath=None,
                 doseq=True, encode=False, decode=False, cainfo=None, cookie=None):
         """Fetch data for given set of parameters"""
-        curl = pycurl.Curl()
-        bbuf, hbuf = self.set_opts(curl, url, params, headers, ckey, cert, capath,
-                                   verbose, verb, doseq, encode, cainfo, cookie)
-        curl.perform()
+        curl = self.pool.acquire(url) if self.pool else pycurl.Curl()
+        reusable = False
+        try:
+            bbuf, hbuf = self.set_opts(curl, url, params, headers, ckey, cert, capath,
+                                       verbose, verb, doseq, encode, cainfo, cookie)
+            curl.perform()
+            reusable = True
+        finally:
+            if self.pool:
+                self.pool.release(url, curl, reusable)
         if verbose:
             print(verb, url, params, headers)
+        return self.parse_response(url, params, headers, verb, decode, bbuf, hbuf)
+
+    def parse_response(self, url, params, headers, verb, decode, bbuf, hbuf):
+        """
+        Return the header and the data of a single request response, or
+        raise the HTTP exception of a failed request
+        """
         header = self.parse_header(hbuf.getvalue())
         data = bbuf.getvalue()
         data = decompress(data, header.header)
@@ -372,60 +531,302 @@ class RequestHandler(object):
                                  verbose, ckey, cert, doseq=doseq)
         return header
 
+    def parse_multi_response(self, url, params, headers, verb, decode, bbuf, hbuf):
+        """
+        Return the list of data items of a multirequest response, each
+        of them updated with the request parameters
+        """
+        header = self.parse_header(hbuf.getvalue())
+        data = bbuf.getvalue()
+        data = decompress(data, header.header)
+        data = decodeBytesToUnicode(data)
+        bbuf.close()
+        hbuf.close()
+        if header.status >= 300:
+            raise getException(url, params, headers, header, data)
+        if verb == 'HEAD':
+            return []
+        data = self.parse_body(data, decode)
+        items = []
+        if isinstance(data, dict):
+            data.update(params)
+            items.append(data)
+        if isinstance(data, list):
+            for item in data:
+                if isinstance(item, dict):
+                    item.update(params)
+                    items.append(item)
+                else:
+                    err = 'Unsupported data format: data=%s, type=%s' \
+                          % (item, type(item))
+                    raise Exception(err)
+        return items
+
     @portForward(8443)
     def multirequest(self, url, parray, headers=None, verb='GET',
                      ckey=None, cert=None, verbose=None, cookie=None,
-                     encode=False, decode=False):
-        """Fetch data for given set of parameters"""
-        multi = pycurl.CurlMulti()
-        for params in parray:
-            curl = pycurl.Curl()
-            bbuf, hbuf = \
-                self.set_opts(curl, url, params, headers, ckey=ckey, cert=cert,
-                              verbose=verbose, cookie=cookie, encode=encode)
-            multi.add_handle(curl)
-            while True:
-                ret, num_handles = multi.perform()
-                if ret != pycurl.E_CALL_MULTI_PERFORM:
-                    break
-            while num_handles:
-                ret = multi.select(1.0)
-                if ret == -1:
-                    continue
-                while True:
-                    ret, num_handles = multi.perform()
-                    if ret != pycurl.E_CALL_MULTI_PERFORM:
-                        break
-            dummyNumq, response, dummyErr = multi.info_read()
-            for _respItem in response:
-                header = self.parse_header(hbuf.getvalue())
-                data = bbuf.getvalue()
-                data = decompress(data, header.header)
-                data = decodeBytesToUnicode(data)
-                if header.status < 300:
-                    if verb == 'HEAD':
-                        data = ''
-                    else:
-                        data = self.parse_body(data, decode)
+                     encode=False, decode=False, window=None, timeout=None, ordered=False):
+        """
+        Fetch data for given set of parameters, running up to window requests
+        (the multi_window configuration by default) at once. Data items are
+        yielded as their requests complete or, with ordered, in the order of
+        the parameters. The timeout applies to every single request.
+        """
+        window = window or self.multiWindow
+        pending = collections.deque(enumerate(parray))
+        results = {}
+        nextIndex = 0
+        mcurl = pycurl.CurlMulti()
+        active = {}
+        try:
+            while pending or active:
+                # fill the window of requests in flight
+                while pending and len(active) < window:
+                    index, params = pending.popleft()
+                    curl = self.pool.acquire(url) if self.pool else pycurl.Curl()
+                    bbuf, hbuf = \
+                        self.set_opts(curl, url, params, headers, ckey=ckey, cert=cert,
+                                      verbose=verbose, verb=verb, cookie=cookie, encode=encode)
+                    if timeout:
+                        curl.setopt(pycurl.TIMEOUT, timeout)
+                    active[curl] = (index, params, bbuf, hbuf)
+                    mcurl.add_handle(curl)
+
+                okList, errList = multi_perform(mcurl)
+                for curl, errno, errmsg in errList:
+                    mcurl.remove_handle(curl)
+                    index, params, _, _ = active.pop(curl)
+                    self.release_handle(url, curl, False)
+                    raise pycurl.error(errno, "url=%s, params=%s: %s" % (url, params, errmsg))
+                for curl in okList:
+                    mcurl.remove_handle(curl)
+                    index, params, bbuf, hbuf = active.pop(curl)
+                    self.release_handle(url, curl, True)
+                    results[index] = self.parse_multi_response(url, params, headers, verb, decode, bbuf, hbuf)
+
+                # stream the results back
+                if ordered:
+                    while nextIndex in results:
+                        for item in results.pop(nextIndex):
+                            yield item
+                        nextIndex += 1
                 else:
-                    exc = getException(url, params, headers, header, data)
-                    bbuf.flush()
-                    hbuf.flush()
-                    raise exc
-                if isinstance(data, dict):
-                    data.update(params)
-                    yield data
-                if isinstance(data, list):
-                    for item in data:
-                        if isinstance(item, dict):
-                            item.update(params)
+                    for index in list(results):
+                        for item in results.pop(index):
                             yield item
-                        else:
-                            err = 'Unsupported data format: data=%s, type=%s' \
-                                  % (item, type(item))
-                            raise Exception(err)
-                bbuf.flush()
-                hbuf.flush()
+
+                if active and not okList and not errList:
+                    mcurl.select(1.0)
+        finally:
+            for curl in active:
+                mcurl.remove_handle(curl)
+                self.release_handle(url, curl, False)
+            mcurl.close()
+
+    def release_handle(self, url, curl, reusable):
+        """
+        Give a handle back to the pool, or close it without a pool
+        """
+        if self.pool:
+            self.pool.release(url, curl, reusable)
+        else:
+            curl.close()
+
+
+class CurlMultiLoop(object):
+    """
+    Run the transfers of a curl multi handle on an asyncio event loop.
+
+    libcurl tells which sockets to watch, and when to time out, through the
+    socket and timer callbacks of the multi handle, and the event loop tells
+    libcurl when the sockets are ready. All the transfers so run at once on
+    the thread of the loop, without blocking it.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.timer = None
+        self.closed = False
+        # future of every transfer in flight, keyed by curl handle
+        self.futures = {}
+        # sockets watched by the loop
+        self.sockets = set()
+        self.mcurl = pycurl.CurlMulti()
+        self.mcurl.setopt(pycurl.M_SOCKETFUNCTION, self._watchSocket)
+        self.mcurl.setopt(pycurl.M_TIMERFUNCTION, self._setTimer)
+
+    def _watchSocket(self, event, sockfd, mcurl, data):
+        """
+        Socket callback: watch the socket for the events libcurl waits for
+        """
+        if self.closed:
+            return
+        if event == pycurl.POLL_REMOVE:
+            self.loop.remove_reader(sockfd)
+            self.loop.remove_writer(sockfd)
+            self.sockets.discard(sockfd)
+            return
+        self.sockets.add(sockfd)
+        if event & pycurl.POLL_IN:
+            self.loop.add_reader(sockfd, self._socketAction, sockfd, pycurl.CSELECT_IN)
+        else:
+            self.loop.remove_reader(sockfd)
+        if event & pycurl.POLL_OUT:
+            self.loop.add_writer(sockfd, self._socketAction, sockfd, pycurl.CSELECT_OUT)
+        else:
+            self.loop.remove_writer(sockfd)
+
+    def _setTimer(self, timeoutMs):
+        """
+        Timer callback: call libcurl back after timeoutMs, -1 to stop the timer
+        """
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if timeoutMs >= 0 and not self.closed:
+            # libcurl must not be called from its own callbacks
+            self.timer = self.loop.call_later(timeoutMs / 1000.0, self._socketAction,
+                                              pycurl.SOCKET_TIMEOUT, 0)
+
+    def _socketAction(self, sockfd, evBitmask):
+        """
+        Let libcurl act on a ready socket, or on a timeout, then complete the
+        futures of the finished transfers
+        """
+        if self.closed:
+            return
+        while True:
+            ret, _ = self.mcurl.socket_action(sockfd, evBitmask)
+            if ret != pycurl.E_CALL_MULTI_PERFORM:
+                break
+        while True:
+            numQueued, okList, errList = self.mcurl.info_read()
+            for curl in okList:
+                self._done(curl, None)
+            for curl, errno, errmsg in errList:
+                self._done(curl, pycurl.error(errno, errmsg))
+            if numQueued == 0:
+                break
+
+    def _done(self, curl, exc):
+        """
+        Remove the handle of a finished transfer and complete its future
+        """
+        self.mcurl.remove_handle(curl)
+        future = self.futures.pop(curl, None)
+        if future is None or future.done():
+            return
+        if exc is None:
+            future.set_result(None)
+        else:
+            future.set_exception(exc)
+
+    async def perform(self, curl):
+        """
+        Run the transfer of a curl handle, raising pycurl.error if it fails
+        """
+        future = self.loop.create_future()
+        self.futures[curl] = future
+        self.mcurl.add_handle(curl)
+        try:
+            await future
+        finally:
+            if self.futures.pop(curl, None) is not None:
+                # cancelled while in flight
+                self.mcurl.remove_handle(curl)
+
+    def close(self):
+        """
+        Abort the transfers in flight and close the multi handle
+        """
+        self.closed = True
+        if self.timer is not None:
+            self.timer.cancel()
+        if not self.loop.is_closed():
+            for sockfd in self.sockets:
+                self.loop.remove_reader(sockfd)
+                self.loop.remove_writer(sockfd)
+        self.sockets = set()
+        for curl, future in list(self.futures.items()):
+            self.mcurl.remove_handle(curl)
+            if not future.done():
+                future.cancel()
+        self.futures = {}
+        self.mcurl.close()
+
+
+class AsyncRequestHandler(RequestHandler):
+    """
+    asyncio counterpart of RequestHandler: request, getdata and getheader
+    are coroutines, with the same options, decoding and errors, whose
+    transfers run on the event loop through a CurlMultiLoop.
+
+    At most max_concurrent (configuration, 50 by default) requests of the
+    handler are in flight at once, the other ones wait for their turn.
+    """
+
+    def __init__(self, config=None, logger=None):
+        super(AsyncRequestHandler, self).__init__(config, logger)
+        config = config or {}
+        self.maxConcurrent = config.get('max_concurrent', 50)
+        # (loop, CurlMultiLoop, semaphore) of the running event loop
+        self.loopState = None
+
+    def getLoopState(self):
+        """
+        Return the CurlMultiLoop and the semaphore bounding the concurrent
+        requests of the running event loop
+        """
+        loop = asyncio.get_running_loop()
+        if self.loopState is None or self.loopState[0] is not loop:
+            if self.loopState is not None:
+                self.loopState[1].close()
+            self.loopState = (loop, CurlMultiLoop(loop), asyncio.Semaphore(self.maxConcurrent))
+        return self.loopState[1], self.loopState[2]
+
+    @portForward(8443)
+    async def request(self, url, params, headers=None, verb='GET',
+                      verbose=0, ckey=None, cert=None, capath=None,
+                      doseq=True, encode=False, decode=False, cainfo=None, cookie=None):
+        """Fetch data for given set of parameters"""
+        multiLoop, semaphore = self.getLoopState()
+        async with semaphore:
+            curl = self.pool.acquire(url) if self.pool else pycurl.Curl()
+            reusable = False
+            try:
+                bbuf, hbuf = self.set_opts(curl, url, params, headers, ckey, cert, capath,
+                                           verbose, verb, doseq, encode, cainfo, cookie)
+                await multiLoop.perform(curl)
+                reusable = True
+            finally:
+                self.release_handle(url, curl, reusable)
+        if verbose:
+            print(verb, url, params, headers)
+        return self.parse_response(url, params, headers, verb, decode, bbuf, hbuf)
+
+    async def getdata(self, url, params, headers=None, verb='GET',
+                      verbose=0, ckey=None, cert=None, doseq=True,
+                      encode=False, decode=False, cookie=None):
+        """Fetch data for given set of parameters"""
+        _, data = await self.request(url=url, params=params, headers=headers, verb=verb,
+                                     verbose=verbose, ckey=ckey, cert=cert, doseq=doseq,
+                                     encode=encode, decode=decode, cookie=cookie)
+        return data
+
+    async def getheader(self, url, params, headers=None, verb='GET',
+                        verbose=0, ckey=None, cert=None, doseq=True):
+        """Fetch HTTP header"""
+        header, _ = await self.request(url, params, headers, verb,
+                                       verbose, ckey, cert, doseq=doseq)
+        return header
+
+    def close(self):
+        """
+        Abort the requests in flight and release the multi handle
+        """
+        if self.loopState is not None:
+            self.loopState[1].close()
+            self.loopState = None
 
 
 HTTP_PAT = re.compile( \
@@ -516,43 +917,35 @@ def getdata(urls, ckey, cert, headers=None, options=None, num_conn=50, cookie=No
             curl.hbuf = hbuf
             curl.bbuf = bbuf
             curl.url = url
-        # Run the internal curl state machine for the multi stack
-        while True:
-            ret, _ = mcurl.perform()
-            if ret != pycurl.E_CALL_MULTI_PERFORM:
-                break
-        # Check for curl objects which have terminated, and add them to the
-        # freelist
-        while True:
-            num_q, ok_list, err_list = mcurl.info_read()
-            for curl in ok_list:
-                hdrs = decodeBytesToUnicode(curl.hbuf.getvalue())
-                data = decompress(decodeBytesToUnicode(curl.bbuf.getvalue()), ResponseHeader(hdrs).getHeader())
-                url = curl.url
-                curl.bbuf.flush()
-                curl.bbuf.close()
-                curl.hbuf.close()
-                curl.hbuf = None
-                curl.bbuf = None
-                mcurl.remove_handle(curl)
-                freelist.append(curl)
-                yield {'url': url, 'data': data, 'headers': hdrs}
-            for curl, errno, errmsg in err_list:
-                hdrs = curl.hbuf.getvalue()
-                data = curl.bbuf.getvalue()
-                url = curl.url
-                curl.bbuf.flush()
-                curl.bbuf.close()
-                curl.hbuf.close()
-                curl.hbuf = None
-                curl.bbuf = None
-                mcurl.remove_handle(curl)
-                freelist.append(curl)
-                yield {'url': url, 'data': None, 'headers': hdrs, \
-                       'error': errmsg, 'code': errno}
-            num_processed = num_processed + len(ok_list) + len(err_list)
-            if num_q == 0:
-                break
+        # Run the internal curl state machine for the multi stack and check
+        # for curl objects which have terminated, and add them to the freelist
+        ok_list, err_list = multi_perform(mcurl)
+        for curl in ok_list:
+            hdrs = decodeBytesToUnicode(curl.hbuf.getvalue())
+            data = decompress(decodeBytesToUnicode(curl.bbuf.getvalue()), ResponseHeader(hdrs).getHeader())
+            url = curl.url
+            curl.bbuf.flush()
+            curl.bbuf.close()
+            curl.hbuf.close()
+            curl.hbuf = None
+            curl.bbuf = None
+            mcurl.remove_handle(curl)
+            freelist.append(curl)
+            yield {'url': url, 'data': data, 'headers': hdrs}
+        for curl, errno, errmsg in err_list:
+            hdrs = curl.hbuf.getvalue()
+            data = curl.bbuf.getvalue()
+            url = curl.url
+            curl.bbuf.flush()
+            curl.bbuf.close()
+            curl.hbuf.close()
+            curl.hbuf = None
+            curl.bbuf = None
+            mcurl.remove_handle(curl)
+            freelist.append(curl)
+            yield {'url': url, 'data': None, 'headers': hdrs, \
+                   'error': errmsg, 'code': errno}
+        num_processed = num_processed + len(ok_list) + len(err_list)
         # Currently no more I/O is pending, could do something in the meantime
         # (display a progress bar, etc.).
         # We just call select() to sleep until some more data is available.
@@ -561,6 +954,27 @@ def getdata(urls, ckey, cert, headers=None, options=None, num_conn=50, cookie=No
     cleanup(mcurl)
 
 
+def multi_perform(mcurl):
+    """
+    Run the internal curl state machine of the multi stack. Return the
+    list of completed curl objects and the list of (curl, errno, errmsg)
+    tuples of the failed ones.
+    """
+    while True:
+        ret, _ = mcurl.perform()
+        if ret != pycurl.E_CALL_MULTI_PERFORM:
+            break
+    okList = []
+    errList = []
+    while True:
+        num_q, ok_list, err_list = mcurl.info_read()
+        okList.extend(ok_list)
+        errList.extend(err_list)
+        if num_q == 0:
+            break
+    return okList, errList
+
+
 def cleanup(mcurl):
     "Clean-up MultiCurl handles"
     for curl in mcurl.handles:
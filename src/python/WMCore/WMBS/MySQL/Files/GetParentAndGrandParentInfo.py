@@ -5,7 +5,9 @@ _GetParentAndGrandParentInfo_
 Figure out parentage information for a file in WMBS.  This will return
 information about a file's parent and it's grand parent such as the
 lfn, id and whether or not the file is merged.  This will also determine
-whether or not the file is a redneck parent or redneck child.
+whether or not the file is a redneck parent or redneck child.  The lfn of
+the child is returned as well, so that the parents of many files can be
+looked up at once.
 """
 from __future__ import division
 
@@ -13,7 +15,7 @@ from WMCore.Database.DBFormatter import DBFormatter
 
 
 class GetParentAndGrandParentInfo(DBFormatter):
-    sql = """SELECT wfp.id, wfp.lfn, wfp.merged,
+    sql = """SELECT wfd.lfn AS child_lfn, wfp.id, wfp.lfn, wfp.merged,
                     wfgp.lfn AS gplfn, wfgp.merged AS gpmerged
              FROM wmbs_file_details wfp
              INNER JOIN wmbs_file_parent wfpa ON wfpa.parent = wfp.id
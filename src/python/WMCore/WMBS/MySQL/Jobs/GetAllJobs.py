@@ -47,13 +47,23 @@ class GetAllJobs(DBFormatter):
                 final.append(listvalues(i)[0])
             return final
 
+    def formatStream(self, resultStream):
+        """
+        _formatStream_
+
+        Yield the job IDs of each streamed chunk of results as a list.
+        """
+        for result in resultStream:
+            yield [row[0] for row in result.fetchall()]
+
     def execute(self, state=None, jobType=None, conn=None,
-                transaction=False, limitRows=None):
+                transaction=False, limitRows=None, stream=False, arraysize=None):
         """
         _execute_
 
         Execute the SQL for the given job ID and then format and return
-        the result.
+        the result. With stream=True, a generator yielding lists of at
+        most arraysize job IDs is returned instead.
         """
         if limitRows:
             extraSql = self.limit_sql % limitRows
@@ -61,15 +71,15 @@ class GetAllJobs(DBFormatter):
             extraSql = ""
 
         if state is None:
-            result = self.dbi.processData(self.sql_all + extraSql, {}, conn=conn,
-                                          transaction=transaction)
+            sql, binds = self.sql_all + extraSql, {}
+        elif jobType:
+            sql, binds = self.sql_state_type + extraSql, {'state': state.lower(), 'type': jobType}
         else:
-            if jobType:
-                result = self.dbi.processData(self.sql_state_type + extraSql, {'state': state.lower(), 'type': jobType},
-                                              conn=conn, transaction=transaction)
-            else:
-                result = self.dbi.processData(self.sql_state + extraSql, {'state': state.lower()},
-                                              conn=conn, transaction=transaction)
+            sql, binds = self.sql_state + extraSql, {'state': state.lower()}
+
+        if stream:
+            return self.formatStream(self.dbi.processDataStream(sql, binds, conn=conn, arraysize=arraysize))
 
+        result = self.dbi.processData(sql, binds, conn=conn, transaction=transaction)
         res = self.format(result)
         return res
@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+"""
+_GetMaxIdByState_
+
+MySQL implementation of Jobs.GetMaxIdByState
+"""
+
+from WMCore.Database.DBFormatter import DBFormatter
+
+
+class GetMaxIdByState(DBFormatter):
+    """
+    Retrieve the highest ID of the wmbs jobs in a given state
+
+    Returns an integer value, or None if there are no jobs in that state.
+    """
+    sql = """
+          SELECT MAX(id) FROM wmbs_job
+              WHERE state = (SELECT id FROM wmbs_job_state WHERE name = :state)
+          """
+
+    def execute(self, state, conn=None, transaction=False):
+        result = self.dbi.processData(self.sql, {'state': state},
+                                      conn=conn,
+                                      transaction=transaction)
+        return self.format(result)[0][0]
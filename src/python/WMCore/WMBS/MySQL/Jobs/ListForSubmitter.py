@@ -14,8 +14,13 @@ class ListForSubmitter(DBFormatter):
 
     List the available jobs in WMBS order by descending subscription priority,
     descending workflow priority, and ascending workflow ID.
+
+    With minJobId, only list the jobs with a greater ID (up to maxJobId, or,
+    with minStateTime, also the ones that entered the created state since then)
+    ordered by ascending job ID, such that a limited result can be resumed from
+    its last job ID.
     """
-    sql = """SELECT wmbs_job.id AS id,
+    sql_select = """SELECT wmbs_job.id AS id,
                     wmbs_job.name AS name,
                     wmbs_job.cache_dir AS cache_dir,
                     wmbs_sub_types.name AS task_type,
@@ -36,20 +41,65 @@ class ListForSubmitter(DBFormatter):
                  wmbs_job.state = wmbs_job_state.id
                INNER JOIN wmbs_workflow ON
                  wmbs_subscription.workflow = wmbs_workflow.id
-             WHERE wmbs_job_state.name = 'created'
+             WHERE wmbs_job_state.name = 'created'"""
+
+    sql_order = """
              ORDER BY
                wmbs_sub_types.priority DESC,
                wmbs_workflow.priority DESC,
                wmbs_workflow.id ASC"""
 
+    sql = sql_select + sql_order
+
+    min_id_sql = " AND wmbs_job.id > :min_id"
+
+    max_id_sql = " AND wmbs_job.id <= :max_id"
+
+    min_state_time_sql = " AND wmbs_job.state_time >= :min_state_time"
+
+    sql_order_id = " ORDER BY wmbs_job.id ASC"
+
+    # the primary key and idx_wmbs_job_state_time serve each side of the union,
+    # where a single OR of both conditions reads all the created jobs
+    sql_union = "SELECT * FROM (%s UNION %s) new_jobs ORDER BY id ASC"
+
     limit_sql = " limit %d"
 
-    def execute(self, conn=None, transaction=False, limitRows=None):
+    def getSQL(self, minJobId=None, minStateTime=None, maxJobId=None):
+        """
+        Build the query for all the created jobs, or only for the new ones
+        """
+        if minJobId is None:
+            return self.sql
+        sql = self.sql_select + self.min_id_sql
+        if maxJobId is not None:
+            sql += self.max_id_sql
+        if minStateTime is None:
+            return sql + self.sql_order_id
+        return self.sql_union % (sql, self.sql_select + self.min_state_time_sql)
+
+    def execute(self, conn=None, transaction=False, limitRows=None, stream=False, arraysize=None,
+                minJobId=None, minStateTime=None, maxJobId=None):
+        """
+        With stream=True, return a generator yielding lists of at most
+        arraysize jobs, read through a server side cursor.
+        """
+        sql = self.getSQL(minJobId, minStateTime, maxJobId)
         if limitRows:
-            extraSql = self.limit_sql % limitRows
-        else:
-            extraSql = ""
+            sql += self.limit_sql % limitRows
+
+        binds = {}
+        if minJobId is not None:
+            binds['min_id'] = minJobId
+            if maxJobId is not None:
+                binds['max_id'] = maxJobId
+            if minStateTime is not None:
+                binds['min_state_time'] = minStateTime
+
+        if stream:
+            return self.formatStream(self.dbi.processDataStream(sql, binds or None, conn=conn,
+                                                                arraysize=arraysize))
 
-        result = self.dbi.processData(self.sql + extraSql, conn=conn,
+        result = self.dbi.processData(sql, binds, conn=conn,
                                       transaction=transaction)
-        return self.formatDict(result)
+        return self.formatRows(result)
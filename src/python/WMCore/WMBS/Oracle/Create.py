@@ -592,6 +592,9 @@ class Create(CreateWMBSBase):
         self.constraints["03_idx_wmbs_job"] = \
             """CREATE INDEX idx_wmbs_job_state ON wmbs_job(state) %s""" % tablespaceIndex
 
+        self.constraints["04_idx_wmbs_job"] = \
+            """CREATE INDEX idx_wmbs_job_state_time ON wmbs_job(state, state_time) %s""" % tablespaceIndex
+
         self.create["16wmbs_job_assoc"] = \
             """CREATE TABLE wmbs_job_assoc (
                  job    INTEGER NOT NULL,
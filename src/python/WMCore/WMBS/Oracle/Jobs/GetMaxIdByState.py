@@ -0,0 +1,15 @@
+#!/usr/bin/env python
+"""
+_GetMaxIdByState_
+
+Oracle implementation of Jobs.GetMaxIdByState
+"""
+
+from WMCore.WMBS.MySQL.Jobs.GetMaxIdByState import GetMaxIdByState as MySQLGetMaxIdByState
+
+
+class GetMaxIdByState(MySQLGetMaxIdByState):
+    """
+    Identical to MySQL version.
+    """
+    pass
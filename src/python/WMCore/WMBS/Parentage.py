@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""
+_Parentage_
+
+Resolve the merged ancestors of WMBS files.
+
+The merged parents of a file are its merged parents or, for unmerged
+parents, their merged parents, and so on up the parentage graph. The
+ancestors of all the files are resolved together, one generation at a time,
+with a Files.GetParentAndGrandParentInfo query for all the files of each
+generation, and are remembered until the resolver is cleared.
+"""
+
+from builtins import object
+
+UNMERGED_LFN_PREFIX = "/store/unmerged/"
+
+
+class ParentageResolver(object):
+    """
+    _ParentageResolver_
+
+    Find the merged parents of lists of files, given a
+    Files.GetParentAndGrandParentInfo DAO.
+    """
+
+    def __init__(self, getParentInfoAction, excludeUnmergedLFNs=False):
+        """
+        With excludeUnmergedLFNs, files under /store/unmerged/ are not
+        considered merged even if flagged so in WMBS.
+        """
+        self.getParentInfoAction = getParentInfoAction
+        self.excludeUnmergedLFNs = excludeUnmergedLFNs
+        self.parents = {}
+
+    def clear(self):
+        """
+        _clear_
+
+        Forget all the parents resolved so far
+        """
+        self.parents = {}
+
+    def isMerged(self, lfn, merged):
+        """
+        _isMerged_
+
+        Whether the file can be a parent of the files being resolved
+        """
+        if merged is None or int(merged) != 1:
+            return False
+        return not (self.excludeUnmergedLFNs and lfn.startswith(UNMERGED_LFN_PREFIX))
+
+    def findParents(self, lfns, conn=None, transaction=False):
+        """
+        _findParents_
+
+        Find the merged parents of the files. Return a dictionary of the sets
+        of parent lfns keyed by lfn.
+        """
+        # merged ancestors of each file and unmerged ancestors to look up
+        mergedParents = {}
+        unmergedParents = {}
+
+        generation = set(lfns).difference(self.parents)
+        while generation:
+            for lfn in generation:
+                mergedParents[lfn] = set()
+                unmergedParents[lfn] = set()
+            parentsInfo = self.getParentInfoAction.execute(sorted(generation), conn=conn,
+                                                           transaction=transaction)
+            for parentInfo in parentsInfo:
+                child = parentInfo["child_lfn"]
+                # This will catch straight to merge files that do not have redneck
+                # parents.  We will mark the straight to merge file from the job
+                # as a child of the merged parent.
+                if self.isMerged(parentInfo["lfn"], parentInfo["merged"]):
+                    mergedParents[child].add(parentInfo["lfn"])
+                elif parentInfo["gpmerged"] is None:
+                    continue
+                # Handle the files that result from merge jobs that aren't redneck
+                # children.
+                elif self.isMerged(parentInfo["gplfn"], parentInfo["gpmerged"]):
+                    mergedParents[child].add(parentInfo["gplfn"])
+                # If that didn't work, we've reached the great-grandparents,
+                # look them up with the next generation
+                else:
+                    unmergedParents[child].add(parentInfo["gplfn"])
+
+            generation = set()
+            for lfn in unmergedParents:
+                generation.update(unmergedParents[lfn])
+            generation.difference_update(mergedParents)
+            generation.difference_update(self.parents)
+
+        for lfn in mergedParents:
+            self._resolve(lfn, mergedParents, unmergedParents)
+
+        return dict((lfn, self.parents[lfn]) for lfn in lfns)
+
+    def _resolve(self, lfn, mergedParents, unmergedParents):
+        """
+        Resolve the parents of a file from the ones of its unmerged ancestors
+        """
+        if lfn in self.parents:
+            return self.parents[lfn]
+        parents = self.parents[lfn] = mergedParents[lfn]
+        for ancestor in unmergedParents[lfn]:
+            parents.update(self._resolve(ancestor, mergedParents, unmergedParents))
+        return parents
@@ -2,6 +2,7 @@ from __future__ import (division, print_function)
 from memory_profiler import profile
 import time
 from WMCore.REST.CherryPyPeriodicTask import CherryPyPeriodicTask
+from WMCore.WMStats.DataStructs.ActiveDataTracker import ActiveDataTracker
 from WMCore.WMStats.DataStructs.DataCache import DataCache
 from WMCore.Services.WMStats.WMStatsReader import WMStatsReader
 from WMCore.ReqMgr.DataStructs.RequestStatus import WMSTATS_JOB_INFO, WMSTATS_NO_JOB_INFO
@@ -11,6 +12,14 @@ class DataCacheUpdate(CherryPyPeriodicTask):
 
     def __init__(self, rest, config):
         self.getJobInfo = getattr(config, "getJobInfo", False)
+        # follow the changes feeds of ReqMgr and WMStats every cycle instead of
+        # reloading all the active requests once the DataCache has expired
+        self.incremental = getattr(config, "dataCacheIncremental", False)
+        # load all the active requests anyway every so often (in seconds)
+        self.fullReloadInterval = getattr(config, "dataCacheFullReloadInterval", 3600)
+        self.maxChanges = getattr(config, "dataCacheMaxChanges", 10000)
+        self.tracker = None
+        self.lastFullLoad = 0
 
         super(DataCacheUpdate, self).__init__(config)
     @profile
@@ -31,7 +40,9 @@ class DataCacheUpdate(CherryPyPeriodicTask):
         self.logger.info("Starting gatherActiveDataStats with jobInfo set to: %s", self.getJobInfo)
         try:
             tStart = time.time()
-            if DataCache.islatestJobDataExpired():
+            if self.incremental:
+                self.updateActiveData(config)
+            elif DataCache.islatestJobDataExpired():
                 wmstatsDB = WMStatsReader(config.wmstats_url, reqdbURL=config.reqmgrdb_url,
                                           reqdbCouchApp="ReqMgr", logger=self.logger)
                 self.logger.info("Getting active data with job info for statuses: %s", WMSTATS_JOB_INFO)
@@ -47,3 +58,24 @@ class DataCacheUpdate(CherryPyPeriodicTask):
         self.logger.info("Total time loading data from ReqMgr2 and WMStats: %s", time.time() - tStart)
         return
 
+    def updateActiveData(self, config):
+        """
+        Apply the changes of the active requests to the DataCache. All of them
+        are loaded on the first cycle, when the changes cannot be followed and
+        every dataCacheFullReloadInterval seconds.
+        """
+        if self.tracker is None:
+            wmstatsDB = WMStatsReader(config.wmstats_url, reqdbURL=config.reqmgrdb_url,
+                                      reqdbCouchApp="ReqMgr", logger=self.logger)
+            self.tracker = ActiveDataTracker(wmstatsDB, WMSTATS_JOB_INFO, WMSTATS_NO_JOB_INFO,
+                                             jobInfoFlag=self.getJobInfo, maxChanges=self.maxChanges,
+                                             logger=self.logger)
+        jobData = None
+        if time.time() - self.lastFullLoad < self.fullReloadInterval:
+            jobData = self.tracker.update(DataCache.getlatestJobData())
+        if jobData is None:
+            jobData = self.tracker.load()
+            self.lastFullLoad = time.time()
+        # the new data replaces the previous one at once for the REST threads
+        DataCache.setlatestJobData(jobData)
+        self.logger.info("DataCache is up-to-date with %d requests data", len(jobData))
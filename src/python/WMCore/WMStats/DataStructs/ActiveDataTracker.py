@@ -0,0 +1,189 @@
+"""
+_ActiveDataTracker_
+
+Keep the data of the active requests of the WMStats DataCache up to date with
+the CouchDB _changes feeds of ReqMgr and WMStats.
+
+The active requests are loaded once, as DataCacheUpdate always did, after
+reading the update sequences of both databases. From then on only the request
+documents and the agent_request documents changed since these sequences are
+fetched and applied to a copy of the data, so that the REST threads reading
+the DataCache never see a request half updated. The data must be loaded again
+when the changes cannot be followed: nothing loaded yet, a feed error (e.g. the
+database was recreated) or more changes than worth applying one by one.
+"""
+
+from __future__ import (division, print_function)
+
+from builtins import object
+import logging
+
+# request documents, and the deleted ones which have no RequestName anymore
+REQUEST_SELECTOR = {"$or": [{"RequestName": {"$exists": True}}, {"_deleted": True}]}
+# the agent_request documents are only deleted after the request is archived,
+# which removes it from the active data through the ReqMgr feed
+AGENT_REQUEST_SELECTOR = {"type": "agent_request"}
+
+
+class ActiveDataTracker(object):
+    """
+    _ActiveDataTracker_
+
+    Load the active requests with a WMStatsReader, then follow their changes.
+    """
+
+    def __init__(self, wmstatsReader, jobInfoStatus, noJobInfoStatus, jobInfoFlag=False,
+                 maxChanges=10000, logger=None):
+        """
+        The requests in jobInfoStatus get the job information of the agents
+        (AgentJobInfo) if jobInfoFlag is set, the ones in noJobInfoStatus never
+        do. The data is loaded again when there are maxChanges changes or more.
+        """
+        self.reader = wmstatsReader
+        self.jobInfoStatus = list(jobInfoStatus)
+        self.noJobInfoStatus = list(noJobInfoStatus)
+        self.jobInfoFlag = jobInfoFlag
+        self.maxChanges = maxChanges
+        self.logger = logger if logger else logging.getLogger()
+        self.requestSeq = None
+        self.agentSeq = None
+
+    def reset(self):
+        """
+        _reset_
+
+        Forget the sequences, the next update needs a full load
+        """
+        self.requestSeq = None
+        self.agentSeq = None
+
+    def load(self):
+        """
+        _load_
+
+        Load all the active requests and remember the sequences to follow the
+        changes from. The sequences are read first: the changes made while
+        loading are applied again by the next update, which is harmless.
+        """
+        requestSeq = self.reader.reqDB.couchDB.info()['update_seq']
+        agentSeq = self.reader.couchDB.info()['update_seq'] if self.jobInfoFlag else None
+
+        self.logger.info("Getting active data with job info for statuses: %s", self.jobInfoStatus)
+        jobData = self.reader.getActiveData(self.jobInfoStatus, jobInfoFlag=self.jobInfoFlag)
+        self.logger.info("Getting active data with NO job info for statuses: %s", self.noJobInfoStatus)
+        jobData.update(self.reader.getActiveData(self.noJobInfoStatus, jobInfoFlag=False))
+
+        self.requestSeq = requestSeq
+        self.agentSeq = agentSeq
+        return jobData
+
+    def update(self, jobData):
+        """
+        _update_
+
+        Apply the changes since the last load or update to the active data.
+        Return the updated data, a new dictionary if anything changed, or None
+        if the data must be loaded again.
+        """
+        if self.requestSeq is None:
+            return None
+        try:
+            requestChanges = self._getChanges(self.reader.reqDB.couchDB, REQUEST_SELECTOR,
+                                              self.requestSeq)
+            agentChanges = None
+            if self.jobInfoFlag and requestChanges is not None:
+                agentChanges = self._getChanges(self.reader.couchDB, AGENT_REQUEST_SELECTOR,
+                                                self.agentSeq)
+        except Exception as ex:
+            self.logger.warning("Failed to follow the changes feeds, reloading the active data. Error: %s",
+                                str(ex))
+            self.reset()
+            return None
+        if requestChanges is None or (self.jobInfoFlag and agentChanges is None):
+            self.logger.info("More than %d changes to apply, reloading the active data", self.maxChanges)
+            self.reset()
+            return None
+
+        numChanges = len(requestChanges['results'])
+        if agentChanges:
+            numChanges += len(agentChanges['results'])
+        if numChanges:
+            # the REST threads keep reading the previous data
+            jobData = dict(jobData)
+            self._applyRequestChanges(jobData, requestChanges['results'])
+            if agentChanges:
+                self._applyAgentChanges(jobData, agentChanges['results'])
+        self.logger.info("Applied %d changes to the active data", numChanges)
+
+        self.requestSeq = requestChanges['last_seq']
+        if agentChanges:
+            self.agentSeq = agentChanges['last_seq']
+        return jobData
+
+    def _getChanges(self, couchDB, selector, since):
+        """
+        Get the changes of the documents since the sequence, or None if there
+        are too many of them
+        """
+        changes = couchDB.changesBySelector(selector, since=since, limit=self.maxChanges,
+                                            includeDocs=True)
+        if len(changes['results']) >= self.maxChanges and changes.get('pending', 1) > 0:
+            return None
+        return changes
+
+    def _applyRequestChanges(self, jobData, results):
+        """
+        Add, replace or remove the requests changed in ReqMgr, keeping their
+        job information
+        """
+        activeStatus = set(self.jobInfoStatus + self.noJobInfoStatus)
+        jobInfoStatus = set(self.jobInfoStatus)
+        newJobInfo = []
+        for change in results:
+            requestName = change['id']
+            doc = change.get('doc') or {}
+            if change.get('deleted') or doc.get('RequestStatus') not in activeStatus:
+                jobData.pop(requestName, None)
+                continue
+            # remove the couch specific information, as RequestDBReader does
+            for key in ['_rev', '_attachments']:
+                doc.pop(key, None)
+            if self.jobInfoFlag and doc['RequestStatus'] in jobInfoStatus:
+                oldDoc = jobData.get(requestName, {})
+                if oldDoc.get('RequestStatus') in jobInfoStatus:
+                    if 'AgentJobInfo' in oldDoc:
+                        doc['AgentJobInfo'] = oldDoc['AgentJobInfo']
+                else:
+                    newJobInfo.append(requestName)
+            jobData[requestName] = doc
+
+        if newJobInfo:
+            # the requests which just got to a status with job information
+            jobInfo = self.reader.getLatestJobInfoByRequests(newJobInfo)
+            for row in jobInfo['rows'] if jobInfo else []:
+                # documents deleted between the calls have no doc
+                if row.get('doc'):
+                    self._setAgentJobInfo(jobData, row['doc'])
+
+    def _applyAgentChanges(self, jobData, results):
+        """
+        Replace the job information of an agent in the requests changed in
+        WMStats
+        """
+        jobInfoStatus = set(self.jobInfoStatus)
+        for change in results:
+            doc = change.get('doc')
+            if not doc or change.get('deleted'):
+                continue
+            if jobData.get(doc['workflow'], {}).get('RequestStatus') in jobInfoStatus:
+                self._setAgentJobInfo(jobData, doc)
+
+    @staticmethod
+    def _setAgentJobInfo(jobData, doc):
+        """
+        Set the job information of an agent in a copy of the request data
+        """
+        reqInfo = dict(jobData[doc['workflow']])
+        reqInfo['AgentJobInfo'] = dict(reqInfo.get('AgentJobInfo', {}))
+        reqInfo['AgentJobInfo'][doc['agent_url']] = doc
+        jobData[doc['workflow']] = reqInfo
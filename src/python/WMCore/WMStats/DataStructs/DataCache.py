@@ -8,49 +8,48 @@ class DataCache(object):
     # TODO: need to change to  store in  db instead of storing in the memory
     # When mulitple server run for load balancing it could have different result
     # from each server.
-    def __init__(self):
-        self._duration = 300  # 5 minitues
-        self._lastedActiveDataFromAgent = {}
-    
-#    @staticmethod
-    def getDuration(self):
-        return self._duration
-
- #   @staticmethod
-    def setDuration(self, sec):
-        self._duration = sec
-
-  #  @staticmethod
+    _duration = 300  # 5 minitues
+    _lastedActiveDataFromAgent = {}
+
+    @staticmethod
+    def getDuration():
+        return DataCache._duration
+
+    @staticmethod
+    def setDuration(sec):
+        DataCache._duration = sec
+
+    @staticmethod
     @profile
-    def getlatestJobData(self):
-        if (self._lastedActiveDataFromAgent):
-            return self._lastedActiveDataFromAgent["data"]
+    def getlatestJobData():
+        if (DataCache._lastedActiveDataFromAgent):
+            return DataCache._lastedActiveDataFromAgent["data"]
         else:
             return {}
 
-   # @staticmethod
-    def isEmpty(self):
+    @staticmethod
+    def isEmpty():
         # simple check to see if the data cache is populated
-        return not self._lastedActiveDataFromAgent.get("data")
+        return not DataCache._lastedActiveDataFromAgent.get("data")
 
-    #@staticmethod
+    @staticmethod
     @profile
-    def setlatestJobData(self, jobData):
-        self._lastedActiveDataFromAgent["time"] = int(time.time())
-        self._lastedActiveDataFromAgent["data"] = jobData
+    def setlatestJobData(jobData):
+        DataCache._lastedActiveDataFromAgent["time"] = int(time.time())
+        DataCache._lastedActiveDataFromAgent["data"] = jobData
 
-    #@staticmethod
-    def islatestJobDataExpired(self):
-        if not self._lastedActiveDataFromAgent:
+    @staticmethod
+    def islatestJobDataExpired():
+        if not DataCache._lastedActiveDataFromAgent:
             return True
 
-        if (int(time.time()) - self._lastedActiveDataFromAgent["time"]) > self._duration:
+        if (int(time.time()) - DataCache._lastedActiveDataFromAgent["time"]) > DataCache._duration:
             return True
         return False
 
-    #@staticmethod
-    def filterData(self, filterDict, maskList):
-        reqData = self.getlatestJobData()
+    @staticmethod
+    def filterData(filterDict, maskList):
+        reqData = DataCache.getlatestJobData()
 
         for _, reqInfo in viewitems(reqData):
             reqData = RequestInfo(reqInfo)
@@ -64,9 +63,9 @@ class DataCache(object):
                     elif result is not None and result != "":
                         yield result
 
-    #@staticmethod
-    def filterDataByRequest(self, filterDict, maskList=None):
-        reqData = self.getlatestJobData()
+    @staticmethod
+    def filterDataByRequest(filterDict, maskList=None):
+        reqData = DataCache.getlatestJobData()
 
         if maskList is not None:
             if isinstance(maskList, (str, bytes)):
@@ -86,9 +85,9 @@ class DataCache(object):
                         resultItem[prop] = reqInfo.get(prop, None)
                     yield resultItem
 
-    #@staticmethod
-    def getProtectedLFNs(self):
-        reqData = self.getlatestJobData()
+    @staticmethod
+    def getProtectedLFNs():
+        reqData = DataCache.getlatestJobData()
 
         for _, reqInfo in viewitems(reqData):
             for dirPath in protectedLFNs(reqInfo):
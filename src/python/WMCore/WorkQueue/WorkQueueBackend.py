@@ -51,6 +51,82 @@ def sortAvailableElements(elementsList):
     elementsList.sort(key=lambda element: element['Priority'], reverse=True)
 
 
+class SiteJobCounter(object):
+    """
+    Index over the siteJobCounts dictionary-of-dictionaries, to count the
+    jobs running at a site with a priority greater or equal to a given one.
+
+    Every site gets a Fenwick tree (binary indexed tree) over its priorities,
+    sorted in descending order, such that both counting the jobs and adding
+    the jobs of an accepted element take a logarithmic time in the number
+    of priorities. The trees are built the first time a site is looked up,
+    and siteJobCounts is kept updated in place.
+    """
+
+    def __init__(self, siteJobCounts, priorities=None):
+        """
+        :param siteJobCounts: a dictionary-of-dictionaries key'ed by the site name; value
+            is a dictionary with the number of jobs running at a given priority.
+        :param priorities: the priorities that will be looked up, e.g. the ones
+            of the elements to be matched
+        """
+        self.siteJobCounts = siteJobCounts
+        self.priorities = set(priorities or [])
+        self.trees = {}
+
+    def _getTree(self, site, prio):
+        """
+        Return the priority positions and the tree of a site, (re)building
+        it if it doesn't exist yet or if it doesn't know the given priority
+        """
+        if site in self.trees and prio in self.trees[site][0]:
+            return self.trees[site]
+
+        self.priorities.add(prio)
+        jobsByPrio = self.siteJobCounts.get(site, {})
+        positions = {}
+        for i, priority in enumerate(sorted(self.priorities.union(jobsByPrio), reverse=True)):
+            positions[priority] = i + 1
+        tree = [0] * (len(positions) + 1)
+        for priority, jobs in viewitems(jobsByPrio):
+            tree[positions[priority]] += jobs
+        # linear time construction, propagate every node to its parent
+        for i in range(1, len(tree)):
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self.trees[site] = (positions, tree)
+        return self.trees[site]
+
+    def jobCount(self, site, prio):
+        """
+        Return the number of jobs running at the site with priority greater or equal to prio
+        """
+        positions, tree = self._getTree(site, prio)
+        count = 0
+        i = positions[prio]
+        while i > 0:
+            count += tree[i]
+            i -= i & -i
+        return count
+
+    def addJobs(self, site, prio, jobs):
+        """
+        Add jobs running at the site with the given priority
+        """
+        self.siteJobCounts.setdefault(site, {})
+        self.siteJobCounts[site][prio] = self.siteJobCounts[site].setdefault(prio, 0) + jobs
+        if site not in self.trees or prio not in self.trees[site][0]:
+            # built with the updated job counts on the next look up
+            self.trees.pop(site, None)
+            return
+        positions, tree = self.trees[site]
+        i = positions[prio]
+        while i < len(tree):
+            tree[i] += jobs
+            i += i & -i
+
+
 class WorkQueueBackend(object):
     """
     Represents persistent storage for WorkQueue
@@ -380,6 +456,7 @@ class WorkQueueBackend(object):
             element = CouchWorkQueueElement.fromDocument(self.db, item)
             sortedElements.append(element)
         sortAvailableElements(sortedElements)
+        jobCounter = SiteJobCounter(siteJobCounts, [element['Priority'] for element in sortedElements])
 
         for element in sortedElements:
             commonSites = possibleSites(element)
@@ -391,7 +468,7 @@ class WorkQueueBackend(object):
                 if site in thresholds:
                     # Count the number of jobs currently running of greater priority, if they
                     # are less than the site thresholds, then accept this element
-                    curJobCount = sum([x[1] if x[0] >= prio else 0 for x in viewitems(siteJobCounts.get(site, {}))])
+                    curJobCount = jobCounter.jobCount(site, prio)
                     self.logger.debug("Job Count: %s, site: %s thresholds: %s", curJobCount, site, thresholds[site])
                     if curJobCount < thresholds[site]:
                         possibleSite = site
@@ -401,9 +478,7 @@ class WorkQueueBackend(object):
                 self.logger.debug("Meant to accept workflow: %s, with prio: %s, element id: %s, for site: %s",
                                   element['RequestName'], prio, element.id, possibleSite)
                 elements.append(element)
-                siteJobCounts.setdefault(possibleSite, {})
-                siteJobCounts[possibleSite][prio] = siteJobCounts[possibleSite].setdefault(prio, 0) + \
-                                                    element['Jobs'] * element.get('blowupFactor', 1.0)
+                jobCounter.addJobs(possibleSite, prio, element['Jobs'] * element.get('blowupFactor', 1.0))
             else:
                 self.logger.debug("No available resources for %s with localdoc id %s",
                                   element['RequestName'], element.id)
@@ -524,6 +599,7 @@ class WorkQueueBackend(object):
             else:
                 sortedElements.append(element)
         sortAvailableElements(sortedElements)
+        jobCounter = SiteJobCounter(siteJobCounts, [element['Priority'] for element in sortedElements])
 
         for element in sortedElements:
             if numElems <= 0:
@@ -538,7 +614,7 @@ class WorkQueueBackend(object):
                 if site in thresholds:
                     # Count the number of jobs currently running of greater priority, if they
                     # are less than the site thresholds, then accept this element
-                    curJobCount = sum([x[1] if x[0] >= prio else 0 for x in viewitems(siteJobCounts.get(site, {}))])
+                    curJobCount = jobCounter.jobCount(site, prio)
                     self.logger.debug("Job Count: %s, site: %s thresholds: %s",
                                       curJobCount, site, thresholds[site])
                     if curJobCount < thresholds[site]:
@@ -550,9 +626,7 @@ class WorkQueueBackend(object):
                                  element['RequestName'], prio, element.id, possibleSite)
                 numElems -= 1
                 elems.append(element)
-                siteJobCounts.setdefault(possibleSite, {})
-                siteJobCounts[possibleSite][prio] = siteJobCounts[possibleSite].setdefault(prio, 0) + \
-                                                    element['Jobs'] * element.get('blowupFactor', 1.0)
+                jobCounter.addJobs(possibleSite, prio, element['Jobs'] * element.get('blowupFactor', 1.0))
             else:
                 self.logger.debug("No available resources for %s with doc id %s",
                                   element['RequestName'], element.id)
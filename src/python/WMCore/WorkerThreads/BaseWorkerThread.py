@@ -17,6 +17,7 @@ import traceback
 
 from WMCore.Database.DBExceptionHandler import db_exception_handler
 from WMCore.Database.Transaction import Transaction
+from WMCore.WorkerThreads.WorkNotifier import WorkListener, getNotifyDir
 
 
 class BaseWorkerThread(object):
@@ -25,6 +26,13 @@ class BaseWorkerThread(object):
     regular intervals. Framework (through WorkerThreadManager) ensures that
     a default transaction, trigger and message service are available as in
     event handler threads.
+
+    Workers of components configured with wakeupStates are woken up early
+    when other components move jobs to any of these states. Their poll
+    interval then backs off by pollBackoffFactor, up to maxPollInterval,
+    after every cycle that came up empty. The algorithm reports the work it
+    did by setting cycleWork to the number of items it processed; when it
+    doesn't, the cycles woken up by a notification count as busy.
     """
 
     def __init__(self):
@@ -52,6 +60,16 @@ class BaseWorkerThread(object):
         # Init the timing
         self.lastTime = time.time()
 
+        # Init the notifications of new work
+        self.workListener = None
+        self.currentIdleTime = None
+        self.maxIdleTime = None
+        self.backoffFactor = 2
+        self.pendingNotifications = []
+        self.notifiedCycle = False
+        self.cycleWork = None
+        self.stateLatencyStats = {}
+
         # Get the current DBFactory
         myThread = threading.currentThread()
         self.dbFactory = myThread.dbFactory
@@ -114,6 +132,53 @@ class BaseWorkerThread(object):
             myThread.logdbClient = None
         return
 
+    def setUpWorkListener(self):
+        """
+        Listen for notifications of the states the component is configured
+        to wake up for, if any
+        """
+        config = self.component.config
+        compName = getattr(getattr(config, "Agent", None), "componentName", None)
+        compSect = getattr(config, compName, None) if compName else None
+        states = getattr(compSect, "wakeupStates", [])
+        notifyDir = getNotifyDir(config)
+        if not states or not notifyDir:
+            return
+
+        self.currentIdleTime = self.idleTime
+        self.maxIdleTime = max(getattr(compSect, "maxPollInterval", self.idleTime), self.idleTime)
+        self.backoffFactor = getattr(compSect, "pollBackoffFactor", 2)
+        try:
+            self.workListener = WorkListener(notifyDir, "%s.%s" % (compName, self.__class__.__name__), states)
+        except Exception as ex:
+            logging.warning("Failed to listen for work notifications, polling every %s secs: %s",
+                            self.idleTime, str(ex))
+            self.workListener = None
+        else:
+            logging.info("Waking up for jobs moved to: %s", ", ".join(sorted(states)))
+        return
+
+    def recordStateLatency(self, notifications):
+        """
+        _recordStateLatency_
+
+        Account the time between the state changes notified to the thread
+        and the end of the cycle that handled them, per state.
+        """
+        now = time.time()
+        for state, changeTime in notifications:
+            latency = max(now - changeTime, 0.0)
+            stats = self.stateLatencyStats.setdefault(state, {"count": 0, "last": 0.0, "max": 0.0, "total": 0.0})
+            stats["count"] += 1
+            stats["last"] = latency
+            stats["max"] = max(stats["max"], latency)
+            stats["total"] += latency
+        for state in set(state for state, _ in notifications):
+            stats = self.stateLatencyStats[state]
+            logging.info("Handled new %s jobs %.3f secs after their state change (avg %.3f, max %.3f secs)",
+                         state, stats["last"], stats["total"] / stats["count"], stats["max"])
+        return
+
     def initInThread(self, parameters):
         """
         Called when the thread is actually running in its own thread. Performs
@@ -142,6 +207,7 @@ class BaseWorkerThread(object):
 
         self.setUpHeartbeat(myThread)
         self.setUpLogDB(myThread)
+        self.setUpWorkListener()
 
         # Call worker setup
         self.setup(parameters)
@@ -179,6 +245,9 @@ class BaseWorkerThread(object):
                         try:
                             if self.useHeartbeat:
                                 self.heartbeatAPI.updateWorkerHeartbeat(self.workerName, "Running")
+                            notifications, self.pendingNotifications = self.pendingNotifications, []
+                            self.notifiedCycle = bool(notifications)
+                            self.cycleWork = None
 
                             tSpent, results, _ = algorithmWithDBExceptionHandler(parameters)
                             if tSpent and self.useHeartbeat:
@@ -192,6 +261,9 @@ class BaseWorkerThread(object):
                                 msg += " Raise a bug against me. Rollback."
                                 logging.error(msg)
                                 myThread.transaction.rollback()
+
+                            if notifications:
+                                self.recordStateLatency(notifications)
                         except Exception as ex:
                             if myThread.transaction.transaction is not None:
                                 myThread.transaction.rollback()
@@ -228,6 +300,9 @@ class BaseWorkerThread(object):
                 except Exception as ex:
                     logging.error("Heartbeat error update failed %s", str(ex))
 
+        if self.workListener:
+            self.workListener.close()
+
         # Indicate to manager that thread is done
         self.terminateCallback(threading.currentThread().name)
 
@@ -248,10 +323,21 @@ class BaseWorkerThread(object):
         Need to constantly watch if the thread is terminated for
         properly stopping/terminating it.
 
+        Threads listening for work notifications wake up as soon as they get
+        one. Their sleep time goes back to idleTime after a cycle that did
+        some work, otherwise it grows up to maxIdleTime.
+
         returns control when it's time to wake back up
         doesn't return any values
         """
-        idleTime = self.idleTime
+        if self.cycleWork is None:
+            busyCycle = self.notifiedCycle
+        else:
+            busyCycle = self.cycleWork > 0
+        if self.workListener and busyCycle:
+            self.currentIdleTime = self.idleTime
+
+        idleTime = self.currentIdleTime if self.workListener else self.idleTime
         while idleTime > 0:
             if self.useHeartbeat and idleTime % 60 == 0:
                 # send a heartbeat every minute
@@ -260,5 +346,14 @@ class BaseWorkerThread(object):
             if self.notifyTerminate.isSet():
                 break
 
-            time.sleep(1)
+            if self.workListener:
+                notifications = self.workListener.wait(1)
+                if notifications:
+                    self.pendingNotifications.extend(notifications)
+                    break
+            else:
+                time.sleep(1)
             idleTime -= 1
+
+        if self.workListener and not busyCycle:
+            self.currentIdleTime = min(int(self.currentIdleTime * self.backoffFactor), self.maxIdleTime)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+"""
+_WorkNotifier_
+
+Notifications of new work between the agent components.
+
+Components moving jobs to a new state notify the other components through
+unix datagram sockets in the WorkNotify directory of the agent work area.
+Every worker thread waiting for notifications binds its own socket there,
+and the notifiers send a datagram with the state and the time of the change
+to all of them. Notifications are best effort: they are dropped when a
+listener is gone or its socket buffer is full, in which case the listener
+still polls at its regular interval.
+"""
+
+import errno
+import logging
+import os
+import select
+import socket
+import time
+
+NOTIFY_DIR = "WorkNotify"
+SOCKET_SUFFIX = ".sock"
+
+
+def getNotifyDir(config):
+    """
+    _getNotifyDir_
+
+    Return the notifications directory of the agent, or None if the
+    configuration has no work area.
+    """
+    workDir = getattr(getattr(config, "General", None), "workDir", None)
+    if not workDir:
+        return None
+    return os.path.join(workDir, NOTIFY_DIR)
+
+
+class WorkNotifier(object):
+    """
+    _WorkNotifier_
+
+    Send notifications of jobs moved to a state to all the listeners.
+    Nothing is sent if no component ever listened for notifications.
+    """
+
+    def __init__(self, notifyDir):
+        self.notifyDir = notifyDir
+
+    def notify(self, state):
+        """
+        _notify_
+
+        Notify all the listeners that jobs were moved to the given state.
+        Return the number of listeners notified.
+        """
+        if not self.notifyDir:
+            return 0
+        try:
+            socketNames = [name for name in os.listdir(self.notifyDir) if name.endswith(SOCKET_SUFFIX)]
+        except OSError:
+            return 0
+        if not socketNames:
+            return 0
+
+        message = ("%s %.6f" % (state, time.time())).encode("utf-8")
+        sent = 0
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            sock.setblocking(False)
+            for name in socketNames:
+                try:
+                    sock.sendto(message, os.path.join(self.notifyDir, name))
+                    sent += 1
+                except socket.error as ex:
+                    # the listener is gone or too busy to read its notifications
+                    logging.debug("Failed to notify %s of new %s jobs: %s", name, state, str(ex))
+        finally:
+            sock.close()
+        return sent
+
+
+class WorkListener(object):
+    """
+    _WorkListener_
+
+    Receive the notifications of jobs moved to any of the given states.
+    """
+
+    def __init__(self, notifyDir, name, states):
+        self.states = set(states)
+        self.socketPath = os.path.join(notifyDir, name + SOCKET_SUFFIX)
+        try:
+            os.makedirs(notifyDir)
+        except OSError as ex:
+            if ex.errno != errno.EEXIST:
+                raise
+        # a previous instance of the component may have left its socket behind
+        if os.path.exists(self.socketPath):
+            os.remove(self.socketPath)
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.socket.bind(self.socketPath)
+        self.socket.setblocking(False)
+
+    def wait(self, timeout):
+        """
+        _wait_
+
+        Wait up to timeout seconds for notifications. Return all the pending
+        notifications of the listened states, as (state, changeTime) tuples.
+        """
+        notifications = []
+        endTime = time.time() + timeout
+        while True:
+            if select.select([self.socket], [], [], max(endTime - time.time(), 0))[0]:
+                notifications.extend(self._receive())
+            if notifications or time.time() >= endTime:
+                return notifications
+
+    def _receive(self):
+        """
+        Read all the queued notifications of the listened states
+        """
+        notifications = []
+        while True:
+            try:
+                message = self.socket.recv(1024)
+            except socket.error:
+                return notifications
+            try:
+                state, changeTime = message.decode("utf-8").split()
+                changeTime = float(changeTime)
+            except ValueError:
+                logging.warning("Ignoring bad work notification: %s", message)
+                continue
+            if state in self.states:
+                notifications.append((state, changeTime))
+
+    def close(self):
+        """
+        _close_
+
+        Stop listening and remove the socket
+        """
+        self.socket.close()
+        try:
+            os.remove(self.socketPath)
+        except OSError:
+            pass
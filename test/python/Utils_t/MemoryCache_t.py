@@ -6,7 +6,7 @@ Unittests for MemoryCache object
 import unittest
 from time import sleep
 
-from Utils.MemoryCache import MemoryCache, MemoryCacheException
+from Utils.MemoryCache import LRUCache, MemoryCache, MemoryCacheException
 #from Utils.PythonVersion import PY3
 
 
@@ -78,5 +78,58 @@ class MemoryCacheTest(unittest.TestCase):
         self.assertRaises(TypeError, cache.setCache, ["item3"])
 
 
+    def testLRUCache(self):
+        cache = LRUCache(maxSize=3)
+        for key in ("a", "b", "c"):
+            cache.set(key, key.upper())
+        self.assertEqual(cache.get("a"), "A")
+        # "b" is now the least recently used item
+        cache.set("d", "D")
+        self.assertEqual(len(cache), 3)
+        self.assertNotIn("b", cache)
+        self.assertEqual(cache.get("b", "missing"), "missing")
+        self.assertEqual(cache.get("c"), "C")
+        self.assertEqual(cache.stats(), {"size": 3, "maxSize": 3, "bytes": 0, "maxBytes": None,
+                                         "hits": 2, "misses": 1, "evictions": 1})
+
+        # invalid items are dropped
+        self.assertIsNone(cache.get("c", validate=lambda value: value == "X"))
+        self.assertNotIn("c", cache)
+        self.assertEqual(cache.pop("d"), "D")
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.misses, 2)
+
+    def testLRUCacheExpiration(self):
+        cache = LRUCache(maxSize=10, expiration=1)
+        cache.set("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        sleep(1.5)
+        self.assertIsNone(cache.get("a"))
+        self.assertNotIn("a", cache)
+
+    def testLRUCacheBytes(self):
+        cache = LRUCache(maxSize=10, maxBytes=10)
+        cache.set("a", "aaaa")
+        cache.set("b", "bbbb")
+        cache.get("a")
+        # "b" is evicted to make room for "c"
+        cache.set("c", "cccc")
+        self.assertEqual(sorted(cache._cache), ["a", "c"])
+        self.assertEqual(cache.bytes, 8)
+        cache.set("a", "a")
+        cache.set("d", b"dd", size=3)
+        self.assertEqual(cache.bytes, 8)
+        # items larger than maxBytes are not kept
+        cache.set("e", "e" * 11)
+        self.assertNotIn("e", cache)
+        self.assertEqual(len(cache), 3)
+        self.assertEqual(cache.stats()["evictions"], 1)
+        cache.pop("c")
+        self.assertEqual(cache.bytes, 4)
+        cache.clear()
+        self.assertEqual(cache.bytes, 0)
+
+
 if __name__ == "__main__":
     unittest.main()
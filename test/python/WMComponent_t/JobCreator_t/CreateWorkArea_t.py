@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""
+_CreateWorkArea_t_
+
+Unit tests for the creation of the job group work areas
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from WMComponent.JobCreator.CreateWorkArea import CreateWorkArea, CreateWorkAreaException, makedirs
+from WMCore.DataStructs.Job import Job
+from WMCore.DataStructs.JobGroup import JobGroup
+
+
+class WorkloadDummy(object):
+    """
+    The loaded workload of the job groups
+    """
+
+    def name(self):
+        return "TestWorkload"
+
+
+class WorkflowDummy(object):
+    """
+    The WMBS workflow of the job groups
+    """
+    task = "/TestWorkload/ReReco"
+
+
+class CreateWorkAreaTest(unittest.TestCase):
+    """
+    Create the work areas of job groups of the same task concurrently
+    """
+
+    def setUp(self):
+        self.testDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.testDir, ignore_errors=True)
+
+    def testMakedirs(self):
+        """
+        Test that a directory created meanwhile is not an error
+        """
+        directory = os.path.join(self.testDir, "TestWorkload", "ReReco")
+        makedirs(directory)
+        makedirs(directory)
+        self.assertTrue(os.path.isdir(directory))
+
+        fileName = os.path.join(self.testDir, "file")
+        with open(fileName, "w") as fd:
+            fd.write("in the way")
+        self.assertRaises(CreateWorkAreaException, makedirs, os.path.join(fileName, "ReReco"))
+
+    def testConcurrentJobGroups(self):
+        """
+        Test the job groups of a task created by a thread pool, like the JobCreatorPoller does
+        """
+        numGroups = 20
+        jobGroups = []
+        for groupID in range(1, numGroups + 1):
+            jobGroup = JobGroup()
+            jobGroup.id = groupID
+            for jobID in range(groupID * 10, groupID * 10 + 5):
+                job = Job(name="job_%i" % jobID)
+                job['id'] = jobID
+                jobGroup.add(job)
+            jobGroup.commit()
+            jobGroups.append(jobGroup)
+
+        # all the threads look for the task directory at once
+        barrier = threading.Barrier(numGroups)
+
+        def createArea(jobGroup):
+            barrier.wait()
+            CreateWorkArea().processJobs(jobGroup=jobGroup, startDir=self.testDir,
+                                         workflow=WorkflowDummy(), wmWorkload=WorkloadDummy(),
+                                         cache=False)
+            return jobGroup
+
+        with ThreadPoolExecutor(max_workers=numGroups) as executor:
+            results = list(executor.map(createArea, jobGroups))
+
+        taskDir = os.path.join(self.testDir, "TestWorkload", "ReReco")
+        self.assertEqual(len(os.listdir(taskDir)), numGroups)
+        for jobGroup in results:
+            for job in jobGroup.jobs:
+                self.assertEqual(job['cache_dir'], os.path.join(taskDir, "JobCollection_%i_0" % jobGroup.id,
+                                                                "job_%i" % job['id']))
+                self.assertTrue(os.path.isdir(job['cache_dir']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -22,6 +22,7 @@ from WMCore_t.WMSpec_t.TestSpec import createTestWorkload
 from nose.plugins.attrib import attr
 
 from WMComponent.JobCreator.JobCreatorPoller import JobCreatorPoller, capResourceEstimates
+from WMComponent.JobCreator.JobObjectStore import JobObjectReader
 from WMCore.Agent.HeartbeatAPI import HeartbeatAPI
 from WMCore.DAOFactory import DAOFactory
 from WMCore.DataStructs.Run import Run
@@ -298,6 +299,51 @@ class JobCreatorTest(EmulatedUnitTestCase):
 
         return
 
+    def testCreatorThreads(self):
+        """
+        _testCreatorThreads_
+
+        Create the job groups with a thread pool and the collection job object store,
+        and check that every job is committed with a loadable job object
+        """
+        config = self.getConfig()
+        config.JobCreator.creatorThreads = 4
+        config.JobCreator.jobObjectStore = "collection"
+
+        name = makeUUID()
+        nSubs = 5
+        nFiles = 10
+        workloadName = 'TestWorkload'
+
+        self.createWorkload(workloadName=workloadName)
+        workloadPath = os.path.join(self.testDir, 'workloadTest', 'TestWorkload', 'WMSandbox', 'WMWorkload.pkl')
+
+        self.createJobCollection(name=name, nSubs=nSubs, nFiles=nFiles, workflowURL=workloadPath)
+
+        testJobCreator = JobCreatorPoller(config=config)
+        testJobCreator.algorithm()
+
+        getJobsAction = self.daoFactory(classname="Jobs.GetAllJobs")
+        jobIDs = getJobsAction.execute(state='Created', jobType="Processing")
+        self.assertEqual(len(jobIDs), nSubs * nFiles)
+
+        getCacheAction = self.daoFactory(classname="Jobs.GetCache")
+        reader = JobObjectReader()
+        counters = set()
+        for jobID in jobIDs:
+            cacheDir = getCacheAction.execute(jobID)
+            self.assertTrue(os.path.isdir(cacheDir))
+            self.assertFalse(os.path.isfile(os.path.join(cacheDir, 'job.pkl')))
+            job = reader.load(cacheDir, jobID)
+            self.assertEqual(job['id'], jobID)
+            self.assertEqual(job['workflow'], name)
+            counters.add(job['counter'])
+        reader.clear()
+        # job counters of the workflow are unique, regardless of the order the groups were created in
+        self.assertEqual(counters, set(range(1, nSubs * nFiles + 1)))
+
+        return
+
     def testCampaignName(self):
         """
         Test campaign name is written into job pickle file
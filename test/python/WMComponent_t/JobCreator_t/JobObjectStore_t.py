@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+"""
+_JobObjectStore_t_
+
+Unit tests for the JobCreator job object stores
+"""
+
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from nose.plugins.attrib import attr
+
+from WMComponent.JobCreator.JobObjectStore import (COLLECTION_DATA, COLLECTION_INDEX, JOB_PICKLE,
+                                                   JobObjectReader, JobObjectStoreException,
+                                                   getJobObjectStore)
+from WMCore.DataStructs.Job import Job
+from WMCore.DataStructs.Run import Run
+from WMCore.DataStructs.File import File
+
+
+class JobObjectStoreTest(unittest.TestCase):
+    """
+    Test writing and reading job objects with the pickle and collection stores
+    """
+
+    def setUp(self):
+        self.testDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.testDir, ignore_errors=True)
+
+    def createJobs(self, numJobs, jobsPerCollection=1000):
+        """
+        Create jobs with their cache directories laid out like CreateWorkArea does
+        """
+        jobs = []
+        for jobID in range(1, numJobs + 1):
+            collectionDir = os.path.join(self.testDir, "JobCollection_1_%i" % (jobID // jobsPerCollection))
+            cacheDir = os.path.join(collectionDir, "job_%i" % jobID)
+            os.makedirs(cacheDir)
+
+            testFile = File(lfn="/store/data/file_%i.root" % jobID, size=1024, events=100)
+            testFile.addRun(Run(1, *list(range(jobID, jobID + 10))))
+            job = Job(name="job_%i" % jobID, files=[testFile])
+            job['id'] = jobID
+            job['cache_dir'] = cacheDir
+            job['possiblePSN'] = set(["T2_CH_CERN", "T1_US_FNAL"])
+            job['sandbox'] = "/data/sandbox.tar.bz2"
+            jobs.append(job)
+        return jobs
+
+    def saveJobs(self, jobs, storeType):
+        """
+        Save the jobs with a single store, like creatorProcess does
+        """
+        jobStore = getJobObjectStore(storeType)
+        for job in jobs:
+            jobStore.save(job)
+        jobStore.close()
+
+    def testPickleStore(self):
+        """
+        Test that the pickle store writes a job.pkl per job and that it can be read back
+        """
+        jobs = self.createJobs(10)
+        self.saveJobs(jobs, "pickle")
+
+        reader = JobObjectReader()
+        for job in jobs:
+            self.assertTrue(os.path.isfile(os.path.join(job['cache_dir'], JOB_PICKLE)))
+            loadedJob = reader.load(job['cache_dir'], job['id'])
+            self.assertEqual(loadedJob['name'], job['name'])
+            self.assertEqual(loadedJob['possiblePSN'], job['possiblePSN'])
+            self.assertEqual(loadedJob.getFiles(type="lfn"), job.getFiles(type="lfn"))
+        reader.clear()
+
+    def testCollectionStore(self):
+        """
+        Test that the collection store writes a single data and index file per collection
+        """
+        jobs = self.createJobs(25, jobsPerCollection=10)
+        self.saveJobs(jobs, "collection")
+
+        collectionDirs = set(os.path.dirname(job['cache_dir']) for job in jobs)
+        self.assertEqual(len(collectionDirs), 3)
+        for collectionDir in collectionDirs:
+            self.assertTrue(os.path.isfile(os.path.join(collectionDir, COLLECTION_DATA)))
+            self.assertTrue(os.path.isfile(os.path.join(collectionDir, COLLECTION_INDEX)))
+
+        reader = JobObjectReader(maxOpenFiles=2)
+        # read them in reverse order to exercise the seeks and the open files limit
+        for job in reversed(jobs):
+            self.assertFalse(os.path.isfile(os.path.join(job['cache_dir'], JOB_PICKLE)))
+            loadedJob = reader.load(job['cache_dir'], job['id'])
+            self.assertEqual(loadedJob['id'], job['id'])
+            self.assertEqual(loadedJob['name'], job['name'])
+            self.assertEqual(loadedJob.getFiles(type="lfn"), job.getFiles(type="lfn"))
+        self.assertTrue(len(reader.dataFiles) <= 2)
+        reader.clear()
+        self.assertEqual(reader.dataFiles, {})
+
+    def testAppendedJobs(self):
+        """
+        Test that jobs appended to a collection after its index was read are found
+        """
+        jobs = self.createJobs(10)
+        self.saveJobs(jobs[:5], "collection")
+
+        reader = JobObjectReader()
+        self.assertEqual(reader.load(jobs[0]['cache_dir'], jobs[0]['id'])['name'], jobs[0]['name'])
+        self.saveJobs(jobs[5:], "collection")
+        self.assertEqual(reader.load(jobs[9]['cache_dir'], jobs[9]['id'])['name'], jobs[9]['name'])
+        reader.clear()
+
+    def testMissingAndCorruptJobs(self):
+        """
+        Test that missing jobs return None and corrupt jobs raise an exception
+        """
+        jobs = self.createJobs(3)
+        reader = JobObjectReader()
+        self.assertIsNone(reader.load(jobs[0]['cache_dir'], jobs[0]['id']))
+
+        # corrupt job.pkl file
+        with open(os.path.join(jobs[1]['cache_dir'], JOB_PICKLE), 'wb') as fd:
+            fd.write(b"not a pickle")
+        self.assertRaises(JobObjectStoreException, reader.load, jobs[1]['cache_dir'], jobs[1]['id'])
+
+        # truncated collection data file, written after the (empty) index was cached
+        self.saveJobs(jobs[2:], "collection")
+        reader.clear()
+        collectionDir = os.path.dirname(jobs[2]['cache_dir'])
+        with open(os.path.join(collectionDir, COLLECTION_DATA), 'r+b') as fd:
+            fd.truncate(10)
+        self.assertRaises(JobObjectStoreException, reader.load, jobs[2]['cache_dir'], jobs[2]['id'])
+        reader.clear()
+
+        self.assertRaises(JobObjectStoreException, getJobObjectStore, "sqlite")
+
+    @attr('performance', 'integration')
+    def testPerformance(self):
+        """
+        Compare the time to store and load many jobs with both stores
+        """
+        numJobs = 20000
+        jobs = self.createJobs(numJobs)
+        print("\nStoring and loading %d jobs" % numJobs)
+        for storeType in ("pickle", "collection"):
+            startTime = time.time()
+            self.saveJobs(jobs, storeType)
+            saveTime = time.time() - startTime
+
+            reader = JobObjectReader()
+            startTime = time.time()
+            for job in jobs:
+                reader.load(job['cache_dir'], job['id'])
+            reader.clear()
+            loadTime = time.time() - startTime
+            print("  %s: save %.3f secs, load %.3f secs" % (storeType, saveTime, loadTime))
+
+            for job in jobs:
+                pklFile = os.path.join(job['cache_dir'], JOB_PICKLE)
+                if os.path.isfile(pklFile):
+                    os.remove(pklFile)
+
+
+if __name__ == '__main__':
+    unittest.main()
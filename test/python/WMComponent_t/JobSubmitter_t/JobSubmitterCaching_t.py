@@ -7,6 +7,7 @@ Verify that the caching of jobs and white/black lists works correctly.
 
 import os
 import pickle
+import time
 import unittest
 
 from WMComponent.JobSubmitter.JobSubmitterPoller import JobSubmitterPoller
@@ -97,17 +98,18 @@ class JobSubmitterCachingTest(EmulatedUnitTestCase):
 
         return config
 
-    def injectJobs(self):
+    def injectJobs(self, priorityB=None):
         """
         _injectJobs_
 
         Inject two workflows into WMBS and save the job objects to disk.
+        The jobs of both workflows get interleaved IDs.
         """
         testWorkflowA = Workflow(spec="specA.pkl", owner="Steve",
                                  name="wf001", task="TestTaskA")
         testWorkflowA.create()
         testWorkflowB = Workflow(spec="specB.pkl", owner="Steve",
-                                 name="wf002", task="TestTaskB")
+                                 name="wf002", task="TestTaskB", priority=priorityB)
         testWorkflowB.create()
 
         testFileset = Fileset("testFileset")
@@ -208,6 +210,91 @@ class JobSubmitterCachingTest(EmulatedUnitTestCase):
                          "Error: The job cache should be empty.  Contains: %i" % len(mySubmitterPoller.jobDataCache))
         return
 
+    def testIncrementalCaching(self):
+        """
+        _testIncrementalCaching_
+
+        Verify that incremental refreshes only pick up new jobs, and that
+        the full refreshes purge the jobs that left the created state.
+        """
+        config = self.createConfig()
+        config.JobSubmitter.incrementalRefresh = True
+        config.JobSubmitter.fullRefreshCycles = 3
+        mySubmitterPoller = JobSubmitterPoller(config)
+        mySubmitterPoller.getThresholds()
+        mySubmitterPoller.refreshCache()
+        self.assertEqual(len(mySubmitterPoller.jobDataCache), 0)
+        self.assertIsNone(mySubmitterPoller.jobIdHighWaterMark)
+
+        # without a high-water mark, it's still a full refresh
+        self.injectJobs()
+        mySubmitterPoller.refreshCache()
+        self.assertEqual(len(mySubmitterPoller.jobDataCache), 20)
+        self.assertEqual(mySubmitterPoller.jobIdHighWaterMark, max(mySubmitterPoller.jobDataCache))
+        self.assertTrue(mySubmitterPoller.refreshSummary.startswith("full refresh of 20 jobs"))
+
+        # killed jobs stay in the cache until the next full refresh
+        killWorkflow("wf001", jobCouchConfig=config)
+        mySubmitterPoller.refreshCache()
+        self.assertTrue(mySubmitterPoller.refreshSummary.startswith("incremental refresh"))
+        self.assertEqual(len(mySubmitterPoller.jobDataCache), 20)
+
+        mySubmitterPoller.refreshCache()
+        self.assertTrue(mySubmitterPoller.refreshSummary.startswith("full refresh"))
+        self.assertEqual(len(mySubmitterPoller.jobDataCache), 10)
+        return
+
+    def testIncrementalCachingTruncated(self):
+        """
+        _testIncrementalCachingTruncated_
+
+        Verify that the jobs cut off by maxJobsToCache in a full refresh are
+        paged through by the incremental refreshes that follow, when they have
+        lower IDs than the jobs cached.
+        """
+        config = self.createConfig()
+        config.JobSubmitter.incrementalRefresh = True
+        config.JobSubmitter.fullRefreshCycles = 10
+        config.JobSubmitter.maxJobsToCache = 12
+        config.JobSubmitter.refreshTimeMargin = 0
+        mySubmitterPoller = JobSubmitterPoller(config)
+        mySubmitterPoller.getThresholds()
+
+        # the jobs of wf002 come first, and 8 jobs of wf001 with lower IDs are cut off
+        self.injectJobs(priorityB=10)
+        # such that the incremental refreshes don't take the jobs for retries
+        time.sleep(1)
+        mySubmitterPoller.refreshCache()
+        self.assertEqual(len(mySubmitterPoller.jobDataCache), 12)
+        requestNames = [job['request_name'] for job in mySubmitterPoller.jobDataCache.values()]
+        self.assertEqual(requestNames.count("wf002"), 10)
+        self.assertEqual(mySubmitterPoller.jobIdHighWaterMark, 20)
+        self.assertEqual(mySubmitterPoller.backfillJobId, 0)
+
+        # no room in the cache for the jobs cut off yet
+        mySubmitterPoller.refreshCache()
+        self.assertTrue(mySubmitterPoller.refreshSummary.startswith("incremental refresh of 0 jobs"))
+        self.assertEqual(mySubmitterPoller.backfillJobId, 0)
+
+        # the jobs of wf002 leave the cache as if they were submitted
+        killWorkflow("wf002", jobCouchConfig=config)
+        jobIdsB = [jobId for jobId, job in mySubmitterPoller.jobDataCache.items() if job['request_name'] == "wf002"]
+        mySubmitterPoller._purgeJobsFromCache(jobIdsB)
+        mySubmitterPoller.refreshCache()
+        self.assertTrue(mySubmitterPoller.refreshSummary.startswith("incremental refresh of 10 jobs"))
+        self.assertEqual(len(mySubmitterPoller.jobDataCache), 10)
+        self.assertEqual(set(job['request_name'] for job in mySubmitterPoller.jobDataCache.values()),
+                         set(["wf001"]))
+        # the page filled the room left, there can be more jobs after it
+        self.assertEqual(mySubmitterPoller.backfillJobId, max(mySubmitterPoller.jobDataCache))
+
+        mySubmitterPoller.refreshCache()
+        self.assertTrue(mySubmitterPoller.refreshSummary.startswith("incremental refresh of 0 jobs"))
+        self.assertIsNone(mySubmitterPoller.backfillJobId)
+        self.assertEqual(mySubmitterPoller.jobIdHighWaterMark, 20)
+        self.assertEqual(len(mySubmitterPoller.jobDataCache), 10)
+        return
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+"""
+_CondorEventLog_t_
+
+Unit tests for reading the job state changes from the schedd event log,
+using events recorded in the CondorEventLog.cycle* files.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from WMCore.BossAir.CondorEventLog import CondorEventLogReader, getJobStates, parseEvents
+from WMCore.WMBase import getTestBase
+
+
+class CondorEventLogTest(unittest.TestCase):
+    """
+    _CondorEventLogTest_
+
+    Replay two tracking cycles of recorded events
+    """
+
+    def setUp(self):
+        self.testDir = tempfile.mkdtemp()
+        self.eventLog = os.path.join(self.testDir, "EventLog")
+        self.cycles = []
+        for cycle in (1, 2):
+            with open(os.path.join(getTestBase(), "WMCore_t/BossAir_t/CondorEventLog.cycle%d" % cycle), "rb") as fd:
+                self.cycles.append(fd.read())
+
+    def tearDown(self):
+        shutil.rmtree(self.testDir, ignore_errors=True)
+
+    def writeLog(self, data, path=None):
+        """
+        Append events to the event log
+        """
+        with open(path or self.eventLog, "ab") as fd:
+            fd.write(data)
+
+    def testParseEvents(self):
+        """
+        Test parsing the recorded events
+        """
+        events = parseEvents(self.cycles[0])
+        self.assertEqual(len(events), 17)
+        self.assertEqual([event['EventTypeNumber'] for event in events[:2]], [0, 28])
+        self.assertEqual(events[0]['GridId'], "1234.0")
+        self.assertEqual(events[0]['EventTime'], "2024-03-01 10:00:00")
+        self.assertNotIn('JobStatus', events[0])
+
+        executeInfo = events[11]
+        self.assertEqual(executeInfo['GridId'], "1234.0")
+        self.assertEqual(executeInfo['TriggerEventTypeNumber'], 1)
+        self.assertEqual(executeInfo['JobStatus'], 2)
+        self.assertEqual(executeInfo['MachineAttrGLIDEIN_CMSSite0'], "T2_US_UCSD")
+        self.assertEqual(executeInfo['DESIRED_Sites'], "T1_US_FNAL,T2_US_UCSD")
+        self.assertEqual(executeInfo['EventTypeNumber'], 28)
+
+        self.assertEqual(parseEvents(b""), [])
+        self.assertEqual(parseEvents(b"not an event\n...\n"), [])
+
+    def testJobStates(self):
+        """
+        Test the job states after each cycle of events
+        """
+        jobStates = getJobStates(parseEvents(self.cycles[0]))
+        self.assertEqual(jobStates, {"1234.0": ("Running", "T2_US_UCSD"),
+                                     "1234.1": ("Running", "T1_US_FNAL"),
+                                     "1234.2": ("Running", "T2_CH_CERN"),
+                                     "1234.3": ("Idle", None),
+                                     "1234.4": ("Idle", None)})
+
+        # the states are updated in place, unknown events are ignored
+        jobStates.pop("1234.0")
+        getJobStates(parseEvents(self.cycles[1]), jobStates)
+        self.assertEqual(jobStates, {"1234.0": ("Completed", "T2_US_UCSD"),
+                                     "1234.1": ("Held", "T1_US_FNAL"),
+                                     "1234.2": ("Idle", "T2_CH_CERN"),
+                                     "1234.3": ("Removed", None),
+                                     "1234.4": ("Running", "T2_US_UCSD"),
+                                     "5678.0": ("Idle", None)})
+
+    def testReader(self):
+        """
+        Test reading the events incrementally, through the log rotations
+        """
+        reader = CondorEventLogReader(self.eventLog)
+        self.assertEqual(reader.readEvents(), [])
+        self.assertTrue(reader.lostEvents)
+
+        self.writeLog(self.cycles[0])
+        reader.reset()
+        self.assertFalse(reader.lostEvents)
+        self.assertEqual(reader.readEvents(), [])
+
+        # events being written are read once complete
+        cut = self.cycles[1].index(b"Job was held.")
+        self.writeLog(self.cycles[1][:cut])
+        events = reader.readEvents()
+        self.assertEqual([event['EventTypeNumber'] for event in events], [5, 28])
+        self.writeLog(self.cycles[1][cut:])
+        events = reader.readEvents()
+        self.assertEqual(len(events), 8)
+        self.assertEqual(events[0]['Description'], "Job was held.")
+        self.assertEqual(reader.readEvents(), [])
+        self.assertFalse(reader.lostEvents)
+
+        # the end of the rotated log is read before the new one
+        self.writeLog(self.cycles[0][:self.cycles[0].index(b"000 (1234.001.000)")])
+        os.rename(self.eventLog, self.eventLog + ".old")
+        self.writeLog(self.cycles[0])
+        events = reader.readEvents()
+        self.assertEqual(len(events), 2 + 17)
+        self.assertFalse(reader.lostEvents)
+
+        # events are lost if the log was rotated more than once
+        # (keep the dropped log open, so that its inode is not reused)
+        os.rename(self.eventLog, self.eventLog + ".old")
+        with open(self.eventLog + ".old", "rb"):
+            self.writeLog(self.cycles[1], self.eventLog + ".other")
+            os.rename(self.eventLog + ".other", self.eventLog + ".old")
+            self.writeLog(self.cycles[1])
+            self.assertEqual(len(reader.readEvents()), 10)
+        self.assertTrue(reader.lostEvents)
+
+        # or truncated
+        reader.reset()
+        self.assertFalse(reader.lostEvents)
+        with open(self.eventLog, "wb") as fd:
+            fd.write(self.cycles[1][:100])
+        self.assertEqual(reader.readEvents(), [])
+        self.assertTrue(reader.lostEvents)
+
+
+if __name__ == '__main__':
+    unittest.main()
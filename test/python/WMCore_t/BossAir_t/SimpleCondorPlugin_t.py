@@ -11,11 +11,15 @@ from future.utils import viewitems
 
 import os.path
 import re
+import shutil
+import tempfile
 import threading
 import time
 import unittest
 from subprocess import Popen, PIPE
 
+from mock import mock
+
 from WMCore_t.BossAir_t.BossAir_t import BossAirTest, getCondorRunningJobs
 from nose.plugins.attrib import attr
 
@@ -23,8 +27,10 @@ from WMComponent.JobSubmitter.JobSubmitterPoller import JobSubmitterPoller
 from WMComponent.JobTracker.JobTrackerPoller import JobTrackerPoller
 from WMCore.BossAir.BossAirAPI import BossAirAPI
 from WMCore.BossAir.StatusPoller import StatusPoller
-from WMCore.BossAir.Plugins.SimpleCondorPlugin import activityToType
+from WMCore.BossAir.CondorEventLog import CondorEventLogReader
+from WMCore.BossAir.Plugins.SimpleCondorPlugin import SimpleCondorPlugin, activityToType
 from WMCore.JobStateMachine.ChangeState import ChangeState
+from WMCore.WMBase import getTestBase
 
 
 class SimpleCondorPluginTest(BossAirTest):
@@ -467,6 +473,185 @@ class SimpleCondorPluginTest(BossAirTest):
         self.assertEqual(activityToType(None), "unknown")
 
 
+class ScheddDummy(object):
+    """
+    The classAds of the jobs in the schedd, counting the queries
+    """
+
+    def __init__(self):
+        self.jobs = {}
+        self.queries = 0
+        self.fail = False
+
+    def xquery(self, constraint, projection):
+        self.queries += 1
+        if self.fail:
+            raise RuntimeError("Failed to connect to the schedd")
+        jobAds = []
+        for gridId, (jobStatus, location) in self.jobs.items():
+            clusterId, procId = gridId.split(".")
+            jobAd = {'ClusterId': int(clusterId), 'ProcId': int(procId), 'JobStatus': jobStatus}
+            if location:
+                jobAd['MachineAttrGLIDEIN_CMSSite0'] = location
+            jobAds.append(jobAd)
+        return jobAds
+
+
+class SimpleCondorPluginTrackingTest(unittest.TestCase):
+    """
+    _SimpleCondorPluginTrackingTest_
+
+    Track jobs with the classAds of the schedd, or with the two cycles of
+    events recorded in the CondorEventLog.cycle* files
+    """
+
+    def setUp(self):
+        self.testDir = tempfile.mkdtemp()
+        self.eventLog = os.path.join(self.testDir, "EventLog")
+        self.cycles = []
+        for cycle in (1, 2):
+            with open(os.path.join(getTestBase(), "WMCore_t/BossAir_t/CondorEventLog.cycle%d" % cycle), "rb") as fd:
+                self.cycles.append(fd.read())
+
+        # the schedd after the first cycle of events, 1234.5 has no event at all
+        self.schedd = ScheddDummy()
+        self.schedd.jobs = {"1234.0": (2, "T2_US_UCSD"), "1234.1": (2, "T1_US_FNAL"), "1234.2": (2, "T2_CH_CERN"),
+                            "1234.3": (1, None), "1234.4": (1, None), "1234.5": (2, "T2_DE_DESY")}
+        patcher = mock.patch("WMCore.BossAir.Plugins.SimpleCondorPlugin.htcondor.Schedd", return_value=self.schedd)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # only the attributes used to track the jobs are needed
+        self.plugin = SimpleCondorPlugin.__new__(SimpleCondorPlugin)
+        self.plugin.agent = "testAgent"
+        self.plugin.eventLogReader = None
+        self.plugin.jobInfo = {}
+        self.plugin.lastFullTracking = 0
+        self.plugin.fullTrackingInterval = 3600
+
+        self.jobs = [{'jobid': 100 + procId, 'gridid': "1234.%d" % procId, 'status': 'Idle', 'location': None}
+                     for procId in range(6)]
+
+    def tearDown(self):
+        shutil.rmtree(self.testDir, ignore_errors=True)
+
+    def writeLog(self, data):
+        """
+        Append events to the event log
+        """
+        with open(self.eventLog, "ab") as fd:
+            fd.write(data)
+
+    def track(self):
+        """
+        Track the jobs still running, return the grid ids in each list
+        """
+        runningList, changeList, completeList = self.plugin.track(self.jobs)
+        completed = set(job['gridid'] for job in completeList)
+        self.jobs = [job for job in self.jobs if job['gridid'] not in completed]
+        return [[job['gridid'] for job in jobList] for jobList in (runningList, changeList, completeList)]
+
+    def jobStatus(self):
+        """
+        The status and location of the jobs still running
+        """
+        return dict((job['gridid'], (job['status'], job['location'])) for job in self.jobs)
+
+    def testFullTracking(self):
+        """
+        Test that the schedd is queried on every cycle, and that the jobs it
+        doesn't know are complete
+        """
+        running, changed, complete = self.track()
+        self.assertEqual(running, ["1234.0", "1234.1", "1234.2", "1234.3", "1234.4", "1234.5"])
+        self.assertEqual(changed, ["1234.0", "1234.1", "1234.2", "1234.5"])
+        self.assertEqual(complete, [])
+        self.assertEqual(self.jobStatus()["1234.0"], ("Running", "T2_US_UCSD"))
+
+        del self.schedd.jobs["1234.1"]
+        self.schedd.jobs["1234.2"] = (5, "T2_CH_CERN")
+        running, changed, complete = self.track()
+        self.assertEqual(complete, ["1234.1", "1234.2"])
+        self.assertEqual(changed, ["1234.1", "1234.2"])
+        self.assertEqual(self.schedd.queries, 2)
+
+        # a failed query leaves the jobs alone
+        self.schedd.fail = True
+        self.assertEqual(self.track(), [[], [], []])
+        self.assertEqual(self.schedd.queries, 3)
+
+    def testEventLogTracking(self):
+        """
+        Test that the jobs are tracked from the events written since the
+        previous cycle, with a full query once in a while
+        """
+        self.writeLog(self.cycles[0])
+        self.plugin.eventLogReader = CondorEventLogReader(self.eventLog)
+
+        # nothing to start from, the schedd is queried first
+        running, changed, complete = self.track()
+        self.assertEqual(changed, ["1234.0", "1234.1", "1234.2", "1234.5"])
+        self.assertEqual(self.schedd.queries, 1)
+        self.assertEqual(self.plugin.jobInfo, {"1234.0": ("Running", "T2_US_UCSD"),
+                                               "1234.1": ("Running", "T1_US_FNAL"),
+                                               "1234.2": ("Running", "T2_CH_CERN"),
+                                               "1234.3": ("Idle", None), "1234.4": ("Idle", None),
+                                               "1234.5": ("Running", "T2_DE_DESY")})
+
+        # then only from the events, the job without any keeps its status
+        self.writeLog(self.cycles[1])
+        running, changed, complete = self.track()
+        self.assertEqual(self.schedd.queries, 1)
+        self.assertEqual(running, ["1234.2", "1234.4", "1234.5"])
+        self.assertEqual(changed, ["1234.0", "1234.1", "1234.2", "1234.3", "1234.4"])
+        self.assertEqual(complete, ["1234.0", "1234.1", "1234.3"])
+        self.assertEqual(self.jobStatus(), {"1234.2": ("Idle", "T2_CH_CERN"),
+                                            "1234.4": ("Running", "T2_US_UCSD"),
+                                            "1234.5": ("Running", "T2_DE_DESY")})
+        # the finished jobs are not tracked anymore
+        self.assertEqual(sorted(self.plugin.jobInfo), ["1234.2", "1234.4", "1234.5", "5678.0"])
+
+        # no new event, no change
+        self.assertEqual(self.track(), [["1234.2", "1234.4", "1234.5"], [], []])
+        self.assertEqual(self.schedd.queries, 1)
+
+        # the periodic full query completes the jobs the schedd doesn't know
+        self.plugin.lastFullTracking -= self.plugin.fullTrackingInterval
+        self.schedd.jobs = {"1234.2": (1, None), "1234.4": (2, "T2_US_UCSD")}
+        running, changed, complete = self.track()
+        self.assertEqual(self.schedd.queries, 2)
+        self.assertEqual(running, ["1234.2", "1234.4"])
+        self.assertEqual(complete, ["1234.5"])
+
+    def testLostEvents(self):
+        """
+        Test that the schedd is queried when events may have been missed
+        """
+        self.writeLog(self.cycles[0])
+        self.plugin.eventLogReader = CondorEventLogReader(self.eventLog)
+        self.track()
+        self.assertEqual(self.schedd.queries, 1)
+
+        # the log was truncated: the schedd is queried right away
+        with open(self.eventLog, "wb") as fd:
+            fd.write(self.cycles[1][:100])
+        self.schedd.jobs["1234.0"] = (4, "T2_US_UCSD")
+        running, changed, complete = self.track()
+        self.assertEqual(self.schedd.queries, 2)
+        self.assertEqual(complete, ["1234.0"])
+        self.assertFalse(self.plugin.eventLogReader.lostEvents)
+
+        # and after a failed query, until one succeeds
+        self.schedd.fail = True
+        self.plugin.lastFullTracking -= self.plugin.fullTrackingInterval
+        self.assertEqual(self.track(), [[], [], []])
+        self.assertTrue(self.plugin.eventLogReader.lostEvents)
+        self.schedd.fail = False
+        self.writeLog(self.cycles[1][100:])
+        self.track()
+        self.assertEqual(self.schedd.queries, 4)
+        self.assertFalse(self.plugin.eventLogReader.lostEvents)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -3,8 +3,12 @@
 from builtins import zip, str, range
 from future.utils import viewitems
 
+import random
+import time
 import unittest
 
+from nose.plugins.attrib import attr
+
 # import FWCore.ParameterSet.Config as cms
 from WMCore.DataStructs.LumiList import LumiList
 
@@ -369,6 +373,84 @@ class LumiListTest(unittest.TestCase):
 
         self.assertEqual(c1.getCMSSWString(), w2.getCMSSWString())
 
+    def testContains(self):
+        """
+        Test lookups of runs, run/lumi pairs and open ended lumi ranges
+        """
+        lumiList = LumiList(compactList={'1': [[1, 33], [35, 35], [37, 47]],
+                                         '2': [[49, 75]],
+                                         '3': [[10, 0]]})
+        self.assertTrue(lumiList.contains(1))
+        self.assertTrue(lumiList.contains('2'))
+        self.assertFalse(lumiList.contains(4))
+        self.assertTrue(lumiList.contains(1, 1))
+        self.assertTrue(lumiList.contains((1, 35)))
+        self.assertTrue([1, 47] in lumiList)
+        self.assertFalse(lumiList.contains(1, 34))
+        self.assertFalse(lumiList.contains(1, 48))
+        self.assertFalse(lumiList.contains(2, 48))
+        self.assertFalse(lumiList.contains(4, 1))
+        # upper bound 0 means until the end of the run
+        self.assertTrue(lumiList.contains(3, 1000))
+        self.assertFalse(lumiList.contains(3, 9))
+        with self.assertRaises(RuntimeError):
+            lumiList.contains(1.5)
+
+    def testSetOperationsRandom(self):
+        """
+        Compare set operations against plain python sets of run/lumi pairs
+        """
+        random.seed(42)
+        for _ in range(200):
+            alumis = {str(run): random.sample(range(1, 60), random.randint(1, 40)) for run in random.sample(range(1, 8), 4)}
+            blumis = {str(run): random.sample(range(1, 60), random.randint(1, 40)) for run in random.sample(range(1, 8), 4)}
+            a = LumiList(runsAndLumis=alumis)
+            b = LumiList(runsAndLumis=blumis)
+            aSet = set(a.getLumis())
+            bSet = set(b.getLumis())
+
+            self.assertEqual((a - b).getLumis(), sorted(aSet - bSet))
+            self.assertEqual((a & b).getLumis(), sorted(aSet & bSet))
+            self.assertEqual((a | b).getLumis(), sorted(aSet | bSet))
+            self.assertEqual(LumiList(lumis=sorted(aSet - bSet)).getCompactList(), (a - b).getCompactList())
+            # operands must not be modified
+            self.assertEqual(a.getLumis(), sorted(aSet))
+            self.assertEqual(b.getLumis(), sorted(bSet))
+
+            pairs = [(random.randint(1, 8), random.randint(1, 60)) for _ in range(50)]
+            self.assertEqual(a.filterLumis(pairs), [pair for pair in pairs if pair in aSet])
+            self.assertEqual([a.contains(pair) for pair in pairs], [pair in aSet for pair in pairs])
+
+    @attr('performance', 'integration')
+    def testPerformance(self):
+        """
+        Time set operations and lookups on large lumi lists
+        """
+        random.seed(1)
+
+        def makeCompactList(nRuns, nRanges):
+            compactList = {}
+            for run in range(nRuns):
+                lumi = 1
+                compactList[str(100000 + run)] = []
+                for _ in range(nRanges):
+                    lumi += random.randint(1, 5)
+                    lastLumi = lumi + random.randint(0, 20)
+                    compactList[str(100000 + run)].append([lumi, lastLumi])
+                    lumi = lastLumi + 1
+            return compactList
+
+        a = LumiList(compactList=makeCompactList(50, 2000))
+        b = LumiList(compactList=makeCompactList(50, 2000))
+        pairs = [(100000 + random.randint(0, 49), random.randint(1, 60000)) for _ in range(100000)]
+
+        for label, func in [('a - b', lambda: a - b), ('a & b', lambda: a & b), ('a | b', lambda: a | b),
+                            ('filterLumis', lambda: a.filterLumis(pairs)),
+                            ('contains', lambda: [a.contains(pair) for pair in pairs])]:
+            startTime = time.time()
+            func()
+            print("  %s: %.3f secs" % (label, time.time() - startTime))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -10,9 +10,13 @@ Unit tests for the DBInterface class
 
 from builtins import range
 
+import logging
 import unittest
 import threading
 
+from sqlalchemy import create_engine, event
+
+from WMCore.Database.DBCore import DBInterface
 from WMQuality.TestInit import TestInit
 
 class DBCoreTest(unittest.TestCase):
@@ -285,6 +289,38 @@ class DBCoreTest(unittest.TestCase):
 
         return
 
+    def testProcessDataStream(self):
+        """
+        _testProcessDataStream_
+
+        Verify that streamed selects return all the rows in chunks of
+        at most arraysize rows.
+        """
+        binds = []
+        for i in range(2501):
+            binds.append({"one": i, "two": i * 2, "three": str(i * 3)})
+
+        insertSQL = "INSERT INTO test_tablea VALUES (:one, :two, :three)"
+        selectSQL = "SELECT column1, column2, column3 FROM test_tablea WHERE column1 >= :one"
+
+        myThread = threading.currentThread()
+        myThread.dbi.processData(insertSQL, binds = binds)
+
+        resultSets = list(myThread.dbi.processDataStream(selectSQL, {"one": 1}, arraysize = 1000))
+        self.assertEqual([len(resultSet.fetchall()) for resultSet in resultSets], [1000, 1000, 500])
+        self.assertEqual([key.lower() for key in resultSets[0].keys], ["column1", "column2", "column3"])
+
+        results = set()
+        for resultSet in resultSets:
+            for row in resultSet.fetchall():
+                results.add(row[0])
+        self.assertEqual(results, set(range(1, 2501)))
+
+        resultSets = list(myThread.dbi.processDataStream("SELECT column1 FROM test_tablea WHERE column1 < 0"))
+        self.assertEqual(resultSets, [])
+
+        return
+
     def testInsertHugeNumber(self):
         """
         _testInsertHugeNumber_
@@ -316,5 +352,90 @@ class DBCoreTest(unittest.TestCase):
 
         return
 
+class DBCoreBulkSelectTest(unittest.TestCase):
+    """
+    Test the IN list rewrite of selects run for many binds, counting the
+    round trips against an in memory SQLite database.
+    """
+
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+        self.statements = []
+        event.listen(self.engine, "before_cursor_execute", self.countStatement)
+
+        self.dbi = DBInterface(logging, self.engine)
+        self.conn = self.dbi.connection()
+        self.dbi.processData("CREATE TABLE test_tablea (column1 INTEGER, column2 INTEGER, column3 VARCHAR(255))",
+                             conn = self.conn)
+        binds = [{"one": i, "two": i * 2, "three": str(i * 3)} for i in range(1200)]
+        self.dbi.processData("INSERT INTO test_tablea VALUES (:one, :two, :three)", binds, conn = self.conn)
+        self.statements = []
+        return
+
+    def tearDown(self):
+        self.conn.close()
+        return
+
+    def countStatement(self, conn, cursor, statement, parameters, context, executemany):
+        """Record every statement sent to the database"""
+        self.statements.append(statement)
+
+    def testBulkSelect(self):
+        """
+        _testBulkSelect_
+
+        Verify that single bind selects are run maxBindsPerQuery binds at a
+        time and return the same rows as one query per bind.
+        """
+        selectSQL = "SELECT column1, column2, column3 FROM test_tablea WHERE column1 = :one"
+        binds = [{"one": i} for i in range(0, 1200, 2)]
+        self.dbi.maxBindsPerQuery = 250
+
+        resultSets = self.dbi.processData(selectSQL, binds, conn = self.conn)
+        self.assertEqual(len(self.statements), 3)
+        self.assertTrue("column1 IN (:one_0, :one_1" in self.statements[0])
+        self.assertEqual(len(resultSets), 3)
+        self.assertEqual(resultSets[0].keys, ["column1", "column2", "column3"])
+        results = sorted(tuple(row) for resultSet in resultSets for row in resultSet.fetchall())
+        self.assertEqual(results, [(i, i * 2, str(i * 3)) for i in range(0, 1200, 2)])
+
+        # binds without any match still return a ResultSet
+        resultSets = self.dbi.processData(selectSQL, [{"one": -1}, {"one": -2}], conn = self.conn)
+        self.assertEqual(len(resultSets), 1)
+        self.assertEqual(resultSets[0].fetchall(), [])
+        return
+
+    def testBulkSelectFallback(self):
+        """
+        _testBulkSelectFallback_
+
+        Verify that selects which can't be rewritten are still run once
+        per bind.
+        """
+        binds = [{"one": 1}, {"one": 2}, {"one": 3}]
+        for selectSQL in ["SELECT column1 FROM test_tablea WHERE column1 >= :one",
+                          "SELECT count(*) FROM test_tablea WHERE column1 = :one",
+                          "SELECT column1 FROM test_tablea WHERE column1 = :one ORDER BY column2",
+                          "SELECT column1 FROM test_tablea WHERE column1 = :one OR column2 = 4",
+                          "SELECT column1 FROM test_tablea WHERE column2 IN (SELECT column2 FROM test_tablea WHERE column1 = :one)"]:
+            self.statements = []
+            self.dbi.processData(selectSQL, binds, conn = self.conn)
+            self.assertEqual(len(self.statements), 3, selectSQL)
+
+        # duplicated bind values must return the rows once per bind
+        self.statements = []
+        resultSets = self.dbi.processData("SELECT column1 FROM test_tablea WHERE column1 = :one",
+                                          [{"one": 1}, {"one": 1}], conn = self.conn)
+        self.assertEqual(len(self.statements), 2)
+        self.assertEqual(len(resultSets[0].fetchall()), 2)
+
+        # multiple binds can't be rewritten
+        self.statements = []
+        self.dbi.processData("SELECT column1 FROM test_tablea WHERE column1 = :one AND column2 = :two",
+                             [{"one": 1, "two": 2}, {"one": 2, "two": 4}], conn = self.conn)
+        self.assertEqual(len(self.statements), 2)
+        return
+
+
 if __name__ == "__main__":
     unittest.main()
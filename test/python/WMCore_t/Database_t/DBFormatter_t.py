@@ -9,11 +9,14 @@ Unit tests for the DBFormatter class
 from __future__ import print_function
 
 import threading
+import time
 import unittest
 
 from builtins import str
+from nose.plugins.attrib import attr
 
 from WMCore.Database.DBFormatter import DBFormatter
+from WMCore.Database.ResultSet import ResultSet
 from WMQuality.TestInit import TestInit
 
 
@@ -83,5 +86,76 @@ class DBFormatterTest(unittest.TestCase):
         self.assertEqual(output, {'column3': 'value2a', 'column2': 1, 'column1': 'value1a'})
 
 
+class DBFormatterRowsTest(unittest.TestCase):
+    """
+    _DBFormatterRowsTest_
+
+    Unit tests for the DBFormatter fast formatting, using synthetic
+    result sets instead of a database
+
+    """
+
+    def setUp(self):
+        self.dbformatter = DBFormatter(None, None)
+
+    def makeResultSet(self, keys, data):
+        """Build a ResultSet holding the given rows"""
+        resultSet = ResultSet()
+        resultSet.keys = keys
+        resultSet.data = data
+        return resultSet
+
+    def testFormatRows(self):
+        """
+        Test the formatRows output types against formatDict
+        """
+        keys = ['ID', b'NAME', 'Cache_Dir']
+        data = [(1, None, '/dir/a'), (2, b'job2', '/dir/b'), (3, b'job3', None)]
+        result = [self.makeResultSet(keys, data), self.makeResultSet(keys, data[:1])]
+
+        expected = [{'id': 1, 'name': None, 'cache_dir': '/dir/a'},
+                    {'id': 2, 'name': 'job2', 'cache_dir': '/dir/b'},
+                    {'id': 3, 'name': 'job3', 'cache_dir': None},
+                    {'id': 1, 'name': None, 'cache_dir': '/dir/a'}]
+        self.assertEqual(self.dbformatter.formatDict(result), expected)
+        self.assertEqual(self.dbformatter.formatRows(result), expected)
+
+        output = self.dbformatter.formatRows(result, rowType="columns")
+        self.assertEqual(output, {'id': [1, 2, 3, 1],
+                                  'name': [None, 'job2', 'job3', None],
+                                  'cache_dir': ['/dir/a', '/dir/b', None, '/dir/a']})
+
+        output = self.dbformatter.formatRows(result, rowType="namedtuple")
+        self.assertEqual(len(output), 4)
+        self.assertEqual(output[1].id, 2)
+        self.assertEqual(output[1].name, 'job2')
+        self.assertEqual(output[2].cache_dir, None)
+        self.assertEqual([row._asdict() for row in output], expected)
+
+        self.assertEqual(self.dbformatter.formatRows([self.makeResultSet(keys, [])]), [])
+        self.assertEqual(self.dbformatter.formatList([self.makeResultSet(['ID'], [(b'a',), (2,)])]), ['a', 2])
+        with self.assertRaises(ValueError):
+            self.dbformatter.formatRows(result, rowType="set")
+
+    @attr('performance', 'integration')
+    def testFormatRowsPerformance(self):
+        """
+        Time the different formatting modes over a large synthetic result
+        """
+        keys = ['ID', 'NAME', 'CACHE_DIR', 'TASK_TYPE', 'TASK_PRIO', 'RETRY_COUNT',
+                'REQUEST_NAME', 'TASK_ID', 'WF_PRIORITY', 'TASK_NAME']
+        data = [(i, 'job-%d' % i, '/data/jobs/%d' % i, 'Processing', 1, 0, 'request', 7, 100000, '/request/Task')
+                for i in range(300000)]
+        result = [self.makeResultSet(keys, data)]
+
+        startTime = time.time()
+        self.dbformatter.formatDict(result)
+        print("  formatDict: %.3f secs" % (time.time() - startTime))
+        for rowType in ("dict", "columns", "namedtuple"):
+            startTime = time.time()
+            self.dbformatter.formatRows(result, rowType=rowType)
+            print("  formatRows(%s): %.3f secs" % (rowType, time.time() - startTime))
+
+
 if __name__ == "__main__":
     unittest.main()
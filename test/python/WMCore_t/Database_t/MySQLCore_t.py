@@ -122,5 +122,40 @@ class DBCoreTest(unittest.TestCase):
 
         return
 
+    def testBulkSelectSubstitution(self):
+        """
+        _testBulkSelectSubstitution_
+
+        Verify that selects run for many binds of the same variable are
+        sent as a single query with an IN list of MySQL bind variables.
+        """
+        class FakeConnection(object):
+            def __init__(self):
+                self.statements = []
+
+            def execute(self, sql, binds=None):
+                self.statements.append((sql, binds))
+                return FakeResultProxy()
+
+        class FakeResultProxy(object):
+            closed = False
+            returns_rows = True
+
+            def __iter__(self):
+                return iter([])
+
+            def close(self):
+                return
+
+        myInterface = MySQLInterface(logger = logging, engine = None)
+        connection = FakeConnection()
+        myInterface.processData("SELECT id FROM wmbs_job WHERE id = :jobid",
+                                [{"jobid": 1}, {"jobid": 2}, {"jobid": 3}],
+                                conn = connection, transaction = True)
+
+        self.assertEqual(connection.statements,
+                         [("SELECT id FROM wmbs_job WHERE id IN (%s, %s, %s)", [(1, 2, 3)])])
+        return
+
 if __name__ == "__main__":
     unittest.main()
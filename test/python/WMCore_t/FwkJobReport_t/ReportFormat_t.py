@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+"""
+_ReportFormat_t_
+
+Unit tests for the compact framework job report format.
+"""
+
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from nose.plugins.attrib import attr
+
+from WMCore.FwkJobReport.Report import Report
+from WMCore.FwkJobReport.ReportFormat import MAGIC, LazyConfigSection, dumpReport, loadReport
+from WMCore.WMBase import getTestBase
+
+
+class ReportFormatTest(unittest.TestCase):
+    """
+    _ReportFormatTest_
+
+    Compare the compact format with the pickled reports.
+    """
+
+    def setUp(self):
+        self.testData = os.path.join(getTestBase(), "WMCore_t/FwkJobReport_t")
+        self.testDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.testDir, ignore_errors=True)
+
+    def parseReport(self, xmlName="CMSSWProcessingReport.xml"):
+        """
+        Build a report with a cmsRun step parsed from the XML and a logArch step
+        """
+        report = Report("cmsRun1")
+        report.parse(os.path.join(self.testData, xmlName))
+        report.setTaskName("/Test/ReReco")
+        report.setJobID(42)
+        report.addStep("logArch1")
+        report.addOutputFile("logArchive", {"lfn": "/store/logs/log.tar.gz", "pfn": "log.tar.gz",
+                                            "module_label": "logArchive", "events": 0, "size": 1024})
+        return report
+
+    def testRoundTrip(self):
+        """
+        Test that the compact and pickled reports are loaded identically
+        """
+        for xmlName in ("CMSSWProcessingReport.xml", "CMSSWFailReport.xml", "CMSSWPileup.xml",
+                        "CMSSWSkippedNonExistentFile.xml", "PerformanceReport.xml"):
+            report = self.parseReport(xmlName)
+            compactPath = os.path.join(self.testDir, "Report.compact.pkl")
+            picklePath = os.path.join(self.testDir, "Report.pickle.pkl")
+            report.save(compactPath)
+            report.persist(picklePath, compact=False)
+
+            with open(compactPath, "rb") as fd:
+                self.assertTrue(fd.read(len(MAGIC)) == MAGIC)
+            with open(picklePath, "rb") as fd:
+                self.assertFalse(fd.read(len(MAGIC)) == MAGIC)
+
+            compactReport = Report()
+            compactReport.load(compactPath)
+            pickleReport = Report()
+            pickleReport.load(picklePath)
+
+            self.assertIsInstance(compactReport.data, LazyConfigSection)
+            self.assertEqual(compactReport.listSteps(), report.listSteps())
+            self.assertEqual(compactReport.getExitCode(), pickleReport.getExitCode())
+            self.assertEqual(compactReport.taskSuccessful(), pickleReport.taskSuccessful())
+            self.assertEqual(compactReport.__to_json__(None), pickleReport.__to_json__(None))
+            self.assertEqual(sorted(str(compactReport).splitlines()), sorted(str(report).splitlines()))
+
+    def testLazyLoading(self):
+        """
+        Test that step sections are only unpickled when accessed
+        """
+        report = self.parseReport()
+        reportPath = os.path.join(self.testDir, "Report.0.pkl")
+        report.save(reportPath)
+
+        compactReport = Report()
+        compactReport.load(reportPath)
+        cmsRun1 = compactReport.retrieveStep("cmsRun1")
+        self.assertEqual(cmsRun1.status, report.data.cmsRun1.status)
+        self.assertIn("performance", cmsRun1._internal_lazy)
+        self.assertIn("output", cmsRun1._internal_lazy)
+        self.assertIn("performance", cmsRun1.listSections_())
+
+        outputFiles = compactReport.getAllFilesFromStep("cmsRun1")
+        self.assertEqual(len(outputFiles), len(report.getAllFilesFromStep("cmsRun1")))
+        self.assertNotIn("output", cmsRun1._internal_lazy)
+        self.assertIn("performance", cmsRun1._internal_lazy)
+        self.assertIs(cmsRun1.output._internal_parent_ref, cmsRun1)
+
+        # section_ must not replace a pending section
+        self.assertEqual(cmsRun1.section_("performance").dictionary_whole_tree_(),
+                         report.data.cmsRun1.performance.dictionary_whole_tree_())
+
+        # pending sections can be replaced or deleted
+        delattr(cmsRun1, "skipped")
+        self.assertFalse(hasattr(cmsRun1, "skipped"))
+        self.assertNotIn("skipped", cmsRun1.listSections_())
+        self.assertRaises(AttributeError, getattr, cmsRun1, "nonExistent")
+
+    def testModifyAndSave(self):
+        """
+        Test that a loaded compact report can be modified and saved again
+        """
+        report = self.parseReport()
+        reportPath = os.path.join(self.testDir, "Report.0.pkl")
+        report.save(reportPath)
+
+        compactReport = Report()
+        compactReport.load(reportPath)
+        compactReport.setTaskName("/Test/Other")
+        compactReport.addError("cmsRun1", 50660, "MemoryError", "Too much memory")
+        compactReport.save(reportPath)
+
+        newReport = Report()
+        newReport.load(reportPath)
+        self.assertEqual(newReport.getTaskName(), "/Test/Other")
+        self.assertEqual(newReport.getStepExitCode("cmsRun1"), 50660)
+        self.assertEqual(newReport.getAllFiles(), compactReport.getAllFiles())
+
+        # and pickled, as when it is sent through the ProcessPool
+        compactReport = Report()
+        compactReport.load(reportPath)
+        compactReport.persist(reportPath, compact=False)
+        newReport = Report()
+        newReport.load(reportPath)
+        self.assertEqual(newReport.__to_json__(None), compactReport.__to_json__(None))
+
+    def testLegacyReport(self):
+        """
+        Test that reports pickled by older versions are still loaded
+        """
+        report = Report()
+        report.load(os.path.join(self.testData, "Report.0.pkl"))
+        self.assertTrue(report.listSteps())
+        self.assertNotIsInstance(report.data, LazyConfigSection)
+
+    def testBadReports(self):
+        """
+        Test that truncated and unknown version reports are rejected
+        """
+        report = self.parseReport()
+        reportPath = os.path.join(self.testDir, "Report.0.pkl")
+        with open(reportPath, "wb") as fd:
+            dumpReport(report.data, fd)
+        with open(reportPath, "rb") as fd:
+            data = fd.read()
+
+        self.assertRaises(ValueError, loadReport, data[:-10])
+        badVersion = data[:len(MAGIC)] + b"\x63" + data[len(MAGIC) + 1:]
+        self.assertRaises(ValueError, loadReport, badVersion)
+
+    @attr('performance', 'integration')
+    def testPerformance(self):
+        """
+        Time loading 1000 reports and extracting what the JobAccountant needs
+        """
+        report = self.parseReport("PerformanceReport.xml")
+        numReports = 1000
+        print("\nLoading %d reports" % numReports)
+        for compact in (False, True):
+            reportPath = os.path.join(self.testDir, "Report.%s.pkl" % compact)
+            report.persist(reportPath, compact=compact)
+
+            startTime = time.time()
+            for _ in range(numReports):
+                jobReport = Report()
+                jobReport.load(reportPath)
+                if jobReport.taskSuccessful():
+                    jobReport.getAllFiles()
+                jobReport.getAllSkippedFiles()
+                jobReport.getAllInputFiles()
+            print("  %s: %.3f secs" % ("compact" if compact else "pickle", time.time() - startTime))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,16 +7,26 @@ Unit tests for XMLParser module
 """
 
 # system modules
+from __future__ import print_function
+
+import glob
 import os
+import shutil
+import tempfile
+import time
+import tracemalloc
 import unittest
 
+from nose.plugins.attrib import attr
+
 # WMCore modules
 from WMCore.FwkJobReport.XMLParser import perfSummaryHandler, perfRepHandler, \
         reportBuilder, reportDispatcher, inputFileHandler, fileHandler, \
         runHandler, branchHandler, inputAssocHandler, \
-        perfCPUHandler, perfMemHandler, perfStoreHandler, castMetricValue
-from WMCore.FwkJobReport.Report import Report
-from WMCore.Algorithms.ParseXMLFile import xmlFileToNode
+        perfCPUHandler, perfMemHandler, perfStoreHandler, castMetricValue, \
+        xmlToJobReport
+from WMCore.FwkJobReport.Report import Report, FwkJobReportException
+from WMCore.Algorithms.ParseXMLFile import xmlFileToNode, xmlFileToNodeStream
 from WMCore.WMBase import getTestBase
 
 
@@ -34,6 +44,7 @@ class XMLParserTest(unittest.TestCase):
         Figure out the location of the XML report produced by CMSSW.
         """
         testData = os.path.join(getTestBase(), "WMCore_t/FwkJobReport_t")
+        self.testData = testData
         self.xmlFile = os.path.join(testData, "CMSSWMergeReport2.xml")
         self.xmlXrd = os.path.join(testData, "CMSSWJobReportXrdSiteStatistics.xml")
 
@@ -111,6 +122,106 @@ class XMLParserTest(unittest.TestCase):
         self.assertTrue(True, castMetricValue("true"))
         self.assertTrue("bla", castMetricValue("bla "))
 
+    def compareNodes(self, node, streamNode):
+        """
+        Check that two node structures are identical
+        """
+        self.assertEqual(node.name, streamNode.name)
+        self.assertEqual(node.attrs, streamNode.attrs)
+        self.assertEqual(node.text, streamNode.text)
+        self.assertEqual(len(node.children), len(streamNode.children))
+        for child, streamChild in zip(node.children, streamNode.children):
+            self.compareNodes(child, streamChild)
+
+    def testStreamingParser(self):
+        """
+        Check that the streaming parser builds the same nodes and reports
+        as the node tree one, for all the reports in the test data
+        """
+        corruptFiles = ["CMSSWFailReport2.xml"]
+        xmlFiles = sorted(glob.glob(os.path.join(self.testData, "*.xml")))
+        self.assertTrue(len(xmlFiles) > 10)
+        for xmlFile in xmlFiles:
+            if os.path.basename(xmlFile) in corruptFiles:
+                continue
+            rootNode = xmlFileToNode(xmlFile).children[0]
+            streamChildren = []
+            for streamRoot, streamNode in xmlFileToNodeStream(xmlFile):
+                self.assertEqual(streamRoot.name, rootNode.name)
+                streamChildren.append(streamNode)
+            self.assertEqual(len(streamChildren), len(rootNode.children))
+            for child, streamChild in zip(rootNode.children, streamChildren):
+                self.compareNodes(child, streamChild)
+
+            report = Report("cmsRun1")
+            xmlToJobReport(report, xmlFile, streaming=False)
+            streamReport = Report("cmsRun1")
+            xmlToJobReport(streamReport, xmlFile, streaming=True)
+            self.assertEqual(sorted(str(report.data).splitlines()),
+                             sorted(str(streamReport.data).splitlines()), xmlFile)
+            self.assertEqual(report.__to_json__(None), streamReport.__to_json__(None))
+
+        # corrupt reports are rejected before anything is added to the report
+        for xmlFile in corruptFiles:
+            report = Report("cmsRun1")
+            emptyReport = str(report.data)
+            self.assertRaises(FwkJobReportException, report.parse, os.path.join(self.testData, xmlFile))
+            self.assertEqual(str(report.data), emptyReport)
+
+    def writeLargeReport(self, xmlFile, numFiles, numLumis):
+        """
+        Write a report with many input files and lumi sections, based on
+        the input and output files of CMSSWProcessingReport.xml
+        """
+        lumis = "".join('<LumiSection ID="%d"/>\n' % lumi for lumi in range(1, numLumis + 1))
+        inputFile = """<InputFile>
+<State  Value="closed"/>
+<LFN>/store/data/Run2023/MinimumBias/RAW/v1/000/%(num)d/file.root</LFN>
+<PFN>root://cms-xrd-global.cern.ch//store/data/Run2023/MinimumBias/RAW/v1/000/%(num)d/file.root</PFN>
+<Catalog></Catalog>
+<ModuleLabel>source</ModuleLabel>
+<GUID>D470C00D-6934-DF11-8FC1-%(num)012d</GUID>
+<Branches>
+</Branches>
+<InputType>primaryFiles</InputType>
+<InputSourceClass>PoolSource</InputSourceClass>
+<EventsRead>1000</EventsRead>
+<Runs>
+<Run ID="%(num)d">
+%(lumis)s</Run>
+</Runs>
+</InputFile>
+"""
+        with open(xmlFile, "w") as fd:
+            fd.write("<FrameworkJobReport>\n")
+            for num in range(numFiles):
+                fd.write(inputFile % {"num": num, "lumis": lumis})
+            fd.write("</FrameworkJobReport>\n")
+
+    @attr('performance', 'integration')
+    def testStreamingPerformance(self):
+        """
+        Compare the time and peak memory used by both parsers on a large report
+        """
+        testDir = tempfile.mkdtemp()
+        try:
+            xmlFile = os.path.join(testDir, "LargeReport.xml")
+            self.writeLargeReport(xmlFile, numFiles=2000, numLumis=100)
+            print("\nParsing a %.1f MB report" % (os.path.getsize(xmlFile) / 1024.0 / 1024.0))
+            for streaming in (False, True):
+                report = Report("cmsRun1")
+                tracemalloc.start()
+                startTime = time.time()
+                xmlToJobReport(report, xmlFile, streaming=streaming)
+                parseTime = time.time() - startTime
+                peakMemory = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                self.assertEqual(len(report.getAllInputFiles()), 2000)
+                print("  %s: %.3f secs, peak memory %.1f MB" % ("streaming" if streaming else "node tree",
+                                                               parseTime, peakMemory / 1024.0 / 1024.0))
+        finally:
+            shutil.rmtree(testDir, ignore_errors=True)
+
 
 
 if __name__ == "__main__":
@@ -7,12 +7,19 @@ _ChangeState_t_
 from builtins import range, int, str as newstr
 from future.utils import viewvalues
 
+import json
 import os
 import threading
+import time
 import unittest
 
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from Utils.MemoryCache import LRUCache
 from WMCore.DAOFactory import DAOFactory
-from WMCore.Database.CMSCouch import CouchServer
+from WMCore.Database.CMSCouch import CouchServer, Database
 from WMCore.FwkJobReport.Report import Report
 from WMCore.JobSplitting.SplitterFactory import SplitterFactory
 from WMCore.JobStateMachine.ChangeState import ChangeState, Transitions
@@ -972,5 +979,287 @@ class TestChangeState(unittest.TestCase):
         return
 
 
+class CouchStandIn(BaseHTTPRequestHandler):
+    """
+    _CouchStandIn_
+
+    Minimal CouchDB server, supporting _all_docs, _bulk_docs and the update
+    handlers used by ChangeState, which counts the requests it gets.
+    """
+    databases = {}
+    requests = Counter()
+    conflicts = Counter()
+
+    def log_message(self, *args):
+        return
+
+    def reply(self, data, status=200):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def readBody(self):
+        return json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+
+    def saveDoc(self, database, doc):
+        """
+        Save a document, unless its revision is outdated
+        """
+        current = database.get(doc["_id"])
+        if (current and current["_rev"] != doc.get("_rev")) or self.conflicts[doc["_id"]] > 0:
+            self.conflicts[doc["_id"]] -= 1
+            return {"id": doc["_id"], "error": "conflict", "reason": "Document update conflict."}
+        revision = int(current["_rev"].split("-")[0]) + 1 if current else 1
+        doc["_rev"] = "%d-stand-in" % revision
+        database[doc["_id"]] = doc
+        return {"id": doc["_id"], "ok": True, "rev": doc["_rev"]}
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        dbName, operation = url.path.strip("/").split("/")[:2]
+        database = self.databases.setdefault(dbName, {})
+        self.requests[operation] += 1
+        data = self.readBody()
+        if operation == "_all_docs":
+            rows = []
+            for key in data["keys"]:
+                if key in database:
+                    doc = json.loads(json.dumps(database[key]))
+                    rows.append({"id": key, "key": key, "value": {"rev": doc["_rev"]}, "doc": doc})
+                else:
+                    rows.append({"key": key, "error": "not_found"})
+            self.reply({"total_rows": len(database), "rows": rows})
+        elif operation == "_bulk_docs":
+            self.reply([self.saveDoc(database, doc) for doc in data["docs"]], status=201)
+
+    def do_PUT(self):
+        url = urlparse(self.path)
+        dbName, _, _, _, handler, docId = url.path.strip("/").split("/")
+        database = self.databases.setdefault(dbName, {})
+        self.requests[handler] += 1
+        query = dict((key, value[0]) for key, value in parse_qs(url.query).items())
+        transition = {"oldstate": query.get("oldstate"), "newstate": query["newstate"],
+                      "location": query.get("location"), "timestamp": int(query["timestamp"])}
+        doc = json.loads(json.dumps(database.get(docId))) if docId in database else None
+        if handler == "stateTransition":
+            # as JobDump/updates/stateTransition.js, where the missing parameters are undefined
+            if doc is None:
+                doc = {"_id": docId, "states": {}}
+            maxKey = 0
+            for key in doc["states"]:
+                maxKey = max(maxKey, int(key))
+            newTransition = dict((key, query[key]) for key in ("oldstate", "newstate", "location") if key in query)
+            newTransition["timestamp"] = int(query["timestamp"])
+            doc["states"][str(maxKey + 1)] = newTransition
+        elif handler == "jobStateTransition":
+            doc = doc or {"_id": docId}
+            doc.setdefault("state_history", []).append(transition)
+        elif doc is None:
+            self.reply({"error": "not_found"}, status=404)
+            return
+        else:
+            doc["state"] = transition["newstate"]
+            doc["timestamp"] = transition["timestamp"]
+        self.saveDoc(database, doc)
+        self.reply("OK", status=201)
+
+
+class BulkStateTransitionTest(unittest.TestCase):
+    """
+    _BulkStateTransitionTest_
+
+    Test recording the state transitions in bulk against a CouchDB stand-in
+    """
+
+    def setUp(self):
+        CouchStandIn.databases = {}
+        CouchStandIn.requests = Counter()
+        CouchStandIn.conflicts = Counter()
+        self.server = HTTPServer(("localhost", 0), CouchStandIn)
+        self.serverThread = threading.Thread(target=self.server.serve_forever)
+        self.serverThread.start()
+        couchUrl = "http://localhost:%s" % self.server.server_port
+
+        # only the attributes used to record the transitions are needed
+        self.changeState = ChangeState.__new__(ChangeState)
+        self.changeState.jobsdatabase = Database("changestate_t/jobs", couchUrl)
+        self.changeState.jsumdatabase = Database("job_summary", couchUrl)
+        self.changeState.maxBulkCommit = 250
+        self.changeState.maxConflictRetries = 10
+        return
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.serverThread.join()
+        return
+
+    def createJobs(self, numJobs):
+        """
+        Create jobs already in couch, with their job summaries
+        """
+        jobs = []
+        jobsDB = CouchStandIn.databases.setdefault("changestate_t%2Fjobs", {})
+        jsumDB = CouchStandIn.databases.setdefault("job_summary", {})
+        for jobID in range(1, numJobs + 1):
+            job = {"id": jobID, "name": "job_%d" % jobID, "couch_record": str(jobID),
+                   "location": "T2_CH_CERN", "site_cms_name": "T2_CH_CERN"}
+            jobsDB[str(jobID)] = {"_id": str(jobID), "_rev": "1-stand-in", "jobid": jobID,
+                                  "states": {"1": {"oldstate": "none", "newstate": "new",
+                                                   "location": "Agent", "timestamp": 1}}}
+            jsumDB[job["name"]] = {"_id": job["name"], "_rev": "1-stand-in", "state": "new"}
+            jobs.append(job)
+        return jobs
+
+    def testBulkTransitions(self):
+        """
+        _testBulkTransitions_
+
+        Test that the bulk path records the same transitions as the update
+        handlers, with a few requests per maxBulkCommit jobs.
+        """
+        jobs = self.createJobs(1000)
+        for job in jobs[:10]:
+            self.changeState.jobsdatabase.makeRequest(
+                uri="/changestate_t%%2Fjobs/_design/JobDump/_update/stateTransition/%s"
+                    "?oldstate=created&newstate=executing&location=T2_CH_CERN&timestamp=10" % job["couch_record"],
+                type="PUT", decode=False)
+        self.assertEqual(CouchStandIn.requests["stateTransition"], 10)
+        expectedDocs = dict((job["couch_record"], CouchStandIn.databases["changestate_t%2Fjobs"][job["couch_record"]])
+                            for job in jobs[:10])
+        for expectedDoc in expectedDocs.values():
+            self.assertEqual(expectedDoc["states"], {"1": {"oldstate": "none", "newstate": "new",
+                                                           "location": "Agent", "timestamp": 1},
+                                                     "2": {"oldstate": "created", "newstate": "executing",
+                                                           "location": "T2_CH_CERN", "timestamp": 10}})
+
+        CouchStandIn.requests.clear()
+        self.changeState.recordTransitionsInBulk(jobs, "executing", "created", 10, updatesummary=True)
+        self.assertEqual(CouchStandIn.requests, Counter({"_all_docs": 8, "_bulk_docs": 8}))
+
+        jobsDB = CouchStandIn.databases["changestate_t%2Fjobs"]
+        for docId, expectedDoc in expectedDocs.items():
+            # these got the transition twice
+            self.assertEqual(jobsDB[docId]["states"]["3"], expectedDoc["states"]["2"])
+        for job in jobs[10:]:
+            self.assertEqual(jobsDB[job["couch_record"]]["states"]["2"],
+                             {"oldstate": "created", "newstate": "executing",
+                              "location": "T2_CH_CERN", "timestamp": 10})
+        for job in jobs:
+            summary = CouchStandIn.databases["job_summary"][job["name"]]
+            self.assertEqual(summary["state"], "executing")
+            self.assertEqual(summary["timestamp"], 10)
+            self.assertEqual(summary["state_history"], [{"oldstate": "created", "newstate": "executing",
+                                                         "location": "T2_CH_CERN", "timestamp": 10}])
+
+        # retrydone is recorded as jobfailed in the summaries, new jobs are skipped
+        CouchStandIn.requests.clear()
+        jobs[0]["couch_record"] = None
+        self.changeState.recordTransitionsInBulk(jobs[:5], "retrydone", "jobcooloff", 20, updatesummary=True)
+        self.assertEqual(CouchStandIn.requests, Counter({"_all_docs": 2, "_bulk_docs": 2}))
+        self.assertEqual(len(jobsDB["1"]["states"]), 3)
+        self.assertEqual(jobsDB["2"]["states"]["4"]["newstate"], "retrydone")
+        self.assertEqual(jobsDB["2"]["states"]["4"]["location"], "Agent")
+        self.assertEqual(CouchStandIn.databases["job_summary"]["job_1"]["state"], "jobfailed")
+        return
+
+    def testConflictsAndMissingDocs(self):
+        """
+        _testConflictsAndMissingDocs_
+
+        Test that conflicts are retried and missing documents are created
+        """
+        jobs = self.createJobs(10)
+        del CouchStandIn.databases["changestate_t%2Fjobs"]["3"]
+        del CouchStandIn.databases["job_summary"]["job_3"]
+        CouchStandIn.conflicts["4"] = 2
+        CouchStandIn.conflicts["5"] = 20
+
+        self.changeState.recordTransitionsInBulk(jobs, "success", "complete", 30, updatesummary=True)
+        jobsDB = CouchStandIn.databases["changestate_t%2Fjobs"]
+        self.assertEqual(jobsDB["3"]["states"], {"1": {"oldstate": "complete", "newstate": "success",
+                                                       "location": "Agent", "timestamp": 30}})
+        self.assertEqual(jobsDB["4"]["states"]["2"]["newstate"], "success")
+        self.assertEqual(len(jobsDB["4"]["states"]), 2)
+        # too many conflicts, given up
+        self.assertEqual(len(jobsDB["5"]["states"]), 1)
+        self.assertEqual(CouchStandIn.requests["_bulk_docs"], 1 + 11)
+
+        summary = CouchStandIn.databases["job_summary"]["job_3"]
+        self.assertNotIn("state", summary)
+        self.assertEqual(summary["state_history"][0]["newstate"], "success")
+
+        failed = self.changeState.jobsdatabase.updateBulkDocumentsWithFunction(["4", "6"], lambda docId, doc: None)
+        self.assertEqual(failed, [])
+        return
+
+
+class SpecCacheTest(unittest.TestCase):
+    """
+    _SpecCacheTest_
+
+    Test the cache of the workflow spec data used for the FWJR uploads
+    """
+
+    def setUp(self):
+        self.specGen = WMSpecGenerator()
+        self.specUrl = self.specGen.createProcessingSpec("TestWorkflow", returnType="file")
+        self.daoCalls = 0
+
+        # only the attributes used to load the specs are needed
+        self.oldCache = ChangeState.specCache
+        ChangeState.specCache = LRUCache(maxSize=2)
+        self.changeState = ChangeState.__new__(ChangeState)
+        self.changeState.getWorkflowSpecDAO = self
+        return
+
+    def tearDown(self):
+        ChangeState.specCache = self.oldCache
+        self.specGen.removeSpecs()
+        return
+
+    def execute(self, task):
+        """
+        Stand-in for the Workflow.GetSpecAndNameFromTask DAO
+        """
+        self.daoCalls += 1
+        return {task: {"spec": self.specUrl, "name": task.split("/")[1]}}
+
+    def testSpecCache(self):
+        """
+        _testSpecCache_
+
+        Test that the specs are only loaded when not cached or modified
+        """
+        taskName = "/TestWorkflow/ReReco1"
+        specData = self.changeState.getWorkflowSpecData("TestWorkflow", taskName)
+        self.assertIn(taskName, specData)
+        self.assertIn("Campaign", specData)
+        for _ in range(100):
+            self.assertEqual(self.changeState.getWorkflowSpecData("TestWorkflow", taskName), specData)
+        self.assertEqual(self.daoCalls, 1)
+        self.assertEqual(ChangeState.specCache.stats()["hits"], 100)
+
+        # the spec was modified
+        os.utime(self.specUrl, (time.time() + 10, time.time() + 10))
+        self.changeState.getWorkflowSpecData("TestWorkflow", taskName)
+        self.assertEqual(self.daoCalls, 2)
+
+        # shared between instances and bounded
+        otherChangeState = ChangeState.__new__(ChangeState)
+        otherChangeState.getWorkflowSpecDAO = self
+        otherChangeState.getWorkflowSpecData("TestWorkflow", taskName)
+        self.assertEqual(self.daoCalls, 2)
+        otherChangeState.getWorkflowSpecData("OtherWorkflow1", taskName)
+        otherChangeState.getWorkflowSpecData("OtherWorkflow2", taskName)
+        self.changeState.getWorkflowSpecData("TestWorkflow", taskName)
+        self.assertEqual(self.daoCalls, 5)
+        self.assertEqual(ChangeState.specCache.stats()["evictions"], 2)
+        return
+
+
 if __name__ == "__main__":
     unittest.main()
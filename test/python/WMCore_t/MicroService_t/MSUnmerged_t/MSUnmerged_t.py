@@ -4,15 +4,20 @@ Unit tests for MicorService/MSUnmerged/MSUnmerged.py module
 """
 from __future__ import division, print_function
 
+import errno
 import json
 import os
+import shutil
+import tempfile
+import time
 import unittest
 
 from future.utils import viewkeys
 from mock import mock
+from nose.plugins.attrib import attr
 
 from Utils.PythonVersion import PY3
-from WMCore.MicroService.MSUnmerged.MSUnmerged import MSUnmerged, MSUnmergedRSE
+from WMCore.MicroService.MSUnmerged.MSUnmerged import MSUnmerged, MSUnmergedRSE, GfalError, dirFilesGen
 from WMCore.Services.Rucio import Rucio
 
 
@@ -46,11 +51,13 @@ class RucioConMonEmul(object):
         """
         return self.rseConsStatsDump
 
-    def getRSEUnmerged(self, rseName, zipped=False):
+    def getRSEUnmerged(self, rseName, zipped=False, stream=False):
         """
         Emulates getting the list of all unmerged files in an RSE
         In reality it returns it from a file.
         """
+        if stream:
+            return (lfn for lfn in self.rseUnmergedDump)
         return self.rseUnmergedDump
 
 
@@ -81,6 +88,51 @@ def getBasicRSEData():
     return rse
 
 
+class LocalGfal2Context(object):
+    """
+    A stand-in for the gfal2 context object, working on the local filesystem
+    """
+    def __init__(self, failFiles=None, failUnlinkCalls=0):
+        self.failFiles = failFiles or set()
+        self.failUnlinkCalls = failUnlinkCalls
+        self.freed = False
+
+    @staticmethod
+    def _call(func, path):
+        try:
+            return func(path)
+        except OSError as ex:
+            raise GfalError(str(ex), ex.errno) from None
+
+    def stat(self, path):
+        return self._call(os.stat, path)
+
+    def listdir(self, path):
+        return self._call(os.listdir, path)
+
+    def rmdir(self, path):
+        self._call(os.rmdir, path)
+        return 0
+
+    def unlink(self, paths):
+        if self.failUnlinkCalls:
+            self.failUnlinkCalls -= 1
+            raise GfalError("Connection timed out", errno.ETIMEDOUT)
+        result = []
+        for path in paths:
+            try:
+                if path in self.failFiles:
+                    raise GfalError("Permission denied", errno.EACCES)
+                self._call(os.unlink, path)
+                result.append(None)
+            except GfalError as ex:
+                result.append(ex)
+        return result
+
+    def free(self):
+        self.freed = True
+
+
 class WMStatsServerEmul(object):
     """
     A simple class to emulate the basic behaviour of the RucioConMon Service
@@ -284,3 +336,224 @@ class MSUnmergedTest(unittest.TestCase):
         self.assertItemsEqual(viewkeys(filterData['files']['toDelete']), viewkeys(toDeleteDict))
         self.assertItemsEqual(list(filterData['files']['toDelete']['/store/unmerged/express/prod/2020/1/12']),
                               toDeleteDict['/store/unmerged/express/prod/2020/1/12'])
+
+    def testDirFilesGen(self):
+        "Test the bisect lookup of the files of a directory"
+        sortedFiles = sorted(["/store/unmerged/SAM/testSRM/SAM-host",
+                              "/store/unmerged/SAM/testSRM/SAM-host/lcg-util/file1.txt",
+                              "/store/unmerged/SAM/testSRM/SAM-host/lcg-util/file2.txt",
+                              "/store/unmerged/SAM/testSRM/SAM-host-2/lcg-util/file3.txt",
+                              "/store/unmerged/SAM/testSRM/SAM-host.cern.ch/file4.txt",
+                              "/store/unmerged/SAM/testSRM/SAM-hos/file5.txt"])
+        self.assertEqual(list(dirFilesGen(sortedFiles, "/store/unmerged/SAM/testSRM/SAM-host")),
+                         ["/store/unmerged/SAM/testSRM/SAM-host",
+                          "/store/unmerged/SAM/testSRM/SAM-host/lcg-util/file1.txt",
+                          "/store/unmerged/SAM/testSRM/SAM-host/lcg-util/file2.txt"])
+        self.assertEqual(list(dirFilesGen(sortedFiles, "/store/unmerged/SAM/testSRM/SAM-host/lcg-util")),
+                         ["/store/unmerged/SAM/testSRM/SAM-host/lcg-util/file1.txt",
+                          "/store/unmerged/SAM/testSRM/SAM-host/lcg-util/file2.txt"])
+        self.assertEqual(list(dirFilesGen(sortedFiles, "/store/unmerged/SAM/testSRM/SAM-hos")),
+                         ["/store/unmerged/SAM/testSRM/SAM-hos/file5.txt"])
+        self.assertEqual(list(dirFilesGen(sortedFiles, "/store/unmerged/SAM/testSRM/SAM-other")), [])
+        self.assertEqual(list(dirFilesGen([], "/store/unmerged/SAM")), [])
+
+    def testStreamUnmergedFiles(self):
+        "Test that streaming the unmerged files gives the same files to delete"
+        self.msUnmerged.protectedLFNs = set(self.msUnmerged.wmstatsSvc.getProtectedLFNs())
+        for dirFilterExcl in ([], ["/store/unmerged/Run2016G/"]):
+            self.msUnmerged.msConfig['dirFilterExcl'] = dirFilterExcl
+            results = []
+            for stream in (False, True):
+                self.msUnmerged.msConfig['rucioConMonStream'] = stream
+                rse = MSUnmergedRSE('T2_US_Wisconsin')
+                rse = self.msUnmerged.getUnmergedFiles(rse)
+                rse = self.msUnmerged.filterUnmergedFiles(rse)
+                toDelete = dict((dirLfn, sorted(fileGen)) for dirLfn, fileGen in rse['files']['toDelete'].items())
+                results.append((rse['counters'], rse['dirs'], toDelete))
+
+            self.assertEqual(results[0][0]['totalNumFiles'], 11938)
+            self.assertEqual(results[0], results[1])
+            # the compact index only keeps the files which are not protected
+            self.assertIsInstance(rse['files']['allUnmerged'], dict)
+            self.assertFalse(set(rse['files']['allUnmerged']) & self.msUnmerged.protectedLFNs)
+            self.assertTrue(all(results[1][2].values()))
+
+    def createUnmergedTree(self, baseDir, numDirs, filesPerDir):
+        """
+        Create unmerged directories with files in subdirectories on the local filesystem,
+        and an RSE object ready to be cleaned with its pfnPrefix pointing to them
+        """
+        lfns = []
+        for dirNum in range(numDirs):
+            dirLfn = "/store/unmerged/Run2022A/PrimaryDataset%d/AODSIM/ProcString-v1" % dirNum
+            for fileNum in range(filesPerDir):
+                lfns.append("%s/%05d/file%d.root" % (dirLfn, fileNum % 2, fileNum))
+        for lfn in lfns:
+            os.makedirs(os.path.dirname(baseDir + lfn), exist_ok=True)
+            with open(baseDir + lfn, "w") as fd:
+                fd.write(lfn)
+
+        rse = MSUnmergedRSE('T2_US_Wisconsin')
+        rse['files']['allUnmerged'] = lfns
+        rse['dirs']['allUnmerged'] = set(self.msUnmerged._cutPath(lfn) for lfn in lfns)
+        rse = self.msUnmerged.filterUnmergedFiles(rse)
+        rse['pfnPrefix'] = baseDir
+        return rse
+
+    def testCleanRSE(self):
+        "Test the deletion of files with a local filesystem gfal2 context"
+        self.msUnmerged.protectedLFNs = set()
+        self.msUnmerged.msConfig['enableRealMode'] = True
+        self.msUnmerged.msConfig['filesToDeleteSliceSize'] = 3
+        for numThreads in (1, 4):
+            self.msUnmerged.msConfig['deletionThreads'] = numThreads
+            baseDir = tempfile.mkdtemp()
+            contexts = []
+
+            def createContext(*args):
+                contexts.append(LocalGfal2Context())
+                return contexts[-1]
+
+            try:
+                rse = self.createUnmergedTree(baseDir, numDirs=6, filesPerDir=10)
+                with mock.patch('WMCore.MicroService.MSUnmerged.MSUnmerged.createGfal2Context', createContext):
+                    rse = self.msUnmerged.cleanRSE(rse)
+                self.assertEqual(len(contexts), numThreads)
+                self.assertTrue(all(ctx.freed for ctx in contexts))
+                self.assertEqual(rse['counters']['filesDeletedSuccess'], 60)
+                self.assertEqual(rse['counters']['filesDeletedFail'], 0)
+                self.assertLessEqual(rse['counters']['dirsDeletedSuccess'], 6)
+                self.assertEqual(rse['counters']['gfalErrors'], {})
+                self.assertTrue(rse['isClean'])
+                for dirLfn in rse['dirs']['toDelete']:
+                    self.assertFalse(os.path.exists(baseDir + dirLfn))
+                    self.assertTrue(os.path.isdir(os.path.dirname(baseDir + dirLfn)))
+            finally:
+                shutil.rmtree(baseDir, ignore_errors=True)
+
+    def testCleanRSEErrors(self):
+        "Test the accounting of deletion errors and the retries of failed unlink calls"
+        self.msUnmerged.protectedLFNs = set()
+        self.msUnmerged.msConfig['enableRealMode'] = True
+        self.msUnmerged.msConfig['filesToDeleteSliceSize'] = 3
+        self.msUnmerged.msConfig['deletionThreadsPerRSE'] = {'T2_US_Wisconsin': 3}
+        self.msUnmerged.msConfig['deletionRetries'] = 1
+        self.msUnmerged.msConfig['deletionBackoff'] = 0
+        baseDir = tempfile.mkdtemp()
+        try:
+            rse = self.createUnmergedTree(baseDir, numDirs=3, filesPerDir=10)
+            failFiles = set([baseDir + "/store/unmerged/Run2022A/PrimaryDataset1/AODSIM/ProcString-v1/00000/file0.root",
+                             baseDir + "/store/unmerged/Run2022A/PrimaryDataset1/AODSIM/ProcString-v1/00001/file1.root"])
+            # every context fails its first unlink call, which is then retried
+            with mock.patch('WMCore.MicroService.MSUnmerged.MSUnmerged.createGfal2Context',
+                            lambda *args: LocalGfal2Context(failFiles=failFiles, failUnlinkCalls=1)):
+                rse = self.msUnmerged.cleanRSE(rse)
+            self.assertEqual(rse['counters']['filesDeletedSuccess'], 28)
+            self.assertEqual(rse['counters']['filesDeletedFail'], 2)
+            self.assertEqual(rse['counters']['gfalErrors'], {os.strerror(errno.EACCES): 2})
+            self.assertEqual(rse['counters']['dirsDeletedSuccess'], 2)
+            self.assertEqual(rse['counters']['dirsDeletedFail'], 1)
+            self.assertEqual(rse['dirs']['deletedFail'],
+                             set(["/store/unmerged/Run2022A/PrimaryDataset1/AODSIM/ProcString-v1"]))
+            self.assertFalse(rse['isClean'])
+        finally:
+            shutil.rmtree(baseDir, ignore_errors=True)
+
+    def testCleanRSEInFlight(self):
+        "Test that only a few directories per deletion worker are held in memory"
+        self.msUnmerged.protectedLFNs = set()
+        self.msUnmerged.msConfig['enableRealMode'] = True
+        self.msUnmerged.msConfig['deletionThreads'] = 2
+        baseDir = tempfile.mkdtemp()
+        contexts = []
+
+        def createContext(*args):
+            contexts.append(LocalGfal2Context())
+            return contexts[-1]
+
+        try:
+            rse = self.createUnmergedTree(baseDir, numDirs=20, filesPerDir=5)
+            # count the Pfn lists built and not yet accounted for
+            inFlight = {'current': 0, 'max': 0}
+
+            def countedGen(fileLfnGen):
+                inFlight['current'] += 1
+                inFlight['max'] = max(inFlight['max'], inFlight['current'])
+                for fileLfn in fileLfnGen:
+                    yield fileLfn
+
+            updateDirCounters = self.msUnmerged._updateDirCounters
+
+            def countedUpdate(*args):
+                inFlight['current'] -= 1
+                updateDirCounters(*args)
+
+            for dirLfn in rse['files']['toDelete']:
+                rse['files']['toDelete'][dirLfn] = countedGen(rse['files']['toDelete'][dirLfn])
+            with mock.patch('WMCore.MicroService.MSUnmerged.MSUnmerged.createGfal2Context', createContext), \
+                 mock.patch.object(self.msUnmerged, '_updateDirCounters', countedUpdate):
+                rse = self.msUnmerged.cleanRSE(rse)
+            self.assertEqual(rse['counters']['filesDeletedSuccess'], 100)
+            self.assertEqual(rse['counters']['dirsDeletedSuccess'], 20)
+            self.assertEqual(inFlight['current'], 0)
+            self.assertLessEqual(inFlight['max'], 4)
+
+            # the workers are stopped and the contexts freed if cleaning the RSE fails
+            contexts[:] = []
+            rse = self.createUnmergedTree(baseDir, numDirs=10, filesPerDir=5)
+            dirLfns = list(rse['files']['toDelete'])
+
+            def failingGen():
+                raise RuntimeError("Lost the unmerged files dump")
+                yield  # pylint: disable=W0101
+
+            rse['files']['toDelete'][dirLfns[6]] = failingGen()
+            with mock.patch('WMCore.MicroService.MSUnmerged.MSUnmerged.createGfal2Context', createContext):
+                self.assertRaises(RuntimeError, self.msUnmerged.cleanRSE, rse)
+            self.assertEqual(len(contexts), 2)
+            self.assertTrue(all(ctx.freed for ctx in contexts))
+            self.assertLessEqual(rse['counters']['dirsDeletedSuccess'], 6)
+        finally:
+            shutil.rmtree(baseDir, ignore_errors=True)
+
+    @attr('performance', 'integration')
+    def testFilterUnmergedFilesPerformance(self):
+        "Time grouping a synthetic RucioConMon dump of 5M files into directories"
+        numDirs, filesPerDir = 2000, 2500
+        dump = []
+        for dirNum in range(numDirs):
+            dirLfn = "/store/unmerged/Run2022%d/PrimaryDataset%d/AODSIM/ProcString_v%d-v1" % (dirNum % 7, dirNum, dirNum)
+            for fileNum in range(filesPerDir):
+                dump.append("%s/%05d/%08X-6934-DF11-8FC1-000423D99F3E.root" % (dirLfn, fileNum % 10, fileNum))
+        self.msUnmerged.rucioConMon.rseUnmergedDump = dump
+        self.msUnmerged.protectedLFNs = set()
+        print("\nGrouping %d files into %d directories" % (len(dump), numDirs))
+
+        rse = MSUnmergedRSE('T2_US_Wisconsin')
+        startTime = time.time()
+        rse = self.msUnmerged.getUnmergedFiles(rse)
+        print("  getUnmergedFiles: %.3f secs" % (time.time() - startTime))
+        startTime = time.time()
+        rse = self.msUnmerged.filterUnmergedFiles(rse)
+        numFiles = sum(len(list(fileGen)) for fileGen in rse['files']['toDelete'].values())
+        print("  filterUnmergedFiles: %.3f secs" % (time.time() - startTime))
+        self.assertEqual(rse['counters']['dirsToDelete'], numDirs)
+        self.assertEqual(numFiles, len(dump))
+
+        # the former full scan of the files, for a single directory
+        dirLfn = next(iter(rse['files']['toDelete']))
+        startTime = time.time()
+        numFiles = len([fileLfn for fileLfn in dump if fileLfn.startswith(dirLfn)])
+        print("  full scan for one of the directories: %.3f secs" % (time.time() - startTime))
+        self.assertEqual(numFiles, filesPerDir)
+        del rse, dump
+
+        # and when streaming it
+        self.msUnmerged.msConfig['rucioConMonStream'] = True
+        rse = MSUnmergedRSE('T2_US_Wisconsin')
+        startTime = time.time()
+        rse = self.msUnmerged.getUnmergedFiles(rse)
+        rse = self.msUnmerged.filterUnmergedFiles(rse)
+        numFiles = sum(len(list(fileGen)) for fileGen in rse['files']['toDelete'].values())
+        print("  streaming: %.3f secs" % (time.time() - startTime))
+        self.assertEqual(numFiles, numDirs * filesPerDir)
@@ -4,11 +4,24 @@ _ProcessPool_t
 Unit tests for the ProcessPool class.
 """
 
+from __future__ import print_function
+
 from builtins import range
+import os
+import shutil
+import tempfile
+import threading
+import time
 import unittest
 import nose
+import zmq
+
+from nose.plugins.attrib import attr
 
-from WMCore.ProcessPool.ProcessPool import ProcessPool
+from WMCore.DataStructs.File import File
+from WMCore.DataStructs.Run import Run
+from WMCore.ProcessPool.ProcessPool import (ProcessPool, ProcessPoolException, SlaveDispatcher,
+                                            chunkWork, fileSizeCost, getCodec, getEndpoints, msgpack)
 from WMQuality.TestInit import TestInit
 
 class ProcessPoolTest(unittest.TestCase):
@@ -125,6 +138,260 @@ class ProcessPoolTest(unittest.TestCase):
 
 
 
+    def testD_PickleCodecIPC(self):
+        """
+        _testPickleCodecIPC_
+
+        Run the pool with the pickle codec over the ipc transport
+        """
+        raise nose.SkipTest
+        config = self.testInit.getConfiguration()
+        config.Agent.useHeartbeat = False
+        self.testInit.generateWorkDir(config)
+
+        processPool = ProcessPool("ProcessPool_t.ProcessPoolTestWorker",
+                                  totalSlaves = 2,
+                                  componentDir = config.General.workDir,
+                                  namespace = "WMCore_t",
+                                  config = config,
+                                  codec = "pickle",
+                                  transport = "ipc")
+
+        input = [{"id": i, "fwjr_path": "/data/Report.%i.pkl" % i} for i in range(100)]
+        processPool.enqueue(input)
+        result = processPool.dequeue(len(input))
+        self.assertEqual(sorted(result, key=lambda x: x["id"]), input)
+        return
+
+    def testE_Batching(self):
+        """
+        _testBatching_
+
+        Run the pool in batching mode, chunking the work by FWJR size
+        """
+        raise nose.SkipTest
+        config = self.testInit.getConfiguration()
+        config.Agent.useHeartbeat = False
+        self.testInit.generateWorkDir(config)
+
+        processPool = ProcessPool("ProcessPool_t.ProcessPoolTestWorker",
+                                  totalSlaves = 3,
+                                  componentDir = config.General.workDir,
+                                  namespace = "WMCore_t",
+                                  config = config,
+                                  batching = True)
+
+        input = [{"id": i, "fwjr_path": "/data/Report.%i.pkl" % i} for i in range(100)]
+        processPool.enqueue(input, costFunction = fileSizeCost)
+        result = processPool.dequeue(len(input))
+        self.assertEqual(sorted(result, key=lambda x: x["id"]), input)
+
+        slaveStats = processPool.slaveStats()
+        self.assertEqual(sum(stats["items"] for stats in slaveStats.values()), 100)
+        return
+
+
+class ProcessPoolCodecTest(unittest.TestCase):
+    """
+    _ProcessPoolCodecTest_
+
+    Test the ProcessPool message codecs and transports with a thread echoing
+    the messages back, like a slave running the ProcessPoolTestWorker.
+    """
+
+    def setUp(self):
+        self.testDir = tempfile.mkdtemp()
+        self.context = zmq.Context()
+
+    def tearDown(self):
+        self.context.term()
+        shutil.rmtree(self.testDir, ignore_errors=True)
+
+    def echoSlave(self, codecName, inAddress, outAddress):
+        """
+        Decode and send back every message until STOP
+        """
+        codec = getCodec(codecName)
+        receiver = self.context.socket(zmq.PULL)
+        receiver.connect(inAddress)
+        sender = self.context.socket(zmq.PUSH)
+        sender.connect(outAddress)
+        while True:
+            data = codec.recv(receiver)
+            if data == "STOP":
+                break
+            codec.send(sender, data)
+        receiver.close()
+        sender.close()
+
+    def echo(self, codecName, transport, work, batchSize=500):
+        """
+        Send the work through an echo slave, enqueueing and dequeueing it in
+        batches like the pool does. Return the results and the items/sec.
+        """
+        bindAddresses, connectAddresses = getEndpoints(transport, "5565", "5568",
+                                                       self.testDir, "EchoSlave")
+        codec = getCodec(codecName)
+        sender = self.context.socket(zmq.PUSH)
+        sender.bind(bindAddresses[0])
+        sink = self.context.socket(zmq.PULL)
+        sink.bind(bindAddresses[1])
+        slave = threading.Thread(target=self.echoSlave, args=(codecName,) + connectAddresses)
+        slave.start()
+
+        result = []
+        startTime = time.time()
+        for start in range(0, len(work), batchSize):
+            batch = work[start:start + batchSize]
+            for item in batch:
+                codec.send(sender, item)
+            for _ in batch:
+                result.append(codec.recv(sink))
+        elapsedTime = time.time() - startTime
+
+        codec.send(sender, "STOP")
+        slave.join()
+        sender.close(linger=0)
+        sink.close(linger=0)
+        return result, len(work) / max(elapsedTime, 1e-6)
+
+    def createWork(self, numItems):
+        """
+        Create JobAccountant like work, a list of jobs with their FWJR path
+        """
+        return [[{"id": jobID, "fwjr_path": "/data/srv/JobCache/job_%i/Report.0.pkl" % jobID}]
+                for jobID in range(numItems)]
+
+    def testCodecs(self):
+        """
+        _testCodecs_
+
+        Test that all the codecs return the same work over both transports
+        """
+        work = self.createWork(10)
+        work.extend(["STRING", 10, 2.5, None, {"type": "ERROR", "msg": "Crashed"}])
+        codecs = ["json", "pickle"]
+        if msgpack is not None:
+            codecs.append("msgpack")
+        for codecName in codecs:
+            for transport in ("tcp", "ipc"):
+                result, _ = self.echo(codecName, transport, work)
+                self.assertEqual(result, work)
+
+        # objects with __to_json__ are thunked by json, pickled as they are by pickle
+        testFile = File(lfn="/store/data/file.root", size=1024, events=10)
+        testFile.addRun(Run(1, 1, 2, 3))
+        result, _ = self.echo("json", "tcp", [testFile])
+        self.assertEqual(result[0]["lfn"], "/store/data/file.root")
+        result, _ = self.echo("pickle", "ipc", [testFile, {"data": bytearray(b"x" * 100000)}])
+        self.assertIsInstance(result[0], File)
+        self.assertEqual(result[0]["runs"], testFile["runs"])
+        self.assertEqual(result[1], {"data": bytearray(b"x" * 100000)})
+
+        self.assertRaises(ProcessPoolException, getCodec, "yaml")
+        self.assertRaises(ProcessPoolException, getEndpoints, "udp", "5565", "5568",
+                          self.testDir, "EchoSlave")
+        return
+
+    @attr('performance', 'integration')
+    def testCodecPerformance(self):
+        """
+        _testCodecPerformance_
+
+        Compare the items/sec going through a slave with every codec and transport
+        """
+        numItems = 20000
+        work = self.createWork(numItems)
+        print("\nSending %d items to an echo slave" % numItems)
+        codecs = ["json", "pickle"]
+        if msgpack is not None:
+            codecs.append("msgpack")
+        for codecName in codecs:
+            for transport in ("tcp", "ipc"):
+                _, rate = self.echo(codecName, transport, work)
+                print("  %s+%s: %.0f items/sec" % (codecName, transport, rate))
+        return
+
+
+class ProcessPoolDispatchTest(unittest.TestCase):
+    """
+    _ProcessPoolDispatchTest_
+
+    Test the chunking and the dispatching of the work in batching mode
+    """
+
+    def setUp(self):
+        self.testDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.testDir, ignore_errors=True)
+
+    def testChunkWork(self):
+        """
+        _testChunkWork_
+
+        Test that the work is split in chunks of similar cost
+        """
+        chunks = chunkWork(list(range(100)), nChunks=8)
+        self.assertEqual(sum(len(chunk) for chunk, _ in chunks), 100)
+        self.assertTrue(all(cost <= 13 for _, cost in chunks))
+        self.assertEqual(len(chunkWork(list(range(100)), nChunks=8, maxChunkCost=5)), 20)
+        self.assertEqual(chunkWork([], nChunks=8), [])
+
+        # expensive items come first, alone if needed
+        work = [1, 1, 50, 1, 1, 30, 1, 1]
+        chunks = chunkWork(work, costFunction=lambda x: x, nChunks=4)
+        self.assertEqual(chunks[0], ([50], 50))
+        self.assertEqual(chunks[1], ([30], 30))
+        self.assertEqual(sorted(sum((chunk for chunk, _ in chunks), [])), sorted(work))
+
+        # cost by framework job report size
+        work = []
+        for jobID, size in enumerate((100, 10000, 1000)):
+            fwjrPath = os.path.join(self.testDir, "Report.%i.pkl" % jobID)
+            with open(fwjrPath, "wb") as fd:
+                fd.write(b"x" * size)
+            work.append({"id": jobID, "fwjr_path": fwjrPath})
+        work.append({"id": 3, "fwjr_path": os.path.join(self.testDir, "Missing.pkl")})
+        self.assertEqual([fileSizeCost(job) for job in work], [100, 10000, 1000, 1])
+        chunks = chunkWork(work, costFunction=fileSizeCost, nChunks=2)
+        self.assertEqual([[job["id"] for job in chunk] for chunk, _ in chunks], [[1], [2, 0, 3]])
+        return
+
+    def testSlaveDispatcher(self):
+        """
+        _testSlaveDispatcher_
+
+        Test that idle slaves pull the chunks and that their time is accounted
+        """
+        dispatcher = SlaveDispatcher()
+        dispatcher.addChunks(chunkWork(list(range(12)), nChunks=6))
+        self.assertIsNone(dispatcher.nextAssignment(now=0))
+
+        self.assertIsNone(dispatcher.slaveReady("slow", now=0))
+        self.assertIsNone(dispatcher.slaveReady("fast", now=0))
+        self.assertEqual(dispatcher.nextAssignment(now=0), ("slow", [0, 1]))
+        self.assertEqual(dispatcher.nextAssignment(now=0), ("fast", [2, 3]))
+        self.assertIsNone(dispatcher.nextAssignment(now=0))
+
+        # the fast slave takes all the work while the slow one is busy
+        now = 0
+        while dispatcher.pendingChunks:
+            now += 1
+            stats = dispatcher.slaveReady("fast", now=now)
+            self.assertEqual(stats["lastLatency"], 1)
+            self.assertEqual(dispatcher.nextAssignment(now=now)[0], "fast")
+        dispatcher.slaveReady("fast", now=now + 1)
+        stats = dispatcher.slaveReady("slow", now=10)
+
+        self.assertEqual(stats, {"chunks": 1, "items": 2, "cost": 2, "busyTime": 10,
+                                 "lastLatency": 10, "throughput": 0.2})
+        self.assertEqual(dispatcher.stats["fast"]["chunks"], 5)
+        self.assertEqual(dispatcher.stats["fast"]["items"], 10)
+        self.assertEqual(dispatcher.stats["fast"]["throughput"], 2.0)
+        self.assertEqual(sorted(dispatcher.idleSlaves), ["fast", "slow"])
+        self.assertEqual(dispatcher.busySlaves, {})
+        return
 
 
 if __name__ == "__main__":
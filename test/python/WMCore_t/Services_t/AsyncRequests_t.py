@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+"""
+_AsyncRequests_t_
+
+Unit tests for the asyncio requests and Service coroutines, against the
+local HTTPS stand-in server of the pycurl_manager tests.
+"""
+
+import asyncio
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import unittest
+from http.client import HTTPException
+
+from nose.plugins.attrib import attr
+
+from WMCore.Services.Requests import AsyncJSONRequests, AsyncRequests, JSONRequests
+from WMCore.Services.Service import Service
+from WMCore.Services.pycurl_manager import AsyncRequestHandler, CurlHandlePool
+from WMCore_t.Services_t.pycurl_manager_t import StandInServer
+
+
+class AsyncRequestsTest(unittest.TestCase):
+    """
+    Make concurrent requests on a single event loop
+    """
+
+    def setUp(self):
+        self.certDir = tempfile.mkdtemp()
+        try:
+            self.server = StandInServer(self.certDir)
+        except (OSError, subprocess.CalledProcessError) as exc:
+            shutil.rmtree(self.certDir)
+            raise unittest.SkipTest("Cannot start the HTTPS stand-in server: %s" % str(exc))
+        # the stand-in server does not ask for a client certificate
+        self.config = {'key': os.path.join(self.certDir, "key.pem"),
+                       'cert': os.path.join(self.certDir, "cert.pem"),
+                       'cachepath': os.path.join(self.certDir, "cache"),
+                       'logger': logging.getLogger()}
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.certDir)
+
+    def testRequestHandler(self):
+        """
+        Test the coroutines of the request handler
+        """
+        mgr = AsyncRequestHandler({'pool': CurlHandlePool()})
+        url = self.server.url + "/data"
+
+        async def fetch():
+            startTime = time.time()
+            results = await asyncio.gather(*[mgr.request(url, {'delay': 0.3, 'item': i},
+                                                         encode=True, decode=True)
+                                             for i in range(20)])
+            self.assertTrue(time.time() - startTime < 3)
+            for i, (header, data) in enumerate(results):
+                self.assertEqual(header.status, 200)
+                self.assertEqual(data, {"path": "/data?delay=0.3&item=%d" % i})
+
+            header = await mgr.getheader(url, {})
+            self.assertEqual(header.status, 200)
+            with self.assertRaises(HTTPException) as context:
+                await mgr.getdata(self.server.url + "/missing", {})
+            self.assertEqual(context.exception.status, 404)
+
+            # a cancelled request does not disturb the other ones
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(mgr.getdata(url, {'delay': 2}, encode=True), 0.2)
+            self.assertEqual(await mgr.getdata(url, {'item': 1}, encode=True, decode=True),
+                             {"path": "/data?item=1"})
+
+        asyncio.run(fetch())
+        # the handles were reused by the requests, and on a new event loop
+        asyncio.run(mgr.getdata(url, {}))
+        self.assertTrue(mgr.pool.stats()['reused'] >= 4)
+        mgr.close()
+
+    def testBoundedConcurrency(self):
+        """
+        Test that at most max_concurrent requests are in flight at once
+        """
+        requests = AsyncJSONRequests(self.server.url, dict(self.config, max_concurrent=2))
+        self.assertIsInstance(requests, JSONRequests)
+        self.assertEqual(requests['accept_type'], "application/json")
+
+        async def fetch():
+            startTime = time.time()
+            results = await asyncio.gather(*[requests.get("/data", {'delay': 0.3, 'item': i})
+                                             for i in range(6)])
+            self.assertTrue(time.time() - startTime >= 0.9)
+            return results
+
+        results = asyncio.run(fetch())
+        self.assertEqual([status for _, status, _, _ in results], [200] * 6)
+        self.assertEqual(results[5][0], {"path": "/data?delay=0.3&item=5"})
+
+        # errors of Requests
+        requests = AsyncRequests(self.server.url, self.config)
+        with self.assertRaises(HTTPException) as context:
+            asyncio.run(requests.get("/missing"))
+        self.assertEqual(context.exception.status, 404)
+        self.assertIsInstance(asyncio.run(requests.get("/data", decode=False))[0], bytes)
+
+    def testService(self):
+        """
+        Test the coroutine variants of the Service cache methods
+        """
+        service = Service(dict(self.config, endpoint=self.server.url,
+                               accept_type="application/json", content_type="application/json"))
+
+        async def refresh(force=False):
+            method = service.forceRefreshAsync if force else service.refreshCacheAsync
+            files = await asyncio.gather(*[method("data_%d" % i, "data", {'item': i})
+                                           for i in range(10)])
+            results = []
+            for fd in files:
+                results.append(fd.read())
+                fd.close()
+            return results
+
+        results = asyncio.run(refresh())
+        self.assertEqual(results[3], '{"path": "/data?item=3"}')
+        self.assertEqual(len(self.server.cookies), 10)
+        self.assertIsInstance(service.asyncRequests(), AsyncJSONRequests)
+
+        # from the cache, unless forced
+        self.assertEqual(asyncio.run(refresh()), results)
+        self.assertEqual(len(self.server.cookies), 10)
+        self.assertEqual(asyncio.run(refresh(force=True)), results)
+        self.assertEqual(len(self.server.cookies), 20)
+
+        # and the same files as the synchronous methods
+        with service.refreshCache("data_3", "data", {'item': 3}) as fd:
+            self.assertEqual(fd.read(), results[3])
+        self.assertEqual(len(self.server.cookies), 20)
+        with self.assertRaises(HTTPException):
+            asyncio.run(service.refreshCacheAsync("missing", "missing"))
+
+    @attr('performance', 'integration')
+    def testPerformance(self):
+        """
+        Time requests answered in 50ms, one after the other and concurrently
+        """
+        numRequests = 200
+        print("\n%d requests of 50ms" % numRequests)
+        requests = JSONRequests(self.server.url, self.config)
+        startTime = time.time()
+        for i in range(numRequests):
+            requests.get("/data", {'delay': 0.05, 'item': i})
+        print("  Requests: %.3f secs" % (time.time() - startTime))
+
+        for maxConcurrent in (10, 50):
+            requests = AsyncJSONRequests(self.server.url, dict(self.config, max_concurrent=maxConcurrent))
+
+            async def fetch():
+                return await asyncio.gather(*[requests.get("/data", {'delay': 0.05, 'item': i})
+                                              for i in range(numRequests)])
+
+            startTime = time.time()
+            self.assertEqual(len(asyncio.run(fetch())), numRequests)
+            print("  AsyncRequests, max_concurrent=%d: %.3f secs" % (maxConcurrent, time.time() - startTime))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+"""
+_ServiceCache_t_
+
+Unit tests for the memory tier, the stale data and the pruning of the
+Service cache, against the local HTTPS stand-in server of the
+pycurl_manager tests.
+"""
+
+import asyncio
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import unittest
+
+from WMCore.Services.Service import Service
+from WMCore_t.Services_t.pycurl_manager_t import StandInServer
+
+
+class ServiceCacheTest(unittest.TestCase):
+    """
+    Cache the data of a JSON service
+    """
+
+    def setUp(self):
+        self.certDir = tempfile.mkdtemp()
+        try:
+            self.server = StandInServer(self.certDir)
+        except (OSError, subprocess.CalledProcessError) as exc:
+            shutil.rmtree(self.certDir)
+            raise unittest.SkipTest("Cannot start the HTTPS stand-in server: %s" % str(exc))
+        self.serverRunning = True
+        # the stand-in server does not ask for a client certificate
+        self.config = {'endpoint': self.server.url,
+                       'key': os.path.join(self.certDir, "key.pem"),
+                       'cert': os.path.join(self.certDir, "cert.pem"),
+                       'cachepath': os.path.join(self.certDir, "cache"),
+                       'accept_type': "application/json",
+                       'content_type': "application/json",
+                       'logger': logging.getLogger()}
+
+    def tearDown(self):
+        if self.serverRunning:
+            self.server.stop()
+        shutil.rmtree(self.certDir)
+
+    def numRequests(self):
+        """
+        Number of requests answered by the server
+        """
+        return len(self.server.cookies)
+
+    def read(self, service, item, **kwargs):
+        """
+        Return the data of an item, through the cache
+        """
+        with service.refreshCache("data", "data", {'item': item}, **kwargs) as fd:
+            return fd.read()
+
+    def testMemoryCache(self):
+        """
+        Test that the most recently used data is kept in memory
+        """
+        service = Service(dict(self.config, memcachesize=5))
+        for item in range(10):
+            self.assertEqual(self.read(service, item), '{"path": "/data?item=%d"}' % item)
+        # the first items are read from disk, then kept in memory
+        for _ in range(2):
+            for item in range(4):
+                self.assertEqual(self.read(service, item), '{"path": "/data?item=%d"}' % item)
+        self.assertEqual(self.numRequests(), 10)
+        stats = service.cacheStats()
+        self.assertEqual((stats['misses'], stats['diskHits'], stats['memoryHits']), (10, 4, 4))
+        self.assertEqual(stats['memory']['size'], 5)
+        self.assertEqual(stats['memory']['evictions'], 9)
+
+        # the memory tier follows the refreshes and the removals of the files
+        with service.forceRefresh("data", "data", {'item': 3}):
+            pass
+        cachefile = service.cacheFileName("data", inputdata={'item': 3})
+        with open(cachefile, "w") as fd:
+            fd.write("changed on disk")
+        self.assertEqual(self.read(service, 3), '{"path": "/data?item=3"}')
+        service.clearCache("data", {'item': 3})
+        self.assertEqual(self.read(service, 3), '{"path": "/data?item=3"}')
+        self.assertEqual(self.numRequests(), 12)
+
+        # in binary mode, and not without memcachesize
+        self.assertEqual(self.read(service, 3, binary=True), b'{"path": "/data?item=3"}')
+        service = Service(self.config)
+        self.assertIsNone(service.memoryCache)
+        self.assertEqual(self.read(service, 3), '{"path": "/data?item=3"}')
+        self.assertEqual(service.cacheStats()['diskHits'], 1)
+
+    def testStaleCache(self):
+        """
+        Test that stale data is returned while it is being refreshed
+        """
+        service = Service(dict(self.config, memcachesize=10, cacheduration=0.5 / 3600,
+                               usestalecache=True, stalecacheduration=1))
+        self.read(service, 1)
+        # the refresh in the background does not share the requests instance of the caller
+        mainRequests = []
+        makeRequest = service['requests'].makeRequest
+        service['requests'].makeRequest = lambda *args, **kwargs: mainRequests.append(args) or \
+            makeRequest(*args, **kwargs)
+        time.sleep(0.6)
+        self.assertEqual(self.read(service, 1), '{"path": "/data?item=1"}')
+        # refreshed in the background
+        for _ in range(50):
+            if service.cacheStats()['revalidations']:
+                break
+            time.sleep(0.1)
+        stats = service.cacheStats()
+        self.assertEqual((stats['staleHits'], stats['revalidations']), (1, 1))
+        self.assertEqual(self.numRequests(), 2)
+        self.assertEqual(mainRequests, [])
+        self.read(service, 1)
+        self.assertEqual(service.cacheStats()['memoryHits'], 1)
+
+        # the coroutine variant refreshes it in a task
+        time.sleep(0.6)
+
+        async def refresh():
+            with await service.refreshCacheAsync("data", "data", {'item': 1}) as fd:
+                data = fd.read()
+            await asyncio.gather(*service.revalidationTasks)
+            return data
+
+        self.assertEqual(asyncio.run(refresh()), '{"path": "/data?item=1"}')
+        self.assertEqual(service.cacheStats()['revalidations'], 2)
+        self.assertEqual(self.numRequests(), 3)
+
+        # stale data is returned as long as the service fails
+        self.server.stop()
+        self.serverRunning = False
+        time.sleep(0.6)
+        self.assertEqual(self.read(service, 1), '{"path": "/data?item=1"}')
+        for _ in range(50):
+            if service.cacheStats()['revalidationErrors']:
+                break
+            time.sleep(0.1)
+        self.assertEqual(service.cacheStats()['revalidationErrors'], 1)
+
+        # not without usestalecache
+        service['usestalecache'] = False
+        self.assertRaises(Exception, self.read, service, 1)
+
+    def testPruneCache(self):
+        """
+        Test the removal of old cache files
+        """
+        service = Service(dict(self.config, diskcachemaxbytes=10 * 24 + 1, diskcachepruneinterval=0))
+        for item in range(10):
+            self.read(service, item)
+        otherFile = os.path.join(service['cachepath'], "other")
+        with open(otherFile, "w") as fd:
+            fd.write("not a cache file" * 100)
+        # the oldest files go beyond diskcachemaxbytes
+        now = time.time()
+        for item in range(10):
+            cachefile = service.cacheFileName("data", inputdata={'item': item})
+            os.utime(cachefile, (now - 3600 * (10 - item), now - 3600 * (10 - item)))
+        self.read(service, 10)
+        self.assertEqual(service.cacheStats()['pruned'], 1)
+        self.assertFalse(os.path.exists(service.cacheFileName("data", inputdata={'item': 0})))
+
+        self.assertEqual(service.pruneCache(maxAge=5.5), 4)
+        self.assertEqual(service.pruneCache(maxBytes=2 * 24 + 1), 4)
+        self.assertTrue(os.path.exists(service.cacheFileName("data", inputdata={'item': 10})))
+        self.assertTrue(os.path.exists(otherFile))
+        self.assertEqual(service.cacheStats()['pruned'], 9)
+
+        # a failed write leaves no temporary file behind
+        cachefile = service.cacheFileName("data", inputdata={'item': 11})
+        self.assertRaises(TypeError, service._writeCache, cachefile, "not bytes", False, True)
+        self.assertEqual([name for name in os.listdir(service['cachepath']) if name.startswith(".")], [])
+        self.assertFalse(os.path.exists(cachefile))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,16 +2,89 @@
 Unit test for pycurl_manager module.
 """
 
-from __future__ import division
+from __future__ import division, print_function
 
 import gzip
 import os
+import shutil
+import ssl
+import subprocess
 import tempfile
+import threading
+import time
 import unittest
 import traceback
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlparse
+
+import pycurl
+
+from nose.plugins.attrib import attr
+
 from Utils.CertTools import getKeyCertFromEnv
 from WMCore.Services.pycurl_manager import \
-        RequestHandler, ResponseHeader, getdata, cern_sso_cookie, decompress
+        RequestHandler, ResponseHeader, getdata, cern_sso_cookie, decompress, CurlHandlePool
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Answer every request with a small JSON document, keeping the connection open
+    """
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        # delay the response by the delay parameter, in seconds
+        query = parse_qs(urlparse(self.path).query)
+        if "delay" in query:
+            time.sleep(float(query["delay"][0]))
+        body = b'{"path": "%s"}' % self.path.encode()
+        status = 404 if "missing" in self.path else 200
+        self.server.connections.add(self.client_address)
+        self.server.cookies.append(self.headers.get("Cookie"))
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if "cookie" in self.path:
+            self.send_header("Set-Cookie", "session=secret; Path=/")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    """
+    HTTPS server on localhost standing in for a data service
+    """
+    daemon_threads = True
+
+    def __init__(self, certDir):
+        HTTPServer.__init__(self, ("127.0.0.1", 0), StandInHandler)
+        certFile = os.path.join(certDir, "cert.pem")
+        keyFile = os.path.join(certDir, "key.pem")
+        subprocess.check_call(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                               "-subj", "/CN=localhost", "-keyout", keyFile, "-out", certFile],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certFile, keyFile)
+        self.socket = context.wrap_socket(self.socket, server_side=True)
+        self.url = "https://localhost:%d" % self.server_address[1]
+        self.connections = set()
+        self.cookies = []
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def handle_error(self, request, client_address):
+        # clients giving up on delayed responses
+        pass
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
 
 
 class PyCurlManager(unittest.TestCase):
@@ -312,5 +385,162 @@ class PyCurlManager(unittest.TestCase):
             pairs.add(pair)
         self.assertTrue(len(pairs), 100)
 
+
+class CurlHandlePoolTest(unittest.TestCase):
+    """Test the reuse of curl handles against a local HTTPS server"""
+
+    def setUp(self):
+        self.certDir = tempfile.mkdtemp()
+        try:
+            self.server = StandInServer(self.certDir)
+        except (OSError, subprocess.CalledProcessError) as exc:
+            shutil.rmtree(self.certDir)
+            raise unittest.SkipTest("Cannot start the HTTPS stand-in server: %s" % str(exc))
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.certDir)
+
+    def testKeepAlive(self):
+        """
+        Test that the requests to a host reuse the handles and their connections
+        """
+        pool = CurlHandlePool(maxPerHost=2)
+        mgr = RequestHandler(config={'pool': pool})
+        for i in range(10):
+            header, data = mgr.request(self.server.url + "/data", {'item': i}, encode=True, decode=True)
+            self.assertEqual(header.status, 200)
+            self.assertEqual(data, {"path": "/data?item=%d" % i})
+        self.assertRaises(Exception, mgr.request, self.server.url + "/missing", {})
+
+        stats = pool.stats()
+        self.assertEqual(stats['created'], 1)
+        self.assertEqual(stats['reused'], 10)
+        self.assertEqual(stats['idle'], 1)
+        self.assertAlmostEqual(stats['reuseRatio'], 10 / 11.0)
+        self.assertEqual(len(self.server.connections), 1)
+
+        # cookies of a request are not sent with the next ones
+        cookieFile = os.path.join(self.certDir, "cookies")
+        mgr.request(self.server.url + "/cookie", {}, cookie={self.server.url + "/cookie": cookieFile})
+        mgr.request(self.server.url + "/cookie", {}, cookie={self.server.url + "/cookie": cookieFile})
+        mgr.request(self.server.url + "/data", {})
+        self.assertEqual(self.server.cookies[-3:], [None, "session=secret", None])
+
+        # no handle without keep alive
+        mgr = RequestHandler(config={'keepalive': False})
+        self.assertIsNone(mgr.pool)
+        mgr.request(self.server.url + "/data", {})
+        self.assertEqual(pool.stats()['created'], 1)
+
+    def testLimits(self):
+        """
+        Test the limit of idle handles per host and the eviction of idle handles
+        """
+        pool = CurlHandlePool(maxPerHost=2, maxIdleTime=0.5)
+        otherUrl = self.server.url.replace("localhost", "127.0.0.1")
+        handles = [pool.acquire(self.server.url + "/data") for _ in range(3)]
+        other = pool.acquire(otherUrl + "/data")
+        self.assertEqual(pool.stats()['created'], 4)
+        for curl in handles:
+            pool.release(self.server.url + "/data", curl)
+        pool.release(otherUrl, other, reusable=False)
+        stats = pool.stats()
+        self.assertEqual((stats['idle'], stats['released'], stats['discarded']), (2, 2, 2))
+
+        self.assertIn(pool.acquire(self.server.url + "/other"), handles)
+        time.sleep(0.6)
+        self.assertNotIn(pool.acquire(self.server.url + "/data"), handles)
+        stats = pool.stats()
+        self.assertEqual((stats['idle'], stats['evicted'], stats['reused']), (0, 1, 1))
+        pool.clear()
+
+    def testThreads(self):
+        """
+        Test the pool shared by concurrent threads
+        """
+        pool = CurlHandlePool(maxPerHost=4)
+        mgr = RequestHandler(config={'pool': pool})
+        errors = []
+
+        def fetch(thread):
+            try:
+                for i in range(20):
+                    _, data = mgr.request(self.server.url + "/data", {'thread': thread, 'item': i},
+                                          encode=True, decode=True)
+                    self.assertEqual(data["path"], "/data?thread=%d&item=%d" % (thread, i))
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=fetch, args=(thread,)) for thread in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        stats = pool.stats()
+        self.assertEqual(stats['created'] + stats['reused'], 80)
+        self.assertTrue(stats['created'] <= 4)
+        self.assertTrue(len(self.server.connections) <= 4)
+
+    def testConcurrentMultirequest(self):
+        """
+        Test that multirequest runs the requests of its window at once
+        """
+        pool = CurlHandlePool()
+        mgr = RequestHandler(config={'pool': pool})
+        url = self.server.url + "/data"
+        delays = [0.6, 0.1, 0.4, 0.2, 0.3] * 4
+        parray = [{'delay': delay, 'item': i} for i, delay in enumerate(delays)]
+
+        startTime = time.time()
+        items = list(mgr.multirequest(url, parray, window=5, encode=True, decode=True))
+        self.assertTrue(time.time() - startTime < sum(delays) / 2)
+        self.assertEqual(sorted(item['item'] for item in items), list(range(20)))
+        self.assertEqual(items[0]['item'], 1)
+        self.assertEqual(items[0]['path'], "/data?delay=0.1&item=1")
+
+        # in the order of the parameters
+        items = list(mgr.multirequest(url, parray, window=20, encode=True, decode=True, ordered=True))
+        self.assertEqual([item['item'] for item in items], list(range(20)))
+        self.assertTrue(pool.stats()['reused'] >= 5)
+
+        # timeouts and HTTP errors stop the iteration
+        parray = [{'delay': 0.1}, {'delay': 3}, {'delay': 0.2}]
+        self.assertRaises(pycurl.error, list, mgr.multirequest(url, parray, timeout=1, encode=True))
+        self.assertRaises(Exception, list, mgr.multirequest(self.server.url + "/missing", parray[:1], encode=True))
+
+    @attr('performance', 'integration')
+    def testMultirequestPerformance(self):
+        """
+        Time multirequest with different windows against a server answering in 50ms
+        """
+        mgr = RequestHandler(config={'pool': CurlHandlePool()})
+        parray = [{'delay': 0.05, 'item': i} for i in range(200)]
+        print("\n%d requests of 50ms" % len(parray))
+        for window in (1, 10, 50):
+            startTime = time.time()
+            items = list(mgr.multirequest(self.server.url + "/data", parray, window=window,
+                                          encode=True, decode=True))
+            self.assertEqual(len(items), len(parray))
+            print("  window=%d: %.3f secs" % (window, time.time() - startTime))
+
+    @attr('performance', 'integration')
+    def testPerformance(self):
+        """
+        Time requests with and without reusing the connections
+        """
+        numRequests = 500
+        print("\n%d HTTPS requests" % numRequests)
+        for keepalive in (False, True):
+            mgr = RequestHandler(config={'keepalive': keepalive, 'pool': CurlHandlePool()})
+            startTime = time.time()
+            for i in range(numRequests):
+                mgr.request(self.server.url + "/data", {'item': i}, encode=True)
+            print("  keepalive=%s: %.3f secs" % (keepalive, time.time() - startTime))
+            if keepalive:
+                print("  reuse ratio: %.3f" % mgr.pool.stats()['reuseRatio'])
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""
+_Parentage_t_
+
+Unit tests for resolving the merged ancestors of WMBS files.
+"""
+
+import unittest
+
+from WMCore.WMBS.Parentage import ParentageResolver
+
+
+class GetParentInfoDummy(object):
+    """
+    Files.GetParentAndGrandParentInfo over a parentage graph in memory
+    """
+
+    def __init__(self, parents, merged):
+        self.parents = parents
+        self.merged = merged
+        self.queries = []
+
+    def execute(self, childLFNs, conn=None, transaction=False):
+        self.queries.append(childLFNs)
+        result = []
+        for child in childLFNs:
+            for parent in self.parents.get(child, []):
+                grandParents = self.parents.get(parent) or [None]
+                for grandParent in grandParents:
+                    result.append({"child_lfn": child, "id": 1, "lfn": parent,
+                                   "merged": self.merged[parent],
+                                   "gplfn": grandParent,
+                                   "gpmerged": self.merged[grandParent] if grandParent else None})
+        return result
+
+
+class ParentageTest(unittest.TestCase):
+    """
+    _ParentageTest_
+
+    Resolve the parents of merge job outputs
+    """
+
+    def setUp(self):
+        # RAW <- unmerged RECO <- merged RECO <- unmerged AOD <- merged AOD
+        # with a chain of unmerged files in between for the merged files of a
+        # merge of merges
+        self.parents = {}
+        self.merged = {}
+        for i in range(1000):
+            raw = "/store/data/RAW/%d.root" % i
+            self.merged[raw] = 1
+            self.addFile("/store/unmerged/RECO/%d.root" % i, 0, [raw])
+            self.addFile("/store/data/RECO/%d.root" % i, 1, ["/store/unmerged/RECO/%d.root" % i])
+            self.addFile("/store/unmerged/AOD/%d.root" % i, 0, ["/store/data/RECO/%d.root" % i])
+            self.addFile("/store/unmerged/AODMerged/%d.root" % i, 0, ["/store/unmerged/AOD/%d.root" % i])
+        self.addFile("/store/data/AOD/merged.root", 1,
+                     ["/store/unmerged/AODMerged/%d.root" % i for i in range(1000)])
+        # file flagged merged under the unmerged area
+        self.addFile("/store/unmerged/RECO/flagged.root", 1, ["/store/data/RAW/0.root"])
+        self.addFile("/store/data/RECO/flagged.root", 1, ["/store/unmerged/RECO/flagged.root"])
+        self.merged["/store/data/RAW/orphan.root"] = 1
+
+    def addFile(self, lfn, merged, parents):
+        self.merged[lfn] = merged
+        self.parents[lfn] = parents
+
+    def testFindParents(self):
+        """
+        Test that the parents are resolved with one query per generation
+        """
+        dao = GetParentInfoDummy(self.parents, self.merged)
+        resolver = ParentageResolver(dao)
+
+        lfns = ["/store/data/RECO/%d.root" % i for i in range(1000)]
+        parents = resolver.findParents(lfns)
+        self.assertEqual(len(dao.queries), 1)
+        self.assertEqual(parents["/store/data/RECO/7.root"], {"/store/data/RAW/7.root"})
+
+        parents = resolver.findParents(["/store/data/AOD/merged.root", "/store/data/RAW/orphan.root"])
+        self.assertEqual(parents["/store/data/AOD/merged.root"],
+                         set("/store/data/RECO/%d.root" % i for i in range(1000)))
+        self.assertEqual(parents["/store/data/RAW/orphan.root"], set())
+        # the 1000 unmerged AOD grandparents are looked up with a single query
+        self.assertEqual(len(dao.queries), 3)
+        self.assertEqual(len(dao.queries[2]), 1000)
+
+        # the parents are remembered until cleared
+        self.assertEqual(resolver.findParents(["/store/data/AOD/merged.root"]),
+                         {"/store/data/AOD/merged.root": parents["/store/data/AOD/merged.root"]})
+        self.assertEqual(len(dao.queries), 3)
+        resolver.clear()
+        resolver.findParents(["/store/data/AOD/merged.root"])
+        self.assertEqual(len(dao.queries), 5)
+
+    def testExcludeUnmergedLFNs(self):
+        """
+        Test that files in the unmerged area are never used as DBS parents
+        """
+        lfn = "/store/data/RECO/flagged.root"
+        dao = GetParentInfoDummy(self.parents, self.merged)
+        self.assertEqual(ParentageResolver(dao).findParents([lfn])[lfn],
+                         {"/store/unmerged/RECO/flagged.root"})
+        self.assertEqual(ParentageResolver(dao, excludeUnmergedLFNs=True).findParents([lfn])[lfn],
+                         {"/store/data/RAW/0.root"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+"""
+_ActiveDataTracker_t_
+
+Unit tests for following the changes of the active requests, over ReqMgr and
+WMStats databases in memory.
+"""
+
+import copy
+import unittest
+
+from WMCore.WMStats.DataStructs.ActiveDataTracker import ActiveDataTracker
+
+
+class CouchDBDummy(object):
+    """
+    The _changes feed of a CouchDB database in memory
+    """
+
+    def __init__(self):
+        self.docs = {}
+        self.seq = 0
+        self.lastChange = {}
+        self.fail = False
+        self.calls = 0
+
+    def save(self, doc):
+        self.seq += 1
+        self.docs[doc['_id']] = doc
+        self.lastChange[doc['_id']] = self.seq
+
+    def delete(self, docId):
+        self.save({'_id': docId, '_rev': "2-abc", '_deleted': True})
+
+    def info(self):
+        return {'update_seq': "%d-opaque" % self.seq}
+
+    def match(self, selector, doc):
+        for key, value in selector.items():
+            if key == "$or":
+                if not any(self.match(item, doc) for item in value):
+                    return False
+            elif isinstance(value, dict):
+                if (key in doc) != value["$exists"]:
+                    return False
+            elif doc.get(key) != value:
+                return False
+        return True
+
+    def changesBySelector(self, selector, since=None, limit=None, includeDocs=False):
+        self.calls += 1
+        if self.fail:
+            raise IOError("Service Unavailable")
+        since = int(since.split("-")[0])
+        results = []
+        for docId, seq in sorted(self.lastChange.items(), key=lambda item: item[1]):
+            doc = self.docs[docId]
+            if seq > since and self.match(selector, doc):
+                change = {'seq': "%d-opaque" % seq, 'id': docId, 'changes': [{'rev': "2-abc"}],
+                          'doc': copy.deepcopy(doc)}
+                if doc.get('_deleted'):
+                    change['deleted'] = True
+                results.append(change)
+        pending = max(len(results) - limit, 0)
+        results = results[:limit]
+        lastSeq = results[-1]['seq'] if results else "%d-opaque" % since
+        return {'results': results, 'last_seq': lastSeq, 'pending': pending}
+
+
+class RequestDBReaderDummy(object):
+    def __init__(self, couchDB):
+        self.couchDB = couchDB
+
+
+class WMStatsReaderDummy(object):
+    """
+    The WMStatsReader methods used to load the active data
+    """
+
+    def __init__(self):
+        self.reqDB = RequestDBReaderDummy(CouchDBDummy())
+        self.couchDB = CouchDBDummy()
+        self.jobInfoQueries = []
+
+    def getLatestJobInfoByRequests(self, requestNames):
+        self.jobInfoQueries.append(sorted(requestNames))
+        rows = [{'doc': copy.deepcopy(doc)} for doc in self.couchDB.docs.values()
+                if doc.get('type') == "agent_request" and doc['workflow'] in requestNames]
+        return {'rows': rows} if rows else []
+
+    def getActiveData(self, listStatuses, jobInfoFlag=False):
+        results = {}
+        for docId, doc in self.reqDB.couchDB.docs.items():
+            if doc.get('RequestStatus') in listStatuses:
+                results[docId] = copy.deepcopy(doc)
+                del results[docId]['_rev']
+        if results and jobInfoFlag:
+            for row in self.getLatestJobInfoByRequests(list(results))['rows']:
+                jobInfo = results[row['doc']['workflow']].setdefault('AgentJobInfo', {})
+                jobInfo[row['doc']['agent_url']] = row['doc']
+        return results
+
+
+class ActiveDataTrackerTest(unittest.TestCase):
+    """
+    Apply the changes of the requests and of their job information
+    """
+
+    def setUp(self):
+        self.reader = WMStatsReaderDummy()
+        self.reqDB = self.reader.reqDB.couchDB
+        self.wmstatsDB = self.reader.couchDB
+        for i, status in enumerate(["new", "assigned", "running-open", "running-closed", "announced"]):
+            self.saveRequest("request_%d" % i, status)
+        self.saveAgentDoc("request_2", "agent1")
+        self.saveAgentDoc("request_3", "agent1")
+        self.saveAgentDoc("request_3", "agent2")
+        # jobsummary and other documents are not followed
+        self.wmstatsDB.save({'_id': "job_1", 'type': "jobsummary", 'workflow': "request_2"})
+
+    def saveRequest(self, name, status, **kwargs):
+        doc = dict(_id=name, _rev="1-abc", RequestName=name, RequestStatus=status, **kwargs)
+        self.reqDB.save(doc)
+
+    def saveAgentDoc(self, name, agentURL, success=0):
+        self.wmstatsDB.save({'_id': "%s-%s" % (agentURL, name), '_rev': "1-abc", 'type': "agent_request",
+                             'workflow': name, 'agent_url': agentURL, 'status': {'success': success}})
+
+    def createTracker(self, **kwargs):
+        return ActiveDataTracker(self.reader, ["running-open", "running-closed"],
+                                 ["new", "assigned", "acquired"], **kwargs)
+
+    def testApplyChanges(self):
+        """
+        Test that the updates give the same data as a full load
+        """
+        tracker = self.createTracker(jobInfoFlag=True)
+        self.assertIsNone(tracker.update({}))
+        jobData = tracker.load()
+        self.assertEqual(sorted(jobData), ["request_0", "request_1", "request_2", "request_3"])
+        self.assertEqual(sorted(jobData["request_3"]["AgentJobInfo"]), ["agent1", "agent2"])
+        self.assertEqual(len(self.reader.jobInfoQueries), 1)
+
+        # nothing changed
+        self.assertIs(tracker.update(jobData), jobData)
+
+        self.saveRequest("request_0", "assigned", Team="production")
+        self.saveRequest("request_1", "acquired")
+        self.saveRequest("request_1", "running-open")
+        self.saveRequest("request_2", "running-closed")
+        self.saveRequest("request_3", "completed")
+        self.saveRequest("request_4", "aborted")
+        self.saveRequest("request_5", "new")
+        self.saveAgentDoc("request_1", "agent2", success=5)
+        self.saveAgentDoc("request_2", "agent1", success=10)
+        self.saveAgentDoc("request_3", "agent1", success=20)
+        self.saveAgentDoc("request_9", "agent1")
+        previousData = copy.deepcopy(jobData)
+        newData = tracker.update(jobData)
+
+        # only the request getting to a status with job information was queried
+        self.assertEqual(self.reader.jobInfoQueries[1:], [["request_1"]])
+        # the previous data is left alone, for the REST threads still reading it
+        self.assertEqual(jobData, previousData)
+        self.assertEqual(newData, self.createTracker(jobInfoFlag=True).load())
+        self.assertEqual(sorted(newData), ["request_0", "request_1", "request_2", "request_5"])
+        self.assertEqual(newData["request_0"]["Team"], "production")
+        self.assertNotIn("_rev", newData["request_0"])
+        self.assertEqual(newData["request_1"]["AgentJobInfo"]["agent2"]["status"], {'success': 5})
+        self.assertEqual(newData["request_2"]["AgentJobInfo"]["agent1"]["status"], {'success': 10})
+
+        # deleted requests are removed
+        self.reqDB.delete("request_5")
+        self.saveAgentDoc("request_2", "agent2", success=1)
+        jobData = tracker.update(newData)
+        self.assertEqual(sorted(jobData), ["request_0", "request_1", "request_2"])
+        self.assertEqual(sorted(jobData["request_2"]["AgentJobInfo"]), ["agent1", "agent2"])
+        self.assertEqual(sorted(newData["request_2"]["AgentJobInfo"]), ["agent1"])
+
+    def testNoJobInfo(self):
+        """
+        Test that WMStats is not followed without job information
+        """
+        tracker = self.createTracker()
+        jobData = tracker.load()
+        self.assertNotIn("AgentJobInfo", jobData["request_2"])
+        self.saveRequest("request_2", "running-closed")
+        self.saveAgentDoc("request_2", "agent1", success=10)
+        jobData = tracker.update(jobData)
+        self.assertEqual(jobData["request_2"]["RequestStatus"], "running-closed")
+        self.assertNotIn("AgentJobInfo", jobData["request_2"])
+        self.assertEqual(self.wmstatsDB.calls, 0)
+        self.assertEqual(self.reader.jobInfoQueries, [])
+
+    def testReload(self):
+        """
+        Test that the data must be loaded again when the changes cannot be followed
+        """
+        tracker = self.createTracker(jobInfoFlag=True, maxChanges=3)
+        jobData = tracker.load()
+        for i in range(4):
+            self.saveRequest("request_%d" % i, "assigned")
+        self.assertIsNone(tracker.update(jobData))
+        # and until then
+        self.assertIsNone(tracker.update(jobData))
+        self.assertEqual(self.reqDB.calls, 1)
+
+        jobData = tracker.load()
+        for i in range(2):
+            self.saveAgentDoc("request_3", "agent%d" % i)
+        self.saveRequest("request_3", "running-closed")
+        jobData = tracker.update(jobData)
+        self.assertEqual(jobData["request_3"]["RequestStatus"], "running-closed")
+
+        self.wmstatsDB.fail = True
+        self.assertIsNone(tracker.update(jobData))
+        self.wmstatsDB.fail = False
+        self.assertIsNone(tracker.update(jobData))
+        jobData = tracker.load()
+        self.assertEqual(tracker.update(jobData), jobData)
+
+
+if __name__ == '__main__':
+    unittest.main()
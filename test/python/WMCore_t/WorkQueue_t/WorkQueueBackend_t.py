@@ -2,13 +2,18 @@
 """
     CouchWorkQueueElement unit tests
 """
+from __future__ import print_function
+
+import random
 import unittest
 
 import time
 
+from nose.plugins.attrib import attr
+
 from Utils.PythonVersion import PY3
 from WMQuality.TestInitCouchApp import TestInitCouchApp as TestInit
-from WMCore.WorkQueue.WorkQueueBackend import WorkQueueBackend, sortAvailableElements
+from WMCore.WorkQueue.WorkQueueBackend import WorkQueueBackend, SiteJobCounter, sortAvailableElements
 from WMCore.WorkQueue.DataStructs.CouchWorkQueueElement import CouchWorkQueueElement
 from WMCore.WorkQueue.DataStructs.WorkQueueElement import WorkQueueElement
 
@@ -130,6 +135,92 @@ class WorkQueueBackendTest(unittest.TestCase):
         self.assertEqual(len(elemList), 5)
         self.assertItemsEqual(elemList, expected)
 
+    def createSyntheticWork(self, numElements, numSites):
+        """
+        Create random elements, thresholds and site job counts, with the elements sorted
+        """
+        sites = ["T2_XX_Site%d" % i for i in range(numSites)]
+        thresholds = dict((site, random.randint(0, 10000)) for site in sites)
+        siteJobCounts = {}
+        for site in random.sample(sites, numSites // 2):
+            siteJobCounts[site] = dict((random.randint(1, 100) * 1000, random.randint(1, 500))
+                                       for _ in range(random.randint(1, 20)))
+        elements = []
+        for i in range(numElements):
+            elements.append({'CreationTime': random.random(), 'Priority': random.randint(1, 100) * 1000,
+                             'Jobs': random.randint(1, 100), 'blowupFactor': random.choice([1.0, 2.5]),
+                             'Sites': random.sample(sites, random.randint(1, 20)), 'Id': i})
+        sortAvailableElements(elements)
+        return elements, thresholds, siteJobCounts
+
+    def matchElements(self, elements, thresholds, siteJobCounts, indexed):
+        """
+        Run the site matching of _evalAvailableWork over synthetic elements, with either
+        the site job counter or the former sum over all the priorities of a site
+        """
+        jobCounter = SiteJobCounter(siteJobCounts, [element['Priority'] for element in elements])
+        accepted = []
+        for element in elements:
+            prio = element['Priority']
+            for site in element['Sites']:
+                if site in thresholds:
+                    if indexed:
+                        curJobCount = jobCounter.jobCount(site, prio)
+                    else:
+                        curJobCount = sum([x[1] if x[0] >= prio else 0 for x in siteJobCounts.get(site, {}).items()])
+                    if curJobCount < thresholds[site]:
+                        accepted.append((element['Id'], site))
+                        jobs = element['Jobs'] * element['blowupFactor']
+                        if indexed:
+                            jobCounter.addJobs(site, prio, jobs)
+                        else:
+                            siteJobCounts.setdefault(site, {})
+                            siteJobCounts[site][prio] = siteJobCounts[site].setdefault(prio, 0) + jobs
+                        break
+        return accepted
+
+    def testSiteJobCounter(self):
+        """Test the site job counter against the sum over all the priorities"""
+        siteJobCounts = {'T2_XX_SiteA': {100: 5, 300: 10}, 'T2_XX_SiteB': {200: 1}}
+        jobCounter = SiteJobCounter(siteJobCounts, [100, 200])
+        self.assertEqual(jobCounter.jobCount('T2_XX_SiteA', 100), 15)
+        self.assertEqual(jobCounter.jobCount('T2_XX_SiteA', 200), 10)
+        self.assertEqual(jobCounter.jobCount('T2_XX_SiteA', 300), 10)
+        self.assertEqual(jobCounter.jobCount('T2_XX_SiteA', 400), 0)
+        self.assertEqual(jobCounter.jobCount('T2_XX_SiteC', 100), 0)
+
+        # siteJobCounts is updated in place, including for new sites and priorities
+        jobCounter.addJobs('T2_XX_SiteA', 200, 3)
+        jobCounter.addJobs('T2_XX_SiteA', 50, 2)
+        jobCounter.addJobs('T2_XX_SiteC', 100, 4)
+        self.assertEqual(jobCounter.jobCount('T2_XX_SiteA', 200), 13)
+        self.assertEqual(jobCounter.jobCount('T2_XX_SiteA', 50), 20)
+        self.assertEqual(jobCounter.jobCount('T2_XX_SiteC', 100), 4)
+        self.assertEqual(siteJobCounts, {'T2_XX_SiteA': {50: 2, 100: 5, 200: 3, 300: 10},
+                                         'T2_XX_SiteB': {200: 1}, 'T2_XX_SiteC': {100: 4}})
+
+        # and it accepts the same elements than the former sum
+        elements, thresholds, siteJobCounts = self.createSyntheticWork(2000, 50)
+        expectedCounts = dict((site, dict(counts)) for site, counts in siteJobCounts.items())
+        expected = self.matchElements(elements, thresholds, expectedCounts, indexed=False)
+        self.assertEqual(self.matchElements(elements, thresholds, siteJobCounts, indexed=True), expected)
+        self.assertEqual(siteJobCounts, expectedCounts)
+
+    @attr('performance', 'integration')
+    def testSiteJobCounterPerformance(self):
+        """Time the matching of 50k elements against 300 sites"""
+        elements, thresholds, siteJobCounts = self.createSyntheticWork(50000, 300)
+        # large thresholds, such that most elements are accepted
+        thresholds = dict((site, 100 * threshold) for site, threshold in thresholds.items())
+        print("\nMatching %d elements against %d sites" % (len(elements), len(thresholds)))
+        results = []
+        for indexed in (False, True):
+            jobCounts = dict((site, dict(counts)) for site, counts in siteJobCounts.items())
+            startTime = time.time()
+            results.append(self.matchElements(elements, thresholds, jobCounts, indexed))
+            print("  %s: %.3f secs" % ("indexed" if indexed else "sum", time.time() - startTime))
+        self.assertEqual(results[0], results[1])
+
 
 if __name__ == '__main__':
     unittest.main()
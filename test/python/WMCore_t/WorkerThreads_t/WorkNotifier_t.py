@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+"""
+_WorkNotifier_t_
+
+Unit tests for the notifications of new work between components.
+"""
+
+import logging
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from WMCore.Configuration import Configuration
+from WMCore.Database.Transaction import Transaction
+from WMCore.WorkerThreads.BaseWorkerThread import BaseWorkerThread
+from WMCore.WorkerThreads.WorkNotifier import WorkListener, WorkNotifier, getNotifyDir
+
+
+class ComponentDummy(object):
+    """
+    Component with the configuration of a JobArchiver waking up for new work
+    """
+
+    def __init__(self, workDir, wakeupStates):
+        self.config = Configuration()
+        self.config.section_("General")
+        self.config.General.workDir = workDir
+        self.config.section_("Agent")
+        self.config.Agent.componentName = "JobArchiver"
+        self.config.component_("JobArchiver")
+        self.config.JobArchiver.wakeupStates = wakeupStates
+        self.config.JobArchiver.maxPollInterval = 8
+
+
+class WorkNotifierTest(unittest.TestCase):
+    """
+    Test the notifiers, the listeners and the worker threads waking up
+    """
+
+    def setUp(self):
+        self.workDir = tempfile.mkdtemp()
+        myThread = threading.currentThread()
+        myThread.dbFactory = None
+        myThread.logger = logging.getLogger()
+
+    def tearDown(self):
+        shutil.rmtree(self.workDir, ignore_errors=True)
+
+    def createWorker(self, wakeupStates, idleTime=2):
+        """
+        Create a worker thread listening for notifications
+        """
+        worker = BaseWorkerThread()
+        worker.component = ComponentDummy(self.workDir, wakeupStates)
+        worker.idleTime = idleTime
+        worker.notifyTerminate = threading.Event()
+        worker.setUpWorkListener()
+        return worker
+
+    def testNotifications(self):
+        """
+        Test that listeners only get the notifications of their states
+        """
+        notifyDir = getNotifyDir(ComponentDummy(self.workDir, []).config)
+        notifier = WorkNotifier(notifyDir)
+        self.assertEqual(notifier.notify("success"), 0)
+        self.assertEqual(WorkNotifier(None).notify("success"), 0)
+
+        archiver = WorkListener(notifyDir, "JobArchiver.JobArchiverPoller", ["success", "exhausted"])
+        errorHandler = WorkListener(notifyDir, "ErrorHandler.ErrorHandlerPoller", ["jobfailed"])
+        startTime = time.time()
+        self.assertEqual(notifier.notify("success"), 2)
+        self.assertEqual(notifier.notify("jobfailed"), 2)
+        self.assertEqual(notifier.notify("success"), 2)
+
+        notifications = archiver.wait(1)
+        self.assertEqual([state for state, _ in notifications], ["success", "success"])
+        self.assertTrue(all(changeTime >= startTime - 1 for _, changeTime in notifications))
+        self.assertEqual(errorHandler.wait(1)[0][0], "jobfailed")
+
+        # nothing pending, wait for the timeout
+        startTime = time.time()
+        notifier.notify("created")
+        self.assertEqual(archiver.wait(0.5), [])
+        self.assertTrue(time.time() - startTime >= 0.5)
+
+        # notifications to closed listeners are dropped
+        errorHandler.close()
+        self.assertEqual(notifier.notify("jobfailed"), 1)
+
+        # a restarted listener replaces the socket left behind
+        archiver.socket.close()
+        archiver = WorkListener(notifyDir, "JobArchiver.JobArchiverPoller", ["success"])
+        notifier.notify("success")
+        self.assertEqual(len(archiver.wait(1)), 1)
+        archiver.close()
+        return
+
+    def testSleepThread(self):
+        """
+        Test that a worker wakes up on notifications and backs off without work
+        """
+        worker = self.createWorker(["success", "killed"])
+        self.assertEqual(worker.currentIdleTime, 2)
+        self.assertEqual(worker.maxIdleTime, 8)
+
+        # no work done: the poll interval backs off
+        startTime = time.time()
+        worker.sleepThread()
+        self.assertTrue(time.time() - startTime >= 2)
+        self.assertEqual(worker.currentIdleTime, 4)
+
+        # notified: wakes up at once, but keeps backing off after an empty cycle
+        notifier = WorkNotifier(getNotifyDir(worker.component.config))
+        notifier.notify("jobfailed")
+        notifier.notify("success")
+        worker.cycleWork = 0
+        startTime = time.time()
+        worker.sleepThread()
+        self.assertTrue(time.time() - startTime < 1)
+        self.assertEqual(worker.currentIdleTime, 8)
+        notifications = worker.pendingNotifications
+        self.assertEqual([state for state, _ in notifications], ["success"])
+
+        worker.recordStateLatency(notifications)
+        self.assertEqual(worker.stateLatencyStats["success"]["count"], 1)
+        self.assertTrue(worker.stateLatencyStats["success"]["last"] < 1)
+
+        # a cycle that did some work goes back to the regular interval, notified or not
+        worker.pendingNotifications = []
+        worker.cycleWork = 5
+        startTime = time.time()
+        worker.sleepThread()
+        self.assertTrue(time.time() - startTime >= 2)
+        self.assertEqual(worker.currentIdleTime, 2)
+
+        # without the work reported, the notified cycles count as busy
+        worker.cycleWork = None
+        worker.currentIdleTime = 8
+        worker.notifiedCycle = True
+        notifier.notify("success")
+        worker.sleepThread()
+        self.assertEqual(worker.currentIdleTime, 2)
+        worker.notifiedCycle = False
+        notifier.notify("success")
+        worker.sleepThread()
+        self.assertEqual(worker.currentIdleTime, 4)
+
+        # the poll interval does not back off beyond maxPollInterval
+        worker.currentIdleTime = worker.maxIdleTime = 1
+        worker.sleepThread()
+        self.assertEqual(worker.currentIdleTime, 1)
+        worker.workListener.close()
+
+        # workers of components not configured for it just sleep
+        worker = self.createWorker([], idleTime=1)
+        self.assertIsNone(worker.workListener)
+        startTime = time.time()
+        worker.sleepThread()
+        self.assertTrue(time.time() - startTime >= 1)
+        return
+
+    def testCommitCallbacks(self):
+        """
+        Test that the notifications are sent once the transaction is committed
+        """
+        notified = []
+        transaction = Transaction()
+        transaction.addCommitCallback(notified.append, "success")
+        transaction.addCommitCallback(notified.append, "success")
+        transaction.addCommitCallback(notified.append, "killed")
+        self.assertEqual(notified, [])
+        transaction.commit()
+        self.assertEqual(notified, ["success", "killed"])
+
+        transaction.addCommitCallback(notified.append, "exhausted")
+        transaction.rollback()
+        transaction.commit()
+        self.assertEqual(notified, ["success", "killed"])
+        return
+
+
+if __name__ == '__main__':
+    unittest.main()